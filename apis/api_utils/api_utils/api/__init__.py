@@ -8,11 +8,19 @@ from .shared import (
     write_gms_download_data,
     create_gms_download_zip,
     create_scenario_download_zip,
+    get_hazard_download_files,
+    get_disagg_download_files,
+    get_uhs_download_files,
+    get_gms_download_files,
+    get_scenario_download_files,
+    get_gms_download_filename,
     get_available_im_dict,
 )
+from .zip_stream import iter_zip, write_zip, zip_response
 from .utils import (
     endpoint_exception_handling,
     add_metadata_header,
+    get_metadata_header,
     get_check_keys,
     get_download_token,
     get_token_payload,
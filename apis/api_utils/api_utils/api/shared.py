@@ -1,9 +1,13 @@
-"""Contains functions that are used by both the coreAPi and projectAPI"""
+"""Contains functions that are used by both the coreAPi and projectAPI
+
+The download data of each result type is created by a generator that yields
+(filename, content) pairs, which can either be written to a directory or
+streamed straight into a zip archive (see zip_stream)
+"""
 import logging
-import zipfile
-import os
+import tempfile
 from pathlib import Path
-from typing import Sequence
+from typing import Sequence, Iterator, Tuple, List, Callable
 
 import yaml
 import numpy as np
@@ -11,32 +15,47 @@ import pandas as pd
 
 import gmhazard_calc as gc
 from . import utils
+from . import zip_stream
 
+DownloadFiles = Iterator[Tuple[str, zip_stream.ZipContent]]
 
-def write_hazard_download_data(
+
+def _get_plot_data(plot_fn: Callable, *hash_values) -> bytes:
+    """Creates the plot (png) via the given plot function or
+    retrieves it from the plot cache if it already exists for
+    the hash values (i.e. the plotted results)"""
+
+    def create_plot(save_file):
+        # Temporarily disable logging, as matplotlib spams..
+        logging.disable(level=logging.ERROR)
+        try:
+            plot_fn(save_file)
+        finally:
+            logging.disable(level=logging.NOTSET)
+
+    return zip_stream.get_cached_plot(
+        zip_stream.get_result_hash(*hash_values), create_plot
+    )
+
+
+def get_hazard_download_files(
     ensemble_hazard: gc.hazard.EnsembleHazardResult,
-    out_dir: str,
     nzs1170p5_hazard: gc.nz_code.nzs1170p5.NZS1170p5Result = None,
     nzta_hazard: gc.nz_code.nzta_2018.NZTAResult = None,
     prefix: str = None,
-):
+) -> DownloadFiles:
     prefix = "" if prefix is None else f"{prefix}_"
+    file_prefix = f"{prefix}{ensemble_hazard.im.file_format()}"
     ensemble, site_info = ensemble_hazard.ensemble, ensemble_hazard.site
     branches_hazard = ensemble_hazard.branch_hazard_dict
 
     # Ensemble hazard
-    ens_hazard_ffp = (
-        Path(out_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_hazard.csv"
-    )
-    ensemble_hazard.as_dataframe().to_csv(
-        ens_hazard_ffp, index_label="im_values", mode="a"
+    yield (
+        f"{file_prefix}_hazard.csv",
+        ensemble_hazard.as_dataframe().to_csv(index_label="im_values"),
     )
 
     # Branches - total hazard
-    branches_hazard_ffp = (
-        Path(out_dir)
-        / f"{prefix}{ensemble_hazard.im.file_format()}_branches_hazard.csv"
-    )
     branches_total_hazard_dict = {}
     branch_im_values = list(branches_hazard.values())[0].total_hazard.index.values
     for cur_name, cur_data in branches_hazard.items():
@@ -54,25 +73,24 @@ def write_hazard_download_data(
 
     branches_total_hazard_df = pd.DataFrame.from_dict(branches_total_hazard_dict)
     branches_total_hazard_df.index = branch_im_values
-    branches_total_hazard_df.to_csv(
-        branches_hazard_ffp, index_label="im_values", mode="a"
+    yield (
+        f"{file_prefix}_branches_hazard.csv",
+        branches_total_hazard_df.to_csv(index_label="im_values"),
     )
 
     # NZS1170p5 hazard
-    nzs1170p5_metadata, nzs1170p5_ffp = {}, None
+    nzs1170p5_metadata = {}
     if nzs1170p5_hazard is not None:
-        nzs1170p5_ffp = (
-            Path(out_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_nzs1170p5.csv"
-        )
-        nzs1170p5_metadata = (
+        nzs1170p5_header = utils.get_metadata_header(
+            ensemble,
+            site_info,
             f"Z: {nzs1170p5_hazard.Z}, D: {nzs1170p5_hazard.D}, "
-            f"N: {nzs1170p5_hazard.N.values[0]}, Ch: {nzs1170p5_hazard.Ch.iloc[0]}\n"
-        )
-        utils.add_metadata_header(
-            str(nzs1170p5_ffp), ensemble, site_info, nzs1170p5_metadata
+            f"N: {nzs1170p5_hazard.N.values[0]}, Ch: {nzs1170p5_hazard.Ch.iloc[0]}\n",
         )
-        nzs1170p5_hazard.im_values.to_csv(
-            nzs1170p5_ffp, index_label="exceedance", header=True, mode="a"
+        yield (
+            f"{file_prefix}_nzs1170p5.csv",
+            nzs1170p5_header
+            + nzs1170p5_hazard.im_values.to_csv(index_label="exceedance", header=True),
         )
 
         nzs1170p5_metadata = {
@@ -87,15 +105,17 @@ def write_hazard_download_data(
         }
 
     # NZTA_hazard
-    nzta_metadata, nzta_ffp = {}, None
+    nzta_metadata = {}
     if nzta_hazard is not None:
-        nzta_ffp = (
-            Path(out_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_nzta.csv"
+        nzta_header = utils.get_metadata_header(
+            ensemble, site_info, f"Soil Class: {nzta_hazard.soil_class.value}"
         )
-        nzta_metadata = f"Soil Class: {nzta_hazard.soil_class.value}"
-        utils.add_metadata_header(str(nzta_ffp), ensemble, site_info, nzta_metadata)
-        nzta_hazard.pga_values.to_csv(
-            nzta_ffp, index_label="exceedance", header=True, mode="a", index=True
+        yield (
+            f"{file_prefix}_nzta.csv",
+            nzta_header
+            + nzta_hazard.pga_values.to_csv(
+                index_label="exceedance", header=True, index=True
+            ),
         )
 
         nzta_metadata = {"NZTA_metadata": {"soil_class": nzta_hazard.soil_class.value,}}
@@ -113,125 +133,133 @@ def write_hazard_download_data(
         "im": str(ensemble_hazard.im),
         "git_version_hash": utils.get_repo_version(),
     }
-
-    meta_data_ffp = (
-        Path(out_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_metadata.yaml"
-    )
-    with meta_data_ffp.open(mode="w") as f:
+    yield (
+        f"{file_prefix}_metadata.yaml",
         yaml.safe_dump(
-            {**metadata, **nzs1170p5_metadata, **nzta_metadata}, f, sort_keys=False
-        )
+            {**metadata, **nzs1170p5_metadata, **nzta_metadata}, sort_keys=False
+        ),
+    )
 
     # Hazard & hazard branches plot
-    # Temporarily disable logging, as matplotlib spams..
     logging.debug("Creating hazard plots for downloading")
-    logging.disable(level=logging.ERROR)
-
-    hazard_plot_ffp = (
-        Path(out_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_hazard.png"
+    nzs1170p5_im_values = (
+        nzs1170p5_hazard.im_values if nzs1170p5_hazard is not None else None
     )
-    gc.plots.plt_hazard(
-        ensemble_hazard.as_dataframe(),
-        "Hazard",
-        ensemble_hazard.im,
-        str(hazard_plot_ffp),
-        nzs1170p5_hazard.im_values if nzs1170p5_hazard is not None else None,
-        nzta_hazard.pga_values if nzta_hazard is not None else None,
+    nzta_pga_values = nzta_hazard.pga_values if nzta_hazard is not None else None
+    yield (
+        f"{file_prefix}_hazard.png",
+        _get_plot_data(
+            lambda save_file: gc.plots.plt_hazard(
+                ensemble_hazard.as_dataframe(),
+                "Hazard",
+                ensemble_hazard.im,
+                save_file,
+                nzs1170p5_im_values,
+                nzta_pga_values,
+            ),
+            "hazard_plot",
+            ensemble_hazard.im,
+            ensemble_hazard.as_dataframe(),
+            nzs1170p5_im_values,
+            nzta_pga_values,
+        ),
     )
 
-    hazard_branch_plot_ffp = (
-        Path(out_dir)
-        / f"{prefix}{ensemble_hazard.im.file_format()}_hazard_branches.png"
-    )
-    gc.plots.plt_hazard_totals(
-        ensemble_hazard.as_dataframe(),
-        {
-            key: cur_branch_hazard.as_dataframe()
-            for key, cur_branch_hazard in branches_hazard.items()
-        },
-        "Branches Hazard",
-        ensemble_hazard.im,
-        str(hazard_branch_plot_ffp),
-        nzs1170p5_hazard.im_values if nzs1170p5_hazard is not None else None,
-        nzta_hazard.pga_values if nzta_hazard is not None else None,
+    branches_hazard_dfs = {
+        key: cur_branch_hazard.as_dataframe()
+        for key, cur_branch_hazard in branches_hazard.items()
+    }
+    yield (
+        f"{file_prefix}_hazard_branches.png",
+        _get_plot_data(
+            lambda save_file: gc.plots.plt_hazard_totals(
+                ensemble_hazard.as_dataframe(),
+                branches_hazard_dfs,
+                "Branches Hazard",
+                ensemble_hazard.im,
+                save_file,
+                nzs1170p5_im_values,
+                nzta_pga_values,
+            ),
+            "hazard_branches_plot",
+            ensemble_hazard.im,
+            ensemble_hazard.as_dataframe(),
+            *branches_hazard_dfs.keys(),
+            *branches_hazard_dfs.values(),
+            nzs1170p5_im_values,
+            nzta_pga_values,
+        ),
     )
-    logging.disable(level=logging.NOTSET)
 
-    return (
-        ens_hazard_ffp,
-        branches_hazard_ffp,
-        nzs1170p5_ffp,
-        nzta_ffp,
-        meta_data_ffp,
-        hazard_plot_ffp,
-        hazard_branch_plot_ffp,
+
+def write_hazard_download_data(
+    ensemble_hazard: gc.hazard.EnsembleHazardResult,
+    out_dir: str,
+    nzs1170p5_hazard: gc.nz_code.nzs1170p5.NZS1170p5Result = None,
+    nzta_hazard: gc.nz_code.nzta_2018.NZTAResult = None,
+    prefix: str = None,
+) -> List[Path]:
+    return zip_stream.write_files(
+        get_hazard_download_files(
+            ensemble_hazard,
+            nzs1170p5_hazard=nzs1170p5_hazard,
+            nzta_hazard=nzta_hazard,
+            prefix=prefix,
+        ),
+        out_dir,
     )
 
 
 def create_hazard_download_zip(
     ensemble_hazard: gc.hazard.EnsembleHazardResult,
-    tmp_dir: str,
     nzs1170p5_hazard: gc.nz_code.nzs1170p5.NZS1170p5Result = None,
     nzta_hazard: gc.nz_code.nzta_2018.NZTAResult = None,
     prefix: str = None,
-):
-    ffps = write_hazard_download_data(
-        ensemble_hazard,
-        tmp_dir,
-        nzs1170p5_hazard=nzs1170p5_hazard,
-        nzta_hazard=nzta_hazard,
-        prefix=prefix,
+) -> Iterator[bytes]:
+    """Streams the hazard download zip file, see zip_stream.iter_zip"""
+    return zip_stream.iter_zip(
+        get_hazard_download_files(
+            ensemble_hazard,
+            nzs1170p5_hazard=nzs1170p5_hazard,
+            nzta_hazard=nzta_hazard,
+            prefix=prefix,
+        )
     )
 
-    # Create zip file
-    logging.debug("Creating zip file")
-    zip_ffp = Path(tmp_dir) / f"{prefix}{ensemble_hazard.im.file_format()}_hazard.zip"
-    with zipfile.ZipFile(str(zip_ffp), mode="w") as cur_zip:
-        for cur_ffp in ffps:
-            if cur_ffp is not None:
-                cur_zip.write(cur_ffp, Path(cur_ffp).name)
-
-    return str(zip_ffp)
-
 
-def write_disagg_download_data(
+def get_disagg_download_files(
     disagg_data: Sequence[gc.disagg.EnsembleDisaggResult],
     metadata_df: Sequence[pd.DataFrame],
-    out_dir: str,
     src_plot_data: Sequence[bytes] = None,
     eps_plot_data: Sequence[bytes] = None,
     prefix: str = None,
-):
+) -> DownloadFiles:
     prefix = "" if prefix is None else f"{prefix}_"
     ensemble = disagg_data[0].ensemble
 
     # Save total contributions + extra data - Each RP
-    disagg_data_ffps, disagg_agg_data_ffps = [], []
-    meta_data_ffps, mean_values_ffps = [], []
-    src_plot_ffps, eps_plot_ffps = [], []
     for (idx, disagg) in enumerate(disagg_data):
-        disagg_data_ffp = (
-            Path(out_dir)
-            / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_disagg.csv"
-        )
+        file_prefix = f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}"
         disagg_df = disagg.total_contributions_df.merge(
             metadata_df[idx], how="left", left_index=True, right_index=True
         )
         disagg_df.loc[
             "distributed_seismicity", "rupture_name"
         ] = "distributed_seismicity"
-        disagg_df.loc[
-            :,
-            [
-                "rupture_name",
-                "contribution",
-                "epsilon",
-                "annual_rec_prob",
-                "magnitude",
-                "rrup",
-            ],
-        ].to_csv(disagg_data_ffp, index=True, mode="a", index_label="rupture_id")
-        disagg_data_ffps.append(disagg_data_ffp)
+        yield (
+            f"{file_prefix}_disagg.csv",
+            disagg_df.loc[
+                :,
+                [
+                    "rupture_name",
+                    "contribution",
+                    "epsilon",
+                    "annual_rec_prob",
+                    "magnitude",
+                    "rrup",
+                ],
+            ].to_csv(index=True, index_label="rupture_id"),
+        )
 
         # Save an aggregated version in the case of ERF perturbation
         if np.unique(disagg_df.rupture_name.values).size < disagg_df.shape[0]:
@@ -254,24 +282,17 @@ def write_disagg_download_data(
             disagg_agg_df = pd.DataFrame(agg_dict).T.sort_values(
                 "contribution", ascending=False
             )
-
-            disagg_agg_data_ffp = (
-                Path(out_dir)
-                / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_disagg_aggregated.csv"
-            )
-            disagg_agg_df.loc[
-                :, ["contribution", "epsilon", "annual_rec_prob", "magnitude", "rrup",],
-            ].to_csv(
-                disagg_agg_data_ffp, index=True, mode="a", index_label="rupture_name"
+            yield (
+                f"{file_prefix}_disagg_aggregated.csv",
+                disagg_agg_df.loc[
+                    :,
+                    ["contribution", "epsilon", "annual_rec_prob", "magnitude", "rrup",],
+                ].to_csv(index=True, index_label="rupture_name"),
             )
-            disagg_agg_data_ffps.append(disagg_agg_data_ffp)
 
         # Create metadata file
-        meta_data_ffp = (
-            Path(out_dir)
-            / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_metadata.yaml"
-        )
-        with meta_data_ffp.open(mode="w") as f:
+        yield (
+            f"{file_prefix}_metadata.yaml",
             yaml.safe_dump(
                 {
                     "ensemble_id": ensemble.name,
@@ -286,130 +307,89 @@ def write_disagg_download_data(
                     "exceedance": disagg.exceedance,
                     "im_value": float(disagg.im_value),
                     "git_version_hash": utils.get_repo_version(),
-                },
-                f,
-            )
-        meta_data_ffps.append(meta_data_ffp)
+                }
+            ),
+        )
 
         if disagg.mean_values is not None:
-            mean_values_ffp = (
-                Path(out_dir)
-                / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_mean_values.csv"
-            )
-            disagg.mean_values.to_frame().T.to_csv(mean_values_ffp, index=False)
-            mean_values_ffps.append(mean_values_ffp)
-
-        # Write & add plots
-        if src_plot_data[idx] is not None:
-            src_plot_ffp = (
-                Path(out_dir)
-                / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_disagg_src_plot.png"
-            )
-            with src_plot_ffp.open(mode="wb") as f:
-                f.write(src_plot_data[idx])
-            src_plot_ffps.append(src_plot_ffp)
-
-        if eps_plot_data[idx] is not None:
-            eps_plot_ffp = (
-                Path(out_dir)
-                / f"{prefix}{disagg.im.file_format()}_{int(1 / disagg.exceedance)}_disagg_eps_plot.png"
+            yield (
+                f"{file_prefix}_mean_values.csv",
+                disagg.mean_values.to_frame().T.to_csv(index=False),
             )
-            with eps_plot_ffp.open(mode="wb") as f:
-                f.write(eps_plot_data[idx])
-            eps_plot_ffps.append(eps_plot_ffp)
 
-    return (
-        *disagg_data_ffps,
-        *meta_data_ffps,
-        *mean_values_ffps,
-        *src_plot_ffps,
-        *eps_plot_ffps,
-        *disagg_agg_data_ffps,
-    )
+        # Add plots
+        if src_plot_data is not None and src_plot_data[idx] is not None:
+            yield f"{file_prefix}_disagg_src_plot.png", src_plot_data[idx]
 
+        if eps_plot_data is not None and eps_plot_data[idx] is not None:
+            yield f"{file_prefix}_disagg_eps_plot.png", eps_plot_data[idx]
 
-def create_disagg_download_zip(
-    ensemble_disagg: gc.disagg.EnsembleDisaggResult,
-    metadata_df: pd.DataFrame,
-    data_dir: str,
-    src_plot_data: bytes = None,
-    eps_plot_data: bytes = None,
+
+def write_disagg_download_data(
+    disagg_data: Sequence[gc.disagg.EnsembleDisaggResult],
+    metadata_df: Sequence[pd.DataFrame],
+    out_dir: str,
+    src_plot_data: Sequence[bytes] = None,
+    eps_plot_data: Sequence[bytes] = None,
     prefix: str = None,
-):
-    # Write the data
-    ffps = write_disagg_download_data(
-        ensemble_disagg,
-        metadata_df,
-        data_dir,
-        src_plot_data,
-        eps_plot_data,
-        prefix=prefix,
+) -> List[Path]:
+    return zip_stream.write_files(
+        get_disagg_download_files(
+            disagg_data,
+            metadata_df,
+            src_plot_data=src_plot_data,
+            eps_plot_data=eps_plot_data,
+            prefix=prefix,
+        ),
+        out_dir,
     )
 
-    # Create zip file
-    zip_ffp = Path(data_dir) / f"{prefix}disagg.zip"
-    with zipfile.ZipFile(str(zip_ffp), mode="w") as cur_zip:
-        for cur_ffp in ffps:
-            cur_zip.write(cur_ffp, Path(cur_ffp).name)
 
-    return zip_ffp
+def create_disagg_download_zip(
+    ensemble_disagg: Sequence[gc.disagg.EnsembleDisaggResult],
+    metadata_df: Sequence[pd.DataFrame],
+    src_plot_data: Sequence[bytes] = None,
+    eps_plot_data: Sequence[bytes] = None,
+    prefix: str = None,
+) -> Iterator[bytes]:
+    """Streams the disagg download zip file, see zip_stream.iter_zip"""
+    return zip_stream.iter_zip(
+        get_disagg_download_files(
+            ensemble_disagg,
+            metadata_df,
+            src_plot_data=src_plot_data,
+            eps_plot_data=eps_plot_data,
+            prefix=prefix,
+        )
+    )
 
 
-def write_uhs_download_data(
+def get_uhs_download_files(
     uhs_results: Sequence[gc.uhs.EnsembleUHSResult],
     nzs1170p5_results: Sequence[gc.nz_code.nzs1170p5.NZS1170p5Result],
-    out_dir: str,
     prefix: str = None,
-):
+) -> DownloadFiles:
     prefix = "" if prefix is None else f"{prefix}_"
     ensemble = uhs_results[0].ensemble
+    station_name = uhs_results[0].site_info.station_name
 
     # UHS
-    uhs_ffp = Path(out_dir) / f"{prefix}uhs.csv"
     uhs_df = gc.uhs.EnsembleUHSResult.combine_results(uhs_results)
-    uhs_df.to_csv(uhs_ffp, index_label="pSA_periods")
+    yield f"{prefix}uhs.csv", uhs_df.to_csv(index_label="pSA_periods")
 
     # NZS1170.5 - UHS
-    nzs1170p5_uhs_ffp = Path(out_dir) / f"{prefix}nzs1170p5_uhs.csv"
     nzs1170p5_df = gc.nz_code.nzs1170p5.NZS1170p5Result.combine_results(
         nzs1170p5_results
     )
-    nzs1170p5_df.to_csv(nzs1170p5_uhs_ffp, index_label="pSA_periods")
-
-    # Branches - Each RP
-    branches_uhs_ffps = []
-    uhs_branches_plot_ffps = []
-    if uhs_results[0].branch_uhs is not None:
-        for result in uhs_results:
-            branches_uhs_ffp = (
-                Path(out_dir)
-                / f"{prefix}{int(1 / result.branch_uhs[0].exceedance)}_branches_uhs.csv"
-            )
-            uhs_branches_plot_ffp = (
-                Path(out_dir)
-                / f"branches_uhs_plot_rp_{int(1 / result.branch_uhs[0].exceedance)}.png"
-            )
-            branches_uhs_df = gc.uhs.BranchUHSResult.combine_results(result.branch_uhs)
-            branches_uhs_df.to_csv(branches_uhs_ffp, index_label="sa_periods", mode="a")
-            branches_uhs_ffps.append(branches_uhs_ffp)
-            # Creating UHS branches plots
-            gc.plots.plt_uhs_branches(
-                uhs_df,
-                branches_uhs_df,
-                int(1 / result.branch_uhs[0].exceedance),
-                nzs1170p5_uhs=nzs1170p5_df,
-                station_name=uhs_results[0].site_info.station_name,
-                save_file=uhs_branches_plot_ffp,
-            )
-            uhs_branches_plot_ffps.append(uhs_branches_plot_ffp)
+    yield f"{prefix}nzs1170p5_uhs.csv", nzs1170p5_df.to_csv(index_label="pSA_periods")
 
     # Metadata
-    meta_data_ffp = Path(out_dir) / f"{prefix}uhs_metadata.yaml"
-    with meta_data_ffp.open(mode="w") as f:
+    yield (
+        f"{prefix}uhs_metadata.yaml",
         yaml.safe_dump(
             {
                 "ensemble_id": ensemble.name,
-                "station": uhs_results[0].site_info.station_name,
+                "station": station_name,
                 "lon": float(uhs_results[0].site_info.lon),
                 "lat": float(uhs_results[0].site_info.lat),
                 "vs30": float(uhs_results[0].site_info.vs30),
@@ -426,209 +406,314 @@ def write_uhs_download_data(
                     "R": nzs1170p5_results[0].R.to_dict(),
                     "soil_class": nzs1170p5_results[0].soil_class.value,
                 },
-            },
-            f,
-        )
+            }
+        ),
+    )
 
     # Create UHS plot
-    uhs_plot_ffp = Path(out_dir) / f"{prefix}uhs.png"
-    gc.plots.plt_uhs(
-        uhs_df,
-        nzs1170p5_uhs=nzs1170p5_df,
-        station_name=uhs_results[0].site_info.station_name,
-        save_file=uhs_plot_ffp,
+    yield (
+        f"{prefix}uhs.png",
+        _get_plot_data(
+            lambda save_file: gc.plots.plt_uhs(
+                uhs_df,
+                nzs1170p5_uhs=nzs1170p5_df,
+                station_name=station_name,
+                save_file=save_file,
+            ),
+            "uhs_plot",
+            uhs_df,
+            nzs1170p5_df,
+            station_name,
+        ),
     )
 
-    return (
-        uhs_ffp,
-        nzs1170p5_uhs_ffp,
-        meta_data_ffp,
-        uhs_plot_ffp,
-        *branches_uhs_ffps,
-        *uhs_branches_plot_ffps,
-    )
+    # Branches - Each RP
+    if uhs_results[0].branch_uhs is not None:
+        for result in uhs_results:
+            rp = int(1 / result.branch_uhs[0].exceedance)
+            branches_uhs_df = gc.uhs.BranchUHSResult.combine_results(result.branch_uhs)
+            yield (
+                f"{prefix}{rp}_branches_uhs.csv",
+                branches_uhs_df.to_csv(index_label="sa_periods"),
+            )
 
+            # Creating UHS branches plots
+            yield (
+                f"branches_uhs_plot_rp_{rp}.png",
+                _get_plot_data(
+                    lambda save_file: gc.plots.plt_uhs_branches(
+                        uhs_df,
+                        branches_uhs_df,
+                        rp,
+                        nzs1170p5_uhs=nzs1170p5_df,
+                        station_name=station_name,
+                        save_file=save_file,
+                    ),
+                    "uhs_branches_plot",
+                    uhs_df,
+                    branches_uhs_df,
+                    rp,
+                    nzs1170p5_df,
+                    station_name,
+                ),
+            )
 
-def create_uhs_download_zip(
+
+def write_uhs_download_data(
     uhs_results: Sequence[gc.uhs.EnsembleUHSResult],
     nzs1170p5_results: Sequence[gc.nz_code.nzs1170p5.NZS1170p5Result],
-    tmp_dir: str,
+    out_dir: str,
     prefix: str = None,
-):
-    ffps = write_uhs_download_data(uhs_results, nzs1170p5_results, tmp_dir, prefix)
+) -> List[Path]:
+    return zip_stream.write_files(
+        get_uhs_download_files(uhs_results, nzs1170p5_results, prefix=prefix), out_dir
+    )
 
-    # Create zip file
-    zip_ffp = Path(tmp_dir) / f"{prefix}UHS.zip"
-    with zipfile.ZipFile(str(zip_ffp), mode="w") as cur_zip:
-        for cur_ffp in ffps:
-            cur_zip.write(cur_ffp, Path(cur_ffp).name)
 
-    return zip_ffp
+def create_uhs_download_zip(
+    uhs_results: Sequence[gc.uhs.EnsembleUHSResult],
+    nzs1170p5_results: Sequence[gc.nz_code.nzs1170p5.NZS1170p5Result],
+    prefix: str = None,
+) -> Iterator[bytes]:
+    """Streams the UHS download zip file, see zip_stream.iter_zip"""
+    return zip_stream.iter_zip(
+        get_uhs_download_files(uhs_results, nzs1170p5_results, prefix=prefix)
+    )
 
 
-def write_gms_download_data(
+def get_gms_download_files(
     gms_result: gc.gms.GMSResult,
-    out_dir: str,
     disagg_data: gc.disagg.EnsembleDisaggResult,
     prefix: str = None,
-):
-    prefix = "" if prefix is None else f"{prefix}_"
+    missing_waveforms: List = None,
+) -> DownloadFiles:
+    """Note: The waveforms and IM distribution plots can only be
+    written to disk by gmhazard_calc, these are therefore staged in a
+    scratch directory, one record at a time, and removed once read
 
-    # Write the waveforms
-    missing_waveforms = gms_result.gm_dataset.write_waveforms(
-        gms_result.selected_gms_ids, gms_result.site_info, out_dir
-    )
-    if len(missing_waveforms) > 0:
-        print(
-            f"Failed to find waveforms for the following records:\n{missing_waveforms}"
-        )
+    Parameters
+    ----------
+    missing_waveforms: list, optional
+        If specified, the ids of the GMs for which no
+        waveforms could be found are appended to this list,
+        it is complete once the waveforms have been streamed
+    """
+    prefix = "" if prefix is None else f"{prefix}_"
+    missing_waveforms = [] if missing_waveforms is None else missing_waveforms
 
     # Save the relevant raw data
-    gms_result.selected_gms_im_df.to_csv(Path(out_dir) / "selected_gms_im_df.csv")
-    gms_result.selected_gms_metdata_df.to_csv(
-        Path(out_dir) / "selected_gms_metadata_df.csv"
+    yield "selected_gms_im_df.csv", gms_result.selected_gms_im_df.to_csv()
+    yield "selected_gms_metadata_df.csv", gms_result.selected_gms_metdata_df.to_csv()
+    yield "realisations.csv", gms_result.realisations.to_csv()
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        scratch_dir = Path(scratch_dir)
+
+        # Write the waveforms
+        for cur_gm_id in gms_result.selected_gms_ids:
+            missing_waveforms.extend(
+                gms_result.gm_dataset.write_waveforms(
+                    [cur_gm_id], gms_result.site_info, str(scratch_dir)
+                )
+            )
+            for cur_ffp in sorted(scratch_dir.iterdir()):
+                # Read the content before the file is removed, as the
+                # consumer might only use it after resuming this generator
+                cur_content = cur_ffp.read_bytes()
+                cur_ffp.unlink()
+                yield cur_ffp.name, cur_content
+
+        # IM distribution plots
+        gc.plots.plt_gms_im_distribution(gms_result, save_dir=scratch_dir)
+        for cur_ffp in sorted(scratch_dir.iterdir()):
+            yield cur_ffp.name, cur_ffp.read_bytes()
+
+    # Identifies the GMS result for the plot cache
+    gms_hash_values = (
+        "gms_plot",
+        gms_result.ensemble.name,
+        gms_result.site_info,
+        gms_result.IM_j,
+        gms_result.im_j,
+        gms_result.gm_dataset.name,
+        gms_result.selected_gms_im_df,
+        gms_result.realisations,
+        gms_result.cs_param_bounds.contr_df
+        if gms_result.cs_param_bounds is not None
+        else None,
     )
-    gms_result.realisations.to_csv(Path(out_dir) / "realisations.csv")
-
-    # IM distribution plots
-    gc.plots.plt_gms_im_distribution(gms_result, save_dir=Path(out_dir))
 
     # Available Ground Motions plot
     # Don't create it for MixedGroundMotionDataset due
     # the large number of available GMs
     # Todo: Fix this eventually
     if not isinstance(gms_result.gm_dataset, gc.gms.MixedGMDataset):
-        gc.plots.plt_gms_available_gm(
-            gms_result,
-            cs_param_bounds=gms_result.cs_param_bounds,
-            save_file=Path(out_dir) / f"{prefix}gms_available_gm_plot.png",
+        yield (
+            f"{prefix}gms_available_gm_plot.png",
+            _get_plot_data(
+                lambda save_file: gc.plots.plt_gms_available_gm(
+                    gms_result,
+                    cs_param_bounds=gms_result.cs_param_bounds,
+                    save_file=save_file,
+                ),
+                *gms_hash_values,
+                "available_gm",
+            ),
         )
 
     # Pseudo acceleration response spectra plot
-    gc.plots.plt_gms_spectra(
-        gms_result, save_file=Path(out_dir) / f"{prefix}gms_spectra_plot.png",
+    yield (
+        f"{prefix}gms_spectra_plot.png",
+        _get_plot_data(
+            lambda save_file: gc.plots.plt_gms_spectra(
+                gms_result, save_file=save_file
+            ),
+            *gms_hash_values,
+            "spectra",
+        ),
     )
 
     if gms_result.cs_param_bounds is not None:
         # Mw and Rrup distribution plot
-        gc.plots.plt_gms_mw_rrup(
-            gms_result,
-            disagg_data.mean_values,
-            save_file=Path(out_dir) / f"{prefix}gms_mw_rrup_plot.png",
+        yield (
+            f"{prefix}gms_mw_rrup_plot.png",
+            _get_plot_data(
+                lambda save_file: gc.plots.plt_gms_mw_rrup(
+                    gms_result, disagg_data.mean_values, save_file=save_file,
+                ),
+                *gms_hash_values,
+                "mw_rrup",
+                disagg_data.mean_values,
+            ),
         )
 
         # Disagg Distribution plots (Mw Distribution or Rrup distribution)
-        gc.plots.plt_gms_disagg_distribution(
-            gms_result.cs_param_bounds.contr_df.loc[
-                :, ["contribution", "magnitude"]
-            ].set_index("magnitude", drop=True),
-            gms_result,
-            "mag",
-            cs_param_bounds=gms_result.cs_param_bounds,
-            save_file=Path(out_dir) / f"{prefix}gms_mag_disagg_distribution_plot.png",
-        )
-
-        gc.plots.plt_gms_disagg_distribution(
-            gms_result.cs_param_bounds.contr_df.loc[
-                :, ["contribution", "rrup"]
-            ].set_index("rrup", drop=True),
-            gms_result,
-            "rrup",
-            cs_param_bounds=gms_result.cs_param_bounds,
-            save_file=Path(out_dir) / f"{prefix}gms_rrup_disagg_distribution_plot.png",
-        )
+        for cur_param, cur_name in [("magnitude", "mag"), ("rrup", "rrup")]:
+            yield (
+                f"{prefix}gms_{cur_name}_disagg_distribution_plot.png",
+                _get_plot_data(
+                    lambda save_file: gc.plots.plt_gms_disagg_distribution(
+                        gms_result.cs_param_bounds.contr_df.loc[
+                            :, ["contribution", cur_param]
+                        ].set_index(cur_param, drop=True),
+                        gms_result,
+                        cur_name,
+                        cs_param_bounds=gms_result.cs_param_bounds,
+                        save_file=save_file,
+                    ),
+                    *gms_hash_values,
+                    "disagg_distribution",
+                    cur_name,
+                ),
+            )
 
         # Causal Parameters plots
-        gc.plots.plt_gms_causal_param(
-            gms_result,
-            "vs30",
-            cs_param_bounds=gms_result.cs_param_bounds,
-            save_file=Path(out_dir) / f"{prefix}gms_vs30_causal_param_plot.png",
-        )
+        for cur_param in ["vs30", "sf"]:
+            yield (
+                f"{prefix}gms_{cur_param}_causal_param_plot.png",
+                _get_plot_data(
+                    lambda save_file: gc.plots.plt_gms_causal_param(
+                        gms_result,
+                        cur_param,
+                        cs_param_bounds=gms_result.cs_param_bounds,
+                        save_file=save_file,
+                    ),
+                    *gms_hash_values,
+                    "causal_param",
+                    cur_param,
+                ),
+            )
 
-        gc.plots.plt_gms_causal_param(
+
+def write_gms_download_data(
+    gms_result: gc.gms.GMSResult,
+    out_dir: str,
+    disagg_data: gc.disagg.EnsembleDisaggResult,
+    prefix: str = None,
+):
+    missing_waveforms = []
+    ffps = zip_stream.write_files(
+        get_gms_download_files(
             gms_result,
-            "sf",
-            cs_param_bounds=gms_result.cs_param_bounds,
-            save_file=Path(out_dir) / f"{prefix}gms_sf_causal_param_plot.png",
-        )
+            disagg_data,
+            prefix=prefix,
+            missing_waveforms=missing_waveforms,
+        ),
+        out_dir,
+    )
 
-    return os.listdir(out_dir), len(missing_waveforms)
+    return [cur_ffp.name for cur_ffp in ffps], len(missing_waveforms)
 
 
 def create_gms_download_zip(
     gms_result: gc.gms.GMSResult,
-    tmp_dir: str,
     disagg_data: gc.disagg.EnsembleDisaggResult,
     prefix: str = None,
-):
-
-    ffps, missing_waveforms = write_gms_download_data(
-        gms_result, tmp_dir, disagg_data, prefix=prefix,
+    missing_waveforms: List = None,
+) -> Iterator[bytes]:
+    """Streams the GMS download zip file, see zip_stream.iter_zip
+    and get_gms_download_files for missing_waveforms"""
+    return zip_stream.iter_zip(
+        get_gms_download_files(
+            gms_result,
+            disagg_data,
+            prefix=prefix,
+            missing_waveforms=missing_waveforms,
+        )
     )
 
-    zip_ffp = os.path.join(
-        tmp_dir,
+
+def get_gms_download_filename(gms_result: gc.gms.GMSResult, prefix: str = None):
+    """Gets the filename of the GMS download zip file"""
+    prefix = "" if prefix is None else f"{prefix}_"
+    return (
         f"{prefix}{gms_result.ensemble.name}_{gms_result.IM_j.file_format()}"
-        f"_{gms_result.gm_dataset.name}_waveforms.zip",
+        f"_{gms_result.gm_dataset.name}_waveforms.zip"
     )
 
-    with zipfile.ZipFile(zip_ffp, mode="w") as cur_zip:
-        for cur_file in ffps:
-            if cur_file != os.path.basename(zip_ffp):
-                cur_zip.write(
-                    os.path.join(tmp_dir, cur_file), arcname=os.path.basename(cur_file),
-                )
-    return zip_ffp, missing_waveforms
-
 
-def write_scenario_download_data(
+def get_scenario_download_files(
     ensemble_scenario: gc.scenario.EnsembleScenarioResult,
-    rupture_metadata: pd.DataFrame,
-    out_dir: str,
+    rupture_metadata: pd.DataFrame = None,
     prefix: str = None,
-):
-    """Writes the scenario data into 6 different files
+) -> DownloadFiles:
+    """Creates the scenario data as 6 different files
     1 for the main scenario data which stores the
         16th, 50th and 84th percentiles as well as the mu data
     4 for the different tectonic types which stores all
         the scenarios related to that tectonic type and holds
         each models data for that given scenario
     1 for the scenario metadata
-
-    All files are appended to an ffps list to be zipped together
+    and an additional file for the rupture metadata, if specified
 
     Parameters
     ----------
     ensemble_scenario: EnsembleScenarioResult
         ensemble scenario to grab results from
-    rupture_metadata: pd.DataFrame
+    rupture_metadata: pd.DataFrame, optional
         Rupture's metadata
-    out_dir: str
-        The output directory to write the 6 files to
     prefix: str
         The prefix for all the filenames (generally project_id or ensemble_id)
 
-    Returns
+    Yields
     -------
-    List[Path]"""
+    Tuple[str, str]
+        Filename and content of each file"""
     prefix = "" if prefix is None else f"{prefix}_"
     ensemble, site_info = ensemble_scenario.ensemble, ensemble_scenario.site_info
     branch_scenarios = ensemble_scenario.branch_scenarios
 
-    ffps = []
-
     # Ensemble scenario
-    ens_scenario_ffp = Path(out_dir) / f"{prefix}scenarios.csv"
-
     # Combining mu and percentiles dataframes
     mu = ensemble_scenario.mu_data.add_suffix("_mu")
     mu_percentiles_dataframe = mu.join(ensemble_scenario.percentiles)
     mu_percentiles_dataframe = mu_percentiles_dataframe.reindex(
         sorted(mu_percentiles_dataframe.columns), axis=1
     )
-    mu_percentiles_dataframe.to_csv(ens_scenario_ffp, index_label="scenarios", mode="a")
-    ffps.append(ens_scenario_ffp)
+    yield (
+        f"{prefix}scenarios.csv",
+        mu_percentiles_dataframe.to_csv(index_label="scenarios"),
+    )
 
     # Keeps track of the ffps that have been added to the models_df and the models
     model_tec_type_ffps = []
@@ -705,13 +790,12 @@ def write_scenario_download_data(
         ].dropna(axis=1)
         tec_type_df = tec_type_df.reindex(sorted(tec_type_df.columns), axis=1)
 
-        # Writing to csv and saving the ffp
+        # Writing to csv
         if not tec_type_df.empty:
-            tec_type_ffp = (
-                Path(out_dir) / f"{prefix}{tec_type.lower()}_scenario_models.csv"
+            yield (
+                f"{prefix}{tec_type.lower()}_scenario_models.csv",
+                tec_type_df.to_csv(index_label="scenarios"),
             )
-            tec_type_df.to_csv(tec_type_ffp, index_label="scenarios", mode="a")
-            ffps.append(tec_type_ffp)
 
     # Metadata
     metadata = {
@@ -725,40 +809,38 @@ def write_scenario_download_data(
         "im_component": str(ensemble_scenario.ims[0].component),
         "git_version_hash": utils.get_repo_version(),
     }
-    meta_data_ffp = Path(out_dir) / f"{prefix}scenario_metadata.yaml"
-    with open(meta_data_ffp, "w") as f:
-        yaml.safe_dump(metadata, f)
-
-    ffps.append(meta_data_ffp)
+    yield f"{prefix}scenario_metadata.yaml", yaml.safe_dump(metadata)
 
     # Rupture Metadata
-    rupture_metadata_ffp = Path(out_dir) / f"{prefix}scenario_rupture_metadata.csv"
-    rupture_metadata.to_csv(rupture_metadata_ffp)
+    if rupture_metadata is not None:
+        yield f"{prefix}scenario_rupture_metadata.csv", rupture_metadata.to_csv()
 
-    ffps.append(rupture_metadata_ffp)
 
-    return ffps
-
-
-def create_scenario_download_zip(
+def write_scenario_download_data(
     ensemble_scenario: gc.scenario.EnsembleScenarioResult,
     rupture_metadata: pd.DataFrame,
-    tmp_dir: str,
+    out_dir: str,
     prefix: str = None,
-):
-    ffps = write_scenario_download_data(
-        ensemble_scenario, rupture_metadata, out_dir=tmp_dir, prefix=prefix,
+) -> List[Path]:
+    return zip_stream.write_files(
+        get_scenario_download_files(
+            ensemble_scenario, rupture_metadata=rupture_metadata, prefix=prefix
+        ),
+        out_dir,
     )
 
-    # Create zip file
-    logging.debug("Creating zip file")
-    zip_ffp = Path(tmp_dir) / f"{prefix}scenario.zip"
-    with zipfile.ZipFile(zip_ffp, mode="w") as cur_zip:
-        for cur_ffp in ffps:
-            if cur_ffp is not None:
-                cur_zip.write(cur_ffp, cur_ffp.name)
 
-    return zip_ffp
+def create_scenario_download_zip(
+    ensemble_scenario: gc.scenario.EnsembleScenarioResult,
+    rupture_metadata: pd.DataFrame = None,
+    prefix: str = None,
+) -> Iterator[bytes]:
+    """Streams the scenario download zip file, see zip_stream.iter_zip"""
+    return zip_stream.iter_zip(
+        get_scenario_download_files(
+            ensemble_scenario, rupture_metadata=rupture_metadata, prefix=prefix
+        )
+    )
 
 
 def get_available_im_dict(
@@ -114,18 +114,26 @@ def add_metadata_header(
     extra_metadata: str
         Other extra metadata to also include in the header
     """
+    with open(csv_ffp, "w") as f:
+        f.write(get_metadata_header(ensemble, site_info, extra_metadata))
+
+
+def get_metadata_header(
+    ensemble: sc.gm_data.Ensemble,
+    site_info: sc.site.SiteInfo,
+    extra_metadata: str = None,
+) -> str:
+    """Creates the generic metadata header for a csv file,
+    see add_metadata_header for parameter details"""
     metadata_header = (
         f"ensemble_id: {ensemble.name}, station: {site_info.station_name}, "
         f"lon: {site_info.lon}, lat: {site_info.lat}, vs30: {site_info.vs30}\n"
     )
 
-    with open(csv_ffp, "w") as f:
-        f.write(metadata_header)
-
-        if extra_metadata is not None:
-            f.write(extra_metadata)
+    if extra_metadata is not None:
+        metadata_header += extra_metadata
 
-        f.write("\n")
+    return metadata_header + "\n"
 
 
 def get_check_keys(
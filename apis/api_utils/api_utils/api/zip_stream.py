@@ -0,0 +1,198 @@
+"""Streaming zip creation for the download endpoints
+
+Zip archives are written member by member into a non-seekable buffer, which
+is drained after every member, so the response can be sent to the
+user while the remaining files are still being generated.
+"""
+import io
+import shutil
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Iterable, Iterator, Tuple, Union, Callable
+
+import flask
+import pandas as pd
+
+# Size of the chunks used when copying files from disk into the zip stream
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of plots kept in the in-process plot cache
+PLOT_CACHE_SIZE = 256
+
+ZipContent = Union[bytes, str, Path]
+
+_plot_cache = OrderedDict()
+_plot_cache_lock = threading.Lock()
+
+
+class _ChunkBuffer:
+    """Minimal non-seekable file object, which collects the
+    written bytes until they are drained
+
+    As this does not support tell/seek, the ZipFile
+    writes data descriptors after each member instead of
+    going back and updating the local file headers
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(
+    files: Iterable[Tuple[str, ZipContent]], compression: int = zipfile.ZIP_DEFLATED
+) -> Iterator[bytes]:
+    """Creates a zip archive from the given files,
+    yielding the archive bytes as they are produced
+
+    Parameters
+    ----------
+    files: iterable of (arcname, content) pairs
+        Content is either the file data (as bytes or string)
+        or a path to a file on disk, which is copied in chunks
+        Generators are consumed lazily, i.e. each member is only
+        created once all previous members have been sent
+    compression: int, optional
+        The zipfile compression method
+
+    Yields
+    ------
+    bytes
+        The next chunk of the zip archive
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as zip_file:
+        for arcname, content in files:
+            if isinstance(content, Path):
+                with content.open("rb") as src_f, zip_file.open(arcname, "w") as dst_f:
+                    while chunk := src_f.read(FILE_CHUNK_SIZE):
+                        dst_f.write(chunk)
+                        if data := buffer.drain():
+                            yield data
+            else:
+                zip_file.writestr(
+                    arcname, content.encode() if isinstance(content, str) else content
+                )
+
+            if data := buffer.drain():
+                yield data
+
+    # Central directory
+    if data := buffer.drain():
+        yield data
+
+
+def write_zip(files: Iterable[Tuple[str, ZipContent]], zip_ffp: Path) -> Path:
+    """Writes the given files as zip archive to disk, see iter_zip"""
+    with open(zip_ffp, "wb") as f:
+        for chunk in iter_zip(files):
+            f.write(chunk)
+
+    return Path(zip_ffp)
+
+
+def write_files(files: Iterable[Tuple[str, ZipContent]], out_dir: str):
+    """Writes the given files into the specified directory,
+    arcnames with sub-directories are supported
+
+    Returns
+    -------
+    list of Path
+        The file paths of the written files
+    """
+    ffps = []
+    for arcname, content in files:
+        ffp = Path(out_dir) / arcname
+        ffp.parent.mkdir(parents=True, exist_ok=True)
+
+        if isinstance(content, Path):
+            shutil.copyfile(content, ffp)
+        elif isinstance(content, str):
+            ffp.write_text(content)
+        else:
+            ffp.write_bytes(content)
+        ffps.append(ffp)
+
+    return ffps
+
+
+def zip_response(chunks: Iterator[bytes], filename: str) -> flask.Response:
+    """Creates a streamed flask response for the zip archive chunks"""
+    return flask.Response(
+        flask.stream_with_context(chunks),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def get_result_hash(*values) -> str:
+    """Computes a hash for the given values, supports
+    dataframes, series, None and anything with a
+    deterministic string representation"""
+    result_hash = hashlib.sha256()
+    for cur_value in values:
+        if isinstance(cur_value, (pd.DataFrame, pd.Series)):
+            result_hash.update(
+                pd.util.hash_pandas_object(cur_value, index=True).values.tobytes()
+            )
+            result_hash.update(
+                str(
+                    list(cur_value.columns)
+                    if isinstance(cur_value, pd.DataFrame)
+                    else cur_value.name
+                ).encode()
+            )
+        else:
+            result_hash.update(str(cur_value).encode())
+        result_hash.update(b"|")
+
+    return result_hash.hexdigest()
+
+
+def get_cached_plot(key: str, plot_fn: Callable[[io.BytesIO], None]) -> bytes:
+    """Gets the png data of a plot from the plot cache, if
+    the key is not in the cache then the plot is created
+
+    Parameters
+    ----------
+    key: str
+        Cache key, should be created via get_result_hash
+    plot_fn: callable
+        Function that creates the plot, has to
+        take a single parameter, the file object
+        to save the figure to
+
+    Returns
+    -------
+    bytes
+        The png data
+    """
+    with _plot_cache_lock:
+        if key in _plot_cache:
+            _plot_cache.move_to_end(key)
+            return _plot_cache[key]
+
+    buffer = io.BytesIO()
+    plot_fn(buffer)
+    png_data = buffer.getvalue()
+
+    with _plot_cache_lock:
+        _plot_cache[key] = png_data
+        while len(_plot_cache) > PLOT_CACHE_SIZE:
+            _plot_cache.popitem(last=False)
+
+    return png_data
@@ -164,19 +164,16 @@ def download_ens_disagg():
         user_vs30=user_vs30,
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_disagg_download_zip(
+    return au.api.zip_response(
+        au.api.create_disagg_download_zip(
             disagg_data,
             merged_df,
-            tmp_dir,
             src_plot_data=src_plot_data,
             eps_plot_data=eps_plot_data,
             prefix=f"{ensemble.name}",
-        )
-
-        return flask.send_file(
-            zip_ffp, as_attachment=True, attachment_filename=Path(zip_ffp).name
-        )
+        ),
+        f"{ensemble.name}_disagg.zip",
+    )
 
 
 @server.app.route(const.ENSEMBLE_FULL_DISAGG_ENDPOINT, methods=["GET"])
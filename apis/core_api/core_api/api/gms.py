@@ -1,7 +1,5 @@
-import os
 import uuid
 import json
-import tempfile
 from typing import Any, Dict
 
 import flask
@@ -181,21 +179,29 @@ def download_gms_results():
 
     cached_data = cache.get(cache_key)
     if cached_data is not None:
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            # TODO: Find a way to deal with disaggregation data with Core API
-            # For instance, Projects already come with disaggregation data
-            # whereas, Core API, disaggregation data needs to be computed
-            zip_ffp, _ = au.api.create_gms_download_zip(
+        # TODO: Find a way to deal with disaggregation data with Core API
+        # For instance, Projects already come with disaggregation data
+        # whereas, Core API, disaggregation data needs to be computed
+        def iter_zip():
+            missing_waveforms = []
+            yield from au.api.create_gms_download_zip(
                 cached_data.gms_result,
-                tmp_dir,
                 disagg_data=None,
                 prefix=f"{cached_data.ensemble.name}",
+                missing_waveforms=missing_waveforms,
             )
-            return flask.send_file(
-                zip_ffp,
-                as_attachment=True,
-                attachment_filename=os.path.basename(zip_ffp),
-            )
+
+            if len(missing_waveforms) > 0:
+                server.app.logger.info(
+                    f"Failed to find waveforms for simulations: {missing_waveforms}"
+                )
+
+        return au.api.zip_response(
+            iter_zip(),
+            au.api.get_gms_download_filename(
+                cached_data.gms_result, prefix=f"{cached_data.ensemble.name}"
+            ),
+        )
 
     server.app.logger.debug(
         f"No cached data was found for the specified GMS result {cache_key}"
@@ -1,4 +1,3 @@
-import tempfile
 from typing import Tuple, Dict
 
 import flask
@@ -104,8 +103,8 @@ def get_ensemble_hazard():
 def download_ens_hazard():
     """Handles downloading of the hazard data
 
-    The data is computed, saved in a temporary dictionary, zipped and
-    then returned to the user
+    The data is computed (or retrieved from the cache) and
+    streamed to the user as zip file
     """
     server.app.logger.info(
         f"Received request at {const.ENSEMBLE_HAZARD_DOWNLOAD_ENDPOINT}"
@@ -191,20 +190,15 @@ def download_ens_hazard():
             im_component=im.component,
         )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_hazard_download_zip(
+    return au.api.zip_response(
+        au.api.create_hazard_download_zip(
             ensemble_hazard,
-            tmp_dir,
             nzs1170p5_hazard=nzs1170p5_hazard,
             nzta_hazard=nzta_hazard,
             prefix=f"{ensemble.name}",
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{ensemble.name}_{ensemble_hazard.site.station_name}_hazard.zip",
-        )
+        ),
+        f"{ensemble.name}_{ensemble_hazard.site.station_name}_hazard.zip",
+    )
 
 
 def _get_hazard(
@@ -1,4 +1,3 @@
-import tempfile
 from typing import Tuple, List
 
 import flask
@@ -88,8 +87,8 @@ def get_ensemble_scenario():
 def download_ensemble_scenario():
     """Handles downloading of the Scenario data
 
-    The data is computed, saved in a temporary dictionary, zipped and
-    then returned to the user
+    The data is computed (or retrieved from the cache) and
+    streamed to the user as zip file
     """
     server.app.logger.info(
         f"Received request at {const.ENSEMBLE_SCENARIO_DOWNLOAD_ENDPOINT}"
@@ -115,16 +114,12 @@ def download_ensemble_scenario():
         ensemble_id, station, cache, user_vs30=user_vs30, im_component=im_component,
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_scenario_download_zip(
-            ensemble_scenario, tmp_dir, prefix=f"{ensemble.name}",
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{ensemble.name}_{ensemble_scenario.site_info.station_name}_scenario.zip",
-        )
+    return au.api.zip_response(
+        au.api.create_scenario_download_zip(
+            ensemble_scenario, prefix=f"{ensemble.name}"
+        ),
+        f"{ensemble.name}_{ensemble_scenario.site_info.station_name}_scenario.zip",
+    )
 
 
 def _get_scenario(
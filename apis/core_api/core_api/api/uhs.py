@@ -1,4 +1,3 @@
-import tempfile
 from typing import List, Tuple
 
 import flask
@@ -148,16 +147,12 @@ def download_ensemble_uhs():
         ensemble_id, station, exceedances_str, opt_args, cache, user_vs30=user_vs30
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_uhs_download_zip(
-            uhs_results, nzs1170p5_uhs, tmp_dir, prefix=f"{ensemble.name}"
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{ensemble.name}_{site_info.station_name}_UHS.zip",
-        )
+    return au.api.zip_response(
+        au.api.create_uhs_download_zip(
+            uhs_results, nzs1170p5_uhs, prefix=f"{ensemble.name}"
+        ),
+        f"{ensemble.name}_{site_info.station_name}_UHS.zip",
+    )
 
 
 def _get_uhs(
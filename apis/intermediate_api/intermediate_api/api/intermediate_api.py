@@ -57,6 +57,21 @@ def get_auth0_users(is_authenticated):
     raise auth0.AuthError()
 
 
+@app.route(const.INTERMEDIATE_API_PROXY_METRICS_ENDPOINT, methods=["GET"])
+@decorators.get_authentication
+@decorators.endpoint_exception_handler
+def get_proxy_metrics(is_authenticated):
+    """Fetching the latency metrics of the requests proxied
+    to the Core/Project API, these are per process
+    """
+    if is_authenticated and auth0.is_admin():
+        app.logger.info(
+            f"Received request at {const.INTERMEDIATE_API_PROXY_METRICS_ENDPOINT}"
+        )
+        return jsonify(utils.get_route_metrics())
+    raise auth0.AuthError()
+
+
 @app.route(const.INTERMEDIATE_API_ALL_PRIVATE_PROJECTS_ENDPOINT, methods=["GET"])
 @decorators.get_authentication
 @decorators.endpoint_exception_handler
@@ -104,6 +104,8 @@ INTERMEDIATE_API_ALL_PUBLIC_PROJECTS_ENDPOINT = (
     "/intermediateAPI/project/public/get/all"
 )
 
+INTERMEDIATE_API_PROXY_METRICS_ENDPOINT = "/intermediateAPI/proxy/metrics/get"
+
 # Forwarding path to Core API
 # GM data endpoints
 ENSEMBLE_IDS_ENDPOINT = "/api/gm_data/ensemble/ids/get"
@@ -204,3 +206,4 @@ NO_ACCESS_RIGHT_CODE = 403
 CONFLICT_CODE = 409
 INTERNAL_SERVER_ERROR_CODE = 500
 SERVICE_UNAVAILABLE_CODE = 503
+GATEWAY_TIMEOUT_CODE = 504
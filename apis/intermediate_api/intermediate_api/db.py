@@ -1,35 +1,52 @@
-from typing import Dict, List
+import os
+import time
+import threading
+from typing import Dict, List, Callable
 from collections import defaultdict
 
 from intermediate_api import db
 import intermediate_api.models as models
 
+# Time (in seconds) for which permission/project lookups are cached,
+# the cache is per process and cleared on any write to the tables
+PERMISSION_CACHE_TTL = float(os.environ.get("PERMISSION_CACHE_TTL", 30))
 
-def _is_user_in_db(user_id: str):
-    """To check whether the given user_id is in the DB
+_permission_cache = {}
+_permission_cache_lock = threading.Lock()
 
-    Parameters
-    ----------
-    user_id: str
-        Selected user's Auth0 id
-    """
-    return bool(models.User.query.filter_by(user_id=user_id).first())
 
+def _get_cached(key: tuple, load_fn: Callable):
+    """Gets the value for the given key from the permission cache,
+    if it is missing or expired then it is loaded with the load_fn"""
+    with _permission_cache_lock:
+        if (entry := _permission_cache.get(key)) is not None:
+            expiry_time, value = entry
+            if time.monotonic() < expiry_time:
+                return value
+
+    value = load_fn()
+    with _permission_cache_lock:
+        _permission_cache[key] = (time.monotonic() + PERMISSION_CACHE_TTL, value)
 
-def _insert_user(user_id: str):
-    """Insert an user to the MariaDB if not exist
+    return value
+
+
+def clear_permission_cache():
+    """Clears the permission cache, has to be called after
+    any change to the users, projects or permissions tables"""
+    with _permission_cache_lock:
+        _permission_cache.clear()
+
+
+def _is_user_in_db(user_id: str):
+    """To check whether the given user_id is in the DB
 
     Parameters
     ----------
     user_id: str
         Selected user's Auth0 id
     """
-    if not _is_user_in_db(user_id):
-        db.session.add(models.User(user_id))
-        db.session.commit()
-        db.session.flush()
-    else:
-        print(f"User {user_id} already exists")
+    return bool(models.User.query.filter_by(user_id=user_id).first())
 
 
 def is_project_in_db(project_id: str):
@@ -61,91 +78,43 @@ def add_project_to_db(project_id: str, project_name: str, access_level: str):
         db.session.add(models.Project(project_id, project_name, access_level))
         db.session.commit()
         db.session.flush()
+        clear_permission_cache()
     else:
         print(f"Project {project_id} already exists")
 
 
-def _is_permission_in_db(permission_name: str):
-    """To check whether the given permission is in the DB
-
-    Parameters
-    ----------
-    permission_name: str
-        A permission name we use internally.
-        E.g., hazard, hazard:hazard, project...
-    """
-    return bool(
-        models.Auth0Permission.query.filter_by(permission_name=permission_name).first()
-    )
-
-
-def _insert_permission(permission_name: str):
-    """Insert new permission to the MariaDB if not exist
-
-    Parameters
-    ----------
-    permission_name: str
-        A permission name we use internally.
-        E.g., hazard, hazard:hazard, project...
-    """
-    if not _is_permission_in_db(permission_name):
-        db.session.add(models.Auth0Permission(permission_name))
-        db.session.commit()
-        db.session.flush()
-    else:
-        print(f"Project {permission_name} already exists")
-
-
-def _is_user_access_permission_in_db(user_id: str, permission: str):
-    """Check whether there is a row with given user_id & permission
-    
-    Parameters
-    ----------
-    user_id: str
-        Auth0's unique ID
-    permission: str
-        Access permission
-        E.g., Hazard, hazard:hazard, project...
-    """
-    return bool(
-        models.UserPermission.query.filter_by(user_id=user_id)
-        .filter_by(permission_name=permission)
-        .first()
-    )
-
-
-def _insert_user_access_permission(user_id: str, permission: str):
-    """Insert data(page access permission) to the bridging table,
-    users_permissions
+def _insert_permissions(permission_list: List[str]):
+    """Adds any of the given permissions that do not exist
+    yet to the Auth0_Permission table, does not commit
 
     Parameters
     ----------
-    user_id: str
-        Selected user's Auth0 id
-    permission: str
-        Selected user's permission
+    permission_list: list
+        Permission names
         E.g., hazard, hazard:hazard, project...
     """
-    print(
-        f"Check whether the permission is in the DB, if not, add the permission to the DB"
+    existing_permissions = {
+        permission.permission_name
+        for permission in models.Auth0Permission.query.filter(
+            models.Auth0Permission.permission_name.in_(permission_list)
+        ).all()
+    }
+    db.session.add_all(
+        [
+            models.Auth0Permission(permission)
+            for permission in set(permission_list) - existing_permissions
+        ]
     )
-    if not _is_permission_in_db(permission):
-        print(f"{permission} is not in the DB so updating it.")
-        _insert_permission(permission)
-        db.session.flush()
-
-    if not _is_user_access_permission_in_db(user_id, permission):
-        db.session.add(models.UserPermission(user_id, permission))
-        db.session.commit()
-        db.session.flush()
-    else:
-        print(f"{user_id} already has a permission with ${permission}")
 
 
 def update_user_access_permission(user_id: str, permission_list: List):
     """Update/Insert user's assigned permission to a table,
     Users_Permissions
 
+    Syncs the users_permissions table to the token's permissions
+    (trusted source), i.e. outdated permissions are removed and
+    new ones added, all in a single transaction
+
     Parameters
     ----------
     user_id: str
@@ -153,91 +122,35 @@ def update_user_access_permission(user_id: str, permission_list: List):
     permission_list: list
         List of permission that the user has. (From Auth0, trusted source)
     """
-    # Sync the users_permissions table to token's permission (trusted source)
-    # first before we check/update
-    _sync_permissions(user_id, permission_list)
+    permissions = set(permission_list)
+    assigned_permissions = set(_get_user_access_permission(user_id))
 
-    print(f"Check whether the user is in the DB, if not, add the person to the DB")
-    if not _is_user_in_db(user_id):
-        print(f"{user_id} is not in the DB so updating it.")
-        _insert_user(user_id)
-        db.session.flush()
+    removed_permissions = assigned_permissions - permissions
+    new_permissions = permissions - assigned_permissions
+    if not removed_permissions and not new_permissions and _is_user_in_db(user_id):
+        return
 
-    for permission in permission_list:
-        _insert_user_access_permission(user_id, permission)
+    if removed_permissions:
+        models.UserPermission.query.filter_by(user_id=user_id).filter(
+            models.UserPermission.permission_name.in_(removed_permissions)
+        ).delete(synchronize_session=False)
 
+    if not _is_user_in_db(user_id):
+        print(f"{user_id} is not in the DB so updating it.")
+        db.session.add(models.User(user_id))
 
-def _remove_user_access_permission(user_id: str, permission: str):
-    """users_permissions table is outdated, remove illegal permission to update the dashboard
-    
-    Parameters
-    ----------
-    user_id: str
-        Selected user's Auth0 id
-    permission: str
-        Selected user's permission
-        E.g., hazard, hazard:hazard, project...
-    """
-    illegal_permission_row = (
-        models.UserPermission.query.filter_by(user_id=user_id)
-        .filter_by(permission_name=permission)
-        .first()
-    )
-
-    db.session.delete(illegal_permission_row)
-    db.session.commit()
-    db.session.flush()
-
-
-def _insert_user_project_permission(user_id: str, project_id: str):
-    """Insert data(assigned projects) to the bridging table,
-    users_projects
-
-    Parameters
-    ----------
-    user_id: str
-        Selected user's Auth0 id
-    project_id: str
-        Selected project's project code.
-        E.g., gnzl, mac_raes, nzgs_pga, soffitel_qtwn...
-    """
-    # Find a project object with a given project_id to get its project id
-    project_obj = models.Project.query.filter_by(project_id=project_id).first()
-
-    db.session.add(models.UserProject(user_id, project_obj.project_id))
-    db.session.commit()
-    db.session.flush()
-
-
-def _remove_user_project_permission(user_id: str, project_id: str):
-    """Remove data(project) from the bridging table,
-    users_projects
-
-    Parameters
-    ----------
-    user_id: str
-        Selected user's Auth0 id
-    project_id: str
-        Selected project's project code.
-        E.g., gnzl, mac_raes, nzgs_pga, soffitel_qtwn...
-    """
-    try:
-        # Get the project id with the given project name
-        certain_project_id = (
-            models.Project.query.filter_by(project_id=project_id).first().project_id
-        )
-
-        users_projects_row = (
-            models.UserProject.query.filter_by(user_id=user_id)
-            .filter_by(project_id=certain_project_id)
-            .first()
+    if new_permissions:
+        _insert_permissions(list(new_permissions))
+        db.session.flush()
+        db.session.add_all(
+            [
+                models.UserPermission(user_id, permission)
+                for permission in new_permissions
+            ]
         )
 
-        db.session.delete(users_projects_row)
-        db.session.commit()
-        db.session.flush()
-    except:
-        print("Something went wrong.")
+    db.session.commit()
+    clear_permission_cache()
 
 
 def _get_user_access_permission(requested_user_id: str):
@@ -273,16 +186,22 @@ def get_user_project_permission(user_id: str):
     -------
     list of Project IDs from DB (Assigned Projects from Users_Projects table)
     """
-    # Get all projects that are assigned to this user.
-    assigned_project_objs = (
-        models.Project.query.join(models.UserProject)
-        .filter((models.UserProject.user_id == user_id))
-        .all()
-    )
 
-    return {
-        project.project_id: project.project_name for project in assigned_project_objs
-    }
+    def load():
+        # Get all projects that are assigned to this user.
+        assigned_project_objs = (
+            models.Project.query.join(models.UserProject)
+            .filter((models.UserProject.user_id == user_id))
+            .all()
+        )
+
+        return {
+            project.project_id: project.project_name
+            for project in assigned_project_objs
+        }
+
+    # Copy, so the cached value can't be modified by the caller
+    return dict(_get_cached(("user_projects", user_id), load))
 
 
 def get_all_users_project_permissions(auth0_users: Dict):
@@ -357,26 +276,19 @@ def _sync_users_table_with_auth0(auth0_users: Dict):
     auth0_users: Dict
         All the users who are signed up for PSHA app
     """
-    current_user_ids = auth0_users.keys()
-    # Sync Users_Projects table
-    all_users_in_users_projects_table = list(
-        {user.user_id for user in models.UserProject.query.all()}
-    )
-    for user_id in all_users_in_users_projects_table:
-        if user_id not in current_user_ids:
-            models.UserProject.query.filter_by(user_id=user_id).delete()
-            db.session.commit()
-            db.session.flush()
-
-    # Sync Users_Permissions table
-    all_users_in_users_permissions_table = list(
-        {user.user_id for user in models.UserPermission.query.all()}
-    )
-    for user_id in all_users_in_users_permissions_table:
-        if user_id not in current_user_ids:
-            models.UserPermission.query.filter_by(user_id=user_id).delete()
-            db.session.commit()
-            db.session.flush()
+    current_user_ids = list(auth0_users.keys())
+
+    # Sync Users_Projects and Users_Permissions table
+    n_removed = models.UserProject.query.filter(
+        models.UserProject.user_id.notin_(current_user_ids)
+    ).delete(synchronize_session=False)
+    n_removed += models.UserPermission.query.filter(
+        models.UserPermission.user_id.notin_(current_user_ids)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    if n_removed > 0:
+        clear_permission_cache()
 
 
 def allocate_projects_to_user(user_id: str, project_list: List):
@@ -393,11 +305,31 @@ def allocate_projects_to_user(user_id: str, project_list: List):
     print(f"Check whether the user is in the DB, if not, add the person to the DB")
     if not _is_user_in_db(user_id):
         print(f"{user_id} is not in the DB so updating it.")
-        _insert_user(user_id)
+        db.session.add(models.User(user_id))
         db.session.flush()
 
-    for project in project_list:
-        _insert_user_project_permission(user_id, project["value"])
+    # Only add the projects that exist and are not assigned yet
+    project_ids = {project["value"] for project in project_list}
+    valid_project_ids = {
+        project.project_id
+        for project in models.Project.query.filter(
+            models.Project.project_id.in_(project_ids)
+        ).all()
+    }
+    assigned_project_ids = {
+        user_project.project_id
+        for user_project in models.UserProject.query.filter_by(user_id=user_id)
+        .filter(models.UserProject.project_id.in_(project_ids))
+        .all()
+    }
+    db.session.add_all(
+        [
+            models.UserProject(user_id, project_id)
+            for project_id in valid_project_ids - assigned_project_ids
+        ]
+    )
+    db.session.commit()
+    clear_permission_cache()
 
 
 def remove_projects_from_user(user_id: str, project_list: List):
@@ -410,8 +342,13 @@ def remove_projects_from_user(user_id: str, project_list: List):
     project_list: list
         List of projects to remove from the DB
     """
-    for project in project_list:
-        _remove_user_project_permission(user_id, project["value"])
+    models.UserProject.query.filter_by(user_id=user_id).filter(
+        models.UserProject.project_id.in_(
+            [project["value"] for project in project_list]
+        )
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    clear_permission_cache()
 
 
 def get_all_permissions_for_dashboard():
@@ -427,32 +364,6 @@ def get_all_permissions_for_dashboard():
     return [permission.permission_name for permission in all_permission_list]
 
 
-def _sync_permissions(user_id: str, trusted_permission_list: List):
-    """Syncs the user access permissions with the ones from
-    the token (the one source of truth)
-    Filter the users_permissions table to remove outdated permission
-
-    If the access token has the permission of A, B, C but users_permissions table
-    has the permission of A, B, C, D. Then remove the permission D from the
-    users_permissions table as the token is the trusted source of permission.
-
-    Parameters
-    ----------
-    user_id: str
-        It will be used to find a list of permission with the function,
-        _get_all_users_permissions_for_a_user(user_id)
-    trusted_permission_list: list
-        The list to be compared with the list of permission from users_permissions
-        table
-    """
-    # Get a list of permission that are assigned to this user
-    unfiltered_assigned_permission_list = _get_user_access_permission(user_id)
-
-    for permission in unfiltered_assigned_permission_list:
-        if permission not in trusted_permission_list:
-            _remove_user_access_permission(user_id, permission)
-
-
 def write_request_details(user_id: str, action: str, query_dict: Dict):
     """Record users' interaction into the DB
 
@@ -513,10 +424,14 @@ def get_projects(access_level: str = None):
         project_id: project_name
     }
     """
-    projects = (
-        models.Project.query.filter_by(access_level=access_level).all()
-        if access_level is not None
-        else models.Project.query.all()
-    )
 
-    return {project.project_id: project.project_name for project in projects}
+    def load():
+        projects = (
+            models.Project.query.filter_by(access_level=access_level).all()
+            if access_level is not None
+            else models.Project.query.all()
+        )
+
+        return {project.project_id: project.project_name for project in projects}
+
+    return dict(_get_cached(("projects", access_level), load))
@@ -1,7 +1,13 @@
 import os
-import requests
+import time
+import threading
+from typing import Dict
 from datetime import datetime
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 import itsdangerous
 import numpy as np
 import flask
@@ -12,12 +18,28 @@ from itsdangerous.url_safe import URLSafeTimedSerializer
 from intermediate_api import app
 import intermediate_api.db as db
 import intermediate_api.decorators as decorators
+import intermediate_api.constants as const
 
 DOWNLOAD_URL_SECRET_KEY_CORE = os.environ["DOWNLOAD_URL_SECRET_KEY_CORE_API"]
 DOWNLOAD_URL_SECRET_KEY_PROJECT = os.environ["DOWNLOAD_URL_SECRET_KEY_PROJECT_API"]
 DOWNLOAD_URL_VALID_FOR = 24 * 60 * 60
 SALT = os.environ["SALT"]
 
+# Connection pool, timeout and retry settings for the Core/Project API requests
+PROXY_POOL_SIZE = int(os.environ.get("PROXY_POOL_SIZE", 10))
+PROXY_CONNECT_TIMEOUT = float(os.environ.get("PROXY_CONNECT_TIMEOUT", 5))
+PROXY_READ_TIMEOUT = float(os.environ.get("PROXY_READ_TIMEOUT", 600))
+PROXY_MAX_RETRIES = int(os.environ.get("PROXY_MAX_RETRIES", 2))
+PROXY_STREAM_CHUNK_SIZE = 64 * 1024
+
+# One (keep-alive) session per destination API, per process
+_api_sessions = {}
+_api_sessions_lock = threading.Lock()
+
+# Per route latency metrics, per process
+_route_metrics = {}
+_route_metrics_lock = threading.Lock()
+
 
 class ExpiredTokenError(Exception):
     pass
@@ -103,22 +125,125 @@ def proxy_to_api(
                 },
             )
 
-    if methods == "POST":
-        resp = requests.post(
-            api_destination + route, data=data, headers={"Authorization": api_token},
+    session = _get_api_session(api_destination)
+    timeout = (PROXY_CONNECT_TIMEOUT, PROXY_READ_TIMEOUT)
+    stream = content_type == "application/zip"
+
+    start_time = time.perf_counter()
+    try:
+        if methods == "POST":
+            resp = session.post(
+                api_destination + route,
+                data=data,
+                headers={"Authorization": api_token},
+                timeout=timeout,
+            )
+
+        elif methods == "GET":
+            querystring = request.query_string.decode("utf-8")
+
+            if querystring:
+                querystring = "?" + querystring
+
+            resp = session.get(
+                api_destination + route + querystring,
+                headers={"Authorization": api_token},
+                timeout=timeout,
+                stream=stream,
+            )
+    except requests.exceptions.Timeout:
+        app.logger.error(f"Request to {api_destination + route} timed out")
+        _record_route_latency(
+            route, time.perf_counter() - start_time, const.GATEWAY_TIMEOUT_CODE
+        )
+        return flask.Response(status=const.GATEWAY_TIMEOUT_CODE)
+
+    # Pass the body through in chunks, instead of buffering the full download
+    if stream and resp.status_code == const.OK_CODE:
+
+        def generate():
+            try:
+                yield from resp.iter_content(chunk_size=PROXY_STREAM_CHUNK_SIZE)
+            finally:
+                resp.close()
+                _record_route_latency(
+                    route, time.perf_counter() - start_time, resp.status_code
+                )
+
+        headers = {}
+        if "Content-Disposition" in resp.headers:
+            headers["Content-Disposition"] = resp.headers["Content-Disposition"]
+        return flask.Response(
+            flask.stream_with_context(generate()),
+            resp.status_code,
+            mimetype=content_type,
+            headers=headers,
         )
 
-    elif methods == "GET":
-        querystring = request.query_string.decode("utf-8")
+    content = resp.content
+    _record_route_latency(route, time.perf_counter() - start_time, resp.status_code)
+    return flask.Response(content, resp.status_code, mimetype=content_type)
+
+
+def _get_api_session(api_destination: str) -> requests.Session:
+    """Gets the pooled (keep-alive) session for the specified API,
+    GET requests are retried on connection errors and gateway errors"""
+    with _api_sessions_lock:
+        if (session := _api_sessions.get(api_destination)) is None:
+            retry = Retry(
+                total=PROXY_MAX_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=PROXY_POOL_SIZE, max_retries=retry
+            )
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _api_sessions[api_destination] = session
 
-        if querystring:
-            querystring = "?" + querystring
+    return session
 
-        resp = requests.get(
-            api_destination + route + querystring, headers={"Authorization": api_token},
+
+def _record_route_latency(route: str, duration: float, status_code: int):
+    """Adds the latency (in seconds) of a proxied request to the route metrics"""
+    with _route_metrics_lock:
+        metrics = _route_metrics.setdefault(
+            route, {"count": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0}
         )
+        metrics["count"] += 1
+        metrics["errors"] += int(status_code >= const.BAD_REQUEST_CODE)
+        metrics["total_time"] += duration
+        metrics["max_time"] = max(metrics["max_time"], duration)
+
+    app.logger.debug(f"Proxied {route} in {duration:.3f}s, status {status_code}")
+
+
+def get_route_metrics() -> Dict[str, Dict]:
+    """Gets the latency metrics of the proxied routes,
+    note that these are only for the current process
 
-    return flask.Response(resp.content, resp.status_code, mimetype=content_type)
+    Returns
+    -------
+    dictionary in the form of
+    {
+        route: {count, errors, mean_time, max_time}
+    }
+    """
+    with _route_metrics_lock:
+        return {
+            route: {
+                "count": metrics["count"],
+                "errors": metrics["errors"],
+                "mean_time": metrics["total_time"] / metrics["count"],
+                "max_time": metrics["max_time"],
+            }
+            for route, metrics in _route_metrics.items()
+        }
 
 
 def run_project_crosscheck(db_user_projects, public_projects, project_api_projects):
@@ -1,6 +1,3 @@
-import os
-import tempfile
-
 import flask
 from flask_cors import cross_origin
 
@@ -131,15 +128,12 @@ def download_project_disagg():
         rps,
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_disagg_download_zip(
+    return au.api.zip_response(
+        au.api.create_disagg_download_zip(
             ensemble_disagg,
             metadata_df,
-            tmp_dir,
             src_plot_data=src_png_data,
             eps_plot_data=eps_png_data,
-        )
-
-        return flask.send_file(
-            zip_ffp, as_attachment=True, attachment_filename=os.path.basename(zip_ffp)
-        )
+        ),
+        f"{project_id}_{station_id}_disagg.zip",
+    )
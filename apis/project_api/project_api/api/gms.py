@@ -1,6 +1,3 @@
-import os
-import tempfile
-
 import flask
 from flask_cors import cross_origin
 
@@ -86,19 +83,18 @@ def download_gms_results():
     )
     gms_result, cs_param_bounds, disagg_data = utils.load_gms_data(results_dir, gms_id)
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp, missing_waveforms = au.api.create_gms_download_zip(
-            gms_result, tmp_dir, disagg_data
+    def iter_zip():
+        missing_waveforms = []
+        yield from au.api.create_gms_download_zip(
+            gms_result, disagg_data, missing_waveforms=missing_waveforms
         )
 
-        if missing_waveforms > 0:
+        if len(missing_waveforms) > 0:
             server.app.logger.info(
                 f"Failed to find waveforms for simulations: {missing_waveforms}"
             )
 
-        return flask.send_file(
-            zip_ffp, as_attachment=True, attachment_filename=os.path.basename(zip_ffp)
-        )
+    return au.api.zip_response(iter_zip(), au.api.get_gms_download_filename(gms_result))
 
 
 @server.app.route(
@@ -1,5 +1,3 @@
-import tempfile
-
 import flask
 from flask_cors import cross_origin
 
@@ -113,17 +111,10 @@ def download_ens_hazard():
         im,
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_hazard_download_zip(
-            ensemble_hazard,
-            tmp_dir,
-            nzs1170p5_hazard=nzs1170p5_hazard,
-            nzta_hazard=nzta_hazard,
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{ensemble_hazard.ensemble.name}_"
-            f"{ensemble_hazard.site.station_name}_hazard.zip",
-        )
+    return au.api.zip_response(
+        au.api.create_hazard_download_zip(
+            ensemble_hazard, nzs1170p5_hazard=nzs1170p5_hazard, nzta_hazard=nzta_hazard,
+        ),
+        f"{ensemble_hazard.ensemble.name}_"
+        f"{ensemble_hazard.site.station_name}_hazard.zip",
+    )
@@ -1,5 +1,4 @@
 import base64
-import tempfile
 import json
 from pathlib import Path
 
@@ -228,13 +227,7 @@ def download_all(token):
     ]
     server.app.logger.debug(f"Token parameters {project_id}")
 
-    with tempfile.TemporaryDirectory() as zip_tmp_dir:
-        zip_ffp = utils.create_project_zip(
-            server.BASE_PROJECTS_DIR, project_id, version_str, zip_tmp_dir
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{project_id}_data.zip",
-        )
+    return au.api.zip_response(
+        utils.iter_project_zip(server.BASE_PROJECTS_DIR, project_id, version_str),
+        f"{project_id}_data.zip",
+    )
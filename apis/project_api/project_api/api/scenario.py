@@ -1,5 +1,3 @@
-import tempfile
-
 import flask
 from flask_cors import cross_origin
 
@@ -108,13 +106,7 @@ def download_ens_scenario():
         ),
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_scenario_download_zip(
-            ensemble_scenario, rupture_metadata, tmp_dir
-        )
-
-        return flask.send_file(
-            zip_ffp,
-            as_attachment=True,
-            attachment_filename=f"{project_id}_{ensemble_scenario.site_info.station_name}_scenario.zip",
-        )
+    return au.api.zip_response(
+        au.api.create_scenario_download_zip(ensemble_scenario, rupture_metadata),
+        f"{project_id}_{ensemble_scenario.site_info.station_name}_scenario.zip",
+    )
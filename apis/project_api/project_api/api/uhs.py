@@ -1,6 +1,3 @@
-import os
-import tempfile
-
 import flask
 import numpy as np
 from flask_cors import cross_origin
@@ -123,11 +120,7 @@ def download_ensemble_uhs():
         rps,
     )
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        zip_ffp = au.api.create_uhs_download_zip(
-            uhs_results, nzs1170p5_results, tmp_dir
-        )
-
-        return flask.send_file(
-            zip_ffp, as_attachment=True, attachment_filename=os.path.basename(zip_ffp)
-        )
+    return au.api.zip_response(
+        au.api.create_uhs_download_zip(uhs_results, nzs1170p5_results),
+        f"{project_id}_{station_id}_UHS.zip",
+    )
@@ -0,0 +1,114 @@
+"""Project zip tests, these do not require a running API"""
+import zipfile
+import multiprocessing as mp
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import pandas as pd
+
+import gmhazard_calc as gc
+import api_utils as au
+from project_api import utils
+
+PROJECT_ID = "test_project"
+VERSION_STR = "v1"
+STATION_IDS = ["station_1", "station_2", "station_3"]
+GMS_ID = "test_gms"
+GM_IDS = ["gm_1", "gm_2"]
+
+
+class _GMDataset:
+    name = "test_dataset"
+
+    def write_waveforms(self, gm_ids, site_info, output_dir):
+        for cur_gm_id in gm_ids:
+            (Path(output_dir) / f"{cur_gm_id}.000").write_text(
+                f"{site_info}_{cur_gm_id}"
+            )
+        return []
+
+
+def _load_gms_data(station_data_dir: Path, gms_id: str):
+    gms_result = SimpleNamespace(
+        ensemble=SimpleNamespace(name="test_ensemble"),
+        site_info=station_data_dir.name,
+        IM_j="PGA",
+        im_j=0.1,
+        gm_dataset=_GMDataset(),
+        selected_gms_ids=GM_IDS,
+        selected_gms_im_df=pd.DataFrame({"PGA": [0.1, 0.2]}, index=GM_IDS),
+        selected_gms_metdata_df=pd.DataFrame({"mag": [6.0, 7.0]}, index=GM_IDS),
+        realisations=pd.DataFrame({"PGA": [0.1, 0.2]}),
+        cs_param_bounds=None,
+    )
+    return gms_result, None
+
+
+def _plt_gms_im_distribution(gms_result, save_dir: Path):
+    (Path(save_dir) / "gms_im_distribution.png").write_bytes(
+        gms_result.site_info.encode()
+    )
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    """Creates a project (with GMS results only) and mocks the result loading"""
+    for cur_station_id in STATION_IDS:
+        cur_dir = tmp_path / VERSION_STR / PROJECT_ID / "results" / cur_station_id
+        (cur_dir / gc.gms.GMSResult.get_save_dir(GMS_ID)).mkdir(parents=True)
+        (cur_dir / "context_map_plot.png").write_bytes(b"context")
+        (cur_dir / "vs30_map_plot.png").write_bytes(b"vs30")
+
+    project = SimpleNamespace(
+        station_ids=STATION_IDS,
+        gms_params=[SimpleNamespace(id=GMS_ID)],
+        components=[],
+    )
+    monkeypatch.setattr(utils.Project, "load", lambda project_ffp: project)
+    monkeypatch.setattr(utils, "load_gms_data", _load_gms_data)
+    monkeypatch.setattr(gc.plots, "plt_gms_im_distribution", _plt_gms_im_distribution)
+    monkeypatch.setattr(
+        au.api.shared, "_get_plot_data", lambda plot_fn, *hash_values: b"plot"
+    )
+
+    return tmp_path
+
+
+def _read_zip(zip_ffp: Path):
+    with zipfile.ZipFile(zip_ffp) as zip_file:
+        return {
+            cur_name: zip_file.read(cur_name) for cur_name in zip_file.namelist()
+        }, zip_file.namelist()
+
+
+@pytest.mark.skipif(
+    mp.get_start_method() != "fork",
+    reason="The mocked result loading is only inherited by forked workers",
+)
+def test_project_zip_n_procs(project_dir, tmp_path_factory):
+    """The project zip is the same (including file order) when
+    the stations are processed in parallel"""
+    zip_data = []
+    for cur_n_procs in [1, 2]:
+        cur_output_dir = tmp_path_factory.mktemp(f"zip_{cur_n_procs}")
+        utils.create_project_zip(
+            project_dir, PROJECT_ID, VERSION_STR, cur_output_dir, n_procs=cur_n_procs
+        )
+        zip_data.append(_read_zip(cur_output_dir / f"{PROJECT_ID}.zip"))
+
+    (serial_files, serial_names), (parallel_files, parallel_names) = zip_data
+    assert serial_names == parallel_names
+    assert serial_files == parallel_files
+
+    for cur_station_id in STATION_IDS:
+        cur_gms_dir = f"{PROJECT_ID}/{cur_station_id}/{GMS_ID}"
+        for cur_gm_id in GM_IDS:
+            assert (
+                parallel_files[f"{cur_gms_dir}/{cur_gm_id}.000"]
+                == f"{cur_station_id}_{cur_gm_id}".encode()
+            )
+        assert (
+            parallel_files[f"{cur_gms_dir}/gms_im_distribution.png"]
+            == cur_station_id.encode()
+        )
@@ -0,0 +1,56 @@
+"""Result cache tests, these do not require a running API"""
+from functools import lru_cache
+from types import SimpleNamespace
+
+import pandas as pd
+
+from project_api import utils
+
+
+class _Ensemble:
+    def __init__(self):
+        branch = SimpleNamespace(name="branch_a")
+        branch.im_ensemble = SimpleNamespace(ensemble=self, branches=[branch])
+        self.im_ensembles = [branch.im_ensemble]
+
+
+ENSEMBLE = _Ensemble()
+
+
+@lru_cache()
+def _load_hazard_data(results_dir, im, index_version: int):
+    branch = ENSEMBLE.im_ensembles[0].branches[0]
+    ensemble_hazard = SimpleNamespace(
+        ensemble=ENSEMBLE,
+        branch_hazard=[
+            SimpleNamespace(branch=branch, hazard_df=pd.DataFrame({"value": [1.0]}))
+        ],
+        hazard_df=pd.DataFrame({"value": [1.0, 2.0]}),
+    )
+    return ensemble_hazard, None, None
+
+
+def test_load_hazard_data(tmp_path, monkeypatch):
+    """The cached results are copied, apart from the ensemble"""
+    monkeypatch.setattr(utils, "_load_hazard_data", _load_hazard_data)
+
+    ensemble_hazard, nzs1170p5_hazard, nzta_hazard = utils.load_hazard_data(
+        tmp_path, "PGA"
+    )
+    assert nzs1170p5_hazard is None and nzta_hazard is None
+    assert ensemble_hazard.ensemble is ENSEMBLE
+    assert (
+        ensemble_hazard.branch_hazard[0].branch is ENSEMBLE.im_ensembles[0].branches[0]
+    )
+
+    # Modifications are not seen by other requests
+    ensemble_hazard.hazard_df.loc[0, "value"] = -1.0
+    ensemble_hazard.branch_hazard[0].hazard_df.loc[0, "value"] = -1.0
+    ensemble_hazard.branch_hazard.append(None)
+
+    new_ensemble_hazard, _, _ = utils.load_hazard_data(tmp_path, "PGA")
+    assert new_ensemble_hazard is not ensemble_hazard
+    assert _load_hazard_data.cache_info().hits == 1
+    assert new_ensemble_hazard.hazard_df["value"].tolist() == [1.0, 2.0]
+    assert len(new_ensemble_hazard.branch_hazard) == 1
+    assert new_ensemble_hazard.branch_hazard[0].hazard_df["value"].tolist() == [1.0]
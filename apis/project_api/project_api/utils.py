@@ -1,10 +1,9 @@
-import os
-import shutil
-import zipfile
-import tempfile
+import copy
+import json
 import multiprocessing as mp
 from pathlib import Path
-from typing import Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Iterator
 from collections import namedtuple
 from dataclasses import dataclass
 
@@ -17,6 +16,11 @@ import api_utils as au
 import project_gen as pg
 
 
+# Maximum number of decoded results (per result type) and
+# ensembles that are kept in memory, per process
+RESULT_CACHE_SIZE = 64
+ENSEMBLE_CACHE_SIZE = 4
+
 Location = namedtuple("Location", ["name", "vs30_values", "z1p0_values", "z2p5_values"])
 
 
@@ -109,56 +113,24 @@ def get_project(version_str: str, project_id: str) -> Project:
 
 
 def load_hazard_data(results_dir: Path, im: gc.im.IM):
-    ensemble_hazard = gc.hazard.EnsembleHazardResult.load(
-        results_dir / f"hazard_{im.file_format()}"
-    )
-    nzs1170p5_hazard = (
-        gc.nz_code.nzs1170p5.NZS1170p5Result.load(
-            results_dir / f"hazard_nzs1170p5_{im.file_format()}"
+    return tuple(
+        _copy_result(cur_result)
+        for cur_result in _load_hazard_data(
+            results_dir, im, pg.get_index_version(results_dir)
         )
-        if im.im_type == gc.im.IMType.pSA or im.im_type == gc.im.IMType.PGA
-        else None
     )
 
-    nzta_hazard = (
-        gc.nz_code.nzta_2018.NZTAResult.load(results_dir / "hazard_nzta")
-        if im.im_type == gc.im.IMType.pSA or im.im_type == gc.im.IMType.PGA
-        else None
-    )
-
-    return ensemble_hazard, nzs1170p5_hazard, nzta_hazard
-
 
 def load_disagg_data(station_data_dir: Path, im: gc.im.IM, rps: List[int]):
-    ensemble_results, metadata_results = [], []
-    src_pngs, eps_pngs = [], []
-
-    for rp in rps:
-        # No data exists for that RP
-        if not (
-            data_dir := station_data_dir / f"disagg_{im.file_format()}_{rp}"
-        ).exists():
-            print(f"No data available for disagg {im} and RP {rp}, skipping")
-            continue
-
-        ensemble_results.append(gc.disagg.EnsembleDisaggResult.load(data_dir))
-
-        metadata_results.append(
-            pd.read_csv(
-                data_dir / f"disagg_{im.file_format()}_{rp}_metadata.csv",
-                index_col=0,
-            )
-        )
-
-        with open(data_dir / f"disagg_{im.file_format()}_{rp}_src.png", "rb") as f:
-            src_png_data = f.read()
-            src_pngs.append(src_png_data)
-
-        with open(data_dir / f"disagg_{im.file_format()}_{rp}_eps.png", "rb") as f:
-            eps_png_data = f.read()
-            eps_pngs.append(eps_png_data)
-
-    return ensemble_results, metadata_results, src_pngs, eps_pngs
+    ensemble_results, metadata_results, src_pngs, eps_pngs = _load_disagg_data(
+        station_data_dir, im, tuple(rps), pg.get_index_version(station_data_dir)
+    )
+    return (
+        [_copy_result(cur_result) for cur_result in ensemble_results],
+        [cur_df.copy() for cur_df in metadata_results],
+        list(src_pngs),
+        list(eps_pngs),
+    )
 
 
 def load_scenario_rupture_metadata(
@@ -183,7 +155,12 @@ def load_scenario_rupture_metadata(
     data_dir = list(station_data_dir.glob(f"disagg_{ims[0].file_format()}*"))[0]
     metadata_df = pd.read_csv(list(data_dir.glob("*_metadata.csv"))[0], index_col=0)
 
-    ensemble_disagg_result = gc.disagg.EnsembleDisaggResult.load(data_dir)
+    ensemble_disagg_result = gc.disagg.EnsembleDisaggResult.load(
+        data_dir,
+        ensemble=_get_result_ensemble(
+            data_dir / gc.disagg.EnsembleDisaggResult.METADATA_FN
+        ),
+    )
     merged_metadata_df = ensemble_disagg_result.total_contributions_df.merge(
         metadata_df, how="left", left_index=True, right_index=True
     )
@@ -202,40 +179,336 @@ def load_scenario_rupture_metadata(
 
 
 def load_uhs_data(results_dir: Path, rps: List[int]):
-    ensemble = gc.uhs.EnsembleUHSResult.load(results_dir / f"uhs_{rps[0]}").ensemble
+    uhs_results, nzs1170p5_results = _load_uhs_data(
+        results_dir, tuple(rps), pg.get_index_version(results_dir)
+    )
+    return (
+        [_copy_result(cur_result) for cur_result in uhs_results],
+        [_copy_result(cur_result) for cur_result in nzs1170p5_results],
+    )
 
-    uhs_results = [
-        gc.uhs.EnsembleUHSResult.load(results_dir / f"uhs_{rp}", ensemble=ensemble)
-        for rp in rps
-    ]
+
+def load_gms_data(station_data_dir: Path, gms_id: str):
+    return tuple(
+        _copy_result(cur_result)
+        for cur_result in _load_gms_data(
+            station_data_dir, gms_id, pg.get_index_version(station_data_dir)
+        )
+    )
+
+
+def _copy_result(result: Any):
+    """Copies a cached result, so that a request can not modify
+    the cached result that is also used by other requests
+
+    The ensemble (and its IM ensembles & branches) and the GM dataset
+    of the result are not copied, these are loaded once per process
+    and shared by all results"""
+    if result is None:
+        return None
+
+    memo = {}
+    if (ensemble := getattr(result, "ensemble", None)) is not None:
+        memo[id(ensemble)] = ensemble
+        for cur_im_ensemble in ensemble.im_ensembles:
+            memo[id(cur_im_ensemble)] = cur_im_ensemble
+            memo.update(
+                (id(cur_branch), cur_branch) for cur_branch in cur_im_ensemble.branches
+            )
+    if (gm_dataset := getattr(result, "gm_dataset", None)) is not None:
+        memo[id(gm_dataset)] = gm_dataset
+
+    return copy.deepcopy(result, memo)
+
+
+# Decoded results are cached per process, the index version is part of
+# the cache key, so that results are reloaded once project_gen rewrites them.
+# The cached results are only returned as copies, see _copy_result
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _load_hazard_data(results_dir: Path, im: gc.im.IM, index_version: int):
+    result_index = _load_result_index(results_dir, index_version)
+    result_name = gc.hazard.EnsembleHazardResult.get_save_dir(im)
+    data_dir = results_dir / result_name
+    if (
+        binary_ffp := _get_binary_ffp(results_dir, result_name, result_index)
+    ) is not None:
+        ensemble = _get_binary_result_ensemble(binary_ffp)
+        ensemble_hazard = gc.hazard.EnsembleHazardResult.load_binary(
+            binary_ffp, ensemble=ensemble
+        )
+    else:
+        ensemble = _get_result_ensemble(
+            data_dir / gc.hazard.EnsembleHazardResult.METADATA_FN
+        )
+        ensemble_hazard = gc.hazard.EnsembleHazardResult.load(
+            data_dir, ensemble=ensemble
+        )
+    nzs1170p5_hazard = (
+        _load_result(
+            gc.nz_code.nzs1170p5.NZS1170p5Result,
+            results_dir,
+            gc.nz_code.nzs1170p5.NZS1170p5Result.get_save_dir(im, "hazard"),
+            result_index,
+            ensemble,
+        )
+        if im.im_type == gc.im.IMType.pSA or im.im_type == gc.im.IMType.PGA
+        else None
+    )
+
+    nzta_hazard = (
+        _load_result(
+            gc.nz_code.nzta_2018.NZTAResult,
+            results_dir,
+            gc.nz_code.nzta_2018.NZTAResult.get_save_dir(),
+            result_index,
+            ensemble,
+        )
+        if im.im_type == gc.im.IMType.pSA or im.im_type == gc.im.IMType.PGA
+        else None
+    )
+
+    return ensemble_hazard, nzs1170p5_hazard, nzta_hazard
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _load_disagg_data(
+    station_data_dir: Path, im: gc.im.IM, rps: Tuple[int], index_version: int
+):
+    result_index = _load_result_index(station_data_dir, index_version)
+
+    ensemble_results, metadata_results = [], []
+    src_pngs, eps_pngs = [], []
+
+    for rp in rps:
+        # No data exists for that RP
+        data_dir_name = f"disagg_{im.file_format()}_{rp}"
+        if data_dir_name not in result_index.index:
+            print(f"No data available for disagg {im} and RP {rp}, skipping")
+            continue
+
+        data_dir = station_data_dir / data_dir_name
+        if (
+            binary_ffp := _get_binary_ffp(station_data_dir, data_dir_name, result_index)
+        ) is not None:
+            ensemble_results.append(
+                gc.disagg.EnsembleDisaggResult.load_binary(
+                    binary_ffp, ensemble=_get_binary_result_ensemble(binary_ffp)
+                )
+            )
+        else:
+            ensemble_results.append(
+                gc.disagg.EnsembleDisaggResult.load(
+                    data_dir,
+                    ensemble=_get_result_ensemble(
+                        data_dir / gc.disagg.EnsembleDisaggResult.METADATA_FN
+                    ),
+                )
+            )
+
+        metadata_results.append(
+            pd.read_csv(
+                data_dir / f"disagg_{im.file_format()}_{rp}_metadata.csv",
+                index_col=0,
+            )
+        )
+
+        with open(data_dir / f"disagg_{im.file_format()}_{rp}_src.png", "rb") as f:
+            src_png_data = f.read()
+            src_pngs.append(src_png_data)
+
+        with open(data_dir / f"disagg_{im.file_format()}_{rp}_eps.png", "rb") as f:
+            eps_png_data = f.read()
+            eps_pngs.append(eps_png_data)
+
+    return ensemble_results, metadata_results, src_pngs, eps_pngs
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _load_uhs_data(results_dir: Path, rps: Tuple[int], index_version: int):
+    result_index = _load_result_index(results_dir, index_version)
+    ensemble = None
+
+    uhs_results = []
+    for rp in rps:
+        data_dir = results_dir / f"uhs_{rp}"
+        if (
+            binary_ffp := _get_binary_ffp(results_dir, data_dir.name, result_index)
+        ) is not None:
+            ensemble = ensemble or _get_binary_result_ensemble(binary_ffp)
+            uhs_results.append(
+                gc.uhs.EnsembleUHSResult.load_binary(binary_ffp, ensemble=ensemble)
+            )
+        else:
+            ensemble = ensemble or _get_result_ensemble(
+                data_dir / gc.uhs.EnsembleUHSResult.METADATA_FN
+            )
+            uhs_results.append(
+                gc.uhs.EnsembleUHSResult.load(data_dir, ensemble=ensemble)
+            )
 
     nzs1170p5_results = [
-        gc.nz_code.nzs1170p5.NZS1170p5Result.load(cur_dir, ensemble=ensemble)
-        for cur_dir in (results_dir / "uhs_nzs1170p5").glob("uhs_*")
+        _load_result(
+            gc.nz_code.nzs1170p5.NZS1170p5Result,
+            results_dir,
+            cur_name,
+            result_index,
+            ensemble,
+        )
+        for cur_name in pg.get_result_names(result_index, "uhs_nzs1170p5")
     ]
 
     return uhs_results, nzs1170p5_results
 
 
-def load_gms_data(station_data_dir: Path, gms_id: str):
-    data_dir = station_data_dir / f"gms_{gms_id}"
-
-    gms_result = gc.gms.GMSResult.load(data_dir)
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _load_gms_data(station_data_dir: Path, gms_id: str, index_version: int):
+    result_index = _load_result_index(station_data_dir, index_version)
+    data_dir = station_data_dir / gc.gms.GMSResult.get_save_dir(gms_id)
+    if (
+        binary_ffp := _get_binary_ffp(station_data_dir, data_dir.name, result_index)
+    ) is not None:
+        ensemble = _get_binary_result_ensemble(binary_ffp)
+        gms_result = gc.gms.GMSResult.load_binary(binary_ffp, ensemble=ensemble)
+    else:
+        ensemble = _get_result_ensemble(
+            data_dir / gc.gms.GMSResult.VARIABLES_FN, key="ensemble_params"
+        )
+        gms_result = gc.gms.GMSResult.load(data_dir, ensemble=ensemble)
 
+    # The disagg data is not part of the result index
     disagg_data = None
-    if (
-        disagg_data_dir := data_dir
-        / "disagg_data"
-        / f"disagg_{str(gms_result.IM_j).replace('.', 'p')}"
+    disagg_data_dir = (
+        data_dir / "disagg_data" / f"disagg_{str(gms_result.IM_j).replace('.', 'p')}"
         f"_{int(1 / gms_result.exceedance)}"
+    )
+    if (
+        disagg_binary_ffp := gc.result_io.get_binary_ffp(
+            disagg_data_dir.parent, disagg_data_dir.name
+        )
     ).exists():
+        disagg_data = gc.disagg.EnsembleDisaggResult.load_binary(
+            disagg_binary_ffp, ensemble=ensemble
+        )
+    elif disagg_data_dir.exists():
         disagg_data = gc.disagg.EnsembleDisaggResult.load(
-            disagg_data_dir,
+            disagg_data_dir, ensemble=ensemble
         )
 
     return gms_result, disagg_data
 
 
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _load_result_index(data_dir: Path, index_version: int) -> pd.DataFrame:
+    result_index, _ = pg.load_result_index(data_dir)
+    return result_index
+
+
+def _get_binary_ffp(index_dir: Path, result_name: str, result_index: pd.DataFrame):
+    """Gets the binary result file for the specified result (name relative
+    to the directory of the result index), returns None if there is no
+    binary result"""
+    binary_ffp = gc.result_io.get_binary_ffp(index_dir, result_name)
+    return (
+        binary_ffp
+        if binary_ffp.relative_to(index_dir).as_posix() in result_index.index
+        else None
+    )
+
+
+def _load_result(
+    result_cls: type,
+    index_dir: Path,
+    result_name: str,
+    result_index: pd.DataFrame,
+    ensemble: gc.gm_data.Ensemble,
+):
+    """Loads the result from its binary file if there
+    is one, otherwise from its result directory"""
+    if (
+        binary_ffp := _get_binary_ffp(index_dir, result_name, result_index)
+    ) is not None:
+        return result_cls.load_binary(binary_ffp, ensemble=ensemble)
+    return result_cls.load(index_dir / result_name, ensemble=ensemble)
+
+
+def _get_binary_result_ensemble(binary_ffp: Path) -> gc.gm_data.Ensemble:
+    """Gets the (cached) ensemble of a binary result"""
+    with gc.result_io.ResultReader.open(binary_ffp) as reader:
+        return _get_params_ensemble(reader.metadata["ensemble_params"])
+
+
+def _get_result_ensemble(
+    metadata_ffp: Path, key: str = "ensemble_params"
+) -> gc.gm_data.Ensemble:
+    """Gets the (cached) ensemble of a result, based
+    on the ensemble parameters in the result metadata"""
+    with open(metadata_ffp, "r") as f:
+        ensemble_params = json.load(f)[key]
+
+    return _get_params_ensemble(ensemble_params)
+
+
+def _get_params_ensemble(ensemble_params: Dict) -> gc.gm_data.Ensemble:
+    return _load_ensemble(
+        ensemble_params["name"],
+        ensemble_params.get("config_ffp"),
+        ensemble_params["use_im_data_cache"],
+    )
+
+
+@lru_cache(maxsize=ENSEMBLE_CACHE_SIZE)
+def _load_ensemble(
+    name: str, config_ffp: str, use_im_data_cache: bool
+) -> gc.gm_data.Ensemble:
+    return gc.gm_data.Ensemble.load(
+        dict(name=name, config_ffp=config_ffp, use_im_data_cache=use_im_data_cache)
+    )
+
+
+def get_project_zip_files(
+    base_project_dir: Path, project_id: str, version_str: str, n_procs: int = 1,
+) -> Iterator[Tuple[str, au.api.zip_stream.ZipContent]]:
+    """Gets the files of the project download (zip), as (arcname, content)
+    pairs, one station at a time
+
+    With n_procs > 1 the stations are processed in parallel, with
+    the resulting station files returned in station order
+    """
+    project = Project.load(
+        base_project_dir / version_str / project_id / f"{project_id}.yaml"
+    )
+    station_args = [
+        (
+            project,
+            base_project_dir / version_str / project_id / "results" / cur_station_id,
+            project_id,
+            cur_station_id,
+        )
+        for cur_station_id in project.station_ids
+    ]
+
+    if n_procs == 1:
+        for cur_args in station_args:
+            yield from _get_station_files(*cur_args)
+    else:
+        with mp.Pool(n_procs) as p:
+            for cur_station_files in p.imap(_get_station_files_list, station_args):
+                yield from cur_station_files
+
+
+def iter_project_zip(
+    base_project_dir: Path, project_id: str, version_str: str, n_procs: int = 1,
+) -> Iterator[bytes]:
+    """Streams the project as zip file (in download format)"""
+    return au.api.iter_zip(
+        get_project_zip_files(
+            base_project_dir, project_id, version_str, n_procs=n_procs
+        )
+    )
+
+
 def create_project_zip(
     base_project_dir: Path,
     project_id: str,
@@ -244,74 +517,29 @@ def create_project_zip(
     n_procs: int = 1,
 ):
     """Saves the project as zip file (in download format)"""
-    project = Project.load(
-        base_project_dir / version_str / project_id / f"{project_id}.yaml"
+    return au.api.write_zip(
+        get_project_zip_files(
+            base_project_dir, project_id, version_str, n_procs=n_procs
+        ),
+        Path(output_dir) / f"{project_id}.zip",
     )
 
-    with tempfile.TemporaryDirectory() as data_tmp_dir:
-        data_tmp_dir = Path(data_tmp_dir)
-        if n_procs == 1:
-            for cur_station_id in project.station_ids:
-                _write_station(
-                    data_tmp_dir,
-                    project,
-                    base_project_dir
-                    / version_str
-                    / project_id
-                    / "results"
-                    / cur_station_id,
-                    project_id,
-                    cur_station_id,
-                )
-        else:
-            with mp.Pool(n_procs) as p:
-                p.starmap(
-                    _write_station,
-                    [
-                        (
-                            data_tmp_dir,
-                            project,
-                            base_project_dir
-                            / version_str
-                            / project_id
-                            / "results"
-                            / cur_station_id,
-                            project_id,
-                            cur_station_id,
-                        )
-                        for cur_station_id in project.station_ids
-                    ],
-                )
 
-        zip_ffp = Path(output_dir) / f"{project_id}.zip"
-        with zipfile.ZipFile(zip_ffp, mode="w") as cur_zip:
-            for cur_dir, cur_dir_names, cur_file_names in os.walk(
-                data_tmp_dir / project_id
-            ):
-                for cur_filename in cur_file_names:
-                    cur_zip.write(
-                        os.path.join(cur_dir, cur_filename),
-                        os.path.relpath(
-                            os.path.join(cur_dir, cur_filename),
-                            os.path.join(data_tmp_dir / project_id, ".."),
-                        ),
-                    )
-
-            return zip_ffp
-
-
-def _write_station(
-    data_tmp_dir: Path,
-    project: Project,
-    cur_data_dir: Path,
-    project_id: str,
-    station_id: str,
-):
-    output_dir = data_tmp_dir / project_id / station_id
-    output_dir.mkdir(exist_ok=False, parents=True)
+def _get_station_files_list(station_args: Tuple):
+    return list(_get_station_files(*station_args))
+
+
+def _get_station_files(
+    project: Project, cur_data_dir: Path, project_id: str, station_id: str,
+) -> Iterator[Tuple[str, au.api.zip_stream.ZipContent]]:
+    def add_dir(files: Iterator, out_dir: str):
+        for cur_name, cur_content in files:
+            yield f"{out_dir}/{cur_name}", cur_content
+
+    station_dir = f"{project_id}/{station_id}"
 
-    shutil.copy(cur_data_dir / "context_map_plot.png", output_dir)
-    shutil.copy(cur_data_dir / "vs30_map_plot.png", output_dir)
+    yield f"{station_dir}/context_map_plot.png", cur_data_dir / "context_map_plot.png"
+    yield f"{station_dir}/vs30_map_plot.png", cur_data_dir / "vs30_map_plot.png"
 
     for cur_gms_param in project.gms_params:
         if not (
@@ -325,28 +553,32 @@ def _write_station(
             continue
 
         cur_gms_result, cur_disagg_data = load_gms_data(cur_data_dir, cur_gms_param.id)
-
-        (out_dir := output_dir / cur_gms_param.id).mkdir(exist_ok=False)
-        au.api.write_gms_download_data(
-            cur_gms_result,
-            str(out_dir),
-            disagg_data=cur_disagg_data,
+        missing_waveforms = []
+        yield from add_dir(
+            au.api.get_gms_download_files(
+                cur_gms_result, cur_disagg_data, missing_waveforms=missing_waveforms
+            ),
+            f"{station_dir}/{cur_gms_param.id}",
         )
+        if len(missing_waveforms) > 0:
+            print(
+                f"Failed to find waveforms for GMS id {cur_gms_param.id} "
+                f"for the following records:\n{missing_waveforms}"
+            )
 
     for component in project.components:
-        cur_comp_out_dir = output_dir / str(component)
-        cur_comp_out_dir.mkdir(exist_ok=False)
+        cur_comp_out_dir = f"{station_dir}/{component}"
 
         for cur_im in project.ims:
             # Load & write hazard
             ensemble_hazard, nzs1170p5_hazard, nzta_hazard = load_hazard_data(
                 cur_data_dir / str(component), cur_im
             )
-            au.api.write_hazard_download_data(
-                ensemble_hazard,
-                str(cur_comp_out_dir),
-                nzs1170p5_hazard,
-                nzta_hazard=nzta_hazard,
+            yield from add_dir(
+                au.api.get_hazard_download_files(
+                    ensemble_hazard, nzs1170p5_hazard, nzta_hazard=nzta_hazard,
+                ),
+                cur_comp_out_dir,
             )
 
             # Load disagg data
@@ -368,25 +600,30 @@ def _write_station(
             }
 
             # Write disagg data
-            au.api.write_disagg_download_data(
-                ensemble_disagg,
-                metadata_df,
-                str(cur_comp_out_dir),
-                src_plot_data=src_png_data,
-                eps_plot_data=eps_png_data,
+            yield from add_dir(
+                au.api.get_disagg_download_files(
+                    ensemble_disagg,
+                    metadata_df,
+                    src_plot_data=src_png_data,
+                    eps_plot_data=eps_png_data,
+                ),
+                cur_comp_out_dir,
             )
 
-            pd.concat(contributions, axis=1).to_csv(
-                cur_comp_out_dir / f"{cur_im}_disagg_contributions.csv"
+            yield (
+                f"{cur_comp_out_dir}/{cur_im}_disagg_contributions.csv",
+                pd.concat(contributions, axis=1).to_csv(),
             )
-            pd.concat(mean_values, axis=1).to_csv(
-                cur_comp_out_dir / f"{cur_im}_disagg_mean_values.csv"
+            yield (
+                f"{cur_comp_out_dir}/{cur_im}_disagg_mean_values.csv",
+                pd.concat(mean_values, axis=1).to_csv(),
             )
 
         # Load & Write UHS
         uhs_results, nzs1170p5_results = load_uhs_data(
             cur_data_dir / str(component), project.uhs_return_periods
         )
-        au.api.write_uhs_download_data(
-            uhs_results, nzs1170p5_results, str(cur_comp_out_dir)
+        yield from add_dir(
+            au.api.get_uhs_download_files(uhs_results, nzs1170p5_results),
+            cur_comp_out_dir,
         )
@@ -13,6 +13,7 @@ import gmhazard_calc.site_source as site_source
 import gmhazard_calc.uhs as uhs
 import gmhazard_calc.rupture as rupture
 import gmhazard_calc.exceptions as exceptions
+import gmhazard_calc.result_io as result_io
 
 import gmhazard_calc.utils as utils
 import gmhazard_calc.shared as shared
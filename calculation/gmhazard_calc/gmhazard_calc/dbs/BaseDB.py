@@ -88,21 +88,21 @@ class BaseDB:
     def write_attributes(self, **kwargs) -> None:
         """Stores attributes in the root of the h5 db
 
-        Note: string values have to be encoded using np.string_
+        Note: string values have to be encoded using np.bytes_
         """
         # Custom attributes
         for key, value in kwargs.items():
             if value is not None:
                 self._db.root._v_attrs[key] = (
-                    np.string_(value) if isinstance(value, str) else value
+                    np.bytes_(value) if isinstance(value, str) else value
                 )
 
         # Generic attributes
         if not "date_created" in self._db.root._v_attrs._f_list():
             self._db.root._v_attrs.date_created = np.datetime64("now")
-            self._db.root._v_attrs.numpy_version = np.string_(np.__version__)
-            self._db.root._v_attrs.pandas_version = np.string_(pd.__version__)
-            self._db.root._v_attrs.pytables_version = np.string_(tables.__version__)
+            self._db.root._v_attrs.numpy_version = np.bytes_(np.__version__)
+            self._db.root._v_attrs.pandas_version = np.bytes_(pd.__version__)
+            self._db.root._v_attrs.pytables_version = np.bytes_(tables.__version__)
         else:
             self._db.root._v_attrs[
                 f"date_modified_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -122,6 +122,11 @@ class BaseDB:
         mode = "a" if self.writeable else "r"
         self._db = pd.HDFStore(self.db_ffp, mode=mode)
 
+    @check_open
+    def flush(self) -> None:
+        """Flushes all written data to disk"""
+        self._db.flush(fsync=True)
+
     def close(self) -> None:
         """Close opened database"""
         self._db.close()
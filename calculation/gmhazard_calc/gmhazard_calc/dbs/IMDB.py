@@ -1,4 +1,6 @@
+import os
 import itertools
+import threading
 import multiprocessing as mp
 from contextlib import contextmanager
 from typing import Optional, Dict, List, Union, Sequence
@@ -13,23 +15,33 @@ from gmhazard_calc import constants as const
 from gmhazard_calc.im import IM
 from .BaseDB import BaseDB, check_open
 
+# Default maximum size (in bytes) of the IM data kept in
+# memory by the IMDBWriter before it is moved to the staging file
+WRITER_MAX_MEMORY = 2 * 1024 ** 3
 
-def get_station_ruptures(imdb_ffp: str, station: str):
-    """Gets all ruptures names for a specific station
+# Maximum number of (rupture, station) pairs kept in
+# memory when updating the rupture lookup
+LOOKUP_MAX_PAIRS = 50_000_000
+
+# Maximum length of the station names in the rupture lookup log
+LOOKUP_STATION_NAME_SIZE = 64
+
+# Shared IMDB handles registered for the current thread,
+# see IMDB.shared_handles and SharedIMDBHandles.register
+_thread_handles = threading.local()
+
+
+def get_station_rupture_ids(imdb_ffp: str, station: str):
+    """Gets the ids of all ruptures for a specific station
 
     Note I: Only for internal use by the add_rupture_lookup function
     Note II: Has to be outside of the class, as it is called using
     MP which does not support class or static methods
     """
     with IMDB.get_imdb(imdb_ffp) as db:
-        if isinstance(db, IMDBNonParametric):
-            im_data = db.im_data(station)
-            if im_data is not None:
-                return im_data.index.levels[0].values.astype(str)
-        elif isinstance(db, IMDBParametric):
-            im_data = db.im_data(station)
-            if im_data is not None:
-                return im_data.index.values.astype(str)
+        index_values = db._read_im_index(station)
+        if index_values is not None:
+            return np.unique(db._get_row_rupture_ids(index_values))
 
 
 class IMDB(BaseDB):
@@ -38,10 +50,20 @@ class IMDB(BaseDB):
     IMDB_TYPE = "imdb_type"
     IMS_KEY = "ims"
 
+    # Rupture lookup, stored in CSR format, i.e. the stations of the
+    # rupture with id i are stations[station_ix[offsets[i]:offsets[i + 1]]]
+    # Stations written since the last update are recorded in the log
+    LOOKUP_STATIONS_KEY = "/rupture_index/stations"
+    LOOKUP_OFFSETS_KEY = "/rupture_index/offsets"
+    LOOKUP_STATION_IX_KEY = "/rupture_index/station_ix"
+    LOOKUP_LOG_STATIONS_KEY = "/rupture_index/log_stations"
+    LOOKUP_LOG_KEY = "/rupture_index/log"
+
     def __init__(
         self, db_ffp: str, writeable: bool = False, source_type: const.SourceType = None
     ):
         super().__init__(db_ffp, writeable=writeable)
+        self._lookup_cache = {}
 
         # Set the source type
         if source_type is None:
@@ -62,6 +84,10 @@ class IMDB(BaseDB):
     def source_type(self) -> const.SourceType:
         return self._source_type
 
+    def open(self) -> None:
+        super().open()
+        self._lookup_cache = {}
+
     @property
     @check_open
     def imdb_type(self) -> const.IMDataType:
@@ -118,23 +144,33 @@ class IMDB(BaseDB):
             If an im is specified returns a series of format
                 multi index = (station, simulation), value = im value
         """
-        stations = None
-        try:
-            stations = self._db.get(self.get_rupture_lookup_path(rupture_name))
-        except KeyError:
-            pass
+        lookup = self._get_rupture_lookup()
+        if lookup is not None:
+            stations = self.rupture_stations(rupture_name)
+            rupture_id = self._get_rupture_id(rupture_name)
+        else:
+            # Rupture lookup of older IMDBs, one series per rupture
+            stations = None
+            try:
+                stations = self._db.get(self.get_rupture_lookup_path(rupture_name))
+            except KeyError:
+                pass
+            stations = None if stations is None else stations.values.astype(str)
+            rupture_id = None
 
         if stations is None or stations.size == 0:
             return None
-        stations = stations.values.astype(str)
 
-        # Collect the data from each station
+        # Collect the data from each station, with the CSR lookup
+        # only the rows of the rupture are read
         # If this is ever to slow, this can be easily multi-processed using
         # pool and writing a function that just reads the IM data for a
         # given imdb_ffp and station.
         station_data = []
         for cur_station in stations:
-            cur_im_data = self.im_data(cur_station, im=im).loc[rupture_name]
+            cur_im_data = self.im_data(cur_station, im=im, _rupture_id=rupture_id).loc[
+                rupture_name
+            ]
             if im is None and isinstance(cur_im_data, pd.Series):
                 cur_im_data = cur_im_data.to_frame().T
 
@@ -143,6 +179,34 @@ class IMDB(BaseDB):
         df = pd.concat(station_data, axis=0, keys=stations, sort=False)
         return df
 
+    @check_open
+    def rupture_stations(self, rupture_name: str) -> Optional[np.ndarray]:
+        """Gets the stations for which there is data for the specified
+        rupture, using the rupture lookup (only the entries of
+        the rupture are read)
+
+        Returns None if the IMDB has no (CSR) rupture lookup
+        or there is no data for the rupture
+        """
+        lookup = self._get_rupture_lookup()
+        rupture_id = self._get_rupture_id(rupture_name)
+        if lookup is None or rupture_id is None:
+            return None
+
+        stations, offsets = lookup
+        if (
+            rupture_id + 1 >= offsets.size
+            or offsets[rupture_id] == offsets[rupture_id + 1]
+        ):
+            return None
+
+        station_ix = self._db.select(
+            self.LOOKUP_STATION_IX_KEY,
+            start=offsets[rupture_id],
+            stop=offsets[rupture_id + 1],
+        )["station_ix"].values
+        return stations[station_ix]
+
     def rupture_names(self) -> np.ndarray:
         """Returns an array with the names of all the ruptures
         for which there is a data in the IMDB
@@ -157,6 +221,117 @@ class IMDB(BaseDB):
         """
         raise NotImplementedError
 
+    def _get_row_rupture_ids(self, index_values: np.ndarray) -> np.ndarray:
+        """Gets the rupture id of each row of a stored IM dataframe,
+        implemented by the specialisation classes
+        """
+        raise NotImplementedError
+
+    def _get_rupture_id_names(self) -> pd.Series:
+        """Gets the rupture names, index = rupture id,
+        implemented by the specialisation classes
+        """
+        raise NotImplementedError
+
+    def _get_rupture_id(self, rupture_name: str) -> Optional[int]:
+        """Gets the id of the specified rupture, None if there is no such rupture"""
+        if "name_to_id" not in self._lookup_cache:
+            id_names = self._get_rupture_id_names()
+            self._lookup_cache["name_to_id"] = pd.Series(
+                id_names.index.values, index=id_names.values
+            )
+
+        rupture_id = self._lookup_cache["name_to_id"].get(rupture_name)
+        return None if rupture_id is None else int(rupture_id)
+
+    def _get_lookup_rupture_names(self) -> Optional[np.ndarray]:
+        """Gets the names of all ruptures in the rupture
+        lookup, None if the IMDB has no (CSR) rupture lookup"""
+        lookup = self._get_rupture_lookup()
+        if lookup is None:
+            return None
+
+        rupture_ids = np.flatnonzero(np.diff(lookup[1]) > 0)
+        return np.asarray(self._get_rupture_id_names().loc[rupture_ids], dtype=str)
+
+    def _get_rupture_lookup(self):
+        """Gets the stations and offsets of the rupture
+        lookup, None if the IMDB has no (CSR) rupture lookup"""
+        if "lookup" not in self._lookup_cache:
+            try:
+                self._lookup_cache["lookup"] = (
+                    self._db.get(self.LOOKUP_STATIONS_KEY).values.astype(str),
+                    self._db.get(self.LOOKUP_OFFSETS_KEY).values,
+                )
+            except KeyError:
+                self._lookup_cache["lookup"] = None
+
+        return self._lookup_cache["lookup"]
+
+    def _read_im_df(
+        self, station: str, rupture_id: Optional[int] = None
+    ) -> Optional[pd.DataFrame]:
+        """Reads the stored IM dataframe of the specified station,
+        if a rupture id is given then only the rows of the rupture are read"""
+        path = self.get_im_data_path(station)
+        group = self._db.get_node(path)
+        if group is None:
+            return None
+        if rupture_id is None or not self._is_fixed_frame(group):
+            df = self._db.get(path)
+            if rupture_id is not None:
+                df = df.loc[self._get_row_rupture_ids(df.index.values) == rupture_id]
+            return df
+
+        index_values = group.axis1.read()
+        rows = np.flatnonzero(self._get_row_rupture_ids(index_values) == rupture_id)
+        if rows.size == 0:
+            return None
+
+        # Only read the range of rows that contains the rupture
+        start, end = rows[0], rows[-1] + 1
+        blocks = []
+        for ix in range(group._v_attrs.nblocks):
+            values_node = group._f_get_child(f"block{ix}_values")
+            values = (
+                values_node[start:end]
+                if values_node._v_attrs.transposed
+                else values_node[:, start:end].T
+            )
+            blocks.append(
+                pd.DataFrame(
+                    values[rows - start],
+                    columns=_decode(group._f_get_child(f"block{ix}_items").read()),
+                )
+            )
+        df = pd.concat(blocks, axis=1) if len(blocks) > 1 else blocks[0]
+        df = df.loc[:, _decode(group.axis0.read())]
+        df.index = index_values[rows]
+        return df
+
+    def _read_im_index(self, station: str) -> Optional[np.ndarray]:
+        """Reads the index of the stored IM dataframe of the specified station"""
+        path = self.get_im_data_path(station)
+        group = self._db.get_node(path)
+        if group is None:
+            return None
+        if self._is_fixed_frame(group):
+            return group.axis1.read()
+        return self._db.get(path).index.values
+
+    @staticmethod
+    def _is_fixed_frame(group: tables.Group) -> bool:
+        """Checks if the node is a dataframe stored in pandas fixed format
+        with an integer index and numeric values, which allows reading rows"""
+        if getattr(group._v_attrs, "pandas_type", None) != "frame":
+            return False
+        if getattr(group.axis1._v_attrs, "kind", None) != "integer":
+            return False
+        return all(
+            not isinstance(group._f_get_child(f"block{ix}_values"), tables.VLArray)
+            for ix in range(group._v_attrs.nblocks)
+        )
+
     @check_open(writeable=True)
     def write_sites(self, site_df: pd.DataFrame) -> None:
         """Write the sites
@@ -173,6 +348,9 @@ class IMDB(BaseDB):
     def write_im_data(self, station_name: str, im_df: pd.DataFrame) -> None:
         """Writes the IM data for the specified station
 
+        Also records the ruptures of the station in the
+        rupture lookup log, see update_rupture_lookup
+
         Parameters
         ----------
         station_name: str
@@ -180,6 +358,9 @@ class IMDB(BaseDB):
             The dataframe to write
         """
         self._db[self.get_im_data_path(station_name)] = im_df
+        self._log_rupture_ids(
+            station_name, np.unique(self._get_row_rupture_ids(im_df.index.values))
+        )
 
     @check_open(writeable=True)
     def add_im_data(self, station_name: str, im_df: pd.DataFrame) -> None:
@@ -217,11 +398,153 @@ class IMDB(BaseDB):
         self.write_im_data(station_name, cur_df)
 
     @check_open(writeable=True)
-    def write_rupture_lookup(self, rupture_lookup: Dict[str, List[str]]):
-        for cur_rup, cur_stations in rupture_lookup.items():
-            # Save as series (index is meaningless)
-            self._db[self.get_rupture_lookup_path(cur_rup)] = pd.Series(
-                data=cur_stations
+    def update_rupture_lookup(self, max_pairs: int = LOOKUP_MAX_PAIRS) -> None:
+        """Adds the stations recorded in the rupture lookup log (i.e. written
+        since the last update) to the rupture lookup
+
+        The lookup is rebuilt in blocks of ruptures, so that at most
+        max_pairs (rupture, station) pairs are kept in memory
+
+        Parameters
+        ----------
+        max_pairs: int, optional
+        """
+        if self._db.get_node(self.LOOKUP_LOG_STATIONS_KEY) is None:
+            return
+
+        log_stations = self._db.get(self.LOOKUP_LOG_STATIONS_KEY)[
+            "station"
+        ].values.astype(str)
+        lookup = self._get_rupture_lookup()
+        old_stations, old_offsets = (
+            (np.asarray([], dtype=str), np.zeros(1, dtype=np.int64))
+            if lookup is None
+            else lookup
+        )
+        stations = pd.Index(pd.unique(np.concatenate((old_stations, log_stations))))
+
+        # Only the latest log entry of a station is used,
+        # and replaces any existing lookup entries of that station
+        log_valid = np.zeros(log_stations.size, dtype=bool)
+        log_valid[
+            pd.Series(np.arange(log_stations.size), index=log_stations)
+            .groupby(level=0)
+            .last()
+            .values
+        ] = True
+        log_station_ix = stations.get_indexer(log_stations)
+        old_station_valid = ~utils.pandas_isin(old_stations, log_stations)
+
+        def iter_pairs():
+            """Iterates over all (rupture id, station index) pairs"""
+            for start in range(0, old_offsets[-1], max_pairs):
+                station_ix = self._db.select(
+                    self.LOOKUP_STATION_IX_KEY, start=start, stop=start + max_pairs
+                )["station_ix"].values
+                rupture_ids = (
+                    np.searchsorted(
+                        old_offsets,
+                        np.arange(start, start + station_ix.size),
+                        side="right",
+                    )
+                    - 1
+                )
+                mask = old_station_valid[station_ix]
+                yield rupture_ids[mask], station_ix[mask]
+
+            if self._db.get_node(self.LOOKUP_LOG_KEY) is not None:
+                for cur_log in self._db.select(
+                    self.LOOKUP_LOG_KEY, chunksize=max_pairs
+                ):
+                    log_ix = cur_log["log_ix"].values
+                    mask = log_valid[log_ix]
+                    yield cur_log["rupture_id"].values[mask], log_station_ix[
+                        log_ix[mask]
+                    ]
+
+        # Number of stations per rupture
+        counts = np.zeros(old_offsets.size - 1, dtype=np.int64)
+        for rupture_ids, _ in iter_pairs():
+            cur_counts = np.bincount(rupture_ids, minlength=counts.size)
+            cur_counts[: counts.size] += counts
+            counts = cur_counts
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        # Write the station indices in blocks of ruptures
+        new_station_ix_key = f"{self.LOOKUP_STATION_IX_KEY}_new"
+        block_start = 0
+        while block_start < counts.size:
+            block_end = max(
+                block_start + 1,
+                np.searchsorted(offsets, offsets[block_start] + max_pairs, side="right")
+                - 1,
+            )
+            block_rupture_ids, block_station_ix = [], []
+            for rupture_ids, station_ix in iter_pairs():
+                mask = (rupture_ids >= block_start) & (rupture_ids < block_end)
+                block_rupture_ids.append(rupture_ids[mask])
+                block_station_ix.append(station_ix[mask])
+
+            block_station_ix = np.concatenate(block_station_ix)
+            sort_ind = np.lexsort((block_station_ix, np.concatenate(block_rupture_ids)))
+            self._db.append(
+                new_station_ix_key,
+                pd.DataFrame(
+                    {"station_ix": block_station_ix[sort_ind].astype(np.int64)}
+                ),
+                format="table",
+                index=False,
+            )
+            block_start = block_end
+
+        for cur_key in [
+            self.LOOKUP_STATIONS_KEY,
+            self.LOOKUP_OFFSETS_KEY,
+            self.LOOKUP_STATION_IX_KEY,
+            self.LOOKUP_LOG_STATIONS_KEY,
+            self.LOOKUP_LOG_KEY,
+        ]:
+            if self._db.get_node(cur_key) is not None:
+                self._db.remove(cur_key)
+
+        self._db.put(self.LOOKUP_STATIONS_KEY, pd.Series(stations.values))
+        self._db.put(self.LOOKUP_OFFSETS_KEY, pd.Series(offsets))
+        if self._db.get_node(new_station_ix_key) is not None:
+            self._db.get_node(new_station_ix_key)._f_rename(
+                self.LOOKUP_STATION_IX_KEY.rsplit("/", 1)[-1]
+            )
+        else:
+            self._db.append(
+                self.LOOKUP_STATION_IX_KEY,
+                pd.DataFrame({"station_ix": np.zeros(0, dtype=np.int64)}),
+                format="table",
+                index=False,
+            )
+        self._lookup_cache = {}
+
+    def _log_rupture_ids(self, station_name: str, rupture_ids: np.ndarray):
+        """Records the ruptures of the station in the rupture lookup log"""
+        log_stations = self._db.get_node(self.LOOKUP_LOG_STATIONS_KEY)
+        log_ix = 0 if log_stations is None else log_stations.table.nrows
+
+        self._db.append(
+            self.LOOKUP_LOG_STATIONS_KEY,
+            pd.DataFrame({"station": [station_name]}),
+            format="table",
+            min_itemsize={"station": LOOKUP_STATION_NAME_SIZE},
+            index=False,
+        )
+        if rupture_ids.size > 0:
+            self._db.append(
+                self.LOOKUP_LOG_KEY,
+                pd.DataFrame(
+                    {
+                        "log_ix": np.full(rupture_ids.size, log_ix, dtype=np.int64),
+                        "rupture_id": rupture_ids.astype(np.int64),
+                    }
+                ),
+                format="table",
+                index=False,
             )
 
     @staticmethod
@@ -231,7 +554,8 @@ class IMDB(BaseDB):
 
     @staticmethod
     def get_rupture_lookup_path(rupture_name: str) -> str:
-        """Returns the database path for the event based data links"""
+        """Returns the database path for the event based data links
+        of older IMDBs, see update_rupture_lookup for the current format"""
         return f"/rupture_lookup/rupture_{rupture_name}"
 
     @staticmethod
@@ -239,7 +563,42 @@ class IMDB(BaseDB):
     def get_imdb(imdb_ffp: str, writeable: bool = False) -> "IMDB":
         """Creates a contextmanager for the appropriate IMDB instance,
         based on the im_db_type
+
+        If shared handles are registered for the current thread (see
+        shared_handles), then read-only IMDBs are taken from these and
+        the current thread has exclusive access to the IMDB
+        for the duration of the context
         """
+        shared_handles = getattr(_thread_handles, "handles", None)
+        if not writeable and shared_handles is not None:
+            with shared_handles.get_imdb(imdb_ffp) as imdb:
+                yield imdb
+            return
+
+        imdb = IMDB._create(imdb_ffp, writeable=writeable)
+        imdb.open()
+        yield imdb
+        imdb.close()
+
+    @staticmethod
+    @contextmanager
+    def shared_handles() -> "SharedIMDBHandles":
+        """Creates a set of shared handles, i.e. IMDBs that are opened
+        (read-only) only once and shared between the threads the handles
+        are registered for (see SharedIMDBHandles.register), instead of
+        being opened for every access via get_imdb.
+        Threads without registered handles are not affected.
+        The IMDBs are closed when the context exits.
+        """
+        handles = SharedIMDBHandles()
+        try:
+            yield handles
+        finally:
+            handles.close()
+
+    @staticmethod
+    def _create(imdb_ffp: str, writeable: bool = False) -> "IMDB":
+        """Creates the appropriate IMDB instance, based on the im_db_type"""
         with h5py.File(imdb_ffp, mode="r") as h:
             imdb_type = h.attrs[IMDB.IMDB_TYPE].decode()
         if imdb_type == const.IMDataType.non_parametric.value:
@@ -253,17 +612,16 @@ class IMDB(BaseDB):
                 f"{const.IMDataType.non_parametric.value} or "
                 f"{const.IMDataType.parametric.value}"
             )
-        imdb.open()
-        yield imdb
-        imdb.close()
+        return imdb
 
     @staticmethod
     def add_rupture_lookup(db_ffp: str, n_procs: int):
         """
         Add a lookup to get stations for each rupture and to get the full list of rupture names
-        WARNING:
-        Could take a long time for large DB's such as a Distributed Seismicity db
-        Should only be used for a Fault db
+
+        The ruptures of each station are recorded when the station is written,
+        so this only has to read the stations that are not yet part of the lookup
+        (i.e. ones written by an older version), and then updates the lookup.
 
         Parameters
         ----------
@@ -273,41 +631,51 @@ class IMDB(BaseDB):
             Number of processes to use
         """
         with IMDB.get_imdb(db_ffp) as db:
-            stations = db.sites().index.values
-
-        # Iterate over all stations and get all ruptures for each station
-        print("Collecting ruptures for each station")
-        with mp.Pool(n_procs) as pool:
-            result = pool.starmap(
-                get_station_ruptures,
-                [(db_ffp, cur_station) for cur_station in stations],
+            lookup = db._get_rupture_lookup()
+            known_stations = [] if lookup is None else list(lookup[0])
+            if db._db.get_node(IMDB.LOOKUP_LOG_STATIONS_KEY) is not None:
+                known_stations.extend(
+                    db._db.get(IMDB.LOOKUP_LOG_STATIONS_KEY)["station"].values
+                )
+            stations = np.setdiff1d(
+                np.asarray(db.get_stored_stations(), dtype=str),
+                np.asarray(known_stations, dtype=str),
             )
 
-        # Invert the result, i.e. for each rupture get all stations
-        print("Computing rupture lookup")
-        rupture_lookup = {}
-        for cur_station, cur_ruptures in zip(stations, result):
-            if cur_ruptures is not None:
-                for cur_rup in cur_ruptures:
-                    if cur_rup in rupture_lookup.keys():
-                        rupture_lookup[cur_rup].append(cur_station)
-                    else:
-                        rupture_lookup[cur_rup] = [cur_station]
+        # Get all ruptures for each of the missing stations
+        result = []
+        if stations.size > 0:
+            print(f"Collecting ruptures for {stations.size} stations")
+            with mp.Pool(n_procs) as pool:
+                result = pool.starmap(
+                    get_station_rupture_ids,
+                    [(db_ffp, cur_station) for cur_station in stations],
+                )
 
-        # Write
-        print("Writing")
+        print("Computing rupture lookup")
         with IMDB.get_imdb(db_ffp, writeable=True) as db:
-            db.write_rupture_lookup(rupture_lookup)
-            db.write_attributes(
-                rupture_names=np.asarray(list(rupture_lookup.keys()), dtype=str)
-            )
+            for cur_station, cur_rupture_ids in zip(stations, result):
+                if cur_rupture_ids is not None:
+                    db._log_rupture_ids(cur_station, cur_rupture_ids)
+            db.update_rupture_lookup()
+
+    @staticmethod
+    def repack(db_ffp: str):
+        """Repacks the specified db, i.e. copies all nodes into a new
+        file, which removes the unused space left by removed nodes
+
+        Note: The db must not be open while repacking
+        """
+        tmp_ffp = f"{db_ffp}.repack"
+        tables.copy_file(db_ffp, tmp_ffp, overwrite=True)
+        os.replace(tmp_ffp, db_ffp)
 
     @check_open
     def get_stored_stations(self):
         return [
-            stat.split("im_data/")[-1].replace("station_", "")
+            stat.split("im_data/")[-1].replace("station_", "", 1)
             for stat in self._db.keys()
-            if stat not in ["/simulations", "/sites"]
+            if stat.startswith("/im_data/")
         ]
 
 
@@ -333,6 +701,13 @@ class IMDBParametric(IMDB):
         """
         return self._db["ruptures"]
 
+    def _get_row_rupture_ids(self, index_values: np.ndarray) -> np.ndarray:
+        """The index of the IM data are the rupture ids"""
+        return np.asarray(index_values)
+
+    def _get_rupture_id_names(self) -> pd.Series:
+        return self._ruptures()["rupture_name"].astype(str)
+
     @check_open()
     def rupture_names(self) -> Union[None, np.ndarray]:
         """Returns an array with the names of all the ruptures
@@ -341,6 +716,10 @@ class IMDBParametric(IMDB):
         Note: This will only return values if rupture based
         lookup has been added to this IMDB, otherwise returns None
         """
+        rupture_names = self._get_lookup_rupture_names()
+        if rupture_names is not None:
+            return rupture_names
+
         return self.get_attributes().get("rupture_names")
 
     @check_open
@@ -349,6 +728,7 @@ class IMDBParametric(IMDB):
         station: str,
         im: Optional[Union[List[IM], IM]] = None,
         incl_within_between_sigma: bool = False,
+        _rupture_id: Optional[int] = None,
     ) -> Union[pd.DataFrame, pd.Series, None]:
         """Retrieves the IM parameters for the ruptures
         at a specific site
@@ -373,20 +753,16 @@ class IMDBParametric(IMDB):
                 columns = [im_1_mean, im_1_std, im_2_mean, im_2_std...]
             Returns None if there is no data in the IMDB for that station
         """
-        df = None
-        try:
-            df = self._db.get(self.get_im_data_path(station))
-        except KeyError:
-            pass
-
+        df = self._read_im_df(station, rupture_id=_rupture_id)
         if df is None or df.size == 0:
             return None
 
         # Performance hack, replaces the following line of code
         # df.index = self._ruptures().loc[df.index.values, "rupture_name"].values.astype(str)
         with tables.open_file(self.db_ffp, mode="r") as fileh:
+            # PyTables requires writeable coordinate arrays
             lookup_indices = fileh.root.ruptures.table.read_coordinates(
-                df.index.values
+                np.array(df.index.values, dtype=np.int64)
             )["values_block_0"].reshape(-1)
             df.index = (
                 fileh.root.ruptures.meta.values_block_0.meta.table.read_coordinates(
@@ -441,6 +817,7 @@ class IMDBParametric(IMDB):
         """Writes the rupture names to the database"""
         if utils.check_names(["rupture_name"], rupture_df.columns.values):
             self._db.put("ruptures", rupture_df, format="t")
+            self._lookup_cache = {}
 
 
 class IMDBNonParametric(IMDB):
@@ -467,19 +844,37 @@ class IMDBNonParametric(IMDB):
         """Returns an array with the names of all the ruptures
         for which there is a data in the IMDB
         """
+        ruptures = self._get_lookup_rupture_names()
+        if ruptures is not None:
+            return ruptures
+
         ruptures = self.get_attributes().get("rupture_names")
         if ruptures is not None:
             return ruptures
 
-        return np.unique(
-            np.array(
-                list(
-                    np.char.split(
-                        self.simulations().values.astype(str), "_", maxsplit=1
-                    )
-                )
-            )[:, 0]
-        )
+        return self._get_rupture_id_names().values
+
+    def _get_simulation_rupture_ids(self):
+        """Gets the rupture names (i.e. the fault names, sorted) and
+        the rupture id of each simulation (by simulation index)"""
+        if "simulation_rupture_ids" not in self._lookup_cache:
+            simulations = self.simulations()
+            rupture_names, sim_rupture_ids = np.unique(
+                [cur_sim.split("_", 1)[0] for cur_sim in simulations.values],
+                return_inverse=True,
+            )
+            ids = np.full(simulations.index.values.max() + 1, -1, dtype=np.int64)
+            ids[simulations.index.values] = sim_rupture_ids
+            self._lookup_cache["simulation_rupture_ids"] = (rupture_names, ids)
+
+        return self._lookup_cache["simulation_rupture_ids"]
+
+    def _get_row_rupture_ids(self, index_values: np.ndarray) -> np.ndarray:
+        """The index of the IM data are the simulation indices"""
+        return self._get_simulation_rupture_ids()[1][index_values]
+
+    def _get_rupture_id_names(self) -> pd.Series:
+        return pd.Series(self._get_simulation_rupture_ids()[0])
 
     @check_open
     def simulations(self) -> pd.Series:
@@ -494,7 +889,10 @@ class IMDBNonParametric(IMDB):
 
     @check_open
     def im_data(
-        self, station: str, im: Optional[Union[Sequence[str], str]] = None
+        self,
+        station: str,
+        im: Optional[Union[Sequence[str], str]] = None,
+        _rupture_id: Optional[int] = None,
     ) -> Union[None, pd.DataFrame, pd.Series]:
         """Retrieves the IM dataframe for all
         simulations for the specified station
@@ -514,19 +912,14 @@ class IMDBNonParametric(IMDB):
             Otherwise Returns dataframe with the specified format
                 multi index = (rupture, simulation), columns = IM values
         """
-        df = None
-        try:
-            df = self._db.get(self.get_im_data_path(station))
-        except KeyError:
-            pass
-
+        df = self._read_im_df(station, rupture_id=_rupture_id)
         if df is None or df.size == 0:
             return None
 
         simulations = self.simulations()
         df["realisation"] = simulations.iloc[df.index.values].values
         df["fault"] = np.stack(
-            np.char.split(df.realisation.values.astype(str), "_", maxsplit=1)
+            np.char.split(np.asarray(df.realisation.values, dtype=str), "_", maxsplit=1)
         )[:, 0]
         df.sort_values(["fault", "realisation"], inplace=True)
 
@@ -542,8 +935,8 @@ class IMDBNonParametric(IMDB):
     def write_attributes(self, **kwargs):
         """Writes the relevant parametric attributes in the database"""
         super().write_attributes(
-            imdb_type=np.string_(self.imdb_type.value),
-            source_type=np.string_(self._source_type.value),
+            imdb_type=np.bytes_(self.imdb_type.value),
+            source_type=np.bytes_(self._source_type.value),
             **kwargs,
         )
 
@@ -561,3 +954,174 @@ class IMDBNonParametric(IMDB):
                 "Has to be a pd.Series with id as index and simulation names as values"
             )
         self._db["simulations"] = simulations
+        self._lookup_cache = {}
+
+
+class IMDBWriter:
+    """Bulk writer for the IM data of an IMDB
+
+    Instead of rewriting the IM data of a station every time
+    columns are added (see IMDB.add_im_data), the data is accumulated
+    per station and each station is written exactly once when
+    finalise is called. Once the accumulated data exceeds max_memory
+    it is moved to a staging file (without any rewrites) and
+    read back during finalise.
+
+    Parameters
+    ----------
+    imdb: IMDB
+        The IMDB to write to, is opened
+        in write mode when finalising
+    max_memory: int, optional
+        Maximum size (in bytes) of the IM data kept in memory
+    staging_ffp: str, optional
+        The staging file to use, defaults to
+        the IMDB file path with a .staging suffix
+    """
+
+    def __init__(
+        self, imdb: IMDB, max_memory: int = WRITER_MAX_MEMORY, staging_ffp: str = None
+    ):
+        self.imdb = imdb
+        self.max_memory = max_memory
+        self.staging_ffp = (
+            f"{imdb.db_ffp}.staging" if staging_ffp is None else staging_ffp
+        )
+
+        # Per station list of the IM data blocks, either the
+        # dataframe or the key of the block in the staging file
+        self._blocks: Dict[str, List[Union[pd.DataFrame, str]]] = {}
+        self._memory = 0
+
+        self._staging = None
+        self._n_staged = 0
+
+    @property
+    def stations(self) -> List[str]:
+        """The stations for which there is IM data"""
+        return list(self._blocks.keys())
+
+    def add_im_data(self, station_name: str, im_df: pd.DataFrame) -> None:
+        """Adds the given IM df (i.e. columns) to the IM data of the
+        specified station, nothing is written to the IMDB until finalise
+
+        Parameters
+        ----------
+        station_name: str
+        im_df: pd.DataFrame
+            The dataframe to add
+        """
+        self._blocks.setdefault(station_name, []).append(im_df)
+        self._memory += im_df.memory_usage(index=True).sum()
+
+        if self._memory > self.max_memory:
+            self._stage()
+
+    def finalise(self, repack: bool = False) -> None:
+        """Writes the IM data of all stations to the IMDB,
+        existing IM data of a station is kept (and the new
+        columns added), same as for IMDB.add_im_data
+
+        Parameters
+        ----------
+        repack: bool, optional
+            If set, then the IMDB is repacked after writing
+        """
+        with self.imdb as imdb:
+            for cur_station, cur_blocks in self._blocks.items():
+                im_dfs = [
+                    self._staging[cur_block]
+                    if isinstance(cur_block, str)
+                    else cur_block
+                    for cur_block in cur_blocks
+                ]
+
+                # Keep any existing data
+                path = imdb.get_im_data_path(cur_station)
+                try:
+                    im_dfs.insert(0, imdb._db[path])
+                    imdb._db.remove(path)
+                except KeyError:
+                    pass
+
+                # Check that the number of ruptures match
+                assert all(
+                    cur_df.shape[0] == im_dfs[0].shape[0] for cur_df in im_dfs
+                )
+                imdb.write_im_data(
+                    cur_station,
+                    pd.concat(im_dfs, axis=1) if len(im_dfs) > 1 else im_dfs[0],
+                )
+
+        self.close()
+        if repack:
+            IMDB.repack(self.imdb.db_ffp)
+
+    def close(self) -> None:
+        """Discards all IM data that has not been written"""
+        self._blocks, self._memory = {}, 0
+        if self._staging is not None:
+            self._staging.close()
+            self._staging = None
+            os.remove(self.staging_ffp)
+
+    def _stage(self):
+        """Moves all IM data blocks that are currently in memory to the staging file"""
+        if self._staging is None:
+            self._staging = pd.HDFStore(self.staging_ffp, mode="w")
+
+        for cur_blocks in self._blocks.values():
+            for ix, cur_block in enumerate(cur_blocks):
+                if isinstance(cur_block, pd.DataFrame):
+                    key = f"/block_{self._n_staged}"
+                    self._staging.put(key, cur_block)
+                    cur_blocks[ix] = key
+                    self._n_staged += 1
+
+        self._memory = 0
+
+
+class SharedIMDBHandles:
+    """Read-only IMDBs that are kept open and shared between the
+    threads the handles are registered for, see IMDB.shared_handles
+
+    Note: Access to the IMDBs is serialised, as PyTables is not thread-safe
+    """
+
+    def __init__(self):
+        self._imdbs: Dict[str, IMDB] = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def get_imdb(self, imdb_ffp: str) -> IMDB:
+        """Gets the shared IMDB, the current thread has exclusive
+        access to the IMDB for the duration of the context"""
+        with self._lock:
+            if imdb_ffp not in self._imdbs:
+                imdb = IMDB._create(imdb_ffp)
+                imdb.open()
+                self._imdbs[imdb_ffp] = imdb
+            yield self._imdbs[imdb_ffp]
+
+    @contextmanager
+    def register(self):
+        """Registers the handles for the current thread for the duration of
+        the context, i.e. IMDB.get_imdb uses the shared IMDBs"""
+        prev_handles = getattr(_thread_handles, "handles", None)
+        _thread_handles.handles = self
+        try:
+            yield
+        finally:
+            _thread_handles.handles = prev_handles
+
+    def close(self) -> None:
+        """Closes all shared IMDBs"""
+        with self._lock:
+            for cur_imdb in self._imdbs.values():
+                cur_imdb.close()
+            self._imdbs = {}
+
+
+def _decode(values: np.ndarray) -> np.ndarray:
+    """Decodes the (column) names read from the db"""
+    return values.astype(str) if values.dtype.kind == "S" else values
@@ -0,0 +1,169 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .IMDB import IMDB
+
+# Maximum number of simulation IM pools kept in memory
+MAX_N_POOLS = 32
+
+# Simulation IM pools, see get_simulation_im_pool
+_pools = OrderedDict()
+_POOLS_LOCK = threading.Lock()
+
+
+class SimulationIMPool:
+    """The IM values of all simulations for a single station,
+    from a set of (mutually exclusive) non-parametric IMDBs
+
+    The IMDB data is decoded once, i.e. the IM (and log IM) values
+    are held as arrays and the realisations are mapped to fault codes
+
+    Use get_simulation_im_pool to get the (memoised) shared pool
+
+    Parameters
+    ----------
+    station_name: str
+    im_df: dataframe
+        The IM values, format as returned by IMDBNonParametric.im_data,
+        i.e. multi index = (fault, realisation), columns = IMs
+    """
+
+    def __init__(self, station_name: str, im_df: pd.DataFrame):
+        self.station_name = station_name
+
+        im_df = im_df.sort_index()
+        self.simulations = im_df.index.get_level_values("realisation").values.astype(
+            str
+        )
+        self.faults, self.fault_codes = np.unique(
+            im_df.index.get_level_values("fault").values.astype(str),
+            return_inverse=True,
+        )
+
+        self.ims = im_df.columns.values.astype(str)
+        self.im_values = im_df.values.astype(float)
+        self._im_ind = pd.Index(self.ims)
+        self._lnIM_values = None
+
+    @property
+    def lnIM_values(self) -> np.ndarray:
+        if self._lnIM_values is None:
+            self._lnIM_values = np.log(self.im_values)
+        return self._lnIM_values
+
+    @property
+    def simulation_faults(self) -> np.ndarray:
+        """The fault of each simulation"""
+        return self.faults[self.fault_codes]
+
+    def get_im_df(
+        self,
+        IMs: Union[str, Sequence[str]] = None,
+        log: bool = False,
+        fault_index: bool = True,
+    ) -> Union[pd.DataFrame, pd.Series]:
+        """Gets the IM values as dataframe
+
+        Parameters
+        ----------
+        IMs: string or list of strings, optional
+            The IMs of interest, defaults to all IMs
+            If a single IM is specified, then a series is returned
+        log: bool, optional
+            If True, then the log IM values are returned
+        fault_index: bool, optional
+            If True, the index is a multi index (fault, realisation),
+            otherwise just the realisations
+
+        Returns
+        -------
+        dataframe or series
+        """
+        values = self.lnIM_values if log else self.im_values
+        index = (
+            pd.MultiIndex.from_arrays(
+                [self.simulation_faults, self.simulations],
+                names=["fault", "realisation"],
+            )
+            if fault_index
+            else pd.Index(self.simulations, name="realisation")
+        )
+
+        if IMs is None:
+            return pd.DataFrame(data=values.copy(), index=index, columns=self.ims)
+        if isinstance(IMs, str):
+            return pd.Series(
+                data=values[:, self._im_ind.get_loc(IMs)].copy(), index=index, name=IMs
+            )
+
+        IMs = list(IMs)
+        im_ind = self._im_ind.get_indexer(IMs)
+        if np.any(im_ind < 0):
+            raise KeyError(
+                f"IMs {np.asarray(IMs)[im_ind < 0]} are not available "
+                f"for station {self.station_name}"
+            )
+        return pd.DataFrame(data=values[:, im_ind], index=index, columns=IMs)
+
+    @classmethod
+    def from_imdbs(
+        cls, imdb_ffps: Sequence[str], station_name: str
+    ) -> Optional["SimulationIMPool"]:
+        """Loads the pool from the specified IMDBs,
+        returns None if there is no data for the station"""
+        im_dfs = []
+        for cur_imdb_ffp in imdb_ffps:
+            with IMDB.get_imdb(cur_imdb_ffp) as imdb:
+                cur_im_df = imdb.im_data(station_name)
+                if cur_im_df is not None:
+                    im_dfs.append(cur_im_df)
+
+        if len(im_dfs) == 0:
+            return None
+        return cls(station_name, pd.concat(im_dfs) if len(im_dfs) > 1 else im_dfs[0])
+
+
+def get_simulation_im_pool(
+    imdb_ffps: Union[str, Sequence[str]], station_name: str
+) -> Optional[SimulationIMPool]:
+    """Gets the simulation IM pool for the specified
+    non-parametric IMDBs and station
+
+    Pools are memoised (for the most recently used MAX_N_POOLS
+    IMDBs/station combinations), therefore the returned pool
+    must not be modified
+    The memoisation is based on the modification time of the IMDBs,
+    i.e. the pool is reloaded if any of the IMDBs have changed
+
+    Returns None if there is no data for the station
+    """
+    imdb_ffps = (imdb_ffps,) if isinstance(imdb_ffps, str) else tuple(imdb_ffps)
+    key = (
+        tuple((cur_ffp, os.stat(cur_ffp).st_mtime_ns) for cur_ffp in imdb_ffps),
+        station_name,
+    )
+
+    with _POOLS_LOCK:
+        if key in _pools:
+            _pools.move_to_end(key)
+            return _pools[key]
+
+    pool = SimulationIMPool.from_imdbs(imdb_ffps, station_name)
+
+    with _POOLS_LOCK:
+        _pools[key] = pool
+        if len(_pools) > MAX_N_POOLS:
+            _pools.popitem(last=False)
+
+    return pool
+
+
+def clear_simulation_im_pools():
+    """Removes all memoised simulation IM pools"""
+    with _POOLS_LOCK:
+        _pools.clear()
@@ -169,7 +169,7 @@ class SiteSourceDB(BaseDB):
         Stores attributes into the ssd h5
         """
         super().write_attributes(
-            source_type=np.string_(self._source_type.value),
+            source_type=np.bytes_(self._source_type.value),
             erf_fname=erf_fname,
             station_list_fname=station_list_fname,
             **kwargs,
@@ -1,2 +1,14 @@
-from .IMDB import IMDB, IMDBParametric, IMDBNonParametric
-from .SiteSourceDB import SiteSourceDB
\ No newline at end of file
+from .IMDB import (
+    IMDB,
+    IMDBParametric,
+    IMDBNonParametric,
+    IMDBWriter,
+    SharedIMDBHandles,
+    WRITER_MAX_MEMORY,
+)
+from .SiteSourceDB import SiteSourceDB
+from .SimulationIMPool import (
+    SimulationIMPool,
+    get_simulation_im_pool,
+    clear_simulation_im_pools,
+)
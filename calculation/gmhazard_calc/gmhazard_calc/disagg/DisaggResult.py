@@ -9,6 +9,7 @@ import pandas as pd
 from gmhazard_calc import site
 from gmhazard_calc import gm_data
 from gmhazard_calc import rupture
+from gmhazard_calc import result_io
 from gmhazard_calc.im import IM
 
 
@@ -183,6 +184,23 @@ class BaseDisaggResult:
         if self.mean_values is not None:
             self.mean_values.to_csv(data_dir / self.MEAN_VALUES_FN)
 
+    def _write_binary(self, writer: result_io.ResultWriter, metadata: Dict = None):
+        metadata = metadata if metadata is not None else {}
+        writer.set_metadata(
+            {
+                **{
+                    "im": str(self.im),
+                    "im_value": self.im_value,
+                    "exceedance": self.exceedance,
+                    "site": self.site_info.to_dict(),
+                },
+                **metadata,
+            }
+        )
+        writer.write("fault_disagg", self.fault_disagg_id)
+        writer.write("ds_disagg", self.ds_disagg_id)
+        writer.write("mean_values", self.mean_values)
+
 
 class BranchDisaggResult(BaseDisaggResult):
     """Exactly the same as DataDisagg, except that it
@@ -264,6 +282,36 @@ class EnsembleDisaggResult(BaseDisaggResult):
 
         return save_dir
 
+    def save_binary(self, base_dir: Path, compression: str = None) -> Path:
+        """Saves an EnsembleDisaggResult as single binary
+        file in the specified base directory
+
+        Parameters
+        ----------
+        base_dir: Path
+        compression: str, optional
+            The compression to use, e.g. gzip or lzf, see result_io
+
+        Returns
+        -------
+        Path
+            The file path of the saved result
+        """
+        ffp = result_io.get_binary_ffp(
+            base_dir,
+            self.get_save_dir(
+                self.im, exceedance=self.exceedance, im_value=self.im_value
+            ),
+        )
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            self._write_binary(
+                writer, {"ensemble_params": self.ensemble.get_save_params()}
+            )
+
+        return ffp
+
     @staticmethod
     def get_save_dir(im: IM, exceedance: float = None, im_value: float = None):
         assert (
@@ -272,7 +320,7 @@ class EnsembleDisaggResult(BaseDisaggResult):
         return f"disagg_{im.file_format()}_{int(1 / exceedance) if exceedance is not None else str(im_value).replace('.', 'p')}"
 
     @classmethod
-    def load(cls, data_dir: Path):
+    def load(cls, data_dir: Path, ensemble: gm_data.Ensemble = None):
         with open(data_dir / cls.METADATA_FN, "r") as f:
             metadata = json.load(f)
 
@@ -283,7 +331,8 @@ class EnsembleDisaggResult(BaseDisaggResult):
         )
 
         im = IM.from_str(metadata["im"])
-        ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
+        if ensemble is None:
+            ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
 
         site_info = site.SiteInfo.load(data_dir)
         fault_disagg = pd.read_csv(data_dir / cls.FAULT_DISAGG_FN, index_col=0)
@@ -306,6 +355,41 @@ class EnsembleDisaggResult(BaseDisaggResult):
             mean_values=mean_values,
         )
 
+    @classmethod
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        """Loads an EnsembleDisaggResult from a binary result file"""
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            return cls._read_binary(reader, ensemble=ensemble)
+
+    @classmethod
+    def _read_binary(
+        cls, reader: result_io.ResultReader, ensemble: gm_data.Ensemble = None
+    ):
+        metadata = reader.metadata
+
+        im = IM.from_str(metadata["im"])
+        if ensemble is None:
+            ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
+
+        fault_disagg = reader.read("fault_disagg")
+        ds_disagg = reader.read("ds_disagg")
+        fault_disagg.index = rupture.rupture_id_to_ix(
+            ensemble, fault_disagg.index.values
+        )
+        ds_disagg.index = rupture.rupture_id_to_ix(ensemble, ds_disagg.index.values)
+
+        return cls(
+            fault_disagg,
+            ds_disagg,
+            site.SiteInfo.from_dict(metadata["site"]),
+            im,
+            metadata["im_value"],
+            ensemble,
+            ensemble.get_im_ensemble(im.im_type),
+            exceedance=metadata["exceedance"],
+            mean_values=reader.read("mean_values"),
+        )
+
 
 class DisaggGridData:
     """
@@ -419,15 +503,7 @@ class DisaggGridData:
         }
 
     def save(self, base_dir: Path, save_disagg_data: bool = False):
-        name_tag = (
-            int(1 / self.disagg_data.exceedance)
-            if self.disagg_data.exceedance is not None
-            else self.disagg_data.im_value
-        )
-        save_dir = (
-            base_dir
-            / f"disagg_grid_data_{self.disagg_data.im.file_format()}_{name_tag}"
-        )
+        save_dir = base_dir / self.get_save_dir()
         save_dir.mkdir(exist_ok=False, parents=False)
 
         np.save(str(save_dir / self.FLT_BIN_CONTR_FN), self.flt_bin_contr)
@@ -500,3 +576,98 @@ class DisaggGridData:
             metadata["rrup_n_bins"],
             metadata["rrup_bin_size"],
         )
+
+    def get_save_dir(self):
+        name_tag = (
+            int(1 / self.disagg_data.exceedance)
+            if self.disagg_data.exceedance is not None
+            else self.disagg_data.im_value
+        )
+        return f"disagg_grid_data_{self.disagg_data.im.file_format()}_{name_tag}"
+
+    def save_binary(
+        self, base_dir: Path, save_disagg_data: bool = False, compression: str = None
+    ) -> Path:
+        """Saves the DisaggGridData as single binary file in the
+        specified base directory, the eps bins are stored as arrays
+
+        Parameters
+        ----------
+        base_dir: Path
+        save_disagg_data: bool, optional
+            If set, then the disagg data is saved
+            as part of the binary file
+        compression: str, optional
+            The compression to use, e.g. gzip or lzf, see result_io
+
+        Returns
+        -------
+        Path
+            The file path of the saved result
+        """
+        ffp = result_io.get_binary_ffp(base_dir, self.get_save_dir())
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            writer.set_metadata(
+                {
+                    "rrup_bin_size": self.rrup_bin_size,
+                    "rrup_n_bins": self.rrup_n_bins,
+                    "rrup_min": self.rrup_min,
+                    "mag_bin_size": self.mag_bin_size,
+                    "mag_n_bins": self.mag_n_bins,
+                    "mag_min": self.mag_min,
+                }
+            )
+            writer.write("flt_bin_contr", self.flt_bin_contr)
+            writer.write("ds_bin_contr", self.ds_bin_contr)
+            writer.write("eps_bins", np.asarray(self.eps_bins, dtype=float))
+            writer.write("eps_bin_contr", np.stack(self.eps_bin_contr))
+            writer.write("mag_edges", self.mag_edges)
+            writer.write("rrup_edges", self.rrup_edges)
+
+            if save_disagg_data:
+                ensemble_params = self.disagg_data._ensemble.get_save_params()
+                self.disagg_data._write_binary(
+                    writer.group("disagg_data"), {"ensemble_params": ensemble_params}
+                )
+
+        return ffp
+
+    @classmethod
+    def load_binary(
+        cls,
+        ffp: Path,
+        disagg_data: BaseDisaggResult = None,
+        ensemble: gm_data.Ensemble = None,
+    ):
+        """Loads the DisaggGridData from a binary result file,
+        the disagg data has to be provided if it
+        was not saved as part of the binary file"""
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            if disagg_data is None:
+                if "disagg_data" not in reader:
+                    raise Exception(
+                        "Either the DisaggResult has to be saved with the DisaggGridData, "
+                        "or has to be provided."
+                    )
+                disagg_data = EnsembleDisaggResult._read_binary(
+                    reader.group("disagg_data"), ensemble=ensemble
+                )
+
+            metadata = reader.metadata
+            return cls(
+                disagg_data,
+                reader.read("flt_bin_contr"),
+                reader.read("ds_bin_contr"),
+                [tuple(cur_bin) for cur_bin in reader.read("eps_bins").tolist()],
+                list(reader.read("eps_bin_contr")),
+                reader.read("mag_edges"),
+                reader.read("rrup_edges"),
+                metadata["mag_min"],
+                metadata["mag_n_bins"],
+                metadata["mag_bin_size"],
+                metadata["rrup_min"],
+                metadata["rrup_n_bins"],
+                metadata["rrup_bin_size"],
+            )
@@ -1,4 +1,6 @@
-from typing import Union, Optional, Dict
+import functools
+from concurrent.futures import Executor
+from typing import Union, Optional, Dict, Tuple
 
 import pandas as pd
 import numpy as np
@@ -24,6 +26,7 @@ def run_ensemble_disagg(
     im_value: Optional[float] = None,
     calc_mean_values: Optional[bool] = False,
     hazard_result: Optional[hazard.EnsembleHazardResult] = None,
+    executor: Optional[Executor] = None,
 ) -> EnsembleDisaggResult:
     """Computes the ensemble disagg, combining the different
     branches as per equations (9) and (10) from
@@ -41,6 +44,9 @@ def run_ensemble_disagg(
         or the im_value parameter has to be given
     im_value: float, optional
         Compute disagg at this im value
+    executor: Executor, optional
+        Executor used for computing the disagg of the
+        branches in parallel, see run_branches_disagg
 
     Returns
     -------
@@ -57,7 +63,9 @@ def run_ensemble_disagg(
     )
 
     # Compute disagg for each branch
-    branches_dict = run_branches_disagg(im_ensemble, site_info, im, None, im_value)
+    branches_dict = run_branches_disagg(
+        im_ensemble, site_info, im, None, im_value, executor=executor
+    )
 
     fault_disagg_df = pd.DataFrame(
         {
@@ -193,6 +201,7 @@ def run_branches_disagg(
     im: IM,
     exceedance: Optional[float] = None,
     im_value: Optional[float] = None,
+    executor: Optional[Executor] = None,
 ) -> Dict[str, BranchDisaggResult]:
     """Computes the disagg for every branch in the ensemble
 
@@ -206,6 +215,11 @@ def run_branches_disagg(
         or the im_value parameter has to be given
     im_value: float, optional
         Compute disagg at this im value
+    executor: Executor, optional
+        If specified, then the disagg of the branches is computed in
+        parallel, either a thread pool or a process pool created via
+        shared.create_branch_executor
+        The result is the same (incl. order) as for the serial computation
 
     Returns
     -------
@@ -219,13 +233,58 @@ def run_branches_disagg(
     )
 
     # Compute disagg for each branch
-    branch_disagg_dict = {}
-    for branch_name, branch in im_ensemble.branches_dict.items():
-        branch_disagg_dict[branch_name] = run_branch_disagg(
-            im_ensemble, branch, site_info, im, None, im_value
-        )
+    return shared.map_branches(
+        im_ensemble,
+        functools.partial(
+            run_branch_disagg,
+            im_ensemble,
+            site_info=site_info,
+            im=im,
+            im_value=im_value,
+        ),
+        executor=executor,
+        worker_fn=functools.partial(
+            _run_worker_branch_disagg,
+            im_ensemble.ensemble.name,
+            site_info,
+            im,
+            im_value,
+        ),
+        from_worker_fn=lambda branch, result: BranchDisaggResult(
+            *[
+                cur_disagg.set_axis(
+                    rupture.rupture_id_to_ix(
+                        im_ensemble.ensemble, cur_disagg.index.values.astype(str)
+                    )
+                )
+                for cur_disagg in result
+            ],
+            site_info,
+            im,
+            im_value,
+            branch,
+        ),
+    )
 
-    return branch_disagg_dict
+
+def _run_worker_branch_disagg(
+    ensemble_name: str,
+    site_info: site.SiteInfo,
+    im: IM,
+    im_value: float,
+    branch_name: str,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Computes the disagg of the branch in a branch worker process
+
+    Only returns the fault and ds disagg, with the rupture ids as
+    index, as the rupture_id_ix values are specific to the
+    ensemble instance of the worker process
+    """
+    branch = shared.get_worker_branch(ensemble_name, im.im_type, branch_name)
+    result = run_branch_disagg(
+        branch.im_ensemble, branch, site_info, im, im_value=im_value
+    )
+    return result.fault_disagg_id, result.ds_disagg_id
 
 
 def run_branch_disagg(
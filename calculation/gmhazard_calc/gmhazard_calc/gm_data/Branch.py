@@ -101,8 +101,9 @@ class Branch:
     def flt_rupture_df(self):
         """Standardised dataframe that contains
         information for fault ruptures, format:
-        index = rupture id
-        columns = [rupture name, annual recurrence probability, magnitude]
+        index = rupture id ix
+        columns = [rupture name (categorical), annual recurrence probability,
+        magnitude (float32), rupture type (categorical), tectonic type (categorical)]
         """
         if self._flt_rupture_df is None:
             self._flt_rupture_df = self.im_ensemble.ensemble.load_erf(
@@ -115,8 +116,9 @@ class Branch:
     def ds_rupture_df(self):
         """Standardised dataframe that contains
         information for ds ruptures, format:
-        index = rupture id
-        columns = [rupture name, annual recurrence probability, magnitude]
+        index = rupture id ix
+        columns = [rupture name (categorical), annual recurrence probability,
+        magnitude (float32), rupture type (categorical), location (categorical)]
         """
         if self._ds_rupture_df is None:
             self._ds_rupture_df = self.im_ensemble.ensemble.load_erf(
@@ -132,7 +134,9 @@ class Branch:
         index = rupture id ix
         columns = [rupture name, annual recurrence probability, magnitude, tectonic type]
         """
-        return pd.concat([self.flt_rupture_df, self.ds_rupture_df], sort=True)
+        return rupture.concat_compact_rupture_dfs(
+            [self.flt_rupture_df, self.ds_rupture_df]
+        )
 
     @property
     def rupture_df_id(self) -> pd.DataFrame:
@@ -141,12 +145,8 @@ class Branch:
         index = rupture id
         columns = [rupture name, annual recurrence probability, magnitude, tectonic type]
         """
-        rupture_df = pd.concat([self.flt_rupture_df, self.ds_rupture_df], sort=True)
-        return rupture_df.set_index(
-            rupture.rupture_id_ix_to_rupture_id(
-                self.im_ensemble.ensemble, rupture_df.index.values
-            ),
-            inplace=False,
+        return rupture.compact_rupture_df_to_id(
+            self.im_ensemble.ensemble, self.rupture_df_id_ix
         )
 
     @property
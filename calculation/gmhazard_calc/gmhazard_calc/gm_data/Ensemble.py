@@ -1,7 +1,8 @@
 import os
 import hashlib
+import threading
 from glob import glob
-from typing import Dict, TYPE_CHECKING
+from typing import Dict, Optional, TYPE_CHECKING
 
 import yaml
 import numpy as np
@@ -13,6 +14,7 @@ from gmhazard_calc import constants as const
 from gmhazard_calc.im import IM, IMType, IMComponent
 from qcore.formats import load_station_file
 from .IMEnsemble import IMEnsemble
+from .EnsembleManifest import EnsembleManifest, IMDBMetadata
 
 if TYPE_CHECKING:
     from gmhazard_calc.site.SiteInfo import SiteInfo
@@ -37,6 +39,10 @@ def load_data():
 
 ensemble_dict = load_data()
 
+# Lock for updating the rupture id lookup of an ensemble,
+# required when the branches are evaluated in multiple threads
+_RUPTURE_ID_LOCK = threading.Lock()
+
 
 class Ensemble:
     """Represents an ensemble of DataSets.
@@ -57,14 +63,22 @@ class Ensemble:
     lazy_loading: bool, optional
         If True, then properties such as stations, IMs and rupture_df are
         loaded lazily. Otherwise they are loaded on instance creation.
+    use_manifest: bool, optional
+        If True (default), then the IMDB metadata and ERF rupture dataframes
+        are loaded from the cached ensemble manifest (created if required),
+        see EnsembleManifest
 
     Attributes
     ----------
     name : str
         Name of the ensemble
+    im_types: list of IMType
+        The IM types of the ensemble
     im_ensembles_dict: dictionary
         Dictionary of the IMEnsembles that make up
         this ensemble with the IM as key
+        Note: Loads all IMEnsembles, use get_im_ensemble
+        where only a specific IM type is required
     ims: list of IM
         IMs available in this ensemble.
     """
@@ -75,6 +89,7 @@ class Ensemble:
         config_ffp: str = None,
         use_im_data_cache: bool = False,
         lazy_loading: bool = True,
+        use_manifest: bool = True,
     ):
         self.name, self._config_ffp = name, config_ffp
 
@@ -84,47 +99,11 @@ class Ensemble:
             with open(config_ffp, "r") as f:
                 self._config = yaml.safe_load(f)
 
-        # Stations from the stations file, does NOT define the
-        # supported stations of the ensemble, use the stations property
-        self.stations_ll_df = load_station_file(self._config["stations"])
-
-        # Load the IMEnsembles
-        self.im_ensembles_dict = {
-            IMType[im_string]: IMEnsemble(
-                IMType[im_string],
-                self,
-                self._config["datasets"][im_string],
-                use_im_data_cache=use_im_data_cache,
-            )
-            for im_string in self._config["datasets"]
-        }
-        self.im_ensembles = list(self.im_ensembles_dict.values())
-
-        # Load the vs30 values
-        self.vs30_df = (
-            None
-            if self._config.get("vs30") is None
-            else pd.read_csv(
-                self._config["vs30"],
-                delim_whitespace=True,
-                index_col=0,
-                header=None,
-                names=["vs30"],
-            )
-        )
-
-        # Load the Z values
-        self.z_df = (
-            None
-            if self._config.get("z") is None
-            else pd.read_csv(
-                self._config["z"],
-                delim_whitespace=True,
-                header=None,
-                index_col=0,
-                names=["Z1.0", "Z2.5"],
-            )
-        )
+        # IM types of the ensemble, the IMEnsembles (and the
+        # stations, vs30 and Z data) are only loaded when required
+        self.im_types = [IMType[im_string] for im_string in self._config["datasets"]]
+        self._im_ensembles_dict = {}
+        self._stations_ll_df, self._vs30_df, self._z_df = None, None, None
 
         self.flt_ssddb_ffp = self._config["flt_ssdb"]
         self.ds_ssddb_ffp = self._config["ds_ssdb"]
@@ -137,7 +116,12 @@ class Ensemble:
         # a large number of branches
         # rupture_id = "-41.8_172.0_10.0--6.8_ACTIVE_SHALLOW_NZ_DSmodel_2015"
         # rupture_id_ix = 0 (an integer)
-        self._rupture_id_ix_lookup = None
+        # The rupture ids are stored (sorted) as fixed-width bytes, along
+        # with their rupture_id_ix and the inverse, i.e. position of the
+        # rupture id for each rupture_id_ix
+        self._sorted_rupture_ids = np.zeros(0, dtype=np.bytes_)
+        self._sorted_rupture_id_ind = np.zeros(0, dtype=np.int64)
+        self._rupture_id_ix_pos = np.zeros(0, dtype=np.int64)
 
         # IM data cache to reduce number of IMDB reads required
         # Note: This cache is purely in memory and exists per
@@ -152,10 +136,53 @@ class Ensemble:
 
         self._is_simple = None
 
+        self.use_manifest = use_manifest
+        self._manifest = None
+
         if not lazy_loading:
             self.__load_rupture_df()
             self.__load_stations()
 
+    @property
+    def im_ensembles_dict(self) -> Dict[IMType, IMEnsemble]:
+        return {im_type: self.get_im_ensemble(im_type) for im_type in self.im_types}
+
+    @property
+    def im_ensembles(self):
+        return list(self.im_ensembles_dict.values())
+
+    @property
+    def stations_ll_df(self) -> pd.DataFrame:
+        """Stations from the stations file, does NOT define the
+        supported stations of the ensemble, use the stations property"""
+        if self._stations_ll_df is None:
+            self._stations_ll_df = load_station_file(self._config["stations"])
+        return self._stations_ll_df
+
+    @property
+    def vs30_df(self) -> Optional[pd.DataFrame]:
+        if self._vs30_df is None and self._config.get("vs30") is not None:
+            self._vs30_df = pd.read_csv(
+                self._config["vs30"],
+                delim_whitespace=True,
+                index_col=0,
+                header=None,
+                names=["vs30"],
+            )
+        return self._vs30_df
+
+    @property
+    def z_df(self) -> Optional[pd.DataFrame]:
+        if self._z_df is None and self._config.get("z") is not None:
+            self._z_df = pd.read_csv(
+                self._config["z"],
+                delim_whitespace=True,
+                header=None,
+                index_col=0,
+                names=["Z1.0", "Z2.5"],
+            )
+        return self._z_df
+
     @property
     def is_simple(self):
         """
@@ -215,9 +242,7 @@ class Ensemble:
         if self._rupture_df is None:
             self.__load_rupture_df()
 
-        return self._rupture_df.set_index(
-            rupture.rupture_id_ix_to_rupture_id(self, self._rupture_df.index.values)
-        )
+        return rupture.compact_rupture_df_to_id(self, self._rupture_df)
 
     @property
     def fault_rupture_df(self):
@@ -229,55 +254,74 @@ class Ensemble:
     def station_ffp(self):
         return self._config["stations"]
 
+    @property
+    def manifest(self) -> Optional[EnsembleManifest]:
+        """The cached IMDB metadata and ERF rupture dataframes,
+        None if the manifest is not used"""
+        if self.use_manifest and self._manifest is None:
+            self._manifest = EnsembleManifest.load(self._config)
+        return self._manifest
+
+    def get_imdb_metadata(self, imdb_ffp: str) -> IMDBMetadata:
+        """Gets the metadata (stations, IMs, data types) of the specified IMDB"""
+        if self.manifest is not None and imdb_ffp in self.manifest.imdb_metadata:
+            return self.manifest.imdb_metadata[imdb_ffp]
+        return IMDBMetadata.from_imdb(imdb_ffp)
+
     def get_rupture_id_indices(self, rupture_ids: np.ndarray):
         """Gets the rupture_id_ix values for the given rupture_ids
         Adds any missing rupture ids to the lookup
         """
-        # Add ids if needed
-        missing_ids = np.unique(
-            rupture_ids[
-                ~utils.pandas_isin(rupture_ids, self._rupture_id_ix_lookup.index.values)
-            ]
-            if self._rupture_id_ix_lookup is not None
-            else rupture_ids
-        )
-        if missing_ids.size > 0:
-            last_rupture_id_ix = (
-                -1
-                if self._rupture_id_ix_lookup is None
-                else self._rupture_id_ix_lookup.values.max()
-            )
+        rupture_ids = np.asarray(rupture_ids, dtype=str).astype(np.bytes_)
+        with _RUPTURE_ID_LOCK:
+            rupture_id_ind = self.__lookup_rupture_ids(rupture_ids)
+
+            # Add ids if needed
+            missing_mask = rupture_id_ind < 0
+            if np.any(missing_mask):
+                missing_ids = np.unique(rupture_ids[missing_mask])
+                n_ids = self._rupture_id_ix_pos.size
+
+                all_ids = np.concatenate((self._sorted_rupture_ids, missing_ids))
+                all_id_ind = np.concatenate(
+                    (
+                        self._sorted_rupture_id_ind,
+                        np.arange(n_ids, n_ids + missing_ids.size, dtype=np.int64),
+                    )
+                )
+                sort_ind = np.argsort(all_ids, kind="stable")
+                self._sorted_rupture_ids = all_ids[sort_ind]
+                self._sorted_rupture_id_ind = all_id_ind[sort_ind]
 
-            self._rupture_id_ix_lookup = pd.concat(
-                (
-                    self._rupture_id_ix_lookup,
-                    pd.Series(
-                        index=missing_ids,
-                        data=np.arange(
-                            last_rupture_id_ix + 1,
-                            last_rupture_id_ix + missing_ids.shape[0] + 1,
-                        ),
-                    ),
+                self._rupture_id_ix_pos = np.empty(sort_ind.size, dtype=np.int64)
+                self._rupture_id_ix_pos[self._sorted_rupture_id_ind] = np.arange(
+                    sort_ind.size
                 )
-            )
 
-        # Ensure that there are no duplicates in the lookup
-        assert (
-            self._rupture_id_ix_lookup.index.unique().size
-            == self._rupture_id_ix_lookup.size
-        )
+                rupture_id_ind = self.__lookup_rupture_ids(rupture_ids)
 
-        # Get indices
-        return self._rupture_id_ix_lookup.loc[rupture_ids].values
+            return rupture_id_ind
 
     def get_rupture_ids(self, rupture_id_ind: np.ndarray):
         """Convert rupture id indices to rupture ids"""
-        result = self._rupture_id_ix_lookup.iloc[rupture_id_ind].index.values.astype(
-            str
+        with _RUPTURE_ID_LOCK:
+            rupture_id_pos = self._rupture_id_ix_pos[rupture_id_ind]
+            return self._sorted_rupture_ids[rupture_id_pos].astype(str)
+
+    def __lookup_rupture_ids(self, rupture_ids: np.ndarray) -> np.ndarray:
+        """Gets the rupture_id_ix values for the given
+        rupture ids (as bytes), -1 for missing rupture ids"""
+        if self._sorted_rupture_ids.size == 0:
+            return np.full(rupture_ids.size, -1, dtype=np.int64)
+
+        pos = np.searchsorted(self._sorted_rupture_ids, rupture_ids)
+        pos[pos == self._sorted_rupture_ids.size] = 0
+        return np.where(
+            self._sorted_rupture_ids[pos] == rupture_ids,
+            self._sorted_rupture_id_ind[pos],
+            -1,
         )
 
-        return result
-
     def load_erf(self, erf_ffp: str, erf_type: const.ERFFileType):
         """This function should only be used by Branches, for
         the ensemble erf, use the rupture_df property!!
@@ -285,9 +329,21 @@ class Ensemble:
         if erf_ffp in self._branch_rupture_dfs.keys():
             return self._branch_rupture_dfs[erf_ffp]
         else:
-            rupture_df = rupture.rupture_df_from_erf(erf_ffp, erf_type)
-            rupture_df["rupture_type"] = (
-                "flt" if erf_type == const.ERFFileType.flt_nhm else "ds"
+            # Taken from the manifest, as the rupture dataframe is only
+            # kept once, shared by all branches (and IMEnsembles) of the ERF
+            # pop with a default, as another thread might have taken it already
+            rupture_df = (
+                self.manifest.erf_rupture_dfs.pop(erf_ffp, None)
+                if self.manifest is not None
+                else None
+            )
+            if rupture_df is None:
+                rupture_df = rupture.rupture_df_from_erf(erf_ffp, erf_type)
+            rupture_df = rupture.to_compact_rupture_df(
+                rupture_df,
+                const.SourceType.fault
+                if erf_type == const.ERFFileType.flt_nhm
+                else const.SourceType.distributed,
             )
 
             # Convert to rupture id ix
@@ -297,7 +353,18 @@ class Ensemble:
             return rupture_df
 
     def get_im_ensemble(self, im_type: IMType) -> IMEnsemble:
-        return self.im_ensembles_dict[im_type]
+        """Gets the IMEnsemble of the specified IM type,
+        the IMEnsemble is created on first access"""
+        if im_type not in self._im_ensembles_dict:
+            if im_type not in self.im_types:
+                raise KeyError(im_type)
+            self._im_ensembles_dict[im_type] = IMEnsemble(
+                im_type,
+                self,
+                self._config["datasets"][im_type.name],
+                use_im_data_cache=self.use_im_data_cache,
+            )
+        return self._im_ensembles_dict[im_type]
 
     def check_im(self, im: IM):
         """Checks if the specified IM type is supported by
@@ -309,8 +376,14 @@ class Ensemble:
             )
 
     def _get_cache_key(self, site_info: "SiteInfo", imdb_ffp: str):
-        """Returns the IM data cache key for the specified site and IMBD file"""
-        return hashlib.sha256(f"{site_info}_{imdb_ffp}".encode()).hexdigest()
+        """Returns the IM data cache key for the specified site and IMBD file
+
+        The cache holds the unmodified IMDB data, i.e. the key only
+        depends on the station (and not on any user specified vs30)
+        """
+        return hashlib.sha256(
+            f"{site_info.station_name}_{imdb_ffp}".encode()
+        ).hexdigest()
 
     def get_cache_value(self, site_info: "SiteInfo", imdb_ffp: str):
         """Gets the IM dataframe from the IM data cache, returns False if
@@ -377,7 +450,7 @@ class Ensemble:
                 self._rupture_df = im_ensemble.rupture_df_id_ix
             else:
                 # Append and drop duplicates
-                self._rupture_df = pd.concat(
+                self._rupture_df = rupture.concat_compact_rupture_dfs(
                     [self._rupture_df, im_ensemble.rupture_df_id_ix]
                 )
                 self._rupture_df = self._rupture_df.loc[
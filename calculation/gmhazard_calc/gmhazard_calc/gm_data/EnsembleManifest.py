@@ -0,0 +1,210 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+from gmhazard_calc import rupture
+from gmhazard_calc import result_io
+from gmhazard_calc import constants as const
+
+# Directory of the cached manifests
+MANIFEST_DIR = Path(
+    os.getenv(
+        "ENSEMBLE_MANIFEST_DIR",
+        os.path.join(tempfile.gettempdir(), "gmhazard_ensemble_manifests"),
+    )
+)
+
+# Number of threads used for loading the metadata
+MANIFEST_N_THREADS = 8
+
+# Has to be increased for any changes of the manifest content
+MANIFEST_VERSION = 1
+
+MANIFEST_RESULT_TYPE = "ensemble_manifest"
+
+# PyTables is not thread-safe, therefore the IMDBs are read one at a time,
+# while the ERFs are parsed in parallel
+_HDF5_LOCK = threading.Lock()
+
+
+@dataclass
+class IMDBMetadata:
+    """Metadata of an IMDB, as required by the Leaf"""
+
+    stations: np.ndarray
+    ims: np.ndarray
+    source_type: const.SourceType
+    imdb_type: const.IMDataType
+
+    @classmethod
+    def from_imdb(cls, imdb_ffp: str) -> "IMDBMetadata":
+        with _HDF5_LOCK:
+            with dbs.IMDB.get_imdb(imdb_ffp) as imdb:
+                return cls(
+                    imdb.sites().index.values.astype(str),
+                    np.asarray(imdb.ims, dtype=str),
+                    imdb.source_type,
+                    imdb.imdb_type,
+                )
+
+
+class EnsembleManifest:
+    """Cached metadata of the IMDBs and ERFs of an ensemble, i.e. the
+    station sets, IMs and data types of the IMDBs and the rupture
+    dataframes of the ERFs
+
+    The manifest is saved as a single binary file per ensemble config,
+    and is recreated if the config or any of the IMDB/ERF files change
+    (based on the file modification times and sizes).
+
+    Parameters
+    ----------
+    imdb_metadata: dictionary
+        The metadata per IMDB file path
+    erf_rupture_dfs: dictionary
+        The rupture dataframe (see rupture.rupture_df_from_erf) per ERF file path
+    """
+
+    def __init__(
+        self,
+        imdb_metadata: Dict[str, IMDBMetadata],
+        erf_rupture_dfs: Dict[str, pd.DataFrame],
+    ):
+        self.imdb_metadata = imdb_metadata
+        self.erf_rupture_dfs = erf_rupture_dfs
+
+    @classmethod
+    def load(
+        cls,
+        config: Dict,
+        manifest_dir: Path = MANIFEST_DIR,
+        n_threads: int = MANIFEST_N_THREADS,
+    ) -> "EnsembleManifest":
+        """Loads the cached manifest of the ensemble config, if there
+        is no (valid) cached manifest then it is created and saved"""
+        manifest_ffp = (
+            Path(manifest_dir) / f"{get_manifest_key(config)}{result_io.BINARY_SUFFIX}"
+        )
+        if manifest_ffp.exists():
+            try:
+                return cls.load_binary(manifest_ffp)
+            except (OSError, KeyError, result_io.ResultFormatError):
+                pass
+
+        manifest = cls.create(config, n_threads=n_threads)
+        try:
+            manifest_ffp.parent.mkdir(parents=True, exist_ok=True)
+            manifest.save_binary(manifest_ffp)
+        except OSError:
+            # Caching is optional, e.g. a read-only file system
+            pass
+        return manifest
+
+    @classmethod
+    def create(
+        cls, config: Dict, n_threads: int = MANIFEST_N_THREADS
+    ) -> "EnsembleManifest":
+        """Creates the manifest by loading the metadata of all IMDBs and ERFs"""
+        imdb_ffps, erfs = get_config_files(config)
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            erf_results = executor.map(
+                lambda erf: rupture.rupture_df_from_erf(*erf), erfs
+            )
+            imdb_results = executor.map(IMDBMetadata.from_imdb, imdb_ffps)
+
+            return cls(
+                dict(zip(imdb_ffps, imdb_results)),
+                {
+                    erf_ffp: rupture_df
+                    for (erf_ffp, _), rupture_df in zip(erfs, erf_results)
+                },
+            )
+
+    def save_binary(self, ffp: Path):
+        with result_io.ResultWriter.create(ffp, MANIFEST_RESULT_TYPE) as writer:
+            writer.set_metadata({"manifest_version": MANIFEST_VERSION})
+            for ix, (imdb_ffp, metadata) in enumerate(self.imdb_metadata.items()):
+                cur_writer = writer.group(f"imdb_{ix}")
+                cur_writer.set_metadata(
+                    {
+                        "ffp": imdb_ffp,
+                        "source_type": metadata.source_type.value,
+                        "imdb_type": metadata.imdb_type.value,
+                    }
+                )
+                cur_writer.write("stations", metadata.stations)
+                cur_writer.write("ims", metadata.ims)
+            for ix, (erf_ffp, rupture_df) in enumerate(self.erf_rupture_dfs.items()):
+                cur_writer = writer.group(f"erf_{ix}")
+                cur_writer.set_metadata({"ffp": erf_ffp})
+                cur_writer.write("rupture_df", rupture_df)
+
+    @classmethod
+    def load_binary(cls, ffp: Path) -> "EnsembleManifest":
+        with result_io.ResultReader.open(ffp, MANIFEST_RESULT_TYPE) as reader:
+            if reader.metadata["manifest_version"] != MANIFEST_VERSION:
+                raise result_io.ResultFormatError(
+                    f"The manifest {ffp} has an outdated version"
+                )
+
+            imdb_metadata, erf_rupture_dfs = {}, {}
+            for cur_key in reader.group_keys():
+                cur_reader = reader.group(cur_key)
+                cur_metadata = cur_reader.metadata
+                if cur_key.startswith("imdb_"):
+                    imdb_metadata[cur_metadata["ffp"]] = IMDBMetadata(
+                        cur_reader.read("stations").astype(str),
+                        cur_reader.read("ims").astype(str),
+                        const.SourceType(cur_metadata["source_type"]),
+                        const.IMDataType(cur_metadata["imdb_type"]),
+                    )
+                else:
+                    erf_rupture_dfs[cur_metadata["ffp"]] = cur_reader.read("rupture_df")
+
+        return cls(imdb_metadata, erf_rupture_dfs)
+
+
+def get_config_files(
+    config: Dict,
+) -> Tuple[List[str], List[Tuple[str, const.ERFFileType]]]:
+    """Gets the (unique) IMDB file paths and the
+    (ERF file path, ERF file type) pairs of the ensemble config"""
+    imdb_ffps, erfs = {}, {}
+    for im_config in config["datasets"].values():
+        for branch_config in im_config.values():
+            for erf_key in ["flt_erf", "ds_erf"]:
+                erfs[branch_config[erf_key]] = const.ERFFileType.from_str(
+                    branch_config[f"{erf_key}_type"]
+                )
+            for leaf_config in branch_config["leaves"].values():
+                for imdb_ffp in leaf_config["flt_imdbs"] + leaf_config["ds_imdbs"]:
+                    imdb_ffps[imdb_ffp] = None
+
+    return list(imdb_ffps.keys()), list(erfs.items())
+
+
+def get_manifest_key(config: Dict) -> str:
+    """Creates the manifest key, based on the config
+    and the modification time & size of all IMDB/ERF files"""
+    imdb_ffps, erfs = get_config_files(config)
+
+    key_hash = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode())
+    key_hash.update(f"|{MANIFEST_VERSION}".encode())
+    for cur_ffp in imdb_ffps + [erf_ffp for erf_ffp, _ in erfs]:
+        try:
+            stat = os.stat(cur_ffp)
+            key_hash.update(f"|{cur_ffp}|{stat.st_mtime_ns}|{stat.st_size}".encode())
+        except FileNotFoundError:
+            key_hash.update(f"|{cur_ffp}|missing".encode())
+
+    return key_hash.hexdigest()
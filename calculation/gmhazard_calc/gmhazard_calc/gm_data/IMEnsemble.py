@@ -89,11 +89,7 @@ class IMEnsemble:
         if self._rupture_df is None:
             self.__load_rupture_df()
 
-        return self._rupture_df.set_index(
-            rupture.rupture_id_ix_to_rupture_id(
-                self.ensemble, self._rupture_df.index.values
-            )
-        )
+        return rupture.compact_rupture_df_to_id(self.ensemble, self._rupture_df)
 
     @property
     def fault_rupture_df(self):
@@ -151,7 +147,7 @@ class IMEnsemble:
                 self._rupture_df = cur_branch.rupture_df_id_ix
             else:
                 # Append and drop duplicates
-                self._rupture_df = pd.concat(
+                self._rupture_df = rupture.concat_compact_rupture_dfs(
                     [self._rupture_df, cur_branch.rupture_df_id_ix]
                 )
                 self._rupture_df = self._rupture_df.loc[
@@ -3,7 +3,6 @@ from typing import TYPE_CHECKING, List
 
 import numpy as np
 
-from gmhazard_calc import dbs
 from gmhazard_calc import constants as const
 from gmhazard_calc.im import IM, IMType
 
@@ -71,49 +70,53 @@ class Leaf:
         self._metadata_loaded = False
 
     def __load_IMDB_metadata(self) -> None:
-        """Get available IMs and stations of the leaf"""
+        """Get available IMs and stations of the leaf,
+        using the IMDB metadata of the ensemble (manifest)"""
+        ensemble = self.branch.im_ensemble.ensemble
+
         self._flt_stations, self._ds_stations = [], []
         for cur_imdb_ffp in self.flt_imdb_ffps + self.ds_imdb_ffps:
-            with dbs.IMDB.get_imdb(cur_imdb_ffp) as cur_imdb:
-                # Stations
-                if cur_imdb_ffp in self.flt_imdb_ffps:
-                    self._flt_stations.append(cur_imdb.sites().index.values.astype(str))
-                elif cur_imdb_ffp in self.ds_imdb_ffps:
-                    self._ds_stations.append(cur_imdb.sites().index.values.astype(str))
-
-                # IMs (intersection of IMs across all dbs)
-                if self._ims is None:
-                    self._ims = set(
-                        [
-                            IM.from_str(im_string)
-                            for im_string in cur_imdb.ims
-                            if IMType.has_value(im_string)
-                        ]
-                    )
-                else:
-                    self._ims.intersection_update(
-                        [
-                            IM.from_str(im_string)
-                            for im_string in cur_imdb.ims
-                            if IMType.has_value(im_string)
-                        ]
-                    )
-
-                # IM data type
-                if cur_imdb.source_type is const.SourceType.fault:
-                    if self._flt_im_data_type is None:
-                        self._flt_im_data_type = cur_imdb.imdb_type
-                    assert self._flt_im_data_type is cur_imdb.imdb_type, (
-                        "IM data types have to match across IMDBs of "
-                        "the same source type"
-                    )
-                if cur_imdb.source_type is const.SourceType.distributed:
-                    if self._ds_im_data_type is None:
-                        self._ds_im_data_type = cur_imdb.imdb_type
-                    assert self._ds_im_data_type is cur_imdb.imdb_type, (
-                        "IM data types have to match across IMDBs of "
-                        "the same source type"
-                    )
+            cur_metadata = ensemble.get_imdb_metadata(cur_imdb_ffp)
+
+            # Stations
+            if cur_imdb_ffp in self.flt_imdb_ffps:
+                self._flt_stations.append(cur_metadata.stations)
+            elif cur_imdb_ffp in self.ds_imdb_ffps:
+                self._ds_stations.append(cur_metadata.stations)
+
+            # IMs (intersection of IMs across all dbs)
+            if self._ims is None:
+                self._ims = set(
+                    [
+                        IM.from_str(im_string)
+                        for im_string in cur_metadata.ims
+                        if IMType.has_value(im_string)
+                    ]
+                )
+            else:
+                self._ims.intersection_update(
+                    [
+                        IM.from_str(im_string)
+                        for im_string in cur_metadata.ims
+                        if IMType.has_value(im_string)
+                    ]
+                )
+
+            # IM data type
+            if cur_metadata.source_type is const.SourceType.fault:
+                if self._flt_im_data_type is None:
+                    self._flt_im_data_type = cur_metadata.imdb_type
+                assert self._flt_im_data_type is cur_metadata.imdb_type, (
+                    "IM data types have to match across IMDBs of "
+                    "the same source type"
+                )
+            if cur_metadata.source_type is const.SourceType.distributed:
+                if self._ds_im_data_type is None:
+                    self._ds_im_data_type = cur_metadata.imdb_type
+                assert self._ds_im_data_type is cur_metadata.imdb_type, (
+                    "IM data types have to match across IMDBs of "
+                    "the same source type"
+                )
 
         self._flt_stations = (
             np.concatenate(self._flt_stations)
@@ -2,4 +2,5 @@ from .Ensemble import Ensemble, ensemble_dict
 from .IMEnsemble import IMEnsemble
 from .Branch import Branch
 from .Leaf import Leaf
+from .EnsembleManifest import EnsembleManifest, IMDBMetadata
 
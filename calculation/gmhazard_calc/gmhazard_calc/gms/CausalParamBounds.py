@@ -8,6 +8,7 @@ import pandas as pd
 from gmhazard_calc.im import IM
 from gmhazard_calc import gm_data
 from gmhazard_calc import site
+from gmhazard_calc import result_io
 
 
 @dataclass
@@ -106,3 +107,40 @@ class CausalParamBounds:
             exceedance=attributs_dict["exceedance"],
             im_value=attributs_dict["im_value"],
         )
+
+    def _write_binary(self, writer: result_io.ResultWriter):
+        writer.set_metadata(
+            dict(
+                IM_j=str(self.IM_j),
+                ensemble_params=self.ensemble.get_save_params(),
+                site=self.site_info.to_dict(),
+                mw_bounds=self.mw_bounds,
+                rrup_bounds=self.rrup_bounds,
+                vs30_bounds=self.vs30_bounds,
+                sf_bounds=self.sf_bounds,
+                exceedance=self.exceedance,
+                im_value=self.im_value,
+            )
+        )
+        writer.write("contributions", self.contr_df)
+
+    @classmethod
+    def _read_binary(
+        cls, reader: result_io.ResultReader, ensemble: gm_data.Ensemble = None
+    ):
+        attributes_dict = reader.metadata
+
+        return CausalParamBounds(
+            gm_data.Ensemble.load(attributes_dict["ensemble_params"])
+            if ensemble is None
+            else ensemble,
+            site.SiteInfo.from_dict(attributes_dict["site"]),
+            IM.from_str(attributes_dict["IM_j"]),
+            attributes_dict["mw_bounds"],
+            attributes_dict["rrup_bounds"],
+            attributes_dict["vs30_bounds"],
+            attributes_dict["sf_bounds"],
+            contr_df=reader.read("contributions"),
+            exceedance=attributes_dict["exceedance"],
+            im_value=attributes_dict["im_value"],
+        )
@@ -1,12 +1,13 @@
 import json
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Union
 
 import pandas as pd
 
 import sha_calc as sha_calc
 from gmhazard_calc.im import IM
 from gmhazard_calc import gm_data
+from gmhazard_calc import result_io
 
 
 class BranchUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
@@ -98,6 +99,42 @@ class BranchUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
 
         return cls(IMi, IMj, im_j, branch, lnIMi_IMj_Rup, lnIMi_IMj)
 
+    def _write_binary(self, writer: result_io.ResultWriter):
+        writer.set_metadata(
+            dict(
+                IMi=str(self.IMi),
+                IMj=str(self.IMj),
+                im_j=self.im_j,
+                branch_name=self.branch.name,
+            )
+        )
+        writer.write("lnIMi_IMj_rup_mu", self.lnIMi_IMj_Rup.mu)
+        writer.write("lnIMi_IMj_rup_sigma", self.lnIMi_IMj_Rup.sigma)
+        writer.write("lnIMi_IMj_cdf", self.lnIMi_IMj.cdf)
+
+    @classmethod
+    def _read_binary(cls, reader: result_io.ResultReader, branch: gm_data.Branch):
+        variables_dict = reader.metadata
+        assert branch.name == variables_dict["branch_name"]
+
+        IMi = IM.from_str(variables_dict["IMi"])
+        IMj, im_j = IM.from_str(variables_dict["IMj"]), variables_dict["im_j"]
+
+        return cls(
+            IMi,
+            IMj,
+            im_j,
+            branch,
+            sha_calc.Uni_lnIMi_IMj_Rup(
+                reader.read("lnIMi_IMj_rup_mu"),
+                reader.read("lnIMi_IMj_rup_sigma"),
+                IMi,
+                IMj,
+                im_j,
+            ),
+            sha_calc.Uni_lnIMi_IMj(reader.read("lnIMi_IMj_cdf"), IMi, IMj, im_j),
+        )
+
 
 class IMEnsembleUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
     """Represents the GCIM for a specific IMi and IMEnsemble
@@ -121,6 +158,9 @@ class IMEnsembleUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
     branch_uni_gcims: dictionary
         Dictionary of the branch GCIM's that
         make up this combined GCIM
+    neglected_rupture_contribution: float, optional
+        The fraction of the rupture contribution that was neglected,
+        when the ruptures were truncated based on their contribution
     """
 
     VARIABLES_FN = "variables.json"
@@ -133,7 +173,8 @@ class IMEnsembleUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
         IMj: IM,
         im_j: float,
         ln_IMi_IMj: sha_calc.Uni_lnIMi_IMj,
-        branch_uni_gcims: Dict[str, BranchUniGCIM],
+        branch_uni_gcims: Union[Dict[str, BranchUniGCIM], result_io.LazyMember],
+        neglected_rupture_contribution: float = None,
     ):
         sha_calc.UniIMiDist.__init__(self, IMi)
         sha_calc.CondIMjDist.__init__(self, IMj, im_j)
@@ -141,14 +182,32 @@ class IMEnsembleUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
         self.lnIMi_IMj = ln_IMi_IMj
         self.im_ensemble = im_ensemble
 
-        self.branch_uni_gcims = branch_uni_gcims
+        self._branch_uni_gcims = branch_uni_gcims
+        self.neglected_rupture_contribution = neglected_rupture_contribution
+
+    @property
+    def branch_uni_gcims(self) -> Dict[str, BranchUniGCIM]:
+        # Branch GCIMs are only loaded on first access
+        # when loaded from a binary result file
+        if isinstance(self._branch_uni_gcims, result_io.LazyMember):
+            self._branch_uni_gcims = self._branch_uni_gcims.load()
+
+        return self._branch_uni_gcims
 
     def save(self, base_dir: Path):
         save_dir = base_dir / f"{self.IMi}"
         save_dir.mkdir(exist_ok=False)
 
         with open(save_dir / self.VARIABLES_FN, "w") as f:
-            json.dump(dict(IMi=str(self.IMi), IMj=str(self.IMj), im_j=self.im_j), f)
+            json.dump(
+                dict(
+                    IMi=str(self.IMi),
+                    IMj=str(self.IMj),
+                    im_j=self.im_j,
+                    neglected_rupture_contribution=self.neglected_rupture_contribution,
+                ),
+                f,
+            )
 
         self.lnIMi_IMj.cdf.to_csv(save_dir / self.LNIMI_IMJ_CDF_FN)
 
@@ -187,6 +246,53 @@ class IMEnsembleUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
                 )
                 for cur_branch_name, cur_branch in im_ensemble.branches_dict.items()
             },
+            neglected_rupture_contribution=variables_dict.get(
+                "neglected_rupture_contribution"
+            ),
+        )
+
+    def _write_binary(self, writer: result_io.ResultWriter):
+        writer.set_metadata(
+            dict(
+                IMi=str(self.IMi),
+                IMj=str(self.IMj),
+                im_j=self.im_j,
+                neglected_rupture_contribution=self.neglected_rupture_contribution,
+            )
+        )
+        writer.write("lnIMi_IMj_cdf", self.lnIMi_IMj.cdf)
+
+        branch_writer = writer.group("branch_uni_gcims")
+        for cur_branch_name, branch_gcim in self.branch_uni_gcims.items():
+            branch_gcim._write_binary(branch_writer.group(cur_branch_name))
+
+    @classmethod
+    def _read_binary(
+        cls, reader: result_io.ResultReader, im_ensemble: gm_data.IMEnsemble
+    ):
+        variables_dict = reader.metadata
+
+        IMi = IM.from_str(variables_dict["IMi"])
+        IMj, im_j = IM.from_str(variables_dict["IMj"]), variables_dict["im_j"]
+
+        return cls(
+            im_ensemble,
+            IMi,
+            IMj,
+            im_j,
+            sha_calc.Uni_lnIMi_IMj(reader.read("lnIMi_IMj_cdf"), IMi, IMj, im_j),
+            reader.lazy(
+                "branch_uni_gcims",
+                lambda branch_reader: {
+                    cur_branch_name: BranchUniGCIM._read_binary(
+                        branch_reader.group(cur_branch_name), cur_branch
+                    )
+                    for cur_branch_name, cur_branch in im_ensemble.branches_dict.items()
+                },
+            ),
+            neglected_rupture_contribution=variables_dict.get(
+                "neglected_rupture_contribution"
+            ),
         )
 
 
@@ -266,3 +372,22 @@ class SimUniGCIM(sha_calc.UniIMiDist, sha_calc.CondIMjDist):
                 im_j,
             ),
         )
+
+    def _write_binary(self, writer: result_io.ResultWriter):
+        writer.set_metadata(dict(IMi=str(self.IMi), IMj=str(self.IMj), im_j=self.im_j))
+        writer.write("lnIMi_IMj_cdf", self.lnIMi_IMj.cdf)
+
+    @classmethod
+    def _read_binary(cls, reader: result_io.ResultReader, ensemble: gm_data.Ensemble):
+        variables_dict = reader.metadata
+
+        IMi = IM.from_str(variables_dict["IMi"])
+        IMj, im_j = IM.from_str(variables_dict["IMj"]), variables_dict["im_j"]
+
+        return cls(
+            ensemble,
+            IMi,
+            IMj,
+            im_j,
+            sha_calc.Uni_lnIMi_IMj(reader.read("lnIMi_IMj_cdf"), IMi, IMj, im_j),
+        )
@@ -10,6 +10,7 @@ from gmhazard_calc.im import IM, to_im_list, to_string_list
 from gmhazard_calc import gm_data
 from gmhazard_calc import site
 from gmhazard_calc import constants
+from gmhazard_calc import result_io
 from .GroundMotionDataset import GMDataset
 from .CausalParamBounds import CausalParamBounds
 from .GCIMResult import IMEnsembleUniGCIM, SimUniGCIM
@@ -46,6 +47,12 @@ class GMSResult:
     sf: dataframe
         The scaling factor for each of
         the selected ground motions
+    rupture_contribution_threshold: float, optional
+        The rupture contribution threshold used for
+        truncation of the ruptures, None if no truncation was done
+    neglected_rupture_contribution: float, optional
+        The fraction of the rupture contribution that
+        was neglected due to the rupture truncation
     """
 
     SELECTED_GMS_IMS_FN = "selected_gm_ims.csv"
@@ -77,6 +84,8 @@ class GMSResult:
         cs_param_bounds: CausalParamBounds = None,
         sf: pd.DataFrame = None,
         metadata: Tuple[pd.DataFrame, Dict, pd.DataFrame, pd.DataFrame] = (None, None, None, None),
+        rupture_contribution_threshold: float = None,
+        neglected_rupture_contribution: float = None,
     ):
         self.ensemble = ensemble
         self.site_info = site_info
@@ -98,6 +107,9 @@ class GMSResult:
 
         self.sf = sf
 
+        self.rupture_contribution_threshold = rupture_contribution_threshold
+        self.neglected_rupture_contribution = neglected_rupture_contribution
+
         self._metadata_dict, self._selected_gms_metadata_df = metadata[1], metadata[0]
         self._selected_gms_im_16th_50th_84th_df = metadata[2]
         self._gcim_16th_50th_84th_df = metadata[3]
@@ -246,6 +258,8 @@ class GMSResult:
                     metadata_dict=self._metadata_dict,
                     gms_type=self.gms_type.value,
                     exceedance=self.exceedance,
+                    rupture_contribution_threshold=self.rupture_contribution_threshold,
+                    neglected_rupture_contribution=self.neglected_rupture_contribution,
                 ),
                 f,
             )
@@ -256,12 +270,71 @@ class GMSResult:
 
         return save_dir
 
+    def save_binary(self, base_dir: Path, id: str, compression: str = None) -> Path:
+        """Saves the GMSResult (including the GCIMs) as single
+        binary file in the specified base directory
+
+        Parameters
+        ----------
+        base_dir: Path
+        id: str
+            The GMS id
+        compression: str, optional
+            The compression to use, e.g. gzip or lzf, see result_io
+
+        Returns
+        -------
+        Path
+            The file path of the saved result
+        """
+        # Generate the metadata if needed
+        if self._metadata_dict is None:
+            self._compute_metadata()
+
+        ffp = result_io.get_binary_ffp(base_dir, self.get_save_dir(id))
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            writer.set_metadata(
+                dict(
+                    IM_j=str(self.IM_j),
+                    im_j=self.im_j,
+                    IMs=to_string_list(self.IMs),
+                    ensemble_params=self.ensemble.get_save_params(),
+                    site=self.site_info.to_dict(),
+                    gm_dataset_id=self.gm_dataset.name,
+                    metadata_dict=self._metadata_dict,
+                    gms_type=self.gms_type.value,
+                    exceedance=self.exceedance,
+                    rupture_contribution_threshold=self.rupture_contribution_threshold,
+                    neglected_rupture_contribution=self.neglected_rupture_contribution,
+                )
+            )
+            writer.write("selected_gms_ims", self.selected_gms_im_df)
+            writer.write("realisations", self.realisations)
+            writer.write("sf", self.sf)
+            writer.write("selected_gms_metadata", self._selected_gms_metadata_df)
+            writer.write(
+                "selected_gms_im_16th_50th_84th",
+                self._selected_gms_im_16th_50th_84th_df,
+            )
+            writer.write("gcim_16th_50th_84th", self._gcim_16th_50th_84th_df)
+
+            if self.cs_param_bounds is not None:
+                self.cs_param_bounds._write_binary(writer.group("causal_param_bounds"))
+
+            gcim_writer = writer.group("gcims")
+            for IMi, cur_gcim in self.IMi_gcims.items():
+                cur_gcim._write_binary(gcim_writer.group(str(IMi)))
+
+        return ffp
+
     @staticmethod
     def get_save_dir(id: str):
         return f"gms_{id}"
 
     @classmethod
-    def load(cls, data_dir: Path):
+    def load(cls, data_dir: Path, ensemble: gm_data.Ensemble = None):
         site_info = site.SiteInfo.load(data_dir)
         selected_gm_im_df = pd.read_csv(data_dir / cls.SELECTED_GMS_IMS_FN, index_col=0)
         realisations = pd.read_csv(data_dir / cls.REALISATIONS_FN, index_col=0)
@@ -279,7 +352,8 @@ class GMSResult:
 
         with open(data_dir / cls.VARIABLES_FN, "r") as f:
             variable_dict = json.load(f)
-        ensemble = gm_data.Ensemble.load(variable_dict["ensemble_params"])
+        if ensemble is None:
+            ensemble = gm_data.Ensemble.load(variable_dict["ensemble_params"])
 
         gms_type = constants.GMSType(variable_dict["gms_type"])
 
@@ -310,6 +384,12 @@ class GMSResult:
             cs_param_bounds=cs_param_bounds,
             sf=sf,
             exceedance=variable_dict.get("exceedance"),
+            rupture_contribution_threshold=variable_dict.get(
+                "rupture_contribution_threshold"
+            ),
+            neglected_rupture_contribution=variable_dict.get(
+                "neglected_rupture_contribution"
+            ),
             metadata=(
                 pd.read_csv(data_dir / cls.SELECTED_GMS_METDATA_FN, index_col=0),
                 variable_dict["metadata_dict"],
@@ -317,3 +397,66 @@ class GMSResult:
                 pd.read_csv(data_dir / cls.GCIM_16th_50th_84th_FN, index_col=0)
             ),
         )
+
+    @classmethod
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        """Loads a GMSResult from a binary result file,
+        the branch GCIMs are only loaded when first accessed"""
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            variable_dict = reader.metadata
+            if ensemble is None:
+                ensemble = gm_data.Ensemble.load(variable_dict["ensemble_params"])
+
+            gms_type = constants.GMSType(variable_dict["gms_type"])
+            IMs = np.asarray(to_im_list(variable_dict["IMs"]))
+
+            gcim_reader = reader.group("gcims")
+            if gms_type is constants.GMSType.empirical:
+                IMi_gcims = {
+                    IMi: IMEnsembleUniGCIM._read_binary(
+                        gcim_reader.group(str(IMi)),
+                        ensemble.get_im_ensemble(IMi.im_type),
+                    )
+                    for IMi in IMs
+                }
+            else:
+                IMi_gcims = {
+                    IMi: SimUniGCIM._read_binary(gcim_reader.group(str(IMi)), ensemble)
+                    for IMi in IMs
+                }
+
+            cs_param_bounds = (
+                CausalParamBounds._read_binary(
+                    reader.group("causal_param_bounds"), ensemble=ensemble
+                )
+                if "causal_param_bounds" in reader
+                else None
+            )
+
+            return cls(
+                ensemble,
+                site.SiteInfo.from_dict(variable_dict["site"]),
+                IM.from_str(variable_dict["IM_j"]),
+                variable_dict["im_j"],
+                IMs,
+                reader.read("selected_gms_ims"),
+                IMi_gcims,
+                reader.read("realisations"),
+                GMDataset.get_GMDataset(variable_dict["gm_dataset_id"]),
+                gms_type,
+                cs_param_bounds=cs_param_bounds,
+                sf=reader.read("sf"),
+                exceedance=variable_dict.get("exceedance"),
+                rupture_contribution_threshold=variable_dict.get(
+                    "rupture_contribution_threshold"
+                ),
+                neglected_rupture_contribution=variable_dict.get(
+                    "neglected_rupture_contribution"
+                ),
+                metadata=(
+                    reader.read("selected_gms_metadata"),
+                    variable_dict["metadata_dict"],
+                    reader.read("selected_gms_im_16th_50th_84th"),
+                    reader.read("gcim_16th_50th_84th"),
+                ),
+            )
@@ -1,8 +1,9 @@
 import os
 from glob import glob
 from pathlib import Path
+from functools import lru_cache
 from shutil import copyfile
-from typing import Tuple, List, Any, Sequence
+from typing import Tuple, List, Any, Sequence, Dict, Union
 
 import pandas as pd
 import numpy as np
@@ -18,6 +19,9 @@ from gmhazard_calc import constants
 from gmhazard_calc import dbs
 from .CausalParamBounds import CausalParamBounds
 
+# Maximum number of cached vs30 dataframes, see _get_vs30_df
+MAX_N_VS30_DFS = 8
+
 
 def load_gm_dataset_configs():
     data = {}
@@ -48,6 +52,9 @@ class GMDataset:
 
     gms_sources = load_gm_dataset_configs()
 
+    # GMDataset instances, shared between get_GMDataset calls
+    _gm_datasets: Dict[str, "GMDataset"] = {}
+
     def __init__(self, name):
         self.name = name
         self._config = self.gms_sources[name]
@@ -106,6 +113,19 @@ class GMDataset:
         """
         raise NotImplementedError()
 
+    def get_lnIM_df(
+        self,
+        site_info: site.SiteInfo,
+        IMs: Sequence[str],
+        cs_param_bounds: CausalParamBounds = None,
+        sf: pd.Series = None,
+    ) -> pd.DataFrame:
+        """
+        Gets the log IM dataframe for the ground motions in this dataset,
+        see get_im_df for parameter specifications
+        """
+        return np.log(self.get_im_df(site_info, IMs, cs_param_bounds, sf=sf))
+
     def get_metadata_df(
         self, site_info: site.SiteInfo, selected_gms: Sequence[Any] = None
     ) -> pd.DataFrame:
@@ -165,16 +185,34 @@ class GMDataset:
 
     @staticmethod
     def get_GMDataset(name: str) -> "GMDataset":
-        """Creates an GMDataset instance for the specified GMDataset ID"""
+        """Gets the GMDataset instance for the specified GMDataset ID,
+        instances are created on first use and then shared, as loading
+        of the dataset (e.g. the historical IM csv) is expensive
+
+        Note: The returned instance is shared, none of its methods
+        modify the loaded data and it must not be modified by the caller,
+        use clear_gm_datasets to reload the datasets
+        """
+        if (gm_dataset := GMDataset._gm_datasets.get(name)) is not None:
+            return gm_dataset
+
         config = GMDataset.gms_sources[name]
         gms_type = constants.GMSourceType(config["type"])
 
         if gms_type is constants.GMSourceType.simulations:
-            return SimulationGMDataset(name)
+            gm_dataset = SimulationGMDataset(name)
         elif gms_type is constants.GMSourceType.historical:
-            return HistoricalGMDataset(name)
+            gm_dataset = HistoricalGMDataset(name)
         else:
-            return MixedGMDataset(name)
+            gm_dataset = MixedGMDataset(name)
+
+        GMDataset._gm_datasets[name] = gm_dataset
+        return gm_dataset
+
+    @staticmethod
+    def clear_gm_datasets():
+        """Removes all shared GMDataset instances, see get_GMDataset"""
+        GMDataset._gm_datasets.clear()
 
 
 class HistoricalGMDataset(GMDataset):
@@ -182,8 +220,16 @@ class HistoricalGMDataset(GMDataset):
     Represents dataset of historical GM records
 
     Supports filtering of records via CausalParamBounds
+
+    The IM csv is only loaded once, the IM (and log IM) values are
+    cached as arrays per IM on first use, and the causal parameters
+    are sorted, so that causal parameter bounds filtering is done
+    via range queries
     """
 
+    # The metadata columns, and the corresponding CausalParamBounds properties
+    CS_PARAMS = {"mag": "mw", "rrup": "rrup", "vs30": "vs30"}
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -195,6 +241,21 @@ class HistoricalGMDataset(GMDataset):
 
         # Remove duplicates
         self._im_df = self._im_df.loc[~self._im_df.index.duplicated()]
+        self._gm_index = self._im_df.index
+        self._metadata_df = self._im_df.loc[:, list(self.CS_PARAMS.keys())]
+
+        # Sorted causal parameters, for range queries
+        self._cs_param_sort_ind, self._cs_param_sorted = {}, {}
+        for cur_param in self.CS_PARAMS.keys():
+            cur_values = self._metadata_df[cur_param].values.astype(float)
+            self._cs_param_sort_ind[cur_param] = np.argsort(cur_values, kind="stable")
+            self._cs_param_sorted[cur_param] = cur_values[
+                self._cs_param_sort_ind[cur_param]
+            ]
+
+        # Cached IM & log IM values, per IM
+        self._im_values: Dict[str, np.ndarray] = {}
+        self._lnIM_values: Dict[str, np.ndarray] = {}
 
     @property
     def ims(self):
@@ -207,7 +268,7 @@ class HistoricalGMDataset(GMDataset):
 
     @property
     def gm_ids(self):
-        return self._im_df.index.values
+        return self._gm_index.values.copy()
 
     def write_waveforms(
         self, gm_ids: List[Any], site_info: site.SiteInfo, output_dir: str
@@ -241,42 +302,120 @@ class HistoricalGMDataset(GMDataset):
     def get_im_df(
         self,
         site_info: site.SiteInfo,
-        IMs: Sequence[str],
+        IMs: Union[str, Sequence[str]],
         cs_param_bounds: CausalParamBounds = None,
         sf: pd.Series = None,
-    ) -> pd.DataFrame:
+    ) -> Union[pd.DataFrame, pd.Series]:
         """See GMDataset method for parameter specifications"""
-        im_df = self._im_df.copy().loc[:, IMs]
-        metadata_df = self.get_metadata_df(site_info)
+        return self._get_im_data(IMs, cs_param_bounds, sf, log=False)
+
+    def get_lnIM_df(
+        self,
+        site_info: site.SiteInfo,
+        IMs: Union[str, Sequence[str]],
+        cs_param_bounds: CausalParamBounds = None,
+        sf: pd.Series = None,
+    ) -> Union[pd.DataFrame, pd.Series]:
+        """See GMDataset method for parameter specifications
+
+        Uses the cached log IM values, i.e. amplitude
+        scaling is applied in log space
+        """
+        return self._get_im_data(IMs, cs_param_bounds, sf, log=True)
+
+    def _get_im_data(
+        self,
+        IMs: Union[str, Sequence[str]],
+        cs_param_bounds: CausalParamBounds,
+        sf: pd.Series,
+        log: bool,
+    ) -> Union[pd.DataFrame, pd.Series]:
+        im_names = [IMs] if isinstance(IMs, str) else list(IMs)
 
         # CS Param bounds filtering
-        if cs_param_bounds is not None:
-            mask = self._get_filter_mask(metadata_df.loc[im_df.index], cs_param_bounds)
-            im_df = im_df.loc[mask]
+        mask = (
+            np.ones(self._gm_index.size, dtype=bool)
+            if cs_param_bounds is None
+            else self._get_bounds_mask(cs_param_bounds)
+        )
 
-        # Apply amplitude scaling, if a scaling factor is given
+        # Filtering based on SF, only GMs with a scaling factor are used
         if sf is not None:
-            # Perform filtering based on SF
-            mask = (
-                np.ones(im_df.shape[0], dtype=bool)
-                if cs_param_bounds is None
-                else self._get_filter_mask(
-                    metadata_df.loc[im_df.index], cs_param_bounds, sf=sf
+            sf_ind = self._gm_index.get_indexer(sf.index)
+            if np.any(sf_ind < 0):
+                raise ValueError(
+                    "Scaling factors have been provided for GMs "
+                    "that are not part of this dataset"
                 )
-            )
-            im_df = im_df.loc[mask]
+            sf_values = np.full(self._gm_index.size, np.nan)
+            sf_values[sf_ind] = sf.values
 
             # Sanity check
-            if sf.shape[0] < im_df.shape[0]:
+            if np.any(mask & np.isnan(sf_values)):
                 print(
                     "WARNING: Scaling factors have only been provided for a subset "
                     "of available GMs, all GMs without a SF specified will be ignored!"
                 )
+            mask &= ~np.isnan(sf_values)
 
-            # Scale GMs
-            im_df = sha.apply_amp_scaling(im_df, sf.loc[mask])
+            if cs_param_bounds is not None and cs_param_bounds.sf_low is not None:
+                mask &= (sf_values > cs_param_bounds.sf_low) & (
+                    sf_values < cs_param_bounds.sf_high
+                )
 
-        return im_df
+        gm_ind = np.flatnonzero(mask)
+        values = np.stack(
+            [self._get_im_values(cur_im, log=log)[gm_ind] for cur_im in im_names],
+            axis=1,
+        )
+
+        # Apply amplitude scaling, if a scaling factor is given
+        if sf is not None:
+            IMs_alpha = sha.get_scale_alpha(im_names).values
+            cur_sf = sf_values[gm_ind, np.newaxis]
+            values = (
+                values + IMs_alpha * np.log(cur_sf)
+                if log
+                else values * np.power(cur_sf, IMs_alpha)
+            )
+
+        if isinstance(IMs, str):
+            return pd.Series(data=values[:, 0], index=self._gm_index[gm_ind], name=IMs)
+        return pd.DataFrame(data=values, index=self._gm_index[gm_ind], columns=im_names)
+
+    def _get_im_values(self, im: str, log: bool = False) -> np.ndarray:
+        """Gets the (cached) IM or log IM values of all GMs"""
+        if (im_values := self._im_values.get(im)) is None:
+            im_values = self._im_values[im] = self._im_df[im].values.astype(float)
+        if not log:
+            return im_values
+
+        if (lnIM_values := self._lnIM_values.get(im)) is None:
+            lnIM_values = self._lnIM_values[im] = np.log(im_values)
+        return lnIM_values
+
+    def _get_bounds_mask(
+        self, cs_param_bounds: CausalParamBounds, ignore_vs30: bool = False
+    ) -> np.ndarray:
+        """Gets the mask of all GMs of this dataset that are
+        within the causal parameter bounds (excluding SF)"""
+        mask = np.ones(self._gm_index.size, dtype=bool)
+        for cur_param, cur_bounds_name in self.CS_PARAMS.items():
+            cur_low = getattr(cs_param_bounds, f"{cur_bounds_name}_low")
+            cur_high = getattr(cs_param_bounds, f"{cur_bounds_name}_high")
+            if cur_low is None or (ignore_vs30 and cur_param == "vs30"):
+                continue
+
+            # Range query, bounds are exclusive
+            cur_sorted = self._cs_param_sorted[cur_param]
+            start_ix = np.searchsorted(cur_sorted, cur_low, side="right")
+            end_ix = np.searchsorted(cur_sorted, cur_high, side="left")
+
+            cur_mask = np.zeros(self._gm_index.size, dtype=bool)
+            cur_mask[self._cs_param_sort_ind[cur_param][start_ix:end_ix]] = True
+            mask &= cur_mask
+
+        return mask
 
     def compute_scaling_factor(
         self,
@@ -302,9 +441,11 @@ class HistoricalGMDataset(GMDataset):
         series:
             The scaling factor for each of the specified GMs
         """
-        gm_ids = self._im_df.index.values if gm_ids is None else gm_ids
+        im_values = self.get_im_df(None, str(IMj))
+        if gm_ids is not None:
+            im_values = im_values.loc[gm_ids]
 
-        return sha.compute_scaling_factor(str(IMj), im_j, self._im_df.loc[gm_ids, :])
+        return sha.compute_scaling_factor(im_values, str(IMj), im_j)
 
     def apply_amp_scaling(self, sf: pd.Series):
         """
@@ -327,16 +468,26 @@ class HistoricalGMDataset(GMDataset):
         self, site_info: site.SiteInfo, selected_gms: List[Any] = None
     ) -> pd.DataFrame:
         """See GMDataset method for parameter specifications"""
-        meta_df = pd.read_csv(self.empirical_IM_csv_ffp, index_col=0).loc[
-            :, ["mag", "rrup", "vs30"]
-        ]
+        if selected_gms is not None:
+            return self._metadata_df.loc[selected_gms]
+        return self._metadata_df.copy()
 
-        # Drop duplicates
-        meta_df = meta_df.loc[~meta_df.index.duplicated()]
+    def get_n_gms_in_bounds(
+        self,
+        metadata_df: pd.DataFrame,
+        cs_param_bounds: CausalParamBounds,
+        ignore_vs30: bool = False,
+    ):
+        """See GMDataset method for parameter specifications"""
+        # Use the range queries if the metadata is for the full dataset
+        if cs_param_bounds is not None and metadata_df.index.equals(self._gm_index):
+            return np.count_nonzero(
+                self._get_bounds_mask(cs_param_bounds, ignore_vs30=ignore_vs30)
+            )
 
-        if selected_gms is not None:
-            return meta_df.loc[selected_gms]
-        return meta_df
+        return super().get_n_gms_in_bounds(
+            metadata_df, cs_param_bounds, ignore_vs30=ignore_vs30
+        )
 
     def _get_filter_mask(
         self,
@@ -388,20 +539,24 @@ class SimulationGMDataset(GMDataset):
 
         self._ims = None
 
+        # Metadata of all available simulations, per station
+        self._metadata_dfs: Dict[str, pd.DataFrame] = {}
+
     @property
     def ims(self):
         if self._ims is None:
+            ims = None
             for cur_imdb_ffp in self.imdb_ffps:
                 with dbs.IMDBNonParametric(cur_imdb_ffp) as imdb:
                     cur_ims = [im for im in imdb.ims if IMType.has_value(im)]
-                    if self._ims is None:
-                        self._ims = set(cur_ims)
+                    if ims is None:
+                        ims = set(cur_ims)
                     else:
-                        self._ims.intersection_update(cur_ims)
+                        ims.intersection_update(cur_ims)
 
-        self._ims = to_im_list(list(self._ims))
+            self._ims = to_im_list(list(ims))
 
-        return self._ims
+        return list(self._ims)
 
     def write_waveforms(
         self, gm_ids: List[str], site_info: site.SiteInfo, output_dir: str
@@ -419,74 +574,80 @@ class SimulationGMDataset(GMDataset):
         **kwargs,
     ) -> pd.DataFrame:
         """See GMDataset method for parameter specifications"""
-        im_dfs = []
-        for cur_imdb_ffp in self.imdb_ffps:
-            with dbs.IMDBNonParametric(cur_imdb_ffp) as db:
-                cur_im_data = db.im_data(site_info.station_name)
-                if cur_im_data is None:
-                    continue
-
-                im_dfs.append(cur_im_data.reset_index(0))
+        return self._get_im_data(site_info, IMs, cs_param_bounds, log=False)
 
-        if len(im_dfs) == 0:
-            raise ValueError(f"No IM data found for station {site_info.station_name}")
-        im_df = pd.concat(im_dfs, axis=0)
+    def get_lnIM_df(
+        self,
+        site_info: site.SiteInfo,
+        IMs: Sequence[str],
+        cs_param_bounds: CausalParamBounds = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """See GMDataset method for parameter specifications"""
+        return self._get_im_data(site_info, IMs, cs_param_bounds, log=True)
 
+    def _get_im_data(
+        self,
+        site_info: site.SiteInfo,
+        IMs: Union[str, Sequence[str]],
+        cs_param_bounds: CausalParamBounds,
+        log: bool,
+    ) -> Union[pd.DataFrame, pd.Series]:
         if cs_param_bounds is not None:
             raise ValueError(
                 "CausalParamBounds should not be specified for "
                 "simulation based GMS as it is already site-specific"
             )
 
-        return im_df.loc[:, IMs]
+        return self._get_im_pool(site_info).get_im_df(IMs, log=log, fault_index=False)
+
+    def _get_im_pool(self, site_info: site.SiteInfo) -> dbs.SimulationIMPool:
+        im_pool = dbs.get_simulation_im_pool(self.imdb_ffps, site_info.station_name)
+        if im_pool is None:
+            raise ValueError(f"No IM data found for station {site_info.station_name}")
+        return im_pool
 
     def get_metadata_df(
         self, site_info: site.SiteInfo, selected_gms: List[Any] = None
     ) -> pd.DataFrame:
         """See GMDataset method for parameter specifications"""
-        vs30_df = pd.read_csv(
-            self.vs30_params_csv_ffp,
-            names=["station", "vs30"],
-            delimiter="\s+",
-            index_col="station",
+        if (meta_df := self._metadata_dfs.get(site_info.station_name)) is None:
+            meta_df = self._metadata_dfs[
+                site_info.station_name
+            ] = self._load_metadata_df(site_info)
+
+        if selected_gms is not None:
+            return meta_df.loc[selected_gms, ["mag", "rrup", "vs30"]]
+        return meta_df.copy()
+
+    def _load_metadata_df(self, site_info: site.SiteInfo) -> pd.DataFrame:
+        """Loads the metadata of all available simulations for the site"""
+        site_vs30 = float(
+            _get_vs30_df(self.vs30_params_csv_ffp).loc[site_info.station_name, "vs30"]
         )
-        site_vs30 = float(vs30_df.loc[site_info.station_name])
 
         # Site-source dataframe
         site_source_df = _get_site_source_df(
             self.site_source_db_ffp, site_info.station_name
         )
 
-        if selected_gms is not None:
-            meta_data = []
-            for cur_rel in selected_gms:
-                meta_data.append(
-                    (
-                        self.source_metadata_df.loc[cur_rel, "mag"],
-                        site_source_df.loc[cur_rel.split("_")[0]].rrup,
-                        site_vs30,
-                    )
-                )
-            meta_df = pd.DataFrame.from_records(meta_data, index=selected_gms)
-            meta_df.columns = ["mag", "rrup", "vs30"]
-        else:
-            # Need to filter based on actually available GM records
-            im_df = self.get_im_df(site_info, str(self.ims[0]))
-            source_df = self.source_metadata_df.loc[
-                np.isin(self.source_metadata_df.index.values, im_df.index.values)
-            ]
-
-            meta_df = pd.merge(
-                source_df,
-                site_source_df,
-                how="inner",
-                left_on="fault",
-                right_index=True,
+        # Need to filter based on actually available GM records
+        source_df = self.source_metadata_df.loc[
+            np.isin(
+                self.source_metadata_df.index.values,
+                self._get_im_pool(site_info).simulations,
             )
-            meta_df["vs30"] = site_vs30
-            meta_df = meta_df[["fault", "mag", "rrup", "vs30"]]
+        ]
 
-        return meta_df
+        meta_df = pd.merge(
+            source_df,
+            site_source_df,
+            how="inner",
+            left_on="fault",
+            right_index=True,
+        )
+        meta_df["vs30"] = site_vs30
+        return meta_df[["fault", "mag", "rrup", "vs30"]]
 
 
 class MixedGMDataset(GMDataset):
@@ -522,17 +683,18 @@ class MixedGMDataset(GMDataset):
     @property
     def ims(self):
         if self._ims is None:
+            ims = None
             for cur_imdb_ffp in self.imdb_ffps:
                 with dbs.IMDBNonParametric(cur_imdb_ffp) as imdb:
                     cur_ims = [im for im in imdb.ims if IMType.has_value(im)]
-                    if self._ims is None:
-                        self._ims = set(cur_ims)
+                    if ims is None:
+                        ims = set(cur_ims)
                     else:
-                        self._ims.intersection_update(cur_ims)
+                        ims.intersection_update(cur_ims)
 
-        self._ims = to_im_list(list(self._ims))
+            self._ims = to_im_list(list(ims))
 
-        return self._ims
+        return list(self._ims)
 
     def write_waveforms(
         self, gm_ids: Sequence[Any], site_info: site.SiteInfo, output_dir: str
@@ -558,12 +720,7 @@ class MixedGMDataset(GMDataset):
             raise NotImplementedError()
 
         # Filter based on Vs30
-        vs30_df = pd.read_csv(
-            self.vs30_params_csv_ffp,
-            names=["station", "vs30"],
-            delimiter="\s+",
-            index_col="station",
-        )
+        vs30_df = _get_vs30_df(self.vs30_params_csv_ffp)
         vs30_mask = (vs30_df.vs30 >= cs_param_bounds.vs30_low) & (
             vs30_df.vs30 <= cs_param_bounds.vs30_high
         )
@@ -642,12 +799,7 @@ class MixedGMDataset(GMDataset):
         self, site_info: site.SiteInfo, selected_gms: Sequence[Any] = None
     ) -> pd.DataFrame:
         """See GMDataset method for parameter specifications"""
-        vs30_df = pd.read_csv(
-            self.vs30_params_csv_ffp,
-            names=["station", "vs30"],
-            delimiter="\s+",
-            index_col="station",
-        )
+        vs30_df = _get_vs30_df(self.vs30_params_csv_ffp)
 
         # Site-source dataframe
         if selected_gms is not None:
@@ -677,6 +829,22 @@ class MixedGMDataset(GMDataset):
         return meta_df
 
 
+def _get_vs30_df(vs30_params_csv_ffp: str) -> pd.DataFrame:
+    """Loads the vs30 file, only parsed once per
+    file and modification time (i.e. version of the file)"""
+    return _load_vs30_df(vs30_params_csv_ffp, os.stat(vs30_params_csv_ffp).st_mtime_ns)
+
+
+@lru_cache(maxsize=MAX_N_VS30_DFS)
+def _load_vs30_df(vs30_params_csv_ffp: str, mtime_ns: int) -> pd.DataFrame:
+    return pd.read_csv(
+        vs30_params_csv_ffp,
+        names=["station", "vs30"],
+        delimiter="\s+",
+        index_col="station",
+    )
+
+
 def _get_site_source_df(site_source_db_ffp: Path, site_name: str):
     with dbs.SiteSourceDB(str(site_source_db_ffp), constants.SourceType.fault) as ssdb:
         return ssdb.station_data(site_name)
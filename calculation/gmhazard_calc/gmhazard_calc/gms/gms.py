@@ -1,5 +1,7 @@
 import time
-from typing import Optional, Sequence, Dict, Tuple
+import functools
+from concurrent.futures import Executor
+from typing import Optional, Sequence, Dict, Tuple, Union, List, Callable
 
 import pandas as pd
 import numpy as np
@@ -8,6 +10,7 @@ from scipy import stats
 import sha_calc as sha
 from gmhazard_calc.im import IM, IMType, to_im_list, to_string_list
 from gmhazard_calc import gm_data
+from gmhazard_calc import dbs
 from gmhazard_calc import site
 from gmhazard_calc import constants
 from gmhazard_calc import hazard
@@ -36,6 +39,10 @@ def run_ensemble_gms(
     im_weights: pd.Series = None,
     cs_param_bounds: CausalParamBounds = None,
     gms_id: str = None,
+    rupture_contribution_threshold: float = None,
+    seed: int = None,
+    executor: Executor = None,
+    early_stop_R_threshold: float = None,
 ) -> GMSResult:
     """
     Performs ensemble based ground motion selection
@@ -65,6 +72,25 @@ def run_ensemble_gms(
     cs_param_bounds: CausalParamBounds
         The causal filter parameters to apply
         pre-ground motion selection
+    rupture_contribution_threshold: float, optional
+        If specified, then only the ruptures with the largest
+        contribution (i.e. P_Rup_IMj) that cover this fraction of
+        the total contribution (e.g. 0.999) are used for the GCIM
+        computation and realisation generation
+        Only supported for parametric ensembles
+    seed: int, optional
+        Seed for the random number generation, each replica uses
+        its own random number generator spawned from this seed
+        If not specified, then the seed is drawn from the
+        numpy global random state (i.e. np.random.seed)
+    executor: Executor, optional
+        If specified, then the replica are run in parallel
+        using this executor, should be a thread pool,
+        results are the same as for serial execution
+    early_stop_R_threshold: float, optional
+        If specified, then no further replica are run once
+        a replica has n_gms unique GMs and a residual R
+        below this threshold (replica are checked in order)
 
     Returns
     -------
@@ -75,6 +101,15 @@ def run_ensemble_gms(
         im_weights = default_IM_weights(IMj, IMs)
 
     # Sanity checks
+    if (
+        rupture_contribution_threshold is not None
+        and ensemble.flt_im_data_type is not constants.IMDataType.parametric
+    ):
+        raise ValueError(
+            "The rupture contribution threshold is only "
+            "supported for parametric ensembles"
+        )
+
     assert np.all(
         np.isin(to_string_list(IMs), im_weights.index)
     ), "IM weights are not specified for all IMs"
@@ -134,6 +169,10 @@ def run_ensemble_gms(
             im_weights=im_weights,
             cs_param_bounds=cs_param_bounds,
             gms_id=gms_id,
+            rupture_contribution_threshold=rupture_contribution_threshold,
+            seed=seed,
+            executor=executor,
+            early_stop_R_threshold=early_stop_R_threshold,
         )
     elif (
         ensemble.is_simple
@@ -152,6 +191,9 @@ def run_ensemble_gms(
             im_weights=im_weights,
             cs_param_bounds=cs_param_bounds,
             gms_id=gms_id,
+            seed=seed,
+            executor=executor,
+            early_stop_R_threshold=early_stop_R_threshold,
         )
     else:
         raise NotImplementedError(
@@ -173,6 +215,9 @@ def _run_non_parametric_ensemble_gms(
     cs_param_bounds: CausalParamBounds = None,
     sigma_lnIMj: float = 0.05,
     gms_id: str = None,
+    seed: int = None,
+    executor: Executor = None,
+    early_stop_R_threshold: float = None,
 ) -> GMSResult:
     """Performs GMS based on a simulation ensemble
 
@@ -194,33 +239,21 @@ def _run_non_parametric_ensemble_gms(
             "for non-parametric (site-specific) GMS"
         )
 
-    n_ims = len(IMs)
     IMs_str = to_string_list(IMs)
-    im_ensembles = list({ensemble.get_im_ensemble(IMi.im_type) for IMi in IMs})
+    im_ensembles = list(
+        dict.fromkeys(ensemble.get_im_ensemble(IMi.im_type) for IMi in IMs)
+    )
 
     # Get the IMj im values for each simulation
     # from the ensemble, used to calculate IMi|IMj
-    sim_lnIMj_df = (
-        pd.concat(
-            [
-                shared.get_IM_values(
-                    cur_branch.get_imdb_ffps(constants.SourceType.fault), site_info
-                )
-                for cur_branch in ensemble.get_im_ensemble(IMj.im_type).branches
-            ]
-        )[str(IMj)]
-        .droplevel("fault")
-        .apply(np.log)
+    sim_lnIMj_df = _get_sim_lnIM_df(
+        ensemble.get_im_ensemble(IMj.im_type), site_info, str(IMj)
     )
 
     # Get the IM values for the ground motions simulations to select from
-    gm_lnIMi_df = gm_dataset.get_im_df(site_info, IMs_str, cs_param_bounds).apply(
-        np.log
-    )
+    gm_lnIMi_df = gm_dataset.get_lnIM_df(site_info, IMs_str, cs_param_bounds)
     assert np.all(gm_lnIMi_df.columns == IMs_str)
-    gm_lnIMj_df = gm_dataset.get_im_df(site_info, str(IMj), cs_param_bounds).apply(
-        np.log
-    )
+    gm_lnIMj_df = gm_dataset.get_lnIM_df(site_info, str(IMj), cs_param_bounds)
 
     # Truncate
     n_trunc_sigmas = 3
@@ -257,19 +290,8 @@ def _run_non_parametric_ensemble_gms(
 
         # Retrieve the IM values
         # from the ensemble, used to calculate IMi|IMj
-        cur_sim_lnIMi_df = (
-            pd.concat(
-                [
-                    shared.get_IM_values(
-                        cur_branch.get_imdb_ffps(constants.SourceType.fault),
-                        site_info,
-                        IMs=to_string_list(cur_IMs),
-                    )
-                    for cur_branch in cur_im_ensemble.branches
-                ]
-            )
-            .droplevel("fault")
-            .apply(np.log)
+        cur_sim_lnIMi_df = _get_sim_lnIM_df(
+            cur_im_ensemble, site_info, to_string_list(cur_IMs)
         )
 
         # Check that all required simulations exists
@@ -337,92 +359,30 @@ def _run_non_parametric_ensemble_gms(
     )
     corr_matrix = im_sigma / denominator
 
-    # Generate the realisations and
-    # compute the misfits & replica score
-    # (for each replica)
-    rep_rel_lnIMi_dfs = []
-    R_values, sel_gm_ind = [], []
-    IMi_gcim_sigmas = pd.Series(
-        {
-            str(cur_im): cur_gcim.lnIMi_IMj.sigma
-            for cur_im, cur_gcim in IMi_gcims.items()
-        }
-    )
-    for replica_ix in range(n_replica):
-        # Draw samples from MVN with covariance = correlation matrix
-        mvn_samples = np.random.multivariate_normal(
-            np.zeros(len(IMs)), corr_matrix, size=n_gms
-        )
-
-        # Transform to correlated vector of marginal uniform distribution
-        U = np.full((n_gms, n_ims), fill_value=np.nan)
-        for ix, cur_im in enumerate(IMs):
-            U[:, ix] = stats.norm.cdf(mvn_samples[:, ix])
-        U = pd.DataFrame(data=U, columns=IMs_str)
-
-        # Transform to IM values
-        cur_rel_im_values = np.full((n_gms, n_ims), fill_value=np.nan)
-        for im_ix, cur_im in enumerate(IMs):
-            cur_rel_im_values[:, im_ix] = sha.query_non_parametric_cdf_invs(
-                U[str(cur_im)].values,
-                IMi_gcims[cur_im].lnIMi_IMj.cdf.index.values,
-                IMi_gcims[cur_im].lnIMi_IMj.cdf.values,
-            )
-        cur_rel_lnIMi_df = pd.DataFrame(data=cur_rel_im_values, columns=IMs_str)
-        rep_rel_lnIMi_dfs.append(cur_rel_lnIMi_df)
-
-        cur_diff = (
-            cur_rel_lnIMi_df.values[
-                :,
-                np.newaxis,
-                :,
-            ]
-            - gm_lnIMi_df.values
-        )
-
-        cur_misfit = pd.DataFrame(
-            index=cur_rel_lnIMi_df.index,
-            data=np.sum(
-                im_weights.values
-                * (cur_diff / IMi_gcim_sigmas.values[np.newaxis, np.newaxis, :]) ** 2,
-                axis=2,
-            ),
-        )
-
-        cur_selected_gms_ind = gm_lnIMi_df.index.values[
-            cur_misfit.idxmin(axis=1).values
-        ]
-
-        D = ks_stats(
-            IMs,
-            gm_lnIMi_df.loc[cur_selected_gms_ind],
-            {cur_key: cur_gcim.lnIMi_IMj for cur_key, cur_gcim in IMi_gcims.items()},
-        )
-
-        R_values.append(np.sum(im_weights * (D ** 2)))
-        sel_gm_ind.append(list(cur_selected_gms_ind))
-
-    # Only select from the replica which have number of unique GMs == n_gms, or
-    # if there are none select from the set that has
-    # number of unique GMs == max number of unique GMs
-    # to prevent selection of duplicate GMs
-    n_unique_gms = np.asarray(
-        [np.count_nonzero(np.unique(cur_sel_gms_ind)) for cur_sel_gms_ind in sel_gm_ind]
-    )
-    filter_ind = np.flatnonzero(
-        n_unique_gms == n_gms
-        if np.any(n_unique_gms == n_gms)
-        else n_unique_gms == n_unique_gms.max()
-    )
-    print(
-        f"{gms_id} {site_info.station_name}: "
-        f"{filter_ind.size} replica with {n_unique_gms.max()}"
-        f" unique GMs (n_gms = {n_gms})"
+    # Generate the realisations and select the GMs (for each replica)
+    replica_results = _run_replicas(
+        functools.partial(
+            _run_non_parametric_replica,
+            n_gms=n_gms,
+            IMs=IMs,
+            corr_matrix=corr_matrix,
+            lnIMi_IMj={
+                cur_im: cur_gcim.lnIMi_IMj for cur_im, cur_gcim in IMi_gcims.items()
+            },
+            gm_lnIMi_df=gm_lnIMi_df,
+            im_weights=im_weights,
+        ),
+        n_replica,
+        n_gms,
+        seed=seed,
+        executor=executor,
+        early_stop_R_threshold=early_stop_R_threshold,
     )
 
     # Select the best fitting set of ground motions (if multiple replica were run)
-    selected_ix = np.argmin(R_values)
-    gm_ind, rel_lnIMi_df = sel_gm_ind[selected_ix], rep_rel_lnIMi_dfs[selected_ix]
+    rel_lnIMi_df, gm_ind, _ = _select_replica(
+        replica_results, n_gms, n_replica, f"{gms_id} {site_info.station_name}"
+    )
 
     # Add IMj
     rel_lnIMi_df[str(IMj)] = np.log(im_j)
@@ -444,6 +404,39 @@ def _run_non_parametric_ensemble_gms(
     )
 
 
+def _get_sim_lnIM_df(
+    im_ensemble: gm_data.IMEnsemble,
+    site_info: site.SiteInfo,
+    IMs: Union[str, Sequence[str]],
+) -> Union[pd.DataFrame, pd.Series]:
+    """Gets the log IM values (index = realisation) of
+    the simulations of all branches of the IM ensemble
+
+    Uses the shared simulation IM pools, unless a user vs30 is
+    specified, in which case the vs30 modification has to be applied
+    """
+    sim_lnIM_dfs = []
+    for cur_branch in im_ensemble.branches:
+        cur_imdb_ffps = cur_branch.get_imdb_ffps(constants.SourceType.fault)
+        if site_info.user_vs30 is None:
+            cur_pool = dbs.get_simulation_im_pool(cur_imdb_ffps, site_info.station_name)
+            if cur_pool is None:
+                raise ValueError(
+                    f"No IM data found for station {site_info.station_name}"
+                )
+            sim_lnIM_dfs.append(cur_pool.get_im_df(IMs, log=True, fault_index=False))
+        else:
+            sim_lnIM_dfs.append(
+                np.log(
+                    shared.get_IM_values(cur_imdb_ffps, site_info, IMs=IMs).droplevel(
+                        "fault"
+                    )
+                )
+            )
+
+    return pd.concat(sim_lnIM_dfs)
+
+
 def _run_parametric_ensemble_gms(
     ensemble: gm_data.Ensemble,
     site_info: site.SiteInfo,
@@ -457,6 +450,10 @@ def _run_parametric_ensemble_gms(
     im_weights: pd.Series = None,
     cs_param_bounds: CausalParamBounds = None,
     gms_id: str = None,
+    rupture_contribution_threshold: float = None,
+    seed: int = None,
+    executor: Executor = None,
+    early_stop_R_threshold: float = None,
 ) -> GMSResult:
     assert all(
         [
@@ -492,37 +489,29 @@ def _run_parametric_ensemble_gms(
     # Combine & Apply the branch weights
     P_Rup_IMj = P_Rup_IMj.multiply(IMj_adj_branch_weights, axis=1).sum(axis=1)
 
+    # Only keep the ruptures with the largest contributions
+    neglected_rupture_contribution = None
+    if rupture_contribution_threshold is not None:
+        n_ruptures = P_Rup_IMj.size
+        P_Rup_IMj, neglected_rupture_contribution = sha.truncate_rupture_weights(
+            P_Rup_IMj, rupture_contribution_threshold
+        )
+        print(
+            f"{gms_id} {site_info.station_name}: Using {P_Rup_IMj.size} of "
+            f"{n_ruptures} ruptures, neglected rupture contribution "
+            f"{neglected_rupture_contribution:.2e}"
+        )
+
     # Compute the correlation matrix
     rho = sha.compute_correlation_matrix(np.asarray(to_string_list(IMs)), str(IMj))
 
-    # Get correlated vector
-    v_vectors = sha.generate_correlated_vector(
-        n_gms, np.asarray(to_string_list(IMs)), rho, n_replica=n_replica
-    )
-
-    # Pre-allocate the realisation IM value array (and array for
-    # sigma of selected lnIMi|IMj,Rup distributions, required for residual calculation)
-    rep_rel_lnIMi_data = [
-        {IMi: np.full(n_gms, np.nan) for IMi in IMs} for ix in range(n_replica)
-    ]
-    rel_sigma_lnIMi_IMj_Rup = [
-        {IMi: np.full(n_gms, np.nan) for IMi in IMs} for ix in range(n_replica)
-    ]
-
     # Get list of ensembles that cover all IMi in IM vector (i.e. variable IMs)
     IMi_gcims = {}
-    im_ensembles = list({ensemble.get_im_ensemble(IMi.im_type) for IMi in IMs})
-
-    # Select the random ruptures to use for realisation generation
-    # Shape: [N_GMs, N_Replica]
-    rel_ruptures = np.random.choice(
-        P_Rup_IMj.index.values.astype(str),
-        size=n_gms * n_replica,
-        replace=True,
-        p=P_Rup_IMj.values,
-    ).reshape((n_gms, n_replica))
+    im_ensembles = list(
+        dict.fromkeys(ensemble.get_im_ensemble(IMi.im_type) for IMi in IMs)
+    )
 
-    # Computation of GCIM distribution and random realisation generation
+    # Computation of GCIM distribution
     # Overview of main steps:
     # Iterate over each IMEnsemble (i.e. IMi set) and compute
     # 1) Correlation coefficients
@@ -531,21 +520,16 @@ def _run_parametric_ensemble_gms(
     #   3) IMi value corresponding to exceedance of IMj=imj
     #   For each branch:
     #       4) Compute lnIMi|IMj,RUp and lnIMi|IMj
-    #   5) Generate array of [n_gms, n_replica] random numbers
-    #      between 0-1 for branch selection (same across IMi of
-    #      the current IMi set)
     #   For each IMi in IMi set:
-    #       6) Compute adjusted branch weights, using results from step 3)
-    #       7) Compute combined (i.e. across branches) lnIMi|IMj
-    #       For each replica_ix in n_replica:
-    #           7) Select n_gms random branches using the adjusted
-    #              branch weights for IMi
-    #           For each of the selected branches / ruptures:
-    #               8) Using current branch & rupture lnIMi|IMj,Rup
-    #                  generate random realisation
+    #       5) Compute adjusted branch weights, using results from step 3)
+    #       6) Compute combined (i.e. across branches) lnIMi|IMj
+    # The random realisations are then generated per replica,
+    # see _run_parametric_replica
+    im_ensemble_IMs, branch_cdfs = [], {}
     for cur_im_ensemble in im_ensembles:
         # Get the relevant IMi for this IMEnsemble
         cur_IMs = IMs[np.isin(IMs, cur_im_ensemble.ims)]
+        im_ensemble_IMs.append(cur_IMs)
 
         # Get the correlation coefficients
         corr_coeffs = pd.Series(
@@ -580,6 +564,8 @@ def _run_parametric_ensemble_gms(
             im_df = shared.get_IM_values(
                 cur_branch.get_imdb_ffps(constants.SourceType.fault), site_info
             )
+            if neglected_rupture_contribution is not None:
+                im_df = im_df.loc[P_Rup_IMj.index.values]
             sigma_cols = [f"{IMi}_sigma" for IMi in cur_IMs]
 
             # Compute lnIMi|IMj, Rup
@@ -613,16 +599,7 @@ def _run_parametric_ensemble_gms(
                 for IMi in cur_IMs
             }
 
-        # Pick N_gms random numbers, to select the branches for
-        # realisation generation
-        # Use the same random number for each IMi in the current set
-        # to ensure consistent branch/model selection
-        rand_branch_float = np.random.uniform(
-            low=0.0, high=1.0, size=(n_gms, n_replica)
-        )
-
         # Combine the branch lnIMi|IMj distributions for each of the current IMs
-        # and generate random realisation
         cur_branch_names = np.asarray(list(cur_im_ensemble.branches_dict.keys()))
         for IMi in cur_IMs:
             # Compute the adjusted branch weights, using the
@@ -659,56 +636,20 @@ def _run_parametric_ensemble_gms(
                     cur_branch_name: cur_data[IMi]
                     for cur_branch_name, cur_data in cur_branch_gcims.items()
                 },
+                neglected_rupture_contribution=neglected_rupture_contribution,
             )
 
-            # Generate realisation for current IMi,
-            # 1) select random branch
-            # 2) select random rupture
-            # 3) Apply the mean & sigma of the selected lnIMi|IMj,Rup to the
-            #    vector of correlated random numbers
-            for replica_ix in range(n_replica):
-                cur_branch_cdf = cur_adj_branch_weights[IMi].sort_values().cumsum()
-
-                # Ensure it goes to exactly 1.0, to prevent any issues
-                # (as rand_branch_float can go to 1.0)
-                assert np.isclose(cur_branch_cdf.iloc[-1], 1.0, rtol=1e-3), \
-                    "Current branch CDF does not go to 1.0"
-                cur_branch_cdf.iloc[-1] = 1.0
-
-                # Select n_gms random branches based on IMi adjusted branch weights
-                cur_sel_branches = sha.query_non_parametric_cdf_invs(
-                    rand_branch_float[:, replica_ix],
-                    cur_branch_cdf.index.values.astype(str),
-                    cur_branch_cdf.values,
-                )
-                for rel_ix, (cur_branch_name, cur_rupture) in enumerate(
-                    zip(cur_sel_branches, rel_ruptures[:, replica_ix])
-                ):
-                    # Apply mean & sigma of selected lnIMi|IMj,Rup to
-                    # to correponding value of correlated vector
-                    cur_branch_gcim = cur_branch_gcims[cur_branch_name][IMi]
-                    rep_rel_lnIMi_data[replica_ix][IMi][rel_ix] = (
-                        cur_branch_gcim.lnIMi_IMj_Rup.mu[cur_rupture]
-                        + cur_branch_gcim.lnIMi_IMj_Rup.sigma[cur_rupture]
-                        * v_vectors[replica_ix].loc[rel_ix, str(IMi)]
-                    )
-                    rel_sigma_lnIMi_IMj_Rup[replica_ix][IMi][
-                        rel_ix
-                    ] = cur_branch_gcim.lnIMi_IMj_Rup.sigma[cur_rupture]
-
-    # Convert results to dataframes (one per replica)
-    rep_rel_lnIMi_data = [
-        pd.DataFrame(
-            {str(cur_key): cur_value for cur_key, cur_value in cur_values.items()}
-        )
-        for cur_values in rep_rel_lnIMi_data
-    ]
-    rel_sigma_lnIMi_IMj_Rup = [
-        pd.DataFrame(
-            {str(cur_key): cur_value for cur_key, cur_value in cur_sigma_values.items()}
-        )
-        for cur_sigma_values in rel_sigma_lnIMi_IMj_Rup
-    ]
+            # Branch CDF, for the random branch selection
+            # during realisation generation
+            cur_branch_cdf = cur_adj_branch_weights[IMi].sort_values().cumsum()
+
+            # Ensure it goes to exactly 1.0, to prevent any issues
+            # (as the random branch numbers can go to 1.0)
+            assert np.isclose(
+                cur_branch_cdf.iloc[-1], 1.0, rtol=1e-3
+            ), "Current branch CDF does not go to 1.0"
+            cur_branch_cdf.iloc[-1] = 1.0
+            branch_cdfs[IMi] = cur_branch_cdf
 
     # Get the (scaled) ground motions IM values that fall
     # within the specified causal parameter bounds
@@ -718,12 +659,12 @@ def _run_parametric_ensemble_gms(
         cs_param_bounds=cs_param_bounds
     )
     sf = sha.compute_scaling_factor(gm_IMj_df.squeeze(), str(IMj), im_j)
-    gm_lnIM_df = gm_dataset.get_im_df(
+    gm_lnIM_df = gm_dataset.get_lnIM_df(
         site_info,
         IMs_str + [str(IMj)],
         cs_param_bounds=cs_param_bounds,
         sf=sf
-    ).apply(np.log)
+    )
     assert np.all(np.isclose(gm_lnIM_df[str(IMj)], np.log(im_j)))
 
     # Sanity check
@@ -736,70 +677,40 @@ def _run_parametric_ensemble_gms(
         f"{gms_id} {site_info.station_name}:\nPool of available GMs: {gm_lnIM_df.shape[0]}"
     )
 
-    # Compute residuals and select GMs for each replica
-    R_values, sel_gm_ind = [], []
-    for replica_ix in range(n_replica):
-        # Compute residuals between available GMs and current set of realisations
-        cur_sigma_lnIMi_Rup_IMj = (
-            rel_sigma_lnIMi_IMj_Rup[replica_ix].loc[:, IMs_str].values[:, np.newaxis, :]
-        )
-        cur_diff = (
-            rep_rel_lnIMi_data[replica_ix]
-            .loc[:, IMs_str]
-            .values[:, np.newaxis, :]
-            - gm_lnIM_df.loc[:, IMs_str].values
-        )
-        cur_misfit = pd.DataFrame(
-            index=rep_rel_lnIMi_data[replica_ix].index,
-            data=np.sum(
-                im_weights.loc[to_string_list(IMs)].values
-                * (cur_diff / cur_sigma_lnIMi_Rup_IMj) ** 2,
-                axis=2,
-            ),
-        )
-
-        # Select best matching GMs
-        cur_selected_gms_ind = gm_lnIM_df.index.values[cur_misfit.idxmin(axis=1).values]
-
-        # Compute the KS test statistic for each IM_i
-        # I.e. Check how well the empirical distribution of selected GMs
-        # matches with the target distribution (i.e. lnIMi|IMj)
-        D = ks_stats(
-            IMs,
-            gm_lnIM_df.loc[cur_selected_gms_ind],
-            {cur_IMi: cur_gcim.lnIMi_IMj for cur_IMi, cur_gcim in IMi_gcims.items()},
-        )
-
-        # Compute the overall residual & save selected ground motions
-        R_values.append(np.sum(im_weights * (D ** 2)))
-        sel_gm_ind.append(list(cur_selected_gms_ind))
-
-    # Free memory, as these can be large if the
-    # pool of available GMs is large
-    del cur_diff
-    del cur_misfit
-
-    # Only select from the replica which have number of unique GMs == n_gms, or
-    # if there are none select from the set that has
-    # number of unique GMs == max number of unique GMs
-    # to prevent selection of duplicate GMs
-    n_unique_gms = np.asarray(
-        [np.count_nonzero(np.unique(cur_sel_gms_ind)) for cur_sel_gms_ind in sel_gm_ind]
-    )
-    filter_ind = np.flatnonzero(
-        n_unique_gms == n_gms
-        if np.any(n_unique_gms == n_gms)
-        else n_unique_gms == n_unique_gms.max()
-    )
-    print(
-        f"{gms_id} {site_info.station_name}: "
-        f"{filter_ind.size} replica with {n_unique_gms.max()}"
-        f" unique GMs (n_gms = {n_gms})"
+    # Generate the realisations and select the GMs (for each replica)
+    replica_results = _run_replicas(
+        functools.partial(
+            _run_parametric_replica,
+            n_gms=n_gms,
+            IMs=IMs,
+            im_ensemble_IMs=im_ensemble_IMs,
+            rho=rho,
+            P_Rup_IMj=P_Rup_IMj,
+            branch_cdfs=branch_cdfs,
+            lnIMi_IMj_Rup={
+                cur_IMi: {
+                    cur_branch_name: cur_branch_gcim.lnIMi_IMj_Rup
+                    for cur_branch_name, cur_branch_gcim in cur_gcim.branch_uni_gcims.items()
+                }
+                for cur_IMi, cur_gcim in IMi_gcims.items()
+            },
+            lnIMi_IMj={
+                cur_IMi: cur_gcim.lnIMi_IMj for cur_IMi, cur_gcim in IMi_gcims.items()
+            },
+            gm_lnIM_df=gm_lnIM_df,
+            im_weights=im_weights,
+        ),
+        n_replica,
+        n_gms,
+        seed=seed,
+        executor=executor,
+        early_stop_R_threshold=early_stop_R_threshold,
     )
 
     # Select the best fitting set of ground motions (if multiple replica were run)
-    selected_ix = np.argmin(R_values)
-    gm_ind, rel_lnIMi_df = sel_gm_ind[selected_ix], rep_rel_lnIMi_data[selected_ix]
+    rel_lnIMi_df, gm_ind, _ = _select_replica(
+        replica_results, n_gms, n_replica, f"{gms_id} {site_info.station_name}"
+    )
 
     # Add IMj
     rel_lnIMi_df[str(IMj)] = np.log(im_j)
@@ -818,9 +729,295 @@ def _run_parametric_ensemble_gms(
         cs_param_bounds=cs_param_bounds,
         sf=sf[gm_ind],
         exceedance=exceedance,
+        rupture_contribution_threshold=rupture_contribution_threshold,
+        neglected_rupture_contribution=neglected_rupture_contribution,
     )
 
 
+def _run_replicas(
+    replica_fn: Callable[[np.random.Generator], Tuple[pd.DataFrame, List, float]],
+    n_replica: int,
+    n_gms: int,
+    seed: int = None,
+    executor: Executor = None,
+    early_stop_R_threshold: float = None,
+) -> List[Tuple[pd.DataFrame, List, float]]:
+    """Runs the GM selection replica, either
+    serially or in parallel using the executor
+
+    Each replica uses its own random number generator (spawned
+    from the seed), therefore the results do not depend
+    on the executor
+
+    Parameters
+    ----------
+    replica_fn: Callable
+        Runs a single replica with the given random number generator,
+        returns the realisations, the selected GM ids and the residual R
+    n_replica: int
+    n_gms: int
+    seed: int, optional
+    executor: Executor, optional
+    early_stop_R_threshold: float, optional
+        If specified, then only the replica up to (and including)
+        the first replica with n_gms unique GMs and R below this
+        threshold are returned, any remaining replica are not run
+
+    Returns
+    -------
+    list
+        The results of the replica, in replica order
+    """
+    # Draw the seed from the global random state if not specified,
+    # so that np.random.seed still results in reproducible results
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int32).max)
+    rngs = [
+        np.random.default_rng(cur_seed_seq)
+        for cur_seed_seq in np.random.SeedSequence(seed).spawn(n_replica)
+    ]
+
+    def is_early_stop(result: Tuple[pd.DataFrame, List, float]):
+        return (
+            early_stop_R_threshold is not None
+            and np.unique(result[1]).size == n_gms
+            and result[2] < early_stop_R_threshold
+        )
+
+    results = []
+    if executor is None:
+        for cur_rng in rngs:
+            results.append(replica_fn(cur_rng))
+            if is_early_stop(results[-1]):
+                break
+        return results
+
+    futures = [executor.submit(replica_fn, cur_rng) for cur_rng in rngs]
+    for ix, cur_future in enumerate(futures):
+        results.append(cur_future.result())
+        if is_early_stop(results[-1]):
+            for cur_future in futures[ix + 1 :]:
+                cur_future.cancel()
+            break
+    return results
+
+
+def _select_replica(
+    replica_results: List[Tuple[pd.DataFrame, List, float]],
+    n_gms: int,
+    n_replica: int,
+    log_prefix: str,
+) -> Tuple[pd.DataFrame, List, float]:
+    """Selects the best fitting replica, i.e. the replica with the smallest
+    residual R out of the replica with number of unique GMs == n_gms, or if there
+    are none, out of the replica with number of unique GMs == max number of unique GMs
+    (to prevent selection of duplicate GMs)"""
+    n_unique_gms = np.asarray(
+        [np.unique(cur_sel_gms_ind).size for _, cur_sel_gms_ind, _ in replica_results]
+    )
+    filter_ind = np.flatnonzero(
+        n_unique_gms == n_gms
+        if np.any(n_unique_gms == n_gms)
+        else n_unique_gms == n_unique_gms.max()
+    )
+    if len(replica_results) < n_replica:
+        print(f"{log_prefix}: Stopped early after {len(replica_results)} replica")
+    print(
+        f"{log_prefix}: "
+        f"{filter_ind.size} replica with {n_unique_gms.max()}"
+        f" unique GMs (n_gms = {n_gms})"
+    )
+
+    R_values = np.asarray([cur_R for _, _, cur_R in replica_results])
+    return replica_results[filter_ind[np.argmin(R_values[filter_ind])]]
+
+
+def _run_non_parametric_replica(
+    rng: np.random.Generator,
+    n_gms: int,
+    IMs: np.ndarray,
+    corr_matrix: np.ndarray,
+    lnIMi_IMj: Dict[IM, sha.Uni_lnIMi_IMj],
+    gm_lnIMi_df: pd.DataFrame,
+    im_weights: pd.Series,
+) -> Tuple[pd.DataFrame, List, float]:
+    """Generates the realisations and selects the GMs for
+    a single replica of the non-parametric GMS"""
+    # Draw samples from MVN with covariance = correlation matrix
+    mvn_samples = rng.multivariate_normal(np.zeros(len(IMs)), corr_matrix, size=n_gms)
+
+    # Transform to correlated vector of marginal uniform distribution
+    U = stats.norm.cdf(mvn_samples)
+
+    # Transform to IM values
+    rel_lnIMi_df = pd.DataFrame(
+        data=np.stack(
+            [
+                sha.query_non_parametric_cdf_invs(
+                    U[:, im_ix],
+                    lnIMi_IMj[cur_im].cdf.index.values,
+                    lnIMi_IMj[cur_im].cdf.values,
+                )
+                for im_ix, cur_im in enumerate(IMs)
+            ],
+            axis=1,
+        ),
+        columns=to_string_list(IMs),
+    )
+
+    return _select_gms(
+        IMs,
+        rel_lnIMi_df,
+        np.asarray([lnIMi_IMj[cur_im].sigma for cur_im in IMs])[np.newaxis, :],
+        gm_lnIMi_df,
+        lnIMi_IMj,
+        im_weights,
+    )
+
+
+def _run_parametric_replica(
+    rng: np.random.Generator,
+    n_gms: int,
+    IMs: np.ndarray,
+    im_ensemble_IMs: List[np.ndarray],
+    rho: pd.DataFrame,
+    P_Rup_IMj: pd.Series,
+    branch_cdfs: Dict[IM, pd.Series],
+    lnIMi_IMj_Rup: Dict[IM, Dict[str, sha.Uni_lnIMi_IMj_Rup]],
+    lnIMi_IMj: Dict[IM, sha.Uni_lnIMi_IMj],
+    gm_lnIM_df: pd.DataFrame,
+    im_weights: pd.Series,
+) -> Tuple[pd.DataFrame, List, float]:
+    """Generates the realisations and selects the GMs for
+    a single replica of the parametric GMS
+
+    For each realisation
+    1) Select a random rupture (based on P_Rup_IMj)
+    2) Select a random branch (for each IMEnsemble, i.e. IMi set),
+       based on the IMi adjusted branch weights
+    3) Apply the mean & sigma of the selected lnIMi|IMj,Rup to the
+       vector of correlated random numbers
+    """
+    IMs_str = to_string_list(IMs)
+
+    # Select the random ruptures to use for realisation generation
+    rel_ruptures = rng.choice(
+        P_Rup_IMj.index.values.astype(str),
+        size=n_gms,
+        replace=True,
+        p=P_Rup_IMj.values,
+    )
+
+    # Get correlated vector
+    (v_vector,) = sha.generate_correlated_vector(
+        n_gms, np.asarray(IMs_str), rho, rng=rng
+    )
+
+    rel_lnIMi_data, rel_sigma_lnIMi_IMj_Rup = {}, {}
+    for cur_IMs in im_ensemble_IMs:
+        # Use the same random number for each IMi in the current set
+        # to ensure consistent branch/model selection
+        rand_branch_float = rng.uniform(low=0.0, high=1.0, size=n_gms)
+
+        for IMi in cur_IMs:
+            # Select n_gms random branches based on IMi adjusted branch weights
+            cur_sel_branches = sha.query_non_parametric_cdf_invs(
+                rand_branch_float,
+                branch_cdfs[IMi].index.values.astype(str),
+                branch_cdfs[IMi].values,
+            )
+
+            # Get mean & sigma of the selected lnIMi|IMj,Rup
+            cur_mu, cur_sigma = np.full(n_gms, np.nan), np.full(n_gms, np.nan)
+            for cur_branch_name in np.unique(cur_sel_branches):
+                cur_mask = cur_sel_branches == cur_branch_name
+                cur_lnIMi_IMj_Rup = lnIMi_IMj_Rup[IMi][cur_branch_name]
+                cur_mu[cur_mask] = cur_lnIMi_IMj_Rup.mu.loc[
+                    rel_ruptures[cur_mask]
+                ].values
+                cur_sigma[cur_mask] = cur_lnIMi_IMj_Rup.sigma.loc[
+                    rel_ruptures[cur_mask]
+                ].values
+
+            rel_lnIMi_data[str(IMi)] = cur_mu + cur_sigma * v_vector[str(IMi)].values
+            rel_sigma_lnIMi_IMj_Rup[str(IMi)] = cur_sigma
+
+    return _select_gms(
+        IMs,
+        pd.DataFrame(rel_lnIMi_data).loc[:, IMs_str],
+        pd.DataFrame(rel_sigma_lnIMi_IMj_Rup).loc[:, IMs_str].values,
+        gm_lnIM_df,
+        lnIMi_IMj,
+        im_weights,
+    )
+
+
+def _select_gms(
+    IMs: np.ndarray,
+    rel_lnIMi_df: pd.DataFrame,
+    rel_sigma: np.ndarray,
+    gm_lnIM_df: pd.DataFrame,
+    lnIMi_IMj: Dict[IM, sha.Uni_lnIMi_IMj],
+    im_weights: pd.Series,
+) -> Tuple[pd.DataFrame, List, float]:
+    """Selects the best matching GM for each realisation and
+    computes the residual R of the selected GMs
+
+    Parameters
+    ----------
+    IMs: array of IMs
+    rel_lnIMi_df: dataframe
+        The realisations, columns = IMs
+    rel_sigma: array of floats
+        The sigma used for the residual, per realisation and IM,
+        shape [n_gms, n_IMs] (or broadcastable to it)
+    gm_lnIM_df: dataframe
+        The available GMs, columns = IMs
+    lnIMi_IMj: dictionary
+        The target lnIMi|IMj distributions, for the KS test statistic
+    im_weights: series
+
+    Returns
+    -------
+    dataframe
+        The realisations
+    list
+        The ids of the selected GMs
+    float
+        The residual R
+    """
+    IMs_str = to_string_list(IMs)
+    rel_values = rel_lnIMi_df.loc[:, IMs_str].values
+    gm_values = gm_lnIM_df.loc[:, IMs_str].values
+    weights = im_weights.loc[IMs_str].values
+    rel_sigma = np.broadcast_to(rel_sigma, rel_values.shape)
+
+    # Compute the misfit between available GMs and the realisations,
+    # one IM at a time, as the pool of available GMs can be large
+    misfit = np.zeros((rel_values.shape[0], gm_values.shape[0]))
+    for im_ix in range(len(IMs_str)):
+        misfit += (
+            weights[im_ix]
+            * (
+                (rel_values[:, im_ix, np.newaxis] - gm_values[np.newaxis, :, im_ix])
+                / rel_sigma[:, im_ix, np.newaxis]
+            )
+            ** 2
+        )
+
+    # Select best matching GMs
+    selected_gms_pos = np.nanargmin(misfit, axis=1)
+    selected_gms_ind = gm_lnIM_df.index.values[selected_gms_pos]
+
+    # Compute the KS test statistic for each IM_i
+    # I.e. Check how well the empirical distribution of selected GMs
+    # matches with the target distribution (i.e. lnIMi|IMj)
+    D = ks_stats(IMs, gm_lnIM_df.iloc[selected_gms_pos], lnIMi_IMj)
+
+    # Compute the overall residual
+    return rel_lnIMi_df, list(selected_gms_ind), float(np.sum(im_weights * (D ** 2)))
+
+
 def ks_stats(
     IMs: Sequence[IM],
     gms_im_df: pd.DataFrame,
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Union
 import json
 
 import numpy as np
@@ -7,6 +7,7 @@ import pandas as pd
 
 from gmhazard_calc import site
 from gmhazard_calc import exceptions
+from gmhazard_calc import result_io
 from gmhazard_calc import gm_data
 from gmhazard_calc.im import IM
 
@@ -129,6 +130,27 @@ class BaseHazardResult:
         with open(dir / self.METADATA_FN, "w") as f:
             json.dump({**{"im": str(self.im)}, **metadata}, f)
 
+    def _write_binary(self, writer: result_io.ResultWriter, metadata: Dict = None):
+        """Writes the HazardResult data to the binary result writer"""
+        metadata = metadata if metadata is not None else {}
+        writer.set_metadata(
+            {**{"im": str(self.im), "site": self.site.to_dict()}, **metadata}
+        )
+        writer.write("fault_hazard", self.fault_hazard)
+        writer.write("ds_hazard", self.ds_hazard)
+
+    @staticmethod
+    def _read_binary_data(reader: result_io.ResultReader):
+        """Reads the generic HazardResult data from the binary result reader"""
+        metadata = reader.metadata
+
+        return (
+            metadata,
+            site.SiteInfo.from_dict(metadata["site"]),
+            reader.read("fault_hazard"),
+            reader.read("ds_hazard"),
+        )
+
     @classmethod
     def _load_data(cls, data_dir: Path):
         """Loads the generic HazardResult data from the specified directory,
@@ -178,6 +200,14 @@ class BranchHazardResult(BaseHazardResult):
             IM.from_str(metadata["im"]), site_info, fault_hazard, ds_hazard, branch
         )
 
+    @classmethod
+    def _read_binary(cls, reader: result_io.ResultReader, branch: gm_data.Branch):
+        metadata, site_info, fault_hazard, ds_hazard = cls._read_binary_data(reader)
+
+        return cls(
+            IM.from_str(metadata["im"]), site_info, fault_hazard, ds_hazard, branch
+        )
+
 
 class EnsembleHazardResult(BaseHazardResult):
     """Exactly the same as HazardResult, except that it
@@ -192,14 +222,23 @@ class EnsembleHazardResult(BaseHazardResult):
         fault_hazard: pd.Series,
         ds_hazard: pd.Series,
         ensemble: gm_data.Ensemble,
-        branch_hazard: List[BranchHazardResult],
+        branch_hazard: Union[List[BranchHazardResult], result_io.LazyMember],
         percentiles: pd.DataFrame = None,
     ):
         super().__init__(im, site, fault_hazard, ds_hazard)
         self.ensemble = ensemble
-        self.branch_hazard = branch_hazard
+        self._branch_hazard = branch_hazard
         self.percentiles = percentiles
 
+    @property
+    def branch_hazard(self) -> List[BranchHazardResult]:
+        # Branch results are only loaded on first access
+        # when loaded from a binary result file
+        if isinstance(self._branch_hazard, result_io.LazyMember):
+            self._branch_hazard = self._branch_hazard.load()
+
+        return self._branch_hazard
+
     @property
     def branch_hazard_dict(self) -> Dict[str, BranchHazardResult]:
         return {cur_hazard.branch.name: cur_hazard for cur_hazard in self.branch_hazard}
@@ -234,16 +273,50 @@ class EnsembleHazardResult(BaseHazardResult):
 
         return save_dir
 
+    def save_binary(self, base_dir: Path, compression: str = None) -> Path:
+        """Saves an EnsembleHazardResult (including the branches)
+        as single binary file in the specified base directory
+
+        Parameters
+        ----------
+        base_dir: Path
+        compression: str, optional
+            The compression to use, e.g. gzip or lzf, see result_io
+
+        Returns
+        -------
+        Path
+            The file path of the saved result
+        """
+        ffp = result_io.get_binary_ffp(base_dir, self.get_save_dir(self.im))
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            self._write_binary(
+                writer, {"ensemble_params": self.ensemble.get_save_params()}
+            )
+            writer.write("percentiles", self.percentiles)
+
+            branch_writer = writer.group("branch_hazard")
+            for cur_branch_hazard in self.branch_hazard:
+                cur_branch_hazard._write_binary(
+                    branch_writer.group(cur_branch_hazard.branch.name),
+                    metadata={"branch_name": cur_branch_hazard.branch.name},
+                )
+
+        return ffp
+
     @staticmethod
     def get_save_dir(im: IM):
         return f"hazard_{im.file_format()}"
 
     @classmethod
-    def load(cls, data_dir: Path):
+    def load(cls, data_dir: Path, ensemble: gm_data.Ensemble = None):
         metadata, site_info, fault_hazard, ds_hazard = cls._load_data(data_dir)
 
         # Load the ensemble
-        ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
+        if ensemble is None:
+            ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
         im = IM.from_str(metadata["im"])
 
         # Load the branches, each directory in the branch_hazard folder
@@ -274,3 +347,33 @@ class EnsembleHazardResult(BaseHazardResult):
             branch_hazard,
             percentiles,
         )
+
+    @classmethod
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        """Loads an EnsembleHazardResult from a binary result file,
+        the branch results are only loaded when first accessed"""
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            metadata, site_info, fault_hazard, ds_hazard = cls._read_binary_data(reader)
+
+            if ensemble is None:
+                ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
+            im = IM.from_str(metadata["im"])
+            branches_dict = ensemble.get_im_ensemble(im.im_type).branches_dict
+
+            return cls(
+                im,
+                site_info,
+                fault_hazard,
+                ds_hazard,
+                ensemble,
+                reader.lazy(
+                    "branch_hazard",
+                    lambda branch_reader: [
+                        BranchHazardResult._read_binary(
+                            branch_reader.group(cur_name), branches_dict[cur_name]
+                        )
+                        for cur_name in branch_reader.group_keys()
+                    ],
+                ),
+                reader.read("percentiles"),
+            )
@@ -1,5 +1,7 @@
 import time
+import functools
 import multiprocessing as mp
+from concurrent.futures import Executor
 from typing import Tuple, Dict, Optional
 
 import numpy as np
@@ -28,6 +30,7 @@ def run_ensemble_hazard(
     branch_hazard: Optional[Dict[str, BranchHazardResult]] = None,
     im_values: Optional[np.ndarray] = None,
     calc_percentiles: bool = True,
+    executor: Optional[Executor] = None,
 ) -> EnsembleHazardResult:
     """Computes the weighted hazard curve for all branches in
     the specified ensemble.
@@ -49,6 +52,9 @@ def run_ensemble_hazard(
         hazard, not used if branches_hazard is passed in
     calc_percentiles: bool, optional
         True or False to calculate the 16th and 84th percentiles
+    executor: Executor, optional
+        Executor used for computing the hazard of the
+        branches in parallel, see run_branches_hazard
 
     Returns
     -------
@@ -70,6 +76,7 @@ def run_ensemble_hazard(
             site_info,
             im,
             im_values=im_values,
+            executor=executor,
         )
 
     # Combine the branches according to their weights
@@ -126,6 +133,7 @@ def run_branches_hazard(
     site_info: site.SiteInfo,
     im: IM,
     im_values: Optional[np.ndarray] = None,
+    executor: Optional[Executor] = None,
 ) -> Dict[str, BranchHazardResult]:
     """Runs computation of the hazard curve for each of the branches in
     the specified IM-ensemble.
@@ -140,6 +148,11 @@ def run_branches_hazard(
         IM Object to use for calculations
     im_values: array of floats, optional
         The IM values for which to calculate the hazard for.
+    executor: Executor, optional
+        If specified, then the hazard of the branches is computed in
+        parallel, either a thread pool or a process pool created via
+        shared.create_branch_executor
+        The result is the same (incl. order) as for the serial computation
 
     Returns
     -------
@@ -148,13 +161,34 @@ def run_branches_hazard(
     ensemble.check_im(im)
     im_ensemble = ensemble.get_im_ensemble(im.im_type)
 
-    hazards = {}
-    for branch_name, branch in im_ensemble.branches_dict.items():
-        hazards[branch_name] = run_branch_hazard(
-            branch, site_info, im, im_values=im_values
-        )
+    return shared.map_branches(
+        im_ensemble,
+        functools.partial(
+            run_branch_hazard, site_info=site_info, im=im, im_values=im_values
+        ),
+        executor=executor,
+        worker_fn=functools.partial(
+            _run_worker_branch_hazard, ensemble.name, site_info, im, im_values
+        ),
+        from_worker_fn=lambda branch, result: BranchHazardResult(
+            im, site_info, *result, branch
+        ),
+    )
+
 
-    return hazards
+def _run_worker_branch_hazard(
+    ensemble_name: str,
+    site_info: site.SiteInfo,
+    im: IM,
+    im_values: Optional[np.ndarray],
+    branch_name: str,
+) -> Tuple[pd.Series, pd.Series]:
+    """Computes the hazard of the branch in a branch worker process,
+    only returns the fault and ds hazard, as the result object
+    references the ensemble"""
+    branch = shared.get_worker_branch(ensemble_name, im.im_type, branch_name)
+    result = run_branch_hazard(branch, site_info, im, im_values=im_values)
+    return result.fault_hazard, result.ds_hazard
 
 
 def run_branch_hazard(
@@ -227,6 +261,7 @@ def run_full_hazard(
     im: IM,
     calc_percentiles: bool = False,
     im_values: Optional[np.ndarray] = None,
+    executor: Optional[Executor] = None,
 ) -> Tuple[EnsembleHazardResult, Dict[str, BranchHazardResult]]:
     """Convenience function, computes the ensemble
      and hazard for all branches.
@@ -243,6 +278,9 @@ def run_full_hazard(
         True or false for calculating 16th and 84th percentiles
     im_values: np.ndarray, optional
         The IM values for which to calculate the hazard for.
+    executor: Executor, optional
+        Executor used for computing the hazard of the
+        branches in parallel, see run_branches_hazard
 
     Returns
     -------
@@ -251,7 +289,9 @@ def run_full_hazard(
     dict:
         The hazard for each branch, key is the branch name
     """
-    branch_hazard = run_branches_hazard(ensemble, site_info, im, im_values=im_values)
+    branch_hazard = run_branches_hazard(
+        ensemble, site_info, im, im_values=im_values, executor=executor
+    )
     ens_hazard = run_ensemble_hazard(
         ensemble,
         site_info,
@@ -7,6 +7,7 @@ import pandas as pd
 
 from gmhazard_calc import site
 from gmhazard_calc import gm_data
+from gmhazard_calc import result_io
 from gmhazard_calc import constants as const
 from gmhazard_calc.im import IM
 
@@ -134,10 +135,56 @@ class NZS1170p5Result:
 
         return data_dir
 
+    def save_binary(self, base_dir: Path, prefix: str, compression: str = None) -> Path:
+        """Saves the NZS1170p5Result as single binary file
+        in the specified base directory, see result_io"""
+        ffp = result_io.get_binary_ffp(base_dir, self.get_save_dir(self.im, prefix))
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            writer.set_metadata(
+                {
+                    "ensemble_params": self.ensemble.get_save_params(),
+                    "site": self.site_info.to_dict(),
+                    "im": str(self.im),
+                    "sa_period": self.sa_period,
+                    "soil_class": self.soil_class.value,
+                    "Z": self.Z,
+                    "D": self.D,
+                }
+            )
+            writer.write("im_values", self.im_values)
+            writer.write("Ch", self.Ch)
+            writer.write("R", self.R)
+            writer.write("N", self.N)
+
+        return ffp
+
     @staticmethod
     def get_save_dir(im: IM, prefix: str):
         return f"{prefix}_nzs1170p5_{im.file_format()}"
 
+    @classmethod
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            metadata = reader.metadata
+
+            return cls(
+                gm_data.Ensemble.load(metadata["ensemble_params"])
+                if ensemble is None
+                else ensemble,
+                site.SiteInfo.from_dict(metadata["site"]),
+                IM.from_str(metadata["im"]),
+                metadata["sa_period"],
+                reader.read("im_values"),
+                reader.read("Ch"),
+                const.NZSSoilClass(metadata["soil_class"]),
+                metadata["Z"],
+                reader.read("R"),
+                metadata["D"],
+                reader.read("N"),
+            )
+
     @classmethod
     def load(cls, data_dir: Path, ensemble: gm_data.Ensemble = None):
         with open(data_dir / cls.METADATA_FN, "r") as f:
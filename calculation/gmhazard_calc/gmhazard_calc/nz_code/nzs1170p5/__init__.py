@@ -1,3 +1,11 @@
-from .nzs1170p5 import run_ensemble_nzs1170p5, get_soil_class, get_distance_from_site_info, run_hazard_map
+from .nzs1170p5 import (
+    run_ensemble_nzs1170p5,
+    run_ensemble_nzs1170p5_ims,
+    get_soil_class,
+    get_distance_from_site_info,
+    get_station_distances,
+    run_hazard_map,
+    run_hazard_maps,
+)
 from .NZS1170p5Result import NZS1170p5Result
-from gmhazard_calc.nz_code.nzs1170p5.nzs_zfactor_2016.ll2z import ll2z, CITY_RADIUS_SEARCH
\ No newline at end of file
+from gmhazard_calc.nz_code.nzs1170p5.nzs_zfactor_2016.ll2z import ll2z, get_z_interpolator, CITY_RADIUS_SEARCH
\ No newline at end of file
@@ -1,11 +1,10 @@
-import time
-import multiprocessing as mp
-from typing import Optional, Union, Iterable
+from typing import Optional, Union, Sequence, List, Dict
 
 import pandas as pd
 import numpy as np
 
 import sha_calc as sha_calc
+from gmhazard_calc import dbs
 from gmhazard_calc import site
 from gmhazard_calc import gm_data
 from gmhazard_calc import site_source
@@ -76,6 +75,39 @@ def run_ensemble_nzs1170p5(
     -------
     NZS1170p5Result
     """
+    return run_ensemble_nzs1170p5_ims(
+        ensemble,
+        site_info,
+        [im],
+        exceedance_values=exceedance_values,
+        soil_class=soil_class,
+        distance=distance,
+        z_factor=z_factor,
+        z_factor_radius=z_factor_radius,
+    )[0]
+
+
+def run_ensemble_nzs1170p5_ims(
+    ensemble: gm_data.Ensemble,
+    site_info: site.SiteInfo,
+    ims: Sequence[IM],
+    exceedance_values: np.array = DEFAULT_EXCEEDANCE_VALUES,
+    soil_class: Optional[const.NZSSoilClass] = None,
+    distance: Optional[float] = None,
+    z_factor: Optional[float] = None,
+    z_factor_radius: Optional[float] = ll2z.CITY_RADIUS_SEARCH,
+) -> List[Union[NZS1170p5Result, None]]:
+    """
+    Performs the NZ code spectra calculation for multiple IMs,
+    using a single spectra computation for all IMs and exceedances
+
+    See run_ensemble_nzs1170p5 for details on the parameters
+
+    Returns
+    -------
+    list of NZS1170p5Result
+        One result per IM, in the same order as ims
+    """
     if distance is None:
         distance = get_distance_from_site_info(ensemble, site_info)
 
@@ -87,63 +119,64 @@ def run_ensemble_nzs1170p5(
     if soil_class is None:
         soil_class = get_soil_class(site_info.vs30)
 
-    if im.im_type != IMType.PGA and not im.is_pSA():
-        raise Exception("Invalid IM type specified, has to be either PGA or pSA")
-    sa_period = 0 if im.im_type == IMType.PGA else im.period
-
-    result_dict, R_dict, N_dict, Ch_dict = {}, {}, {}, {}
-    for cur_exceedance in exceedance_values:
-        cur_rp = 1 / cur_exceedance
-
-        if cur_rp < 20 or cur_rp > 2500:
-            result_dict[cur_exceedance] = np.nan
-        else:
-            C, Ch, R, N = sha_calc.nzs1170p5_spectra(
-                [sa_period], z_factor, cur_rp, distance, soil_class.value
-            )
-            result_dict[cur_exceedance] = float(C)
-            R_dict[cur_exceedance] = R
-            N_dict[cur_exceedance] = float(N)
-            Ch_dict[cur_exceedance] = float(Ch)
-
-    if im.component != IMComponent.Larger:
-        if im.is_pSA() or im.im_type is IMType.PGA:
-            ratio = sha_calc.get_computed_component_ratio(
+    sa_periods = [get_sa_period(im) for im in ims]
+
+    exceedance_values = np.asarray(exceedance_values)
+    if exceedance_values.size == 0:
+        return [None] * len(ims)
+
+    # NZ code is only defined for return periods between 20 and 2500 years
+    return_periods = 1 / exceedance_values
+    mask = (return_periods >= 20) & (return_periods <= 2500)
+    valid_exceedances = exceedance_values[mask]
+
+    # C & N format: [n_valid_exceedances, n_ims]
+    C, Ch, R, N = sha_calc.nzs1170p5_spectra(
+        sa_periods, z_factor, return_periods[mask], distance, soil_class.value
+    )
+
+    results = []
+    for ix, im in enumerate(ims):
+        im_values = np.full(exceedance_values.size, np.nan)
+        im_values[mask] = C[:, ix]
+
+        if im.component != IMComponent.Larger:
+            im_values *= sha_calc.get_computed_component_ratio(
                 str(IMComponent.Larger),
                 str(im.component),
                 # Using period of 0.01 for PGA IM
                 im.period if im.is_pSA() else 0.01,
             )
-            result_dict = {key: value * ratio for key, value in result_dict.items()}
-
-    if len(result_dict) > 0:
-        return NZS1170p5Result(
-            ensemble,
-            site_info,
-            im,
-            sa_period,
-            pd.Series(result_dict, name="im_values"),
-            pd.Series(Ch_dict),
-            soil_class,
-            z_factor,
-            pd.Series(R_dict),
-            distance,
-            pd.Series(N_dict),
+
+        results.append(
+            NZS1170p5Result(
+                ensemble,
+                site_info,
+                im,
+                sa_periods[ix],
+                pd.Series(im_values, index=exceedance_values, name="im_values"),
+                pd.Series(float(Ch[ix]), index=valid_exceedances),
+                soil_class,
+                z_factor,
+                pd.Series(R, index=valid_exceedances),
+                distance,
+                pd.Series(N[:, ix], index=valid_exceedances),
+            )
         )
 
-    return None
+    return results
 
 
 def run_hazard_map(
-    ensemble: gm_data.Ensemble, im: IM, exceedance: float, n_procs: Optional[int] = 4
+    ensemble: gm_data.Ensemble,
+    im: IM,
+    exceedance: float,
+    n_procs: Optional[int] = None,
 ) -> pd.DataFrame:
     """
     Computes the NZ code hazard at each station in the ensemble for the
     specified exceedance.
 
-    Note: If hdf5 locking issues occur, run this using the
-    env variable HDF5_USE_FILE_LOCKING="False"
-
     Parameters
     ----------
     ensemble: Ensemble
@@ -152,48 +185,102 @@ def run_hazard_map(
     exceedance: float
         The exceedance value
     n_procs:
-        Number of processes to use
+        Not used, the hazard of all stations is computed
+        in a single vectorised computation
 
     Returns
     -------
-    pd.Series
-        format: index = station_name, values: exceedance probability
+    pd.DataFrame
+        format: index = station_name, columns = [lon, lat, value]
+        where value is the NZ code IM value
     """
-    if im.im_type != IMType.PGA and not im.is_pSA():
-        raise Exception(f"Invalid IM {im} specified, has to be either PGA or pSA")
-    im_period = 0 if im.im_type == IMType.PGA else im.period
+    return run_hazard_maps(ensemble, [im], exceedance)[im]
+
+
+def run_hazard_maps(
+    ensemble: gm_data.Ensemble, ims: Sequence[IM], exceedance: float
+) -> Dict[IM, pd.DataFrame]:
+    """
+    Computes the NZ code hazard at each station in the ensemble for the
+    specified exceedance and IMs, using a single spectra computation
+
+    Parameters
+    ----------
+    ensemble: Ensemble
+    ims: list of IMs
+        The IMs of interest, have to be either PGA or pSA
+    exceedance: float
+        The exceedance value
+
+    Returns
+    -------
+    dictionary
+        The hazard map dataframe (see run_hazard_map) per IM
+    """
+    sa_periods = [get_sa_period(im) for im in ims]
 
     # Drop duplicate location stations
     stations_df = ensemble.stations.drop_duplicates(subset=["lon", "lat"])
+    station_names = stations_df.index.values
 
-    n_stations = stations_df.shape[0]
-    if n_procs == 1:
-        excd_probs = []
-        for ix, station_name in enumerate(stations_df.index.values):
-            excd_probs.append(
-                get_hazard(
-                    ensemble, station_name, im_period, exceedance, ix, n_stations
-                )
-            )
-    else:
-        with mp.Pool(n_procs) as p:
-            excd_probs = p.starmap(
-                get_hazard,
-                [
-                    (ensemble, station_name, im_period, exceedance, ix, n_stations)
-                    for ix, station_name in enumerate(stations_df.index.values)
-                ],
-            )
+    z_factors = ll2z.get_z_interpolator().get_z_values(
+        stations_df.loc[:, ["lon", "lat"]].values,
+        radius_search=ll2z.CITY_RADIUS_SEARCH,
+    )
+    distances = get_station_distances(ensemble, station_names)
+    soil_classes = np.asarray(
+        [
+            get_soil_class(cur_vs30).value
+            for cur_vs30 in ensemble.vs30_df.loc[station_names, "vs30"].values
+        ]
+    )
+
+    # C format: [n_stations, n_ims]
+    C, _, _, _ = sha_calc.nzs1170p5_spectra(
+        sa_periods, z_factors, 1 / exceedance, distances, soil_classes
+    )
+
+    results = {}
+    for ix, im in enumerate(ims):
+        result_df = stations_df.copy()
+        result_df["value"] = C[:, ix]
+        results[im] = result_df
+
+    return results
 
-    result_df = stations_df.copy()
-    result_df["value"] = excd_probs
-    return result_df
+
+def get_sa_period(im: IM) -> float:
+    """Gets the NZ code spectra period for the specified IM"""
+    if im.im_type != IMType.PGA and not im.is_pSA():
+        raise Exception(f"Invalid IM {im} specified, has to be either PGA or pSA")
+    return 0 if im.im_type == IMType.PGA else im.period
 
 
 def get_distance_from_site_info(ensemble: gm_data.Ensemble, site_info: site.SiteInfo):
     """Gets the near fault factor for the specified site"""
-    distance_df = site_source.get_distance_df(ensemble.flt_ssddb_ffp, site_info)
+    return _get_near_fault_distance(
+        site_source.get_distance_df(ensemble.flt_ssddb_ffp, site_info)
+    )
+
+
+def get_station_distances(
+    ensemble: gm_data.Ensemble, station_names: Sequence[str]
+) -> np.ndarray:
+    """Gets the near fault distance for each of the specified
+    stations, reading all of them in a single SiteSourceDB session"""
+    with dbs.SiteSourceDB(ensemble.flt_ssddb_ffp) as db:
+        return np.asarray(
+            [
+                _get_near_fault_distance(db.station_data(cur_station_name))
+                for cur_station_name in station_names
+            ],
+            dtype=float,
+        )
 
+
+def _get_near_fault_distance(distance_df: Union[pd.DataFrame, None]):
+    """Gets the distance to the closest contributing
+    fault from the site-source distance dataframe"""
     distance = DEFAULT_NEAR_FAULT_DISTANCE
     if distance_df is not None:
         cur_contr_faults = list(
@@ -221,57 +308,3 @@ def get_soil_class(vs30: float):
         return const.NZSSoilClass.weak_rock
     else:
         return const.NZSSoilClass.rock
-
-
-def get_hazard(
-    ensemble: gm_data.Ensemble,
-    station_name: str,
-    im_periods: Union[Iterable[float], float],
-    exceedance: float,
-    ix: Optional[int] = None,
-    n_stations: Optional[int] = None,
-):
-    """
-    Computes the NZ code hazard for the single exceedance value
-
-    Parameters
-    ----------
-    ensemble: Ensemble
-    station_name: str
-    im_periods: iterable of floats or single float
-        The spectral acceleration periods of interest
-    exceedance: float
-        The annual exceedance of interest
-    ix: int, optional
-        Station index, only used for progress tracking when
-        using this function in a multiprocessing manner
-    n_stations: int, optional
-        Same as ix
-
-    Returns
-    -------
-    float or pd.Series
-        Returns the single NZ code value if im_periods is a single float value,
-        otherwise returns a pd.Series of format,
-        index = SA period, values = NZ code values
-    """
-    # Compute nz code values
-    start_time = time.time()
-    site_info = site.get_site_from_name(ensemble, station_name)
-    C, Ch, R, N = sha_calc.nzs1170p5_spectra(
-        [im_periods] if isinstance(im_periods, float) else im_periods,
-        ll2z.ll2z(
-            (site_info.lon, site_info.lat), radius_search=ll2z.CITY_RADIUS_SEARCH
-        ),
-        1 / exceedance,
-        get_distance_from_site_info(ensemble, site_info),
-        get_soil_class(site_info.vs30).value,
-    )
-
-    if ix is not None and n_stations is not None:
-        print(
-            f"NZ Code Hazard - Progress {ix}/{n_stations} - station {station_name} "
-            f"- {time.time() - start_time}"
-        )
-
-    return float(C) if C.size == 1 else C
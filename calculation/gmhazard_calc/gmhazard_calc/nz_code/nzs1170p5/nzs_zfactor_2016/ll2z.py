@@ -5,9 +5,10 @@ import os
 from matplotlib.path import Path
 import numpy as np
 import pandas as pd
-from scipy.interpolate import griddata
+from scipy.interpolate import LinearNDInterpolator
 
 from qcore import geo
+from gmhazard_calc import utils
 
 DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zdata")
 
@@ -24,6 +25,133 @@ CITY_RADIUS_SEARCH = 2
 Z_VALS = [0.13, 0.15, 0.175, 0.188, 0.20, 0.25, 0.275, 0.30, 0.325, 0.35, 0.375, 0.40, 0.415, 0.425, 0.45, 0.475, 0.50, 0.525, 0.55, 0.575, 0.60]
 Z_FORMAT = os.path.join(DATA, "Z_%.3f_points_WGS84.txt")
 
+# Z-value used outside of the contours
+Z_DEFAULT = 0.13
+
+# Tolerance (km) for the approximate city distance check,
+# the exact distances are only computed for locations within
+# radius_search + tolerance of a city
+CITY_DIST_TOLERANCE = 1.0
+
+# Maximum number of location-city pairs per block of the city distance check
+CITY_DIST_BLOCK_SIZE = 1_000_000
+
+_z_interpolator = None
+
+
+class ZInterpolator:
+    """Computes the z-values for locations, the polygon, city and
+    contour data is loaded (and the contours triangulated) once on creation
+
+    Use get_z_interpolator to get the (module level) shared instance
+    """
+
+    def __init__(self):
+        self.polygons = [
+            (
+                Path(
+                    geo.path_from_corners(
+                        corners=np.loadtxt(polygon_ffp).tolist(),
+                        output=None,
+                        min_edge_points=4,
+                    )
+                ),
+                polygon_z,
+            )
+            for polygon_ffp, polygon_z in POLYGONS
+        ]
+
+        self.cities = pd.read_csv(
+            os.path.join(DATA, "cities_z.csv"),
+            header=None,
+            names=["lon", "lat", "city", "z_value"],
+        )
+
+        # Same as griddata with the linear method,
+        # but the triangulation is only done once
+        points = [np.atleast_2d(np.loadtxt(Z_FORMAT % z)) for z in Z_VALS]
+        self.contour_interpolator = LinearNDInterpolator(
+            np.concatenate(points),
+            np.repeat(Z_VALS, [cur_points.shape[0] for cur_points in points]),
+        )
+
+    def get_z_values(
+        self, locations: np.ndarray, radius_search: float = CITY_RADIUS_SEARCH
+    ) -> np.ndarray:
+        """Computes the z-values for the given locations
+
+        Parameters
+        ----------
+        locations: array of floats
+            The locations, shape [n_locations, 2], with columns lon, lat
+        radius_search: float, optional
+            Checks to see if a city is within X km from the given location,
+            removes the search if value is set to 0
+
+        Returns
+        -------
+        array of floats
+            The z-values, one for each location
+        """
+        locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+        out = np.zeros(locations.shape[0])
+
+        # check if in polygon
+        for polygon, polygon_z in self.polygons:
+            out = np.where(polygon.contains_points(locations), polygon_z, out)
+
+        # check if within specified radius from city
+        if radius_search > 0:
+            city_ind = self._get_nearby_city_ind(locations, radius_search)
+            mask = city_ind >= 0
+            out[mask] = self.cities.z_value.values[city_ind[mask]]
+
+        # interpolate contours
+        z = self.contour_interpolator(locations)
+
+        return np.where(out == 0, np.where(np.isnan(z), Z_DEFAULT, z), out)
+
+    def _get_nearby_city_ind(
+        self, locations: np.ndarray, radius_search: float
+    ) -> np.ndarray:
+        """Gets the index of the closest city for each location with a city
+        within the radius_search distance, -1 for all other locations
+
+        Candidate locations are selected using a vectorised (approximate)
+        distance check, the exact distances are then computed
+        using qcore.geo.get_distances (as for a single location)
+        """
+        cities_ll = self.cities[["lon", "lat"]].values
+
+        candidate_mask = np.zeros(locations.shape[0], dtype=bool)
+        block_size = max(CITY_DIST_BLOCK_SIZE // cities_ll.shape[0], 1)
+        for ix in range(0, locations.shape[0], block_size):
+            dists = utils.great_circle_dist(
+                locations[ix : ix + block_size, 0, np.newaxis],
+                locations[ix : ix + block_size, 1, np.newaxis],
+                cities_ll[:, 0],
+                cities_ll[:, 1],
+            )
+            candidate_mask[ix : ix + block_size] = np.any(
+                dists < radius_search + CITY_DIST_TOLERANCE, axis=1
+            )
+
+        city_ind = np.full(locations.shape[0], -1, dtype=int)
+        for ix in np.flatnonzero(candidate_mask):
+            dists = geo.get_distances(cities_ll, locations[ix, 0], locations[ix, 1])
+            if np.any(dists < radius_search):
+                city_ind[ix] = np.argmin(dists)
+
+        return city_ind
+
+
+def get_z_interpolator() -> ZInterpolator:
+    """Gets the shared ZInterpolator, created on first use"""
+    global _z_interpolator
+    if _z_interpolator is None:
+        _z_interpolator = ZInterpolator()
+    return _z_interpolator
+
 
 def ll2z(locations, radius_search=CITY_RADIUS_SEARCH):
     """Computes the z-value for the given lon, lat tuple or
@@ -33,47 +161,7 @@ def ll2z(locations, radius_search=CITY_RADIUS_SEARCH):
                           removes the search if value is set to 0
     :return: Array of z-values, one for each location specified
     """
-    try:
-        multi = bool(len(locations[0]))
-    except TypeError:
-        multi = False
-        locations = [locations]
-    out = np.zeros(len(locations))
-
-    # check if in polygon
-    for p in POLYGONS:
-        c = Path(
-            geo.path_from_corners(
-                corners=np.loadtxt(p[0]).tolist(), output=None, min_edge_points=4
-            )
-        ).contains_points(locations)
-        out = np.where(c, p[1], out)
-
-    # check if within specified radius from city
-    if radius_search > 0:
-        cities = pd.read_csv(os.path.join(DATA, 'cities_z.csv'), header=None, names=['lon', 'lat', 'city', 'z_value'])
-
-        cities_ll = cities[['lon', 'lat']].values
-        for i, location in enumerate(locations):
-            dists = geo.get_distances(cities_ll, location[0], location[1])
-
-            if np.any(dists < radius_search):
-                cities['dist'] = dists
-                city_idx = cities.dist.idxmin()
-                out[i] = cities.loc[city_idx].z_value
-
-    # interpolate contours
-    nz = []
-    points_all = []
-    for z in Z_VALS:
-        points = np.atleast_2d(np.loadtxt(Z_FORMAT % z))
-        nz.append(len(points))
-        points_all.append(points)
-    points = np.concatenate(points_all)
-    del points_all
-    z = griddata(points, np.repeat(Z_VALS, nz), locations, method="linear")
-
-    return np.where(out == 0, np.where(np.isnan(z), 0.13, z), out)
+    return get_z_interpolator().get_z_values(locations, radius_search=radius_search)
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ import pandas as pd
 
 from gmhazard_calc import site
 from gmhazard_calc import gm_data
+from gmhazard_calc import result_io
 from gmhazard_calc import constants as const
 
 
@@ -92,17 +93,57 @@ class NZTAResult:
                 f,
             )
 
+    def save_binary(self, base_dir: Path, compression: str = None) -> Path:
+        """Saves the NZTAResult as single binary file
+        in the specified base directory, see result_io"""
+        ffp = result_io.get_binary_ffp(base_dir, self.get_save_dir())
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            writer.set_metadata(
+                {
+                    "ensemble_params": self.ensemble.get_save_params(),
+                    "site": self.site_info.to_dict(),
+                    "nearest_town": self.nearest_town,
+                    "soil_class": self.soil_class.value,
+                    "M_eff": self.M_eff,
+                    "c0_1000": self.C0_1000,
+                }
+            )
+            writer.write("pga_values", self.pga_values)
+
+        return ffp
+
     @staticmethod
     def get_save_dir():
         return "hazard_nzta"
 
     @classmethod
-    def load(cls, data_dir: Path):
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            metadata = reader.metadata
+
+            return cls(
+                gm_data.Ensemble.load(metadata["ensemble_params"])
+                if ensemble is None
+                else ensemble,
+                site.SiteInfo.from_dict(metadata["site"]),
+                const.NZTASoilClass(metadata["soil_class"]),
+                reader.read("pga_values"),
+                metadata["M_eff"],
+                metadata["c0_1000"],
+                metadata["nearest_town"],
+            )
+
+    @classmethod
+    def load(cls, data_dir: Path, ensemble: gm_data.Ensemble = None):
         with open(data_dir / cls.METADATA_FN, "r") as f:
             metadata = json.load(f)
 
         return cls(
-            gm_data.Ensemble.load(metadata["ensemble_params"]),
+            gm_data.Ensemble.load(metadata["ensemble_params"])
+            if ensemble is None
+            else ensemble,
             site.SiteInfo.load(data_dir),
             const.NZSSoilClass(metadata["soil_class"]),
             pd.read_csv(
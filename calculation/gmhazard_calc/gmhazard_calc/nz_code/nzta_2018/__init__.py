@@ -1,2 +1,8 @@
-from .nzta import run_ensemble_nzta, get_soil_class
+from .nzta import (
+    run_ensemble_nzta,
+    run_nzta_batch,
+    get_soil_class,
+    get_nzta_lookup,
+    NZTALookup,
+)
 from .NZTAResult import NZTAResult
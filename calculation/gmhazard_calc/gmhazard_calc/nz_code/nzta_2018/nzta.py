@@ -1,17 +1,18 @@
 import os
-from typing import Union
+from typing import Union, Sequence, List, Tuple
 
 import math
 import pandas as pd
 import numpy as np
+from scipy.spatial import cKDTree
 
 import sha_calc as sha
 from gmhazard_calc import site
+from gmhazard_calc import utils
 from gmhazard_calc import gm_data
 from gmhazard_calc import constants as const
 from gmhazard_calc.im import IMComponent
 from .NZTAResult import NZTAResult
-from qcore import geo
 
 # The following CSV file was based on p.147 NZTA Bridge Manual Commentary,
 # where, Lat and Lon of each town was obtained from wikipedia (produced by geohack.toolforge.org)
@@ -25,6 +26,69 @@ NZTA_LOOKUP_FFP = os.path.join(
 DEFAULT_RETURN_PERIODS = np.array([20, 25, 50, 100, 250, 500, 1000, 2000, 2500])
 DEFAULT_EXCEEDANCE_VALUES = 1 / DEFAULT_RETURN_PERIODS
 
+_nzta_lookup = None
+
+
+class NZTALookup:
+    """The NZTA lookup table (see NZTA_LOOKUP_FFP) together with a
+    spatial index of the towns, for nearest town queries
+
+    The towns are indexed using a KD-tree on earth-centred
+    cartesian coordinates, where the chord length is monotonic
+    in the great circle distance
+
+    Use get_nzta_lookup to get the (module level) shared instance
+
+    Parameters
+    ----------
+    nzta_df: pd.DataFrame
+        The NZTA lookup table, index = town name
+    """
+
+    def __init__(self, nzta_df: pd.DataFrame):
+        self.nzta_df = nzta_df
+        self.towns = self.nzta_df.index.values.astype(str)
+
+        self._tree = cKDTree(
+            utils.lon_lat_to_xyz(self.nzta_df["lon"].values, self.nzta_df["lat"].values)
+        )
+
+    def get_nearest_towns(
+        self, lat: np.ndarray, lon: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parameters
+        ----------
+        lat, lon: array of floats
+            The locations of interest
+
+        Returns
+        -------
+        array of strings:
+            name of the closest town for each location
+        array of floats:
+            distance to the closest town (in km) for each location
+        """
+        lat, lon = np.atleast_1d(lat), np.atleast_1d(lon)
+        _, town_ind = self._tree.query(utils.lon_lat_to_xyz(lon, lat))
+
+        dist = utils.great_circle_dist(
+            lon,
+            lat,
+            self.nzta_df["lon"].values[town_ind],
+            self.nzta_df["lat"].values[town_ind],
+        )
+
+        return self.towns[town_ind], dist
+
+
+def get_nzta_lookup() -> NZTALookup:
+    """Gets the shared NZTALookup, created on first use"""
+    global _nzta_lookup
+    if _nzta_lookup is None:
+        _nzta_lookup = NZTALookup(pd.read_csv(NZTA_LOOKUP_FFP, header=0, index_col=0))
+    return _nzta_lookup
+
 
 def run_ensemble_nzta(
     ensemble: gm_data.Ensemble,
@@ -52,43 +116,100 @@ def run_ensemble_nzta(
     -------
     NZTAResult
     """
-    # Load the required NZTA data
-    nzta_df = pd.read_csv(NZTA_LOOKUP_FFP, header=0, index_col=0)
+    return run_nzta_batch(
+        ensemble,
+        [site_info],
+        exceedance_values=exceedance_values,
+        soil_classes=None if soil_class is None else [soil_class],
+        im_component=im_component,
+    )[0]
+
 
-    soil_class = (
-        soil_class if soil_class is not None else get_soil_class(site_info.vs30)
+def run_nzta_batch(
+    ensemble: gm_data.Ensemble,
+    site_infos: Sequence[site.SiteInfo],
+    exceedance_values: np.ndarray = DEFAULT_EXCEEDANCE_VALUES,
+    soil_classes: Sequence[const.NZTASoilClass] = None,
+    im_component: IMComponent = IMComponent.RotD50,
+) -> List[NZTAResult]:
+    """Runs NZTA for multiple sites, the nearest town lookup
+    and PGA computation is done for all sites at once
+
+    Parameters
+    ----------
+    ensemble: Ensemble
+        The ensemble does not affect calculation at all,
+            purely included for consistency/completeness
+    site_infos: list of SiteInfo
+        The sites for which to compute NZTA code hazard
+    exceedance_values: array of floats, optional
+    soil_classes: list of NZTASoilClass, optional
+        The soil class to use for each site, if not specified
+        then these are computed based on the vs30 of the sites
+
+    Returns
+    -------
+    list of NZTAResult
+        One result per site, in the same order as site_infos
+    """
+    nzta_lookup = get_nzta_lookup()
+    nzta_df = nzta_lookup.nzta_df
+
+    soil_classes = (
+        soil_classes
+        if soil_classes is not None
+        else [get_soil_class(cur_site_info.vs30) for cur_site_info in site_infos]
     )
 
     # Get the return periods
-    rp_values = 1 / exceedance_values
+    rp_values = 1 / np.asarray(exceedance_values)
 
-    # Compute PGA and retrieve effective magnitude
-    C0_1000, nearest_town = get_C0_1000(
-        site_info.lat, site_info.lon, soil_class, nzta_df=nzta_df
+    # Retrieve C0_1000 of the nearest towns
+    nearest_towns, _ = nzta_lookup.get_nearest_towns(
+        np.asarray([cur_site_info.lat for cur_site_info in site_infos], dtype=float),
+        np.asarray([cur_site_info.lon for cur_site_info in site_infos], dtype=float),
+    )
+    C0_1000_values = np.where(
+        [cur_soil_class is const.NZTASoilClass.rock for cur_soil_class in soil_classes],
+        nzta_df["C_0_1000_AB"].loc[nearest_towns].values,
+        nzta_df["C_0_1000_DE"].loc[nearest_towns].values,
+    )
+
+    # Compute PGA, format: [n_sites, n_exceedances]
+    R = sha.get_return_period_factor(rp_values)
+    pga_values = np.where(
+        C0_1000_values[:, np.newaxis] != 0,
+        C0_1000_values[:, np.newaxis] * R / 1.3,
+        np.nan,
     )
-    pga_values, M_eff = [], None
-    for cur_rp in rp_values:
-        cur_pga, M_eff = get_pga_meff(C0_1000, nearest_town, cur_rp, nzta_df=nzta_df)
-        pga_values.append(cur_pga)
 
     if im_component != IMComponent.Larger:
-        ratio = sha.get_computed_component_ratio(
+        pga_values = pga_values * sha.get_computed_component_ratio(
             str(IMComponent.Larger),
             str(im_component),
             # Using period of 0.01 for PGA IM
             0.01,
         )
-        pga_values = [value * ratio for value in pga_values]
 
-    return NZTAResult(
-        ensemble,
-        site_info,
-        soil_class,
-        pd.Series(index=exceedance_values, data=pga_values),
-        M_eff,
-        C0_1000,
-        nearest_town,
-    )
+    results = []
+    for ix, (cur_site_info, cur_town) in enumerate(zip(site_infos, nearest_towns)):
+        # Effective magnitude for the last return period, as for get_pga_meff
+        M_eff = (
+            __get_meff(cur_town, rp_values[-1], nzta_df) if rp_values.size > 0 else None
+        )
+        results.append(
+            NZTAResult(
+                ensemble,
+                cur_site_info,
+                soil_classes[ix],
+                pd.Series(index=exceedance_values, data=pga_values[ix]),
+                M_eff,
+                C0_1000_values[ix],
+                str(cur_town),
+            )
+        )
+
+    return results
 
 
 def get_C0_1000(
@@ -103,11 +224,7 @@ def get_C0_1000(
     1. C_0,1000 value for the given vs30 value at the closest location
     2. the name of the closest town
     """
-    nzta_df = (
-        pd.read_csv(NZTA_LOOKUP_FFP, header=0, index_col=0)
-        if nzta_df is None
-        else nzta_df
-    )
+    nzta_df = get_nzta_lookup().nzta_df if nzta_df is None else nzta_df
 
     town, _ = __location_lookup(lat, lon, nzta_df)
     if soil_class is const.NZTASoilClass.rock:
@@ -131,11 +248,7 @@ def get_pga_meff(
     float:
         Effective magnitudes for design return period (years)
     """
-    nzta_df = (
-        pd.read_csv(NZTA_LOOKUP_FFP, header=0, index_col=0)
-        if nzta_df is None
-        else nzta_df
-    )
+    nzta_df = get_nzta_lookup().nzta_df if nzta_df is None else nzta_df
 
     R = sha.get_return_period_factor(RP)
 
@@ -177,9 +290,9 @@ def __location_lookup(lat: float, lon: float, nzta_df: pd.DataFrame):
     float:
         distance to closest town
     """
-    idx, dist = geo.closest_location(
-        np.array([nzta_df["lon"].values, nzta_df["lat"].values]).T, lon, lat
-    )
-    assert idx < len(nzta_df.index)
+    nzta_lookup = get_nzta_lookup()
+    if nzta_df is not nzta_lookup.nzta_df:
+        nzta_lookup = NZTALookup(nzta_df)
+    towns, dists = nzta_lookup.get_nearest_towns(lat, lon)
 
-    return list(nzta_df.index)[idx], dist
+    return towns[0], dists[0]
@@ -0,0 +1,337 @@
+"""Versioned binary serialisation of the result objects
+
+Each result is saved as a single HDF5 file, with the metadata as
+json attribute and the pandas/numpy members as typed datasets
+(dataframes are stored column-wise). Nested results (e.g. branch results)
+are stored as groups, which can be loaded lazily via LazyMember.
+
+Note: This does not replace the csv based save/load of the results,
+which is also used for the user downloads.
+"""
+import os
+import json
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+
+# Version of the binary format, has to be increased for
+# any changes that are not backwards compatible
+FORMAT_VERSION = 1
+
+# File suffix of the binary result files
+BINARY_SUFFIX = ".h5"
+
+# Datasets smaller than this (number of elements) are not compressed
+MIN_COMPRESSION_SIZE = 256
+
+_STR_DTYPE = h5py.string_dtype(encoding="utf-8")
+
+
+class ResultFormatError(Exception):
+    """Raised when a binary result file has an unsupported
+    format version or is of the wrong result type"""
+
+    pass
+
+
+class LazyMember:
+    """A result member that is only loaded from the
+    binary result file when it is first accessed
+
+    Parameters
+    ----------
+    ffp: Path
+        The binary result file
+    group_path: str
+        The path of the group in the result file
+    load_fn: callable
+        Function that loads the member from the group,
+        has to take a single parameter, the ResultReader
+    """
+
+    def __init__(
+        self, ffp: Path, group_path: str, load_fn: Callable[["ResultReader"], Any]
+    ):
+        self.ffp = ffp
+        self.group_path = group_path
+        self.load_fn = load_fn
+
+    def load(self):
+        with h5py.File(self.ffp, mode="r") as h5_file:
+            return self.load_fn(ResultReader(self.ffp, h5_file[self.group_path]))
+
+
+def resolve(value: Any):
+    """Loads the value if it is a LazyMember, otherwise returns it as is"""
+    return value.load() if isinstance(value, LazyMember) else value
+
+
+class ResultWriter:
+    """Writes the members of a result to a group of a binary result file,
+    use ResultWriter.create for creating a new result file
+
+    Parameters
+    ----------
+    h5_group: h5py.Group
+    compression: str, optional
+        The h5py compression filter to use for the
+        datasets, e.g. gzip or lzf, default is None
+    """
+
+    def __init__(self, h5_group: h5py.Group, compression: str = None):
+        self.h5_group = h5_group
+        self.compression = compression
+
+    @classmethod
+    @contextmanager
+    def create(cls, ffp: Union[str, Path], result_type: str, compression: str = None):
+        """Creates a new binary result file, the file is written to
+        a temporary file first and only moved into place once complete"""
+        ffp = Path(ffp)
+        tmp_ffp = ffp.parent / f".{ffp.name}.{os.getpid()}"
+        try:
+            with h5py.File(tmp_ffp, mode="w") as h5_file:
+                h5_file.attrs["format_version"] = FORMAT_VERSION
+                h5_file.attrs["result_type"] = result_type
+                yield cls(h5_file, compression=compression)
+            os.replace(tmp_ffp, ffp)
+        finally:
+            if tmp_ffp.exists():
+                tmp_ffp.unlink()
+
+    def set_metadata(self, metadata: Dict):
+        """Saves the metadata of the result, has to be json serialisable"""
+        self.h5_group.attrs["metadata"] = json.dumps(metadata, default=_to_json)
+
+    def group(self, key: str) -> "ResultWriter":
+        """Creates a sub-group, e.g. for a nested result"""
+        return ResultWriter(self.h5_group.create_group(key), self.compression)
+
+    def write(self, key: str, value: Union[pd.DataFrame, pd.Series, np.ndarray]):
+        """Writes a dataframe, series or array, None values are skipped"""
+        if value is None:
+            return
+
+        if isinstance(value, pd.DataFrame):
+            group = self.h5_group.create_group(key)
+            group.attrs["kind"] = "dataframe"
+            group.attrs["columns"] = json.dumps(list(value.columns), default=_to_json)
+            group.attrs["column_names"] = json.dumps(
+                list(value.columns.names), default=_to_json
+            )
+            self._write_index(group, value.index)
+            for ix in range(value.shape[1]):
+                self._write_array(group, f"column_{ix}", value.iloc[:, ix].values)
+        elif isinstance(value, pd.Series):
+            group = self.h5_group.create_group(key)
+            group.attrs["kind"] = "series"
+            group.attrs["name"] = json.dumps(value.name, default=_to_json)
+            self._write_index(group, value.index)
+            self._write_array(group, "values", value.values)
+        else:
+            self._write_array(self.h5_group, key, np.asarray(value)).attrs[
+                "kind"
+            ] = "array"
+
+    def _write_index(self, group: h5py.Group, index: pd.Index):
+        if isinstance(index, pd.MultiIndex):
+            group.attrs["index_names"] = json.dumps(list(index.names), default=_to_json)
+            for ix in range(index.nlevels):
+                self._write_array(group, f"index_{ix}", index.get_level_values(ix))
+        else:
+            group.attrs["index_name"] = json.dumps(index.name, default=_to_json)
+            self._write_array(group, "index", index)
+
+    def _write_array(
+        self, group: h5py.Group, key: str, values: Union[np.ndarray, pd.Categorical]
+    ):
+        # Categorical values are stored as codes, with the categories as attribute
+        if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+            values = pd.Categorical(values)
+            dataset = self._write_array(group, key, values.codes)
+            dataset.attrs["encoding"] = "categorical"
+            dataset.attrs["categories"] = json.dumps(
+                list(values.categories), default=_to_json
+            )
+            dataset.attrs["ordered"] = values.ordered
+            return dataset
+
+        values = np.asarray(values)
+        if values.dtype.kind in "biufc":
+            encoding = "numeric"
+        elif values.dtype.kind == "U" or all(
+            isinstance(cur_value, str) for cur_value in values.flat
+        ):
+            encoding, values = "str", values.astype(_STR_DTYPE)
+        else:
+            # Mixed object values, e.g. strings & nan
+            encoding = "json"
+            values = np.asarray(
+                [json.dumps(cur_value, default=_to_json) for cur_value in values.flat],
+                dtype=_STR_DTYPE,
+            ).reshape(values.shape)
+
+        compression = (
+            self.compression
+            if values.ndim > 0 and values.size >= MIN_COMPRESSION_SIZE
+            else None
+        )
+        dataset = group.create_dataset(key, data=values, compression=compression)
+        dataset.attrs["encoding"] = encoding
+
+        return dataset
+
+
+class ResultReader:
+    """Reads the members of a result from a group of a binary
+    result file, use ResultReader.open for opening a result file
+
+    Parameters
+    ----------
+    ffp: Path
+        The binary result file
+    h5_group: h5py.Group
+    """
+
+    def __init__(self, ffp: Path, h5_group: h5py.Group):
+        self.ffp = ffp
+        self.h5_group = h5_group
+
+    @classmethod
+    @contextmanager
+    def open(cls, ffp: Union[str, Path], result_type: str = None):
+        """Opens a binary result file, checks the format
+        version and if specified the result type"""
+        with h5py.File(ffp, mode="r") as h5_file:
+            if (version := int(h5_file.attrs["format_version"])) > FORMAT_VERSION:
+                raise ResultFormatError(
+                    f"The result file {ffp} has format version {version}, "
+                    f"only versions up to {FORMAT_VERSION} are supported"
+                )
+            if result_type is not None and h5_file.attrs["result_type"] != result_type:
+                raise ResultFormatError(
+                    f"The result file {ffp} contains a {h5_file.attrs['result_type']} "
+                    f"result, expected a {result_type} result"
+                )
+
+            yield cls(Path(ffp), h5_file)
+
+    @property
+    def metadata(self) -> Dict:
+        return json.loads(self.h5_group.attrs["metadata"])
+
+    def __contains__(self, key: str):
+        return key in self.h5_group
+
+    def group(self, key: str) -> "ResultReader":
+        return ResultReader(self.ffp, self.h5_group[key])
+
+    def group_keys(self) -> List[str]:
+        """The names of the sub-groups (that are not dataframes/series)"""
+        return [
+            cur_key
+            for cur_key, cur_value in self.h5_group.items()
+            if isinstance(cur_value, h5py.Group) and "kind" not in cur_value.attrs
+        ]
+
+    def lazy(self, key: str, load_fn: Callable[["ResultReader"], Any]) -> LazyMember:
+        """Creates a LazyMember for the specified sub-group"""
+        return LazyMember(self.ffp, self.h5_group[key].name, load_fn)
+
+    def read(
+        self, key: str, default: Any = None
+    ) -> Union[pd.DataFrame, pd.Series, np.ndarray]:
+        """Reads a dataframe, series or array, returns
+        the default value if there is no such member"""
+        if key not in self.h5_group:
+            return default
+
+        member = self.h5_group[key]
+        kind = member.attrs["kind"]
+        if kind == "dataframe":
+            columns = json.loads(member.attrs["columns"])
+            if "column_names" in member.attrs:
+                column_names = json.loads(member.attrs["column_names"])
+                columns = (
+                    pd.MultiIndex.from_tuples(
+                        [tuple(cur_column) for cur_column in columns],
+                        names=column_names,
+                    )
+                    if len(column_names) > 1
+                    else pd.Index(columns, name=column_names[0])
+                )
+            return pd.DataFrame(
+                {
+                    ix: self._read_array(member[f"column_{ix}"])
+                    for ix in range(len(columns))
+                },
+                index=self._read_index(member),
+            ).set_axis(columns, axis=1)
+        elif kind == "series":
+            return pd.Series(
+                self._read_array(member["values"]),
+                index=self._read_index(member),
+                name=json.loads(member.attrs["name"]),
+            )
+
+        return self._read_array(member)
+
+    def _read_index(self, group: h5py.Group) -> pd.Index:
+        if "index_names" in group.attrs:
+            index_names = json.loads(group.attrs["index_names"])
+            return pd.MultiIndex.from_arrays(
+                [
+                    self._read_array(group[f"index_{ix}"])
+                    for ix in range(len(index_names))
+                ],
+                names=index_names,
+            )
+
+        return pd.Index(
+            self._read_array(group["index"]),
+            name=json.loads(group.attrs["index_name"]),
+        )
+
+    @staticmethod
+    def _read_array(dataset: h5py.Dataset) -> Union[np.ndarray, pd.Categorical]:
+        encoding = dataset.attrs["encoding"]
+        if encoding == "categorical":
+            return pd.Categorical.from_codes(
+                dataset[()],
+                categories=json.loads(dataset.attrs["categories"]),
+                ordered=bool(dataset.attrs["ordered"]),
+            )
+        elif encoding == "str":
+            return dataset.asstr()[()].astype(object)
+        elif encoding == "json":
+            values = dataset.asstr()[()]
+            return np.asarray(
+                [json.loads(cur_value) for cur_value in np.ravel(values)], dtype=object
+            ).reshape(np.shape(values))
+
+        return dataset[()]
+
+
+def get_binary_ffp(base_dir: Path, name: str) -> Path:
+    """Gets the file path of a binary result"""
+    return base_dir / f"{name}{BINARY_SUFFIX}"
+
+
+def _to_json(value: Any):
+    """Converts the numpy values and file paths to json serialisable
+    values, raises a TypeError for any other (unsupported) type"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, os.PathLike):
+        return os.fspath(value)
+
+    raise TypeError(
+        f"Values of type {type(value).__name__} are not "
+        f"supported by the binary result format"
+    )
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Sequence
 
 import pandas as pd
 import numpy as np
@@ -21,6 +21,16 @@ POINTS_PER_KILOMETER = (
     1 / 0.1
 )  # 1km divided by distance between points (1km/0.1km gives 100m grid)
 
+# Magnitudes are stored as float32 in the compact rupture dataframes,
+# the float64 values are restored by rounding to this number of decimals
+MAGNITUDE_DECIMALS = 6
+RUPTURE_TYPE_DTYPE = pd.CategoricalDtype(
+    [cur_type.value for cur_type in const.SourceType]
+)
+# Separates the location (i.e. point source) from the rest
+# of a distributed seismicity rupture name
+DS_LOCATION_SEPARATOR = "--"
+
 
 def rupture_df_from_erf(
     erf_ffp: str, erf_file_type: const.ERFFileType = const.ERFFileType.flt_nhm
@@ -109,3 +119,110 @@ def rupture_id_ix_to_rupture_id(
     """Converts rupture id ix to rupture ids"""
     return ensemble.get_rupture_ids(rupture_id_ind)
 
+
+def to_compact_rupture_df(rupture_df: pd.DataFrame, source_type: const.SourceType):
+    """Converts the rupture dataframe (see rupture_df_from_erf) to the
+    compact format used by the ensemble, i.e. float32 magnitudes and
+    categorical rupture names, rupture & tectonic types
+
+    For distributed seismicity, the location (i.e. point source) of
+    each rupture is added as categorical column, see utils.create_ds_rupture_name
+
+    Note: Modifies the given dataframe
+
+    Parameters
+    ----------
+    rupture_df: pd.DataFrame
+    source_type: SourceType
+        The source type of the ruptures, set as rupture type
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    rupture_df["rupture_name"] = rupture_df["rupture_name"].astype("category")
+    if source_type is const.SourceType.distributed:
+        location_codes, locations = pd.factorize(
+            rupture_df["rupture_name"]
+            .cat.categories.str.split(DS_LOCATION_SEPARATOR, n=1)
+            .str[0]
+        )
+        rupture_df["location"] = pd.Categorical.from_codes(
+            location_codes[rupture_df["rupture_name"].cat.codes.values],
+            categories=locations,
+        )
+
+    rupture_df["magnitude"] = rupture_df["magnitude"].values.astype(np.float32)
+    rupture_df["rupture_type"] = pd.Categorical.from_codes(
+        np.full(
+            rupture_df.shape[0],
+            RUPTURE_TYPE_DTYPE.categories.get_loc(source_type.value),
+            dtype=np.int8,
+        ),
+        dtype=RUPTURE_TYPE_DTYPE,
+    )
+    if "tectonic_type" in rupture_df.columns:
+        rupture_df["tectonic_type"] = rupture_df["tectonic_type"].astype("category")
+
+    return rupture_df
+
+
+def concat_compact_rupture_dfs(rupture_dfs: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates compact rupture dataframes (see to_compact_rupture_df),
+    the categorical columns stay categorical (using the union of the categories),
+    missing columns are set to nan
+
+    Parameters
+    ----------
+    rupture_dfs: sequence of pd.DataFrame
+
+    Returns
+    -------
+    pd.DataFrame
+        With the columns sorted by name
+    """
+    rupture_dfs = [cur_df.copy(deep=False) for cur_df in rupture_dfs]
+    categorical_columns = dict.fromkeys(
+        cur_column
+        for cur_df in rupture_dfs
+        for cur_column in cur_df.columns
+        if isinstance(cur_df[cur_column].dtype, pd.CategoricalDtype)
+    )
+    for cur_column in categorical_columns:
+        cur_dtypes = [
+            cur_df[cur_column].dtype
+            for cur_df in rupture_dfs
+            if cur_column in cur_df.columns
+        ]
+        categories = cur_dtypes[0].categories
+        for cur_dtype in cur_dtypes[1:]:
+            if not cur_dtype.categories.equals(categories):
+                categories = categories.union(cur_dtype.categories)
+        dtype = pd.CategoricalDtype(categories)
+
+        for cur_df in rupture_dfs:
+            cur_df[cur_column] = (
+                cur_df[cur_column].astype(dtype)
+                if cur_column in cur_df.columns
+                else pd.Categorical.from_codes(
+                    np.full(cur_df.shape[0], -1, dtype=np.int8), dtype=dtype
+                )
+            )
+
+    return pd.concat(rupture_dfs, sort=True)
+
+
+def compact_rupture_df_to_id(
+    ensemble: "gm_data.Ensemble", rupture_df: pd.DataFrame
+) -> pd.DataFrame:
+    """Converts the compact rupture dataframe (index = rupture id ix)
+    to the rupture id indexed dataframe with string rupture
+    names and float64 magnitudes"""
+    rupture_df = rupture_df.set_index(
+        rupture_id_ix_to_rupture_id(ensemble, rupture_df.index.values)
+    )
+    rupture_df["rupture_name"] = rupture_df["rupture_name"].astype(str)
+    rupture_df["magnitude"] = np.round(
+        rupture_df["magnitude"].values.astype(np.float64), MAGNITUDE_DECIMALS
+    )
+    return rupture_df.drop(columns="location", errors="ignore")
@@ -1,5 +1,7 @@
-import math
-from typing import List, Union, Iterable, Tuple, Sequence
+import functools
+import multiprocessing as mp
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Union, Iterable, Tuple, Sequence
 
 import numpy as np
 import pandas as pd
@@ -14,6 +16,9 @@ from gmhazard_calc import rupture
 from gmhazard_calc import utils
 from gmhazard_calc import hazard
 
+# Ensemble of the branch worker processes, see create_branch_executor
+_worker_ensemble = None
+
 
 def get_IM_params(
     im: IM,
@@ -73,75 +78,47 @@ def get_IM_values(
 
     im_dfs, db_type = [], None
     for cur_imdb_ffp in imdb_ffps:
-        # Try the IM data cache
-        if use_cache:
-            cur_im_data = ensemble.get_cache_value(site_info, cur_imdb_ffp)
-            # Can't check for None since that is a valid value
-            if cur_im_data is not False:
-                im_dfs.append(cur_im_data)
-                continue
-        # Otherwise load from IMDB
-        with dbs.IMDB.get_imdb(cur_imdb_ffp) as imdb:
-            if db_type is None:
-                db_type = imdb.imdb_type
-
-            # All dbs have to be either parametric or non-parametric
-            assert imdb.imdb_type == db_type
-
-            # Parametric
-            if isinstance(imdb, dbs.IMDBParametric):
-                cur_im_params = imdb.im_data(site_info.station_name)
-
-                if cur_im_params is not None:
-                    ims = [
-                        IM.from_str(col)
-                        for col in cur_im_params.columns.values
-                        if "sigma" not in col
-                    ]
-                    if site_info.user_vs30 is not None:
-                        # TODO: Can we maybe vectorize this? Or even just support multiple IM types at once?
-                        for im in ims:
-                            if (
-                                im.im_type == IMType.PGA
-                                or im.im_type == IMType.PGV
-                                or im.is_pSA()
-                            ):
-                                cur_im_params.loc[:, [str(im), f"{im}_sigma"]] = (
-                                    apply_vs30_mod_parametric(
-                                        cur_im_params, site_info, im
-                                    )
-                                    .loc[:, ["mu", "sigma"]]
-                                    .values
-                                )
-
-                    im_dfs.append(cur_im_params)
-
-                # Update the IM data cache
-                if use_cache:
-                    ensemble.update_cache(site_info, cur_imdb_ffp, cur_im_params)
-
-            # Non-parametric
-            else:
-                cur_im_values = imdb.im_data(site_info.station_name)
-
-                if site_info.user_vs30 is not None:
-                    # TODO: Can we maybe vectorize this? Or even just support multiple IM types at once?
-                    for im in cur_im_values.columns.values:
-                        im = IM.from_str(im)
-                        if (
-                            im.im_type == IMType.PGA
-                            or im.im_type == IMType.PGV
-                            or im.is_pSA()
-                        ):
-                            cur_im_values[im] = apply_vs30_mod_non_parametric(
-                                cur_im_values, site_info, im
-                            )
-
-                if use_cache:
-                    ensemble.update_cache(site_info, cur_imdb_ffp, cur_im_values)
-
-                if cur_im_values is not None:
-                    im_dfs.append(cur_im_values)
+        # Try the IM data cache, which holds the unmodified IMDB data,
+        # i.e. it is also used for sites with a user specified vs30
+        cur_im_data = (
+            ensemble.get_cache_value(site_info, cur_imdb_ffp) if use_cache else False
+        )
+        # Can't check for None since that is a valid value
+        if cur_im_data is False:
+            # Otherwise load from IMDB
+            with dbs.IMDB.get_imdb(cur_imdb_ffp) as imdb:
+                if db_type is None:
+                    db_type = imdb.imdb_type
+
+                # All dbs have to be either parametric or non-parametric
+                assert imdb.imdb_type == db_type
+
+                # Parametric
+                if isinstance(imdb, dbs.IMDBParametric):
+                    cur_im_data = imdb.im_data(site_info.station_name)
+                # Non-parametric
+                else:
+                    # Shared simulation IM pool, i.e. the IMDB data is only decoded once
+                    cur_pool = dbs.get_simulation_im_pool(
+                        cur_imdb_ffp, site_info.station_name
+                    )
+                    cur_im_data = None if cur_pool is None else cur_pool.get_im_df()
+
+            # Update the IM data cache
+            if use_cache:
+                ensemble.update_cache(site_info, cur_imdb_ffp, cur_im_data)
+
+        if cur_im_data is None:
+            continue
+
+        if site_info.user_vs30 is not None:
+            cur_im_data = (
+                apply_vs30_mod_parametric(cur_im_data, site_info)
+                if _is_parametric(cur_im_data)
+                else apply_vs30_mod_non_parametric(cur_im_data, site_info)
+            )
+
+        im_dfs.append(cur_im_data)
 
     if len(im_dfs) == 0:
         return None
@@ -261,16 +238,6 @@ def get_gm_prob_df(
     return result_df
 
 
-def _apply_mu_im_component(value, component):
-    mu_ratio = sha_calc.get_computed_component_ratio(
-        str(IMComponent.RotD50),
-        str(component),
-        # Using period of 0.01 for PGA IM
-        0.01 if value.name.startswith("PGA") else IM.from_str(value.name).period,
-    )
-    return value + math.log(mu_ratio)
-
-
 def get_im_data(
     branch: gm_data.Branch,
     ensemble: gm_data.Ensemble,
@@ -296,30 +263,31 @@ def get_im_data(
     if im_component != IMComponent.RotD50:
         if im_data_type is constants.IMDataType.parametric:
             # Ensure we only perform component conversion on PGA or pSA IM's
-            sa_im_data = im_data.filter(regex="PGA|pSA")
-            sigma_im_data = sa_im_data.filter(regex="sigma")
-            mu_im_data = sa_im_data[
-                sa_im_data.columns.difference(sigma_im_data.columns)
-            ]
+            sa_columns = im_data.filter(regex="PGA|pSA").columns.values
+            sigma_columns = [cur_col for cur_col in sa_columns if "sigma" in cur_col]
+            mu_columns = [cur_col for cur_col in sa_columns if "sigma" not in cur_col]
 
             # Compute the apply the ratios which are using the paper
             # Relations between Some Horizontal-Component Ground-Motion Intensity Measures Used in Practice (Boore 2017)
             # Sigma ratios were taken from Table 3 and the mu ratio is calculated using equation 2
             # Sigma is dominated by the sigma of the original component and the variation
             # in the sigma of the ratio is minimal, hence constant values where determined from a ratio vs period plot
-            mu_im_data = mu_im_data.apply(
-                lambda value: _apply_mu_im_component(value, im_component)
+            mu_ratios = sha_calc.get_computed_component_ratio(
+                str(IMComponent.RotD50),
+                str(im_component),
+                # Using period of 0.01 for PGA IM
+                [
+                    0.01 if cur_col.startswith("PGA") else IM.from_str(cur_col).period
+                    for cur_col in mu_columns
+                ],
             )
+            im_data[mu_columns] = im_data[mu_columns].values + np.log(mu_ratios)
+
             sigma_ratio = 0.095 if im_component == IMComponent.Larger else 0.085
-            sigma_im_data = sigma_im_data.apply(
-                lambda sigma: np.sqrt((sigma * sigma + sigma_ratio * sigma_ratio))
+            im_data[sigma_columns] = np.sqrt(
+                im_data[sigma_columns].values ** 2 + sigma_ratio ** 2
             )
 
-            # Ensures we have other IM's such as PGV
-            im_data = im_data[im_data.columns.difference(sa_im_data.columns)]
-            # Join back together
-            im_data = pd.concat([im_data, mu_im_data, sigma_im_data], axis=1)
-
         # Non-parametric
         else:
             raise NotImplementedError(
@@ -414,31 +382,87 @@ def compute_adj_branch_weights(
 
 
 def apply_vs30_mod_non_parametric(
-    im_values: pd.DataFrame, site_info: site.SiteInfo, im: IM
-) -> pd.Series:
-    """Applies the user vs30 modification for non-parametric data"""
+    im_values: pd.DataFrame, site_info: site.SiteInfo
+) -> pd.DataFrame:
+    """Applies the user vs30 modification to all
+    (supported) IMs of the non-parametric IM data
+
+    Parameters
+    ----------
+    im_values: dataframe
+        The IM values, columns = IMs
+    site_info: SiteInfo
+
+    Returns
+    -------
+    dataframe
+        The modified IM values
+    """
     assert "PGA" in im_values.columns
-    pga = im_values["PGA"].copy()
+    im_names, periods = _get_site_amp_periods(im_values.columns.values)
 
-    return im_values[str(im)] * __get_site_amp_ratio(
-        pga, site_info.db_vs30, site_info.user_vs30, im
+    im_values = im_values.copy()
+    im_values[im_names] = im_values[im_names].values * sha_calc.site_amp_ratio(
+        im_values["PGA"].values, site_info.db_vs30, site_info.user_vs30, periods
     )
+    return im_values
 
 
 def apply_vs30_mod_parametric(
-    im_params: pd.DataFrame, site_info: site.SiteInfo, im: IM
+    im_params: pd.DataFrame, site_info: site.SiteInfo
 ) -> pd.DataFrame:
-    pga = np.exp(im_params["PGA"])
+    """Applies the user vs30 modification to the mean of all
+    (supported) IMs of the parametric IM data, i.e. the IM
+    distributions are shifted in log space
+
+    Parameters
+    ----------
+    im_params: dataframe
+        The IM parameters, columns = IMs & {IM}_sigma
+    site_info: SiteInfo
+
+    Returns
+    -------
+    dataframe
+        The modified IM parameters
+    """
+    im_names, periods = _get_site_amp_periods(
+        [cur_col for cur_col in im_params.columns.values if "sigma" not in cur_col]
+    )
 
-    #  The below line gets the empirical IM out of log-space,
-    #  applies the correction and then transforms it back into log-space
-    im_params["mu"] = np.log(
-        np.exp(im_params[str(im)])
-        * __get_site_amp_ratio(pga, site_info.db_vs30, site_info.user_vs30, im)
+    im_params = im_params.copy()
+    im_params[im_names] = im_params[im_names].values + np.log(
+        sha_calc.site_amp_ratio(
+            np.exp(im_params["PGA"].values),
+            site_info.db_vs30,
+            site_info.user_vs30,
+            periods,
+        )
     )
+    return im_params
+
+
+def _get_site_amp_periods(columns: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """Gets the IMs that support the vs30 modification (i.e. PGA, PGV & pSA)
+    and the corresponding periods (as used by sha_calc.site_amp_ratio)"""
+    im_names, periods = [], []
+    for cur_col in columns:
+        cur_im = IM.from_str(cur_col)
+        if cur_im.is_pSA():
+            periods.append(cur_im.period)
+        elif cur_im.im_type == IMType.PGV:
+            periods.append(-1)
+        elif cur_im.im_type == IMType.PGA:
+            periods.append(0)
+        else:
+            continue
+        im_names.append(cur_col)
+
+    return im_names, np.asarray(periods, dtype=float)
 
-    im_params["sigma"] = im_params[str(im) + "_sigma"]
-    return im_params[["mu", "sigma"]]
+
+def _is_parametric(im_df: pd.DataFrame) -> bool:
+    return any(str(cur_col).endswith("_sigma") for cur_col in im_df.columns)
 
 
 def get_SA_ims(
@@ -523,96 +547,140 @@ def compute_contr_16_84(
     return quantiles[0], quantiles[1]
 
 
-###
-# VS30 modification code below
-###
-def __fs_auto(i: int, vs30: float, a1100: float = None):
-    """
-    Python implementation of the Campbell Bozorgina 2014 site amplification (aka vs30 adjustments) from the GMM model
-    :param i: index of pSA period
-    :param vs30: vs30 that is being amplified to
-    :param a1100: PGA value at 1100 m/s vs30 for a given site source combination
-    :return: IM factor of site_amplification
+def create_branch_executor(
+    ensemble: gm_data.Ensemble, n_procs: int, use_threads: bool = False
+) -> Executor:
+    """Creates an executor for the parallel evaluation of the
+    branches of an ensemble, see map_branches
+
+    Parameters
+    ----------
+    ensemble: Ensemble
+    n_procs: int
+        Number of threads or processes
+    use_threads: bool, optional
+        If True, then a thread pool is used, otherwise a process pool
+        that uses fork, i.e. the ensemble is shared with the
+        worker processes (copy-on-write) instead of being pickled
+
+    Note: For a process pool, load the branch data (see load_branch_data)
+    before creating the executor, otherwise every worker process
+    loads the branch data separately
+
+    Returns
+    -------
+    Executor
     """
-    # fmt: off
-    k1 = np.array([400, 865.0, 865.0, 865.0, 865.0, 908.0, 1054.0, 1086.0, 1032.0,
-                   878.0, 748.0, 654.0, 587.0, 503.0, 457.0, 410.0,
-                   400.0, 400.0, 400.0, 400.0, 400.0, 400.0, 400.0, 400.0])
-    k2 = np.array([-1.955, -1.186, -1.186, -1.186, -1.219, -1.273, -1.346, -1.471, -1.624,
-                   -1.931, -2.188, -2.381, -2.518, -2.657, -2.669, -2.401,
-                   -1.955, -1.025, -0.299, 0.0, 0.0, 0.0, 0.0, 0.0])
-    c10 = np.array([1.713, 1.090, 1.090, 1.094, 1.149, 1.290, 1.449, 1.535, 1.615,
-                    1.877, 2.069, 2.205, 2.306, 2.398, 2.355, 1.995,
-                    1.447, 0.330, -0.514, -0.848, -0.793, -0.748, -0.664,
-                    -0.576])
-    # fmt: on
-
-    scon_c = 1.88
-    scon_n = 1.18
-
-    if vs30 < k1[i]:  # Low vs30
-        return c10[i] * np.log(vs30 / k1[i]) + k2[i] * np.log(
-            (a1100 + scon_c * np.exp(scon_n * np.log(vs30 / k1[i]))) / (a1100 + scon_c)
+    if use_threads:
+        return ThreadPoolExecutor(max_workers=n_procs)
+
+    return ProcessPoolExecutor(
+        max_workers=n_procs,
+        mp_context=mp.get_context("fork"),
+        initializer=_init_branch_worker,
+        initargs=(ensemble,),
+    )
+
+
+def load_branch_data(branches: Sequence[gm_data.Branch]):
+    """Loads the (lazily loaded) IMDB metadata and
+    rupture dataframes of the specified branches"""
+    for cur_branch in branches:
+        # Accessing the properties loads the data
+        _ = (
+            cur_branch.stations,
+            cur_branch.ims,
+            cur_branch.flt_im_data_type,
+            cur_branch.ds_im_data_type,
+            cur_branch.flt_rupture_df,
+            cur_branch.ds_rupture_df,
         )
-    elif vs30 < 1100.0:  # medium
-        return (c10[i] + k2[i] * scon_n) * np.log(vs30 / k1[i])
-    else:  # high
-        return (c10[i] + k2[i] * scon_n) * np.log(1100.0 / k1[i])
 
 
-def __get_site_amp_ratio(pga: float, db_vs30: float, user_vs30: float, im: IM):
-    """
-    Calculates a PGA_1100 estimate; uses it to calculate a site amplification ratio for the difference in vs30
-    between the user and the modelled vs30
+def map_branches(
+    im_ensemble: gm_data.IMEnsemble,
+    branch_fn: Callable[[gm_data.Branch], Any],
+    executor: Executor = None,
+    worker_fn: Callable[[str], Any] = None,
+    from_worker_fn: Callable[[gm_data.Branch, Any], Any] = None,
+) -> Dict[str, Any]:
+    """Evaluates the function for each branch of the IMEnsemble,
+    either serially or in parallel using the executor
 
-    Scaling is only defined for pSA and PGA otherwise no scaling is applied - aka a ratio of 1.
+    Parameters
+    ----------
+    im_ensemble: IMEnsemble
+    branch_fn: Callable
+        Function that is evaluated for each branch,
+        used if no executor or a thread pool is given
+    executor: Executor, optional
+        Either a thread pool or a process pool created via
+        create_branch_executor, for a thread pool the IMDB handles are
+        shared between the threads evaluating the branches
+        (see IMDB.shared_handles)
+    worker_fn: Callable, optional
+        Picklable (e.g. partial of a module level) function that is called
+        with the branch name in the worker processes, required for a process
+        pool, the branch can be retrieved via get_worker_branch
+    from_worker_fn: Callable, optional
+        Function that converts the result of the
+        worker_fn (with the branch) to the branch result
 
-    :param pga: PGA value at given site/rupture for the original vs30 value
-    :param db_vs30: vs30 of the initial calculation
-    :param user_vs30: vs30 of the site that the intesity measures are to be scaled to
-    :param im: IM of intensity measure to scale
-    :return: a ratio to be applied to intensity measure values to scale them based on the user_vs30
+    Returns
+    -------
+    dictionary
+        The results with the branch name as key, in
+        the branch order of the IMEnsemble (for any executor)
     """
-    pga1100 = pga * np.exp(__fs_auto(0, 1100) - __fs_auto(0, db_vs30, pga))
-
-    periods = np.array(
-        [
-            -1,
-            0,
-            0.001,
-            0.01,
-            0.02,
-            0.03,
-            0.05,
-            0.075,
-            0.10,
-            0.15,
-            0.20,
-            0.25,
-            0.30,
-            0.40,
-            0.50,
-            0.75,
-            1.00,
-            1.50,
-            2.00,
-            3.00,
-            4.00,
-            5.00,
-            7.50,
-            10.0,
+    branch_names = list(im_ensemble.branches_dict.keys())
+    branches = list(im_ensemble.branches_dict.values())
+
+    if executor is None:
+        results = [branch_fn(cur_branch) for cur_branch in branches]
+    elif isinstance(executor, ProcessPoolExecutor):
+        results = [
+            from_worker_fn(cur_branch, cur_result)
+            for cur_branch, cur_result in zip(
+                branches, executor.map(worker_fn, branch_names)
+            )
         ]
-    )
-
-    if im.is_pSA():
-        T = np.argmin(np.abs(periods - im.period))
-    elif im.im_type == IMType.PGV:
-        T = 0
-    elif im.im_type == IMType.PGA:
-        T = 1
     else:
-        return 1
+        load_branch_data(branches)
+        with dbs.IMDB.shared_handles() as imdb_handles:
+            results = list(
+                executor.map(
+                    functools.partial(_run_shared_handles, imdb_handles, branch_fn),
+                    branches,
+                )
+            )
+
+    return dict(zip(branch_names, results))
+
+
+def get_worker_branch(
+    ensemble_name: str, im_type: IMType, branch_name: str
+) -> gm_data.Branch:
+    """Gets the specified branch of the ensemble
+    of the current branch worker process"""
+    if _worker_ensemble is None or _worker_ensemble.name != ensemble_name:
+        raise ValueError(
+            "The process pool used for the branch evaluation "
+            "has to be created via create_branch_executor"
+        )
+    return _worker_ensemble.get_im_ensemble(im_type).branches_dict[branch_name]
+
+
+def _run_shared_handles(
+    imdb_handles: dbs.SharedIMDBHandles,
+    branch_fn: Callable[[gm_data.Branch], Any],
+    branch: gm_data.Branch,
+):
+    """Evaluates the function for the branch, using
+    the shared IMDB handles in the current thread"""
+    with imdb_handles.register():
+        return branch_fn(branch)
 
-    result = np.exp(__fs_auto(T, user_vs30, pga1100) - __fs_auto(T, db_vs30, pga1100))
 
-    return result
+def _init_branch_worker(ensemble: gm_data.Ensemble):
+    global _worker_ensemble
+    _worker_ensemble = ensemble
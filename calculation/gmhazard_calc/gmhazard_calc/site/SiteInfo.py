@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from typing import Dict
 
 import numpy as np
 
@@ -92,33 +93,28 @@ class SiteInfo:
     def __str__(self):
         return f"{self.lon}_{self.lat}_{self.vs30}_{self._user_vs30}_{self._db_vs30}_{self._z1p0}_{self._z2p5}"
 
-    def save(self, save_dir: Path):
-        with open(save_dir / "site.json", "w") as f:
-            json.dump(
-                {
-                    "station_name": self._station_name,
-                    "lat": float(self._lat),
-                    "lon": float(self._lon),
-                    "vs30": float(self._vs30),
-                    "user_vs30": float(self._user_vs30)
-                    if self._user_vs30 is not None
-                    else None,
-                    "z1p0": None
-                    if self._z1p0 is None or np.isnan(self._z1p0)
-                    else float(self._z1p0),
-                    "z2p5": None
-                    if self._z2p5 is None or np.isnan(self._z2p5)
-                    else float(self._z2p5),
-                    "db_vs30": float(self._db_vs30),
-                },
-                f,
-            )
+    def to_dict(self):
+        """Returns the site details as json serialisable dictionary"""
+        return {
+            "station_name": self._station_name,
+            "lat": float(self._lat),
+            "lon": float(self._lon),
+            "vs30": float(self._vs30),
+            "user_vs30": float(self._user_vs30)
+            if self._user_vs30 is not None
+            else None,
+            "z1p0": None
+            if self._z1p0 is None or np.isnan(self._z1p0)
+            else float(self._z1p0),
+            "z2p5": None
+            if self._z2p5 is None or np.isnan(self._z2p5)
+            else float(self._z2p5),
+            "db_vs30": float(self._db_vs30),
+        }
 
     @classmethod
-    def load(cls, data_dir: Path):
-        with open(data_dir / "site.json", "r") as f:
-            data = json.load(f)
-
+    def from_dict(cls, data: Dict):
+        """Creates a SiteInfo from a dictionary, see to_dict"""
         return cls(
             data["station_name"],
             data["lat"],
@@ -128,3 +124,12 @@ class SiteInfo:
             data["z1p0"],
             data["z2p5"],
         )
+
+    def save(self, save_dir: Path):
+        with open(save_dir / "site.json", "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, data_dir: Path):
+        with open(data_dir / "site.json", "r") as f:
+            return cls.from_dict(json.load(f))
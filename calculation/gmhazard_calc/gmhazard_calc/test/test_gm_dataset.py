@@ -0,0 +1,223 @@
+"""GM dataset tests, these use a small synthetic historical IM csv"""
+import os
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import sha_calc
+from gmhazard_calc import gms
+from gmhazard_calc.im import IM
+
+DATASET_ID = "test_historical"
+IMS = ["PGA", "pSA_1.0", "PGV"]
+N_GMS = 60
+
+CS_PARAM_BOUNDS = [
+    None,
+    # Bounds that coincide with metadata values
+    ((5.5, 6.5), (10.0, 40.0), (300.0, 600.0), (None, None)),
+    ((5.0, 7.0), (0.0, 50.0), (None, None), (0.5, 2.0)),
+    ((6.0, 6.0), (None, None), (200.0, 700.0), (None, None)),
+]
+
+
+@pytest.fixture
+def im_csv_ffp(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "mag": rng.choice([5.0, 5.5, 6.0, 6.5, 7.0], N_GMS),
+            "rrup": rng.choice([0.0, 10.0, 20.0, 30.0, 40.0, 50.0], N_GMS),
+            "vs30": rng.choice([200.0, 300.0, 450.0, 600.0, 700.0], N_GMS),
+            **{cur_im: np.exp(rng.normal(-2.0, 1.0, N_GMS)) for cur_im in IMS},
+        },
+        index=pd.Index(np.arange(1000, 1000 + N_GMS), name="RSN"),
+    )
+    df.iloc[::7, 0] = np.nan
+    df.iloc[::11, 2] = np.nan
+
+    # Duplicate GMs are ignored
+    df = pd.concat([df, df.iloc[:3] * 2.0])
+
+    ffp = tmp_path / "im.csv"
+    df.to_csv(ffp)
+    return ffp
+
+
+@pytest.fixture
+def gm_dataset(im_csv_ffp, tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        gms.GMDataset.gms_sources,
+        DATASET_ID,
+        {
+            "type": "historical",
+            "empirical_IM_csv_ffp": str(im_csv_ffp),
+            "empirical_GMs_dir": str(tmp_path),
+        },
+    )
+    monkeypatch.setattr(gms.GMDataset, "_gm_datasets", {})
+    return gms.GMDataset.get_GMDataset(DATASET_ID)
+
+
+def _get_cs_param_bounds(bounds):
+    if bounds is None:
+        return None
+    mw_bounds, rrup_bounds, vs30_bounds, sf_bounds = bounds
+    return gms.CausalParamBounds(
+        None,
+        None,
+        IM.from_str("PGA"),
+        mw_bounds,
+        rrup_bounds,
+        vs30_bounds,
+        sf_bounds=sf_bounds,
+        im_value=0.1,
+    )
+
+
+def _get_filter_mask_reference(
+    metadata_df: pd.DataFrame,
+    cs_param_bounds: gms.CausalParamBounds,
+    ignore_vs30: bool = False,
+    sf: pd.Series = None,
+):
+    """Causal parameter bounds filtering with element-wise (exclusive) comparisons"""
+    mask = np.ones(metadata_df.shape[0], dtype=bool)
+    if cs_param_bounds.mw_low is not None:
+        mask &= (metadata_df.mag.values > cs_param_bounds.mw_low) & (
+            metadata_df.mag.values < cs_param_bounds.mw_high
+        )
+    if cs_param_bounds.rrup_low is not None:
+        mask &= (metadata_df.rrup.values > cs_param_bounds.rrup_low) & (
+            metadata_df.rrup.values < cs_param_bounds.rrup_high
+        )
+    if cs_param_bounds.vs30_low is not None and not ignore_vs30:
+        mask &= (metadata_df.vs30.values > cs_param_bounds.vs30_low) & (
+            metadata_df.vs30.values < cs_param_bounds.vs30_high
+        )
+    if sf is not None and cs_param_bounds.sf_low is not None:
+        mask &= (sf.values > cs_param_bounds.sf_low) & (
+            sf.values < cs_param_bounds.sf_high
+        )
+    return mask
+
+
+def _get_im_df_reference(
+    im_csv_ffp: str,
+    IMs: list,
+    cs_param_bounds: gms.CausalParamBounds = None,
+    sf: pd.Series = None,
+):
+    """Filters and scales the IM csv data directly, GMs without
+    a scaling factor are ignored (if scaling factors are given)"""
+    im_df = pd.read_csv(im_csv_ffp, index_col=0)
+    im_df = im_df.loc[~im_df.index.duplicated()]
+    metadata_df = im_df.loc[:, ["mag", "rrup", "vs30"]]
+    im_df = im_df.loc[:, IMs]
+
+    if cs_param_bounds is not None:
+        im_df = im_df.loc[
+            _get_filter_mask_reference(metadata_df.loc[im_df.index], cs_param_bounds)
+        ]
+
+    if sf is not None:
+        im_df = im_df.loc[im_df.index.isin(sf.index)]
+        cur_sf = sf.loc[im_df.index]
+        if cs_param_bounds is not None:
+            mask = _get_filter_mask_reference(
+                metadata_df.loc[im_df.index], cs_param_bounds, sf=cur_sf
+            )
+            im_df, cur_sf = im_df.loc[mask], cur_sf.loc[mask]
+        im_df = sha_calc.apply_amp_scaling(im_df, cur_sf)
+
+    return im_df
+
+
+def _get_sf(gm_dataset: gms.HistoricalGMDataset, subset: bool):
+    sf = gm_dataset.compute_scaling_factor(IM.from_str("PGA"), 0.2)
+    return sf.iloc[::2] if subset else sf
+
+
+@pytest.mark.parametrize("bounds", CS_PARAM_BOUNDS)
+@pytest.mark.parametrize("sf_type", [None, "all", "subset"])
+def test_get_im_df(gm_dataset, im_csv_ffp, bounds, sf_type):
+    cs_param_bounds = _get_cs_param_bounds(bounds)
+    sf = None if sf_type is None else _get_sf(gm_dataset, sf_type == "subset")
+
+    im_df = gm_dataset.get_im_df(None, IMS, cs_param_bounds, sf=sf)
+    expected_df = _get_im_df_reference(im_csv_ffp, IMS, cs_param_bounds, sf=sf)
+    pd.testing.assert_frame_equal(im_df, expected_df, check_index_type=False)
+
+    # Single IM
+    pd.testing.assert_series_equal(
+        gm_dataset.get_im_df(None, "pSA_1.0", cs_param_bounds, sf=sf),
+        expected_df["pSA_1.0"],
+        check_index_type=False,
+    )
+
+    # Scaling is applied in log space
+    pd.testing.assert_frame_equal(
+        gm_dataset.get_lnIM_df(None, IMS, cs_param_bounds, sf=sf), np.log(im_df)
+    )
+
+
+@pytest.mark.parametrize("bounds", CS_PARAM_BOUNDS[1:])
+@pytest.mark.parametrize("ignore_vs30", [True, False])
+def test_get_bounds_mask(gm_dataset, bounds, ignore_vs30):
+    cs_param_bounds = _get_cs_param_bounds(bounds)
+    metadata_df = gm_dataset.get_metadata_df(None)
+    expected_mask = _get_filter_mask_reference(
+        metadata_df, cs_param_bounds, ignore_vs30=ignore_vs30
+    )
+
+    assert np.array_equal(
+        gm_dataset._get_bounds_mask(cs_param_bounds, ignore_vs30=ignore_vs30),
+        expected_mask,
+    )
+    assert gm_dataset.get_n_gms_in_bounds(
+        metadata_df, cs_param_bounds, ignore_vs30=ignore_vs30
+    ) == np.count_nonzero(expected_mask)
+
+    # Subset of the GMs
+    assert gm_dataset.get_n_gms_in_bounds(
+        metadata_df.iloc[::3], cs_param_bounds, ignore_vs30=ignore_vs30
+    ) == np.count_nonzero(expected_mask[::3])
+
+
+def test_shared_dataset(gm_dataset):
+    """Dataset instances are shared, and are not modified by their users"""
+    assert gms.GMDataset.get_GMDataset(DATASET_ID) is gm_dataset
+
+    gm_ids = gm_dataset.gm_ids
+    gm_ids[:] = 0
+    metadata_df = gm_dataset.get_metadata_df(None)
+    metadata_df.loc[:, "mag"] = 0.0
+    im_df = gm_dataset.get_im_df(None, IMS)
+    im_df.loc[:, "PGA"] = 0.0
+
+    assert np.all(gm_dataset.gm_ids >= 1000)
+    assert np.all(gm_dataset.get_metadata_df(None)["mag"].fillna(5.0) >= 5.0)
+    assert np.all(gm_dataset.get_im_df(None, IMS)["PGA"] > 0.0)
+
+    gms.GMDataset.clear_gm_datasets()
+    assert gms.GMDataset.get_GMDataset(DATASET_ID) is not gm_dataset
+
+
+def test_get_vs30_df(tmp_path):
+    """The vs30 file is parsed again once it has been modified"""
+    vs30_ffp = tmp_path / "stations.vs30"
+    vs30_ffp.write_text("STAT_A 250.0\nSTAT_B 400.0\n")
+
+    vs30_df = gms.GroundMotionDataset._get_vs30_df(str(vs30_ffp))
+    assert vs30_df.loc["STAT_B", "vs30"] == 400.0
+    assert gms.GroundMotionDataset._get_vs30_df(str(vs30_ffp)) is vs30_df
+
+    # Same size, newer modification time
+    stat = vs30_ffp.stat()
+    vs30_ffp.write_text("STAT_A 250.0\nSTAT_B 500.0\n")
+    os.utime(vs30_ffp, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    new_vs30_df = gms.GroundMotionDataset._get_vs30_df(str(vs30_ffp))
+    assert new_vs30_df is not vs30_df
+    assert new_vs30_df.loc["STAT_B", "vs30"] == 500.0
@@ -0,0 +1,214 @@
+"""GMS tests, these use synthetic data and therefore do not require any ensemble data"""
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import sha_calc
+from gmhazard_calc import gms
+from gmhazard_calc import constants as const
+from gmhazard_calc.gms import gms as gms_module
+from gmhazard_calc.im import IM, to_string_list
+
+IMS = np.asarray([IM.from_str(cur_im) for cur_im in ["pSA_0.5", "pSA_1.0", "PGV"]])
+IM_WEIGHTS = pd.Series([0.5, 0.3, 0.2], index=to_string_list(IMS))
+N_GMS = 6
+
+
+def _get_lnIMi_IMj(IMs: np.ndarray):
+    """Lognormal IMi|IMj distributions, as non-parametric CDFs"""
+    x = np.linspace(-6, 2, 200)
+    return {
+        IMi: sha_calc.Uni_lnIMi_IMj(
+            pd.Series(stats.norm.cdf(x, -2.0, 0.6), index=x),
+            str(IMi),
+            "PGA",
+            0.3,
+        )
+        for IMi in IMs
+    }
+
+
+def _get_gm_lnIM_df(rng: np.random.Generator, n_gms: int):
+    return pd.DataFrame(
+        rng.normal(-2.0, 0.8, size=(n_gms, IMS.size)),
+        index=[f"gm_{ix}" for ix in range(n_gms)],
+        columns=to_string_list(IMS),
+    )
+
+
+def _select_gms_reference(
+    IMs: np.ndarray,
+    rel_lnIMi_df: pd.DataFrame,
+    rel_sigma: np.ndarray,
+    gm_lnIM_df: pd.DataFrame,
+    lnIMi_IMj: dict,
+    im_weights: pd.Series,
+):
+    """GM selection with the [n_gms, n_pool, n_IMs] misfit array,
+    i.e. without computing the misfit one IM at a time"""
+    IMs_str = to_string_list(IMs)
+    diff = (
+        rel_lnIMi_df.loc[:, IMs_str].values[:, np.newaxis, :]
+        - gm_lnIM_df.loc[:, IMs_str].values
+    )
+    misfit = pd.DataFrame(
+        index=rel_lnIMi_df.index,
+        data=np.sum(
+            im_weights.loc[IMs_str].values
+            * (diff / np.broadcast_to(rel_sigma, rel_lnIMi_df.shape)[:, np.newaxis, :])
+            ** 2,
+            axis=2,
+        ),
+    )
+    selected_gms_ind = gm_lnIM_df.index.values[misfit.idxmin(axis=1).values]
+    D = gms_module.ks_stats(IMs, gm_lnIM_df.loc[selected_gms_ind], lnIMi_IMj)
+    return list(selected_gms_ind), np.sum(im_weights * (D ** 2))
+
+
+def _replica_fn(rng: np.random.Generator):
+    """Runs a replica with random realisations and a small pool of GMs"""
+    gm_lnIM_df = _get_gm_lnIM_df(np.random.default_rng(0), 30)
+    rel_lnIMi_df = pd.DataFrame(
+        rng.normal(-2.0, 0.6, size=(N_GMS, IMS.size)), columns=to_string_list(IMS)
+    )
+    return gms_module._select_gms(
+        IMS,
+        rel_lnIMi_df,
+        np.full((1, IMS.size), 0.6),
+        gm_lnIM_df,
+        _get_lnIMi_IMj(IMS),
+        IM_WEIGHTS,
+    )
+
+
+def _check_replica_results(results: list, expected_results: list):
+    assert len(results) == len(expected_results)
+    for (rel_df, gm_ids, R), (exp_rel_df, exp_gm_ids, exp_R) in zip(
+        results, expected_results
+    ):
+        pd.testing.assert_frame_equal(rel_df, exp_rel_df)
+        assert gm_ids == exp_gm_ids
+        assert R == exp_R
+
+
+@pytest.mark.parametrize(
+    "im_data_type", [const.IMDataType.non_parametric, const.IMDataType.mixed]
+)
+def test_rupture_contribution_threshold_non_parametric(im_data_type):
+    """The rupture contribution truncation is only supported for parametric ensembles"""
+    ensemble = SimpleNamespace(name="test_ensemble", flt_im_data_type=im_data_type)
+    with pytest.raises(ValueError):
+        gms.run_ensemble_gms(
+            ensemble,
+            None,
+            10,
+            IM.from_str("PGA"),
+            None,
+            np.asarray([IM.from_str("pSA_1.0"), IM.from_str("pSA_3.0")]),
+            exceedance=1 / 500,
+            rupture_contribution_threshold=0.99,
+        )
+
+
+@pytest.mark.parametrize("rel_sigma_shape", [(1, IMS.size), (N_GMS, IMS.size)])
+def test_select_gms(rel_sigma_shape):
+    """The misfit computed one IM at a time gives the same selection & residual"""
+    rng = np.random.default_rng(1)
+    gm_lnIM_df = _get_gm_lnIM_df(rng, 50)
+    rel_lnIMi_df = pd.DataFrame(
+        rng.normal(-2.0, 0.6, size=(N_GMS, IMS.size)), columns=to_string_list(IMS)
+    )
+    rel_sigma = rng.uniform(0.3, 0.8, size=rel_sigma_shape)
+    lnIMi_IMj = _get_lnIMi_IMj(IMS)
+
+    result_df, gm_ids, R = gms_module._select_gms(
+        IMS, rel_lnIMi_df, rel_sigma, gm_lnIM_df, lnIMi_IMj, IM_WEIGHTS
+    )
+    expected_gm_ids, expected_R = _select_gms_reference(
+        IMS, rel_lnIMi_df, rel_sigma, gm_lnIM_df, lnIMi_IMj, IM_WEIGHTS
+    )
+
+    assert result_df is rel_lnIMi_df
+    assert gm_ids == expected_gm_ids
+    assert np.isclose(R, expected_R)
+
+
+def test_run_replicas():
+    """Results are the same for serial and parallel execution"""
+    serial_results = gms_module._run_replicas(_replica_fn, 8, N_GMS, seed=5)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parallel_results = gms_module._run_replicas(
+            _replica_fn, 8, N_GMS, seed=5, executor=executor
+        )
+
+    assert len(serial_results) == 8
+    _check_replica_results(parallel_results, serial_results)
+
+    # The seed is drawn from the global random state if not specified
+    np.random.seed(3)
+    results = gms_module._run_replicas(_replica_fn, 3, N_GMS)
+    np.random.seed(3)
+    _check_replica_results(gms_module._run_replicas(_replica_fn, 3, N_GMS), results)
+
+
+def test_run_replicas_early_stop():
+    """Early stopping stops at the same replica for serial and parallel execution"""
+    all_results = gms_module._run_replicas(_replica_fn, 10, N_GMS, seed=7)
+    R_values = np.asarray([cur_R for _, _, cur_R in all_results])
+    is_unique = np.asarray(
+        [np.unique(cur_gm_ids).size == N_GMS for _, cur_gm_ids, _ in all_results]
+    )
+
+    # Threshold that is only met by a later replica
+    threshold = np.min(R_values[is_unique]) + 1e-9
+    stop_ix = np.flatnonzero(is_unique & (R_values < threshold))[0]
+    assert 0 < stop_ix < R_values.size - 1
+
+    n_calls = []
+
+    def replica_fn(rng: np.random.Generator):
+        n_calls.append(1)
+        return _replica_fn(rng)
+
+    serial_results = gms_module._run_replicas(
+        replica_fn, 10, N_GMS, seed=7, early_stop_R_threshold=threshold
+    )
+    assert len(n_calls) == stop_ix + 1
+    _check_replica_results(serial_results, all_results[: stop_ix + 1])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        parallel_results = gms_module._run_replicas(
+            _replica_fn,
+            10,
+            N_GMS,
+            seed=7,
+            executor=executor,
+            early_stop_R_threshold=threshold,
+        )
+    _check_replica_results(parallel_results, all_results[: stop_ix + 1])
+
+
+def test_select_replica():
+    """Only replica with n_gms unique GMs are considered, if there are
+    none, then only the replica with the most unique GMs"""
+    rel_df = pd.DataFrame()
+    replica_results = [
+        (rel_df, ["gm_0", "gm_1", "gm_1"], 0.1),
+        (rel_df, ["gm_0", "gm_1", "gm_2"], 0.5),
+        (rel_df, ["gm_0", "gm_0", "gm_0"], 0.05),
+        (rel_df, ["gm_3", "gm_4", "gm_5"], 0.3),
+    ]
+    assert gms_module._select_replica(replica_results, 3, 4, "test") is (
+        replica_results[3]
+    )
+
+    replica_results = [replica_results[ix] for ix in [0, 2]] + [
+        (rel_df, ["gm_2", "gm_2", "gm_3"], 0.2)
+    ]
+    assert gms_module._select_replica(replica_results, 3, 4, "test") is (
+        replica_results[0]
+    )
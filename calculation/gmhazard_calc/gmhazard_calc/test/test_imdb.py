@@ -0,0 +1,377 @@
+"""IMDB tests, these use small synthetic IMDBs"""
+import os
+
+import h5py
+import tables
+import pytest
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+from gmhazard_calc import constants as const
+
+STATIONS = np.asarray([f"station_{ix}" for ix in range(6)])
+N_RUPTURES = 8
+
+PARAMETRIC_IMS = ["PGA", "pSA_1.0"]
+PARAMETRIC_COLUMNS = [
+    cur_column for im in PARAMETRIC_IMS for cur_column in [im, f"{im}_sigma"]
+]
+RUPTURE_NAMES = np.asarray([f"rupture_{ix}" for ix in range(N_RUPTURES)])
+
+NON_PARAMETRIC_IMS = ["PGA", "PGV", "pSA_1.0"]
+SIMULATIONS = np.asarray(
+    [
+        f"{cur_fault}_REL{rel_ix:02d}"
+        for cur_fault in ["FaultA", "FaultB", "FaultC", "FaultD"]
+        for rel_ix in range(1, 4)
+    ]
+)
+
+
+def _create_imdb(
+    imdb_ffp: str, imdb_type: const.IMDataType, im_columns: list
+) -> dbs.IMDB:
+    """Creates an IMDB without any IM data"""
+    site_df = pd.DataFrame(
+        {"lon": np.linspace(172, 173, STATIONS.size), "lat": -43.5}, index=STATIONS
+    )
+
+    if imdb_type is const.IMDataType.parametric:
+        imdb = dbs.IMDBParametric(
+            imdb_ffp, writeable=True, source_type=const.SourceType.fault
+        )
+        with imdb:
+            imdb.write_sites(site_df)
+            imdb.write_rupture_data(
+                pd.DataFrame({"rupture_name": pd.Categorical(RUPTURE_NAMES)})
+            )
+            imdb.write_attributes(ims=np.asarray(im_columns, dtype=str))
+    else:
+        imdb = dbs.IMDBNonParametric(
+            imdb_ffp, writeable=True, source_type=const.SourceType.fault
+        )
+        with imdb:
+            imdb.write_sites(site_df)
+            imdb.write_simulations(pd.Series(SIMULATIONS))
+            imdb.write_attributes(ims=np.asarray(im_columns, dtype=str))
+
+    return imdb
+
+
+def _get_im_df(
+    rng: np.random.Generator, imdb_type: const.IMDataType, n_rows: int
+) -> pd.DataFrame:
+    """Creates the IM dataframe of a station, with a random subset of
+    the ruptures (parametric) or simulations (non-parametric)"""
+    if imdb_type is const.IMDataType.parametric:
+        index = np.sort(rng.choice(N_RUPTURES, n_rows, replace=False))
+        return pd.DataFrame(
+            rng.uniform(size=(n_rows, len(PARAMETRIC_COLUMNS))),
+            index=index,
+            columns=PARAMETRIC_COLUMNS,
+        )
+
+    index = np.sort(rng.choice(SIMULATIONS.size, n_rows, replace=False))
+    return pd.DataFrame(
+        rng.uniform(size=(n_rows, len(NON_PARAMETRIC_IMS))),
+        index=index,
+        columns=NON_PARAMETRIC_IMS,
+    )
+
+
+def _write_stations(
+    imdb: dbs.IMDB, rng: np.random.Generator, stations: np.ndarray, n_rows: int = 4
+):
+    with imdb:
+        for cur_station in stations:
+            imdb.write_im_data(cur_station, _get_im_df(rng, imdb.imdb_type, n_rows))
+
+
+def _transpose_blocks(imdb_ffp: str, station: str):
+    """Stores the IM data blocks of the station without the
+    transpose, i.e. in the layout used by older pandas versions"""
+    with tables.open_file(imdb_ffp, mode="a") as h5_file:
+        group = h5_file.get_node(dbs.IMDB.get_im_data_path(station))
+        for ix in range(group._v_attrs.nblocks):
+            values = group._f_get_child(f"block{ix}_values").read()
+            h5_file.remove_node(group, f"block{ix}_values")
+            h5_file.create_array(group, f"block{ix}_values", values.T)
+            group._f_get_child(f"block{ix}_values")._v_attrs.transposed = False
+
+
+def _check_rupture_lookup(imdb_ffp: str):
+    """Checks the rupture lookup against the (full) IM data of all stations"""
+    with dbs.IMDB.get_imdb(imdb_ffp) as imdb:
+        station_data = {
+            cur_station: imdb.im_data(cur_station)
+            for cur_station in imdb.get_stored_stations()
+        }
+        station_ruptures = {
+            cur_station: cur_df.index.get_level_values(0).unique()
+            for cur_station, cur_df in station_data.items()
+            if cur_df is not None
+        }
+
+        expected_rupture_names = np.unique(
+            np.concatenate([cur_names for cur_names in station_ruptures.values()])
+        )
+        assert np.array_equal(np.sort(imdb.rupture_names()), expected_rupture_names)
+
+        for cur_rupture in np.concatenate((expected_rupture_names, ["unknown"])):
+            expected_stations = [
+                cur_station
+                for cur_station, cur_names in station_ruptures.items()
+                if cur_rupture in cur_names
+            ]
+            stations = imdb.rupture_stations(cur_rupture)
+            if len(expected_stations) == 0:
+                assert stations is None
+                assert imdb.rupture_data(cur_rupture) is None
+                continue
+            assert np.array_equal(np.sort(stations), np.sort(expected_stations))
+
+            expected_df = pd.concat(
+                [
+                    station_data[cur_station].loc[[cur_rupture]]
+                    for cur_station in stations
+                ],
+                keys=stations,
+            )
+            if imdb.imdb_type is const.IMDataType.non_parametric:
+                expected_df = expected_df.droplevel(1)
+            pd.testing.assert_frame_equal(
+                imdb.rupture_data(cur_rupture), expected_df, check_names=False
+            )
+
+
+@pytest.fixture(params=[const.IMDataType.parametric, const.IMDataType.non_parametric])
+def imdb(request, tmp_path):
+    return _create_imdb(
+        str(tmp_path / "test.db"),
+        request.param,
+        PARAMETRIC_IMS
+        if request.param is const.IMDataType.parametric
+        else NON_PARAMETRIC_IMS,
+    )
+
+
+@pytest.mark.parametrize("max_pairs", [1, 3, 100])
+def test_update_rupture_lookup(imdb, max_pairs):
+    rng = np.random.default_rng(0)
+
+    # Overwrite one of the stations before the update
+    _write_stations(imdb, rng, STATIONS[:4])
+    _write_stations(imdb, rng, STATIONS[1:2], n_rows=2)
+    with imdb:
+        imdb.update_rupture_lookup(max_pairs=max_pairs)
+    _check_rupture_lookup(imdb.db_ffp)
+
+    # Incremental update, with new stations and overwritten
+    # stations that are already part of the lookup
+    _write_stations(imdb, rng, STATIONS[3:])
+    _write_stations(imdb, rng, STATIONS[:1], n_rows=1)
+    with imdb:
+        assert imdb._db.get_node(imdb.LOOKUP_LOG_KEY) is not None
+        imdb.update_rupture_lookup(max_pairs=max_pairs)
+        assert imdb._db.get_node(imdb.LOOKUP_LOG_KEY) is None
+        assert imdb._db.get_node(imdb.LOOKUP_LOG_STATIONS_KEY) is None
+    _check_rupture_lookup(imdb.db_ffp)
+
+    # Updating without any new stations keeps the lookup
+    with imdb:
+        imdb.update_rupture_lookup(max_pairs=max_pairs)
+    _check_rupture_lookup(imdb.db_ffp)
+
+
+def test_rupture_lookup_no_data(imdb):
+    """A station without any data for the ruptures is part of the lookup stations,
+    but not of the lookup of any rupture"""
+    _write_stations(imdb, np.random.default_rng(1), STATIONS[:2])
+    with imdb:
+        imdb.write_im_data(
+            STATIONS[2], _get_im_df(np.random.default_rng(2), imdb.imdb_type, 0)
+        )
+        imdb.update_rupture_lookup(max_pairs=2)
+        assert STATIONS[2] in imdb._get_rupture_lookup()[0]
+    _check_rupture_lookup(imdb.db_ffp)
+
+
+@pytest.mark.parametrize("transposed", [True, False])
+def test_read_im_df(imdb, transposed):
+    """Reading the rows of a single rupture matches the full read"""
+    rng = np.random.default_rng(3)
+    _write_stations(imdb, rng, STATIONS[:1], n_rows=6)
+    if not transposed:
+        _transpose_blocks(imdb.db_ffp, STATIONS[0])
+
+    # Mixed dtypes, i.e. multiple blocks
+    with imdb:
+        im_df = _get_im_df(rng, imdb.imdb_type, 6)
+        im_df["n_values"] = np.arange(im_df.shape[0], dtype=np.int64)
+        imdb.write_im_data(STATIONS[1], im_df)
+    if not transposed:
+        _transpose_blocks(imdb.db_ffp, STATIONS[1])
+
+    # Not a fixed frame, i.e. requires a full read
+    with imdb:
+        imdb._db.put(
+            imdb.get_im_data_path(STATIONS[2]),
+            _get_im_df(rng, imdb.imdb_type, 6),
+            format="table",
+        )
+
+    with dbs.IMDB.get_imdb(imdb.db_ffp) as imdb:
+        for cur_station, is_fixed_frame in zip(STATIONS[:3], [True, True, False]):
+            group = imdb._db.get_node(imdb.get_im_data_path(cur_station))
+            assert imdb._is_fixed_frame(group) is is_fixed_frame
+
+            full_df = imdb._db.get(imdb.get_im_data_path(cur_station))
+            row_rupture_ids = imdb._get_row_rupture_ids(full_df.index.values)
+            for cur_rupture_id in range(imdb._get_rupture_id_names().size):
+                cur_df = imdb._read_im_df(cur_station, rupture_id=cur_rupture_id)
+                cur_expected_df = full_df.loc[row_rupture_ids == cur_rupture_id]
+                if cur_expected_df.shape[0] == 0:
+                    assert cur_df is None or cur_df.shape[0] == 0
+                else:
+                    pd.testing.assert_frame_equal(
+                        cur_df, cur_expected_df, check_index_type=False
+                    )
+
+        assert imdb._read_im_df(STATIONS[3], rupture_id=0) is None
+
+
+def test_add_rupture_lookup(imdb):
+    """Converts an IMDB with the old per rupture lookup to the CSR lookup"""
+    rng = np.random.default_rng(4)
+    _write_stations(imdb, rng, STATIONS)
+
+    # Create the old rupture lookup, and remove the log
+    with dbs.IMDB.get_imdb(imdb.db_ffp) as cur_imdb:
+        rupture_stations = {}
+        for cur_station in STATIONS:
+            for cur_rupture in (
+                cur_imdb.im_data(cur_station).index.get_level_values(0).unique()
+            ):
+                rupture_stations.setdefault(cur_rupture, []).append(cur_station)
+    with imdb:
+        imdb._db.remove(imdb.LOOKUP_LOG_KEY)
+        imdb._db.remove(imdb.LOOKUP_LOG_STATIONS_KEY)
+        for cur_rupture, cur_stations in rupture_stations.items():
+            imdb._db[imdb.get_rupture_lookup_path(cur_rupture)] = pd.Series(
+                cur_stations
+            )
+    with h5py.File(imdb.db_ffp, mode="a") as h5_file:
+        h5_file.attrs["rupture_names"] = np.asarray(
+            list(rupture_stations.keys()), dtype=str
+        ).astype(np.bytes_)
+
+    with dbs.IMDB.get_imdb(imdb.db_ffp) as cur_imdb:
+        assert cur_imdb._get_rupture_lookup() is None
+        for cur_rupture, cur_stations in rupture_stations.items():
+            assert cur_imdb.rupture_stations(cur_rupture) is None
+            assert np.array_equal(
+                cur_imdb.rupture_data(cur_rupture).index.get_level_values(0).unique(),
+                cur_stations,
+            )
+
+    dbs.IMDB.add_rupture_lookup(imdb.db_ffp, 2)
+    _check_rupture_lookup(imdb.db_ffp)
+
+
+def _get_im_blocks(imdb_type: const.IMDataType, im_df: pd.DataFrame) -> list:
+    """Splits the IM dataframe into per IM column blocks"""
+    if imdb_type is const.IMDataType.parametric:
+        return [im_df.loc[:, [im, f"{im}_sigma"]] for im in PARAMETRIC_IMS]
+    return [im_df.loc[:, [im]] for im in NON_PARAMETRIC_IMS]
+
+
+def _read_im_data(imdb_ffp: str) -> dict:
+    with dbs.IMDB.get_imdb(imdb_ffp) as imdb:
+        return {
+            cur_station: imdb._db[imdb.get_im_data_path(cur_station)]
+            for cur_station in imdb.get_stored_stations()
+        }
+
+
+def _check_im_data(im_data: dict, expected_im_data: dict):
+    assert sorted(im_data.keys()) == sorted(expected_im_data.keys())
+    for cur_station, cur_df in expected_im_data.items():
+        pd.testing.assert_frame_equal(im_data[cur_station], cur_df)
+
+
+@pytest.mark.parametrize("max_memory", [1, 1024 ** 3])
+def test_imdb_writer(imdb, tmp_path, monkeypatch, max_memory):
+    """The writer gives the same IM data as adding the blocks via add_im_data"""
+    rng = np.random.default_rng(5)
+    im_columns = (
+        PARAMETRIC_IMS
+        if imdb.imdb_type is const.IMDataType.parametric
+        else NON_PARAMETRIC_IMS
+    )
+    ref_imdb = _create_imdb(str(tmp_path / "reference.db"), imdb.imdb_type, im_columns)
+
+    # Per station blocks, the first block of the first
+    # station is already in the IMDB before writing
+    station_blocks = {
+        cur_station: _get_im_blocks(imdb.imdb_type, _get_im_df(rng, imdb.imdb_type, 5))
+        for cur_station in STATIONS[:4]
+    }
+    for cur_imdb in [imdb, ref_imdb]:
+        with cur_imdb:
+            cur_imdb.write_im_data(STATIONS[0], station_blocks[STATIONS[0]][0])
+
+    written_stations = []
+    write_im_data = dbs.IMDB.write_im_data
+
+    def count_write_im_data(self, station_name: str, im_df: pd.DataFrame):
+        written_stations.append(station_name)
+        return write_im_data(self, station_name, im_df)
+
+    monkeypatch.setattr(dbs.IMDB, "write_im_data", count_write_im_data)
+
+    writer = dbs.IMDBWriter(imdb, max_memory=max_memory)
+    with ref_imdb:
+        for block_ix in range(len(im_columns)):
+            for cur_station, cur_blocks in station_blocks.items():
+                if cur_station == STATIONS[0] and block_ix == 0:
+                    continue
+                ref_imdb.add_im_data(cur_station, cur_blocks[block_ix])
+                writer.add_im_data(cur_station, cur_blocks[block_ix])
+    assert sorted(writer.stations) == sorted(STATIONS[:4])
+    assert os.path.exists(writer.staging_ffp) is (max_memory == 1)
+
+    written_stations.clear()
+    writer.finalise(repack=True)
+    assert sorted(written_stations) == sorted(STATIONS[:4])
+    assert not os.path.exists(writer.staging_ffp)
+
+    _check_im_data(_read_im_data(imdb.db_ffp), _read_im_data(ref_imdb.db_ffp))
+    with imdb:
+        imdb.update_rupture_lookup()
+    _check_rupture_lookup(imdb.db_ffp)
+
+
+def test_repack(imdb):
+    """Repacking removes the unused space, but keeps the content"""
+    rng = np.random.default_rng(6)
+    _write_stations(imdb, rng, STATIONS, n_rows=6)
+    _write_stations(imdb, rng, STATIONS[:3], n_rows=6)
+    with imdb:
+        imdb.update_rupture_lookup()
+
+    im_data = _read_im_data(imdb.db_ffp)
+    with h5py.File(imdb.db_ffp, mode="r") as h5_file:
+        attrs = dict(h5_file.attrs)
+    size = os.path.getsize(imdb.db_ffp)
+
+    dbs.IMDB.repack(imdb.db_ffp)
+    assert os.path.getsize(imdb.db_ffp) < size
+    assert not os.path.exists(f"{imdb.db_ffp}.repack")
+
+    _check_im_data(_read_im_data(imdb.db_ffp), im_data)
+    with h5py.File(imdb.db_ffp, mode="r") as h5_file:
+        assert sorted(h5_file.attrs.keys()) == sorted(attrs.keys())
+        for cur_key, cur_value in attrs.items():
+            assert np.array_equal(h5_file.attrs[cur_key], cur_value)
+    _check_rupture_lookup(imdb.db_ffp)
@@ -0,0 +1,585 @@
+"""Binary result format (result_io) tests, these use synthetic
+results and therefore do not require any ensemble data"""
+from pathlib import Path
+from types import SimpleNamespace
+
+import h5py
+import pytest
+import numpy as np
+import pandas as pd
+
+import sha_calc
+from gmhazard_calc import gms
+from gmhazard_calc import uhs
+from gmhazard_calc import site
+from gmhazard_calc import disagg
+from gmhazard_calc import hazard
+from gmhazard_calc import gm_data
+from gmhazard_calc import nz_code
+from gmhazard_calc import result_io
+from gmhazard_calc import constants as const
+from gmhazard_calc.im import IM, IMType
+from gmhazard_calc.gms import GCIMResult
+
+BRANCH_NAMES = ["branch_a", "branch_b"]
+RUPTURE_IDS = np.asarray([f"rupture_{ix}" for ix in range(10)])
+IM_VALUES = np.logspace(-3, 0, 20)
+
+
+class _Ensemble:
+    """Minimal stand-in for the Ensemble, as used by the result classes"""
+
+    name = "test_ensemble"
+
+    def __init__(self):
+        self.im_ensemble = SimpleNamespace(branches_dict={})
+        self.im_ensemble.branches_dict.update(
+            {
+                cur_name: SimpleNamespace(name=cur_name, im_ensemble=self.im_ensemble)
+                for cur_name in BRANCH_NAMES
+            }
+        )
+
+    def get_save_params(self):
+        # Includes a file path, as this is supported by the metadata serialisation
+        return {
+            "name": self.name,
+            "config_ffp": Path("ensemble_config.yaml"),
+            "use_im_data_cache": False,
+        }
+
+    def get_im_ensemble(self, im_type: IMType):
+        return self.im_ensemble
+
+    def get_rupture_id_indices(self, rupture_ids: np.ndarray):
+        return pd.Index(RUPTURE_IDS).get_indexer(rupture_ids)
+
+    def get_rupture_ids(self, rupture_id_ind: np.ndarray):
+        return RUPTURE_IDS[rupture_id_ind]
+
+
+@pytest.fixture
+def ensemble():
+    return _Ensemble()
+
+
+@pytest.fixture
+def site_info():
+    return site.SiteInfo("test_station", -43.5, 172.6, 400.0, z1p0=0.1)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def _check_series(result: pd.Series, expected: pd.Series):
+    pd.testing.assert_series_equal(result, expected, check_index_type=False)
+
+
+def _check_df(result: pd.DataFrame, expected: pd.DataFrame):
+    pd.testing.assert_frame_equal(
+        result, expected, check_index_type=False, check_column_type=False
+    )
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "lzf"])
+def test_round_trip(tmp_path, rng, compression):
+    """Dataframes, series and arrays are restored with the same values & dtypes"""
+    n_rows = 2 * result_io.MIN_COMPRESSION_SIZE
+    df = pd.DataFrame(
+        {
+            "float": rng.normal(size=n_rows),
+            "int": np.arange(n_rows, dtype=np.int32),
+            "bool": rng.uniform(size=n_rows) > 0.5,
+            "str": [f"value_{ix}" for ix in range(n_rows)],
+            "mixed": ["a" if ix % 2 == 0 else np.nan for ix in range(n_rows)],
+            "categorical": pd.Categorical.from_codes(
+                np.arange(n_rows) % 3, categories=["low", "medium", "high"]
+            ),
+        },
+        index=pd.Index([f"row_{ix}" for ix in range(n_rows)], name="row"),
+    )
+    multi_index_series = pd.Series(
+        rng.normal(size=6),
+        index=pd.MultiIndex.from_product(
+            [["fault_a", "fault_b"], [1, 2, 3]], names=["fault", "realisation"]
+        ),
+        name="values",
+    )
+    multi_column_df = pd.DataFrame(
+        rng.normal(size=(3, 4)),
+        columns=pd.MultiIndex.from_product(
+            [[0.5, 0.1], ["mean", "std"]], names=["exceedance", "stat"]
+        ),
+    )
+    array = rng.normal(size=(4, 5))
+
+    ffp = tmp_path / f"result{result_io.BINARY_SUFFIX}"
+    with result_io.ResultWriter.create(ffp, "test", compression=compression) as writer:
+        writer.set_metadata({"value": np.float64(1.5), "values": np.arange(3)})
+        writer.write("df", df)
+        writer.write("multi_index_series", multi_index_series)
+        writer.write("multi_column_df", multi_column_df)
+        writer.write("array", array)
+        writer.write("none", None)
+
+    with h5py.File(ffp, mode="r") as h5_file:
+        assert h5_file["df/column_0"].compression == compression
+        assert h5_file["array"].compression is None
+
+    with result_io.ResultReader.open(ffp, "test") as reader:
+        assert reader.metadata == {"value": 1.5, "values": [0, 1, 2]}
+        _check_df(reader.read("df"), df)
+        _check_series(reader.read("multi_index_series"), multi_index_series)
+        _check_df(reader.read("multi_column_df"), multi_column_df)
+        assert np.array_equal(reader.read("array"), array)
+        assert reader.read("none") is None
+        assert "none" not in reader
+
+
+def test_unsupported_metadata(tmp_path):
+    """Unsupported values are rejected, instead of being converted to strings"""
+    with pytest.raises(TypeError):
+        with result_io.ResultWriter.create(
+            tmp_path / f"result{result_io.BINARY_SUFFIX}", "test"
+        ) as writer:
+            writer.set_metadata({"value": object()})
+
+    # The incomplete result file is removed
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_format_version(tmp_path):
+    ffp = tmp_path / f"result{result_io.BINARY_SUFFIX}"
+    with result_io.ResultWriter.create(ffp, "test") as writer:
+        writer.set_metadata({})
+
+    with pytest.raises(result_io.ResultFormatError):
+        with result_io.ResultReader.open(ffp, "other_test"):
+            pass
+
+    with h5py.File(ffp, mode="r+") as h5_file:
+        h5_file.attrs["format_version"] = result_io.FORMAT_VERSION + 1
+
+    with pytest.raises(result_io.ResultFormatError):
+        with result_io.ResultReader.open(ffp, "test"):
+            pass
+
+
+def test_lazy_member(tmp_path):
+    """Lazy members are only read on access and can be
+    loaded after the result file has been closed"""
+    ffp = tmp_path / f"result{result_io.BINARY_SUFFIX}"
+    with result_io.ResultWriter.create(ffp, "test") as writer:
+        writer.set_metadata({})
+        cur_writer = writer.group("nested")
+        cur_writer.set_metadata({"name": "nested"})
+        cur_writer.write("values", np.arange(5))
+
+    load_calls = []
+
+    def load_fn(reader: result_io.ResultReader):
+        load_calls.append(reader.metadata["name"])
+        return reader.read("values")
+
+    with result_io.ResultReader.open(ffp, "test") as reader:
+        assert reader.group_keys() == ["nested"]
+        lazy_member = reader.lazy("nested", load_fn)
+    assert len(load_calls) == 0
+
+    assert np.array_equal(result_io.resolve(lazy_member), np.arange(5))
+    assert load_calls == ["nested"]
+    assert result_io.resolve(3) == 3
+
+
+def test_hazard_result(tmp_path, rng, ensemble, site_info):
+    im = IM.from_str("pSA_1.0")
+    branch_hazard = [
+        hazard.BranchHazardResult(
+            im,
+            site_info,
+            pd.Series(rng.uniform(size=IM_VALUES.size), index=IM_VALUES),
+            pd.Series(rng.uniform(size=IM_VALUES.size), index=IM_VALUES),
+            ensemble.im_ensemble.branches_dict[cur_name],
+        )
+        for cur_name in BRANCH_NAMES
+    ]
+    result = hazard.EnsembleHazardResult(
+        im,
+        site_info,
+        pd.Series(rng.uniform(size=IM_VALUES.size), index=IM_VALUES),
+        pd.Series(rng.uniform(size=IM_VALUES.size), index=IM_VALUES),
+        ensemble,
+        branch_hazard,
+        percentiles=pd.DataFrame(
+            rng.uniform(size=(IM_VALUES.size, 2)),
+            index=IM_VALUES,
+            columns=["16th", "84th"],
+        ),
+    )
+
+    ffp = result.save_binary(tmp_path, compression="gzip")
+    loaded = hazard.EnsembleHazardResult.load_binary(ffp, ensemble=ensemble)
+
+    assert loaded.im == im
+    assert loaded.site.to_dict() == site_info.to_dict()
+    _check_series(loaded.fault_hazard, result.fault_hazard)
+    _check_series(loaded.ds_hazard, result.ds_hazard)
+    _check_df(loaded.percentiles, result.percentiles)
+
+    assert isinstance(loaded._branch_hazard, result_io.LazyMember)
+    for cur_name, cur_branch_hazard in loaded.branch_hazard_dict.items():
+        cur_expected = result.branch_hazard_dict[cur_name]
+        assert cur_branch_hazard.branch is cur_expected.branch
+        _check_series(cur_branch_hazard.fault_hazard, cur_expected.fault_hazard)
+        _check_series(cur_branch_hazard.ds_hazard, cur_expected.ds_hazard)
+
+
+def _get_disagg_result(rng, ensemble, site_info):
+    def get_disagg_df(rupture_id_ind: np.ndarray):
+        return pd.DataFrame(
+            {
+                "contribution": rng.uniform(size=rupture_id_ind.size),
+                "epsilon": rng.normal(size=rupture_id_ind.size),
+            },
+            index=rupture_id_ind,
+        )
+
+    return disagg.EnsembleDisaggResult(
+        get_disagg_df(np.arange(0, 6)),
+        get_disagg_df(np.arange(6, 10)),
+        site_info,
+        IM.from_str("PGA"),
+        0.25,
+        ensemble,
+        ensemble.im_ensemble,
+        exceedance=1 / 500,
+        mean_values=pd.Series({"magnitude": 6.5, "rrup": 20.0, "epsilon": 0.5}),
+    )
+
+
+def _check_disagg_result(
+    loaded: disagg.EnsembleDisaggResult, result: disagg.EnsembleDisaggResult
+):
+    assert loaded.im == result.im
+    assert loaded.im_value == result.im_value
+    assert loaded.exceedance == result.exceedance
+    assert loaded.site_info.to_dict() == result.site_info.to_dict()
+    _check_df(loaded.fault_disagg_id_ix, result.fault_disagg_id_ix)
+    _check_df(loaded.ds_disagg_id_ix, result.ds_disagg_id_ix)
+    _check_series(loaded.mean_values, result.mean_values)
+
+
+def test_disagg_result(tmp_path, rng, ensemble, site_info):
+    result = _get_disagg_result(rng, ensemble, site_info)
+
+    ffp = result.save_binary(tmp_path)
+    _check_disagg_result(
+        disagg.EnsembleDisaggResult.load_binary(ffp, ensemble=ensemble), result
+    )
+
+
+def test_disagg_grid_data(tmp_path, rng, ensemble, site_info):
+    disagg_result = _get_disagg_result(rng, ensemble, site_info)
+    eps_bins = [(-np.inf, 0.0), (0.0, np.inf)]
+    result = disagg.DisaggGridData(
+        disagg_result,
+        rng.uniform(size=(4, 3)),
+        rng.uniform(size=(4, 3)),
+        eps_bins,
+        [rng.uniform(size=(4, 3)) for _ in eps_bins],
+        np.linspace(5, 9, 5),
+        np.linspace(0, 300, 4),
+        5.0,
+        4,
+        1.0,
+        0.0,
+        3,
+        100.0,
+    )
+
+    ffp = result.save_binary(tmp_path, save_disagg_data=True, compression="lzf")
+    loaded = disagg.DisaggGridData.load_binary(ffp, ensemble=ensemble)
+
+    _check_disagg_result(loaded.disagg_data, disagg_result)
+    assert loaded.eps_bins == eps_bins
+    for cur_key in ["flt_bin_contr", "ds_bin_contr", "mag_edges", "rrup_edges"]:
+        assert np.array_equal(getattr(loaded, cur_key), getattr(result, cur_key))
+    assert np.array_equal(
+        np.stack(loaded.eps_bin_contr), np.stack(result.eps_bin_contr)
+    )
+    for cur_key in ["mag_min", "mag_n_bins", "mag_bin_size", "rrup_min", "rrup_n_bins"]:
+        assert getattr(loaded, cur_key) == getattr(result, cur_key)
+
+
+@pytest.mark.parametrize("with_branches", [True, False])
+def test_uhs_result(tmp_path, rng, ensemble, site_info, with_branches):
+    periods = np.asarray([0.1, 0.5, 1.0, 3.0])
+    branch_uhs = (
+        [
+            uhs.BranchUHSResult(
+                ensemble.im_ensemble.branches_dict[cur_name],
+                site_info,
+                1 / 500,
+                periods,
+                rng.uniform(size=periods.size),
+            )
+            for cur_name in BRANCH_NAMES
+        ]
+        if with_branches
+        else None
+    )
+    result = uhs.EnsembleUHSResult(
+        ensemble,
+        branch_uhs,
+        site_info,
+        1 / 500,
+        periods,
+        rng.uniform(size=periods.size),
+        percentiles=pd.DataFrame(
+            rng.uniform(size=(periods.size, 2)), index=periods, columns=["16th", "84th"]
+        ),
+    )
+
+    ffp = result.save_binary(tmp_path)
+    loaded = uhs.EnsembleUHSResult.load_binary(ffp, ensemble=ensemble)
+
+    assert loaded.exceedance == result.exceedance
+    assert np.array_equal(loaded.period_values, periods)
+    assert np.array_equal(loaded.sa_values, result.sa_values)
+    _check_df(loaded.percentiles, result.percentiles)
+    if with_branches:
+        assert [cur_uhs.branch.name for cur_uhs in loaded.branch_uhs] == BRANCH_NAMES
+        for cur_loaded, cur_expected in zip(loaded.branch_uhs, branch_uhs):
+            assert np.array_equal(cur_loaded.sa_values, cur_expected.sa_values)
+    else:
+        assert loaded.branch_uhs is None
+
+
+def _get_cdf(rng):
+    x = np.linspace(-5, 1, 50)
+    return pd.Series(np.sort(rng.uniform(size=x.size)), index=x)
+
+
+@pytest.mark.parametrize("gms_type", list(const.GMSType))
+def test_gms_result(tmp_path, rng, ensemble, site_info, monkeypatch, gms_type):
+    gm_dataset = SimpleNamespace(name="test_gm_dataset")
+    monkeypatch.setitem(gms.GMDataset._gm_datasets, gm_dataset.name, gm_dataset)
+
+    IMj, im_j = IM.from_str("PGA"), 0.3
+    IMs = np.asarray([IM.from_str("pSA_0.5"), IM.from_str("pSA_1.0")])
+    gm_ids = [f"gm_{ix}" for ix in range(4)]
+
+    if gms_type is const.GMSType.empirical:
+        IMi_gcims = {
+            IMi: GCIMResult.IMEnsembleUniGCIM(
+                ensemble.im_ensemble,
+                IMi,
+                IMj,
+                im_j,
+                sha_calc.Uni_lnIMi_IMj(_get_cdf(rng), IMi, IMj, im_j),
+                {
+                    cur_name: GCIMResult.BranchUniGCIM(
+                        IMi,
+                        IMj,
+                        im_j,
+                        cur_branch,
+                        sha_calc.Uni_lnIMi_IMj_Rup(
+                            pd.Series(
+                                rng.normal(size=RUPTURE_IDS.size), index=RUPTURE_IDS
+                            ),
+                            pd.Series(
+                                rng.uniform(size=RUPTURE_IDS.size), index=RUPTURE_IDS
+                            ),
+                            IMi,
+                            IMj,
+                            im_j,
+                        ),
+                        sha_calc.Uni_lnIMi_IMj(_get_cdf(rng), IMi, IMj, im_j),
+                    )
+                    for cur_name, cur_branch in ensemble.im_ensemble.branches_dict.items()
+                },
+                neglected_rupture_contribution=0.01,
+            )
+            for IMi in IMs
+        }
+    else:
+        IMi_gcims = {
+            IMi: GCIMResult.SimUniGCIM(
+                ensemble,
+                IMi,
+                IMj,
+                im_j,
+                sha_calc.Uni_lnIMi_IMj(_get_cdf(rng), IMi, IMj, im_j),
+            )
+            for IMi in IMs
+        }
+
+    im_columns = [str(IMj)] + [str(IMi) for IMi in IMs]
+    cs_param_bounds = gms.CausalParamBounds(
+        ensemble,
+        site_info,
+        IMj,
+        (5.5, 7.5),
+        (0.0, 100.0),
+        (200.0, 600.0),
+        (0.5, 2.0),
+        contr_df=pd.DataFrame(
+            {"contribution": rng.uniform(size=3), "magnitude": [6.0, 6.5, 7.0]},
+            index=RUPTURE_IDS[:3],
+        ),
+        exceedance=1 / 500,
+        im_value=im_j,
+    )
+    result = gms.GMSResult(
+        ensemble,
+        site_info,
+        IMj,
+        im_j,
+        IMs,
+        pd.DataFrame(rng.uniform(size=(4, 3)), index=gm_ids, columns=im_columns),
+        IMi_gcims,
+        pd.DataFrame(rng.uniform(size=(4, 3)), columns=im_columns),
+        gm_dataset,
+        gms_type,
+        exceedance=1 / 500,
+        cs_param_bounds=cs_param_bounds,
+        sf=pd.DataFrame({"sf": rng.uniform(size=4)}, index=gm_ids),
+        metadata=(
+            pd.DataFrame({"mag": rng.uniform(5, 8, size=4)}, index=gm_ids),
+            {"selected_gms_agg": {"mag_mean": 6.5, "mag_error_bounds": [6.0, 7.0]}},
+            pd.DataFrame(rng.uniform(size=(3, 3)), index=["16th", "50th", "84th"]),
+            pd.DataFrame(rng.uniform(size=(3, 2)), columns=[str(IMi) for IMi in IMs]),
+        ),
+        rupture_contribution_threshold=0.99,
+        neglected_rupture_contribution=0.01,
+    )
+
+    ffp = result.save_binary(tmp_path, "test_gms")
+    loaded = gms.GMSResult.load_binary(ffp, ensemble=ensemble)
+
+    assert loaded.gm_dataset is gm_dataset
+    assert loaded.gms_type is gms_type
+    assert loaded.IM_j == IMj and loaded.im_j == im_j
+    assert list(loaded.IMs) == list(IMs)
+    assert loaded.exceedance == result.exceedance
+    assert loaded.rupture_contribution_threshold == 0.99
+    assert loaded.neglected_rupture_contribution == 0.01
+    assert loaded.metadata_dict == result.metadata_dict
+    _check_df(loaded.selected_gms_im_df, result.selected_gms_im_df)
+    _check_df(loaded.realisations, result.realisations)
+    _check_df(loaded.sf, result.sf)
+    _check_df(loaded.selected_gms_metdata_df, result.selected_gms_metdata_df)
+
+    assert loaded.cs_param_bounds.mw_low == 5.5
+    assert loaded.cs_param_bounds.sf_high == 2.0
+    _check_df(loaded.cs_param_bounds.contr_df, cs_param_bounds.contr_df)
+
+    for IMi in IMs:
+        cur_loaded, cur_expected = loaded.IMi_gcims[IMi], IMi_gcims[IMi]
+        assert cur_loaded.IMi == IMi and cur_loaded.IMj == IMj
+        _check_series(cur_loaded.lnIMi_IMj.cdf, cur_expected.lnIMi_IMj.cdf)
+
+        if gms_type is const.GMSType.empirical:
+            assert cur_loaded.neglected_rupture_contribution == 0.01
+            assert isinstance(cur_loaded._branch_uni_gcims, result_io.LazyMember)
+            for cur_name in BRANCH_NAMES:
+                cur_loaded_branch = cur_loaded.branch_uni_gcims[cur_name]
+                cur_expected_branch = cur_expected.branch_uni_gcims[cur_name]
+                _check_series(
+                    cur_loaded_branch.lnIMi_IMj_Rup.mu,
+                    cur_expected_branch.lnIMi_IMj_Rup.mu,
+                )
+                _check_series(
+                    cur_loaded_branch.lnIMi_IMj_Rup.sigma,
+                    cur_expected_branch.lnIMi_IMj_Rup.sigma,
+                )
+                _check_series(
+                    cur_loaded_branch.lnIMi_IMj.cdf, cur_expected_branch.lnIMi_IMj.cdf
+                )
+
+
+def test_nzs1170p5_result(tmp_path, rng, ensemble, site_info):
+    rps = np.asarray([25, 100, 500, 2500])
+    result = nz_code.nzs1170p5.NZS1170p5Result(
+        ensemble,
+        site_info,
+        IM.from_str("pSA_1.0"),
+        1.0,
+        pd.Series(rng.uniform(size=rps.size), index=1 / rps),
+        pd.Series(rng.uniform(size=rps.size), index=1 / rps),
+        const.NZSSoilClass.intermediate_soil,
+        0.3,
+        pd.Series(rng.uniform(size=rps.size), index=1 / rps),
+        20.0,
+        pd.Series(rng.uniform(size=rps.size), index=1 / rps),
+    )
+
+    ffp = result.save_binary(tmp_path, "test")
+    loaded = nz_code.nzs1170p5.NZS1170p5Result.load_binary(ffp, ensemble=ensemble)
+
+    assert loaded.im == result.im
+    assert loaded.soil_class is result.soil_class
+    assert (loaded.sa_period, loaded.Z, loaded.D) == (1.0, 0.3, 20.0)
+    for cur_key in ["im_values", "Ch", "R", "N"]:
+        _check_series(getattr(loaded, cur_key), getattr(result, cur_key))
+
+
+def test_nzta_result(tmp_path, rng, ensemble, site_info):
+    rps = np.asarray([25, 100, 500, 2500])
+    result = nz_code.nzta_2018.NZTAResult(
+        ensemble,
+        site_info,
+        const.NZTASoilClass.rock,
+        pd.Series(rng.uniform(size=rps.size), index=1 / rps),
+        6.5,
+        0.35,
+        "Christchurch",
+    )
+
+    ffp = result.save_binary(tmp_path)
+    loaded = nz_code.nzta_2018.NZTAResult.load_binary(ffp, ensemble=ensemble)
+
+    assert loaded.soil_class is result.soil_class
+    assert (loaded.M_eff, loaded.C0_1000, loaded.nearest_town) == (
+        6.5,
+        0.35,
+        "Christchurch",
+    )
+    _check_series(loaded.pga_values, result.pga_values)
+
+
+def test_ensemble_manifest(tmp_path, rng):
+    rupture_df = pd.DataFrame(
+        {
+            "rupture_name": RUPTURE_IDS,
+            "magnitude": rng.uniform(5, 8, RUPTURE_IDS.size).astype(np.float32),
+            "tectonic_type": pd.Categorical(
+                ["ACTIVE_SHALLOW", "SUBDUCTION_SLAB"] * (RUPTURE_IDS.size // 2)
+            ),
+        },
+        index=pd.Index(RUPTURE_IDS, name="rupture_id"),
+    )
+    manifest = gm_data.EnsembleManifest(
+        {
+            "test_imdb.db": gm_data.IMDBMetadata(
+                np.asarray(["station_a", "station_b"]),
+                np.asarray(["PGA", "pSA_1.0"]),
+                const.SourceType.fault,
+                const.IMDataType.parametric,
+            )
+        },
+        {"test_erf.txt": rupture_df},
+    )
+
+    ffp = tmp_path / f"manifest{result_io.BINARY_SUFFIX}"
+    manifest.save_binary(ffp)
+    loaded = gm_data.EnsembleManifest.load_binary(ffp)
+
+    cur_metadata = loaded.imdb_metadata["test_imdb.db"]
+    assert list(cur_metadata.stations) == ["station_a", "station_b"]
+    assert list(cur_metadata.ims) == ["PGA", "pSA_1.0"]
+    assert cur_metadata.source_type is const.SourceType.fault
+    assert cur_metadata.imdb_type is const.IMDataType.parametric
+    _check_df(loaded.erf_rupture_dfs["test_erf.txt"], rupture_df)
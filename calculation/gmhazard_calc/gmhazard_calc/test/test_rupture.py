@@ -0,0 +1,106 @@
+"""Compact rupture dataframe tests, these use small synthetic rupture dataframes"""
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import rupture
+from gmhazard_calc import utils
+from gmhazard_calc import constants as const
+
+DS_LOCATIONS = [(-43.5, 172.5, 5.0), (-41.3, 174.8, 10.0), (-45.9, 170.5, 5.0)]
+DS_MAGNITUDES = [5.0, 5.5, 6.0]
+
+
+def _get_ds_rupture_df() -> pd.DataFrame:
+    rupture_names = [
+        utils.create_ds_rupture_name(*cur_location, cur_mag, "ACTIVE_SHALLOW")
+        for cur_location in DS_LOCATIONS
+        for cur_mag in DS_MAGNITUDES
+    ]
+    return pd.DataFrame(
+        {
+            "rupture_name": rupture_names,
+            "annual_rec_prob": np.linspace(1e-4, 1e-3, len(rupture_names)),
+            "magnitude": np.tile(DS_MAGNITUDES, len(DS_LOCATIONS)),
+        },
+        index=np.arange(len(rupture_names)) + 2,
+    )
+
+
+def _get_flt_rupture_df() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "rupture_name": ["FaultB", "FaultA"],
+            "annual_rec_prob": [1e-3, 1e-4],
+            "magnitude": [7.1, 6.3],
+            "tectonic_type": ["ACTIVE_SHALLOW", "SUBDUCTION_INTERFACE"],
+        },
+        index=[0, 1],
+    )
+
+
+def _check_categorical(rupture_df: pd.DataFrame, columns: list):
+    for cur_column in columns:
+        assert isinstance(rupture_df[cur_column].dtype, pd.CategoricalDtype)
+    assert not any(
+        cur_dtype == object for cur_dtype in rupture_df.dtypes.values
+    ), "Object columns are not compact"
+
+
+def test_to_compact_rupture_df_ds():
+    rupture_df = _get_ds_rupture_df()
+    rupture_names = rupture_df["rupture_name"].values.copy()
+
+    compact_df = rupture.to_compact_rupture_df(
+        rupture_df.copy(), const.SourceType.distributed
+    )
+    _check_categorical(compact_df, ["rupture_name", "location", "rupture_type"])
+    assert np.array_equal(compact_df["rupture_name"].astype(str).values, rupture_names)
+    assert compact_df["magnitude"].dtype == np.float32
+
+    # One location code per point source
+    assert compact_df["location"].cat.categories.size == len(DS_LOCATIONS)
+    assert np.array_equal(
+        compact_df["location"].astype(str).values,
+        np.repeat(
+            [utils.create_ds_fault_name(*cur_loc) for cur_loc in DS_LOCATIONS],
+            len(DS_MAGNITUDES),
+        ),
+    )
+
+
+def test_to_compact_rupture_df_flt():
+    compact_df = rupture.to_compact_rupture_df(
+        _get_flt_rupture_df(), const.SourceType.fault
+    )
+    _check_categorical(compact_df, ["rupture_name", "rupture_type", "tectonic_type"])
+    assert "location" not in compact_df.columns
+    assert compact_df["rupture_name"].astype(str).tolist() == ["FaultB", "FaultA"]
+
+
+def test_concat_compact_rupture_dfs():
+    flt_df = rupture.to_compact_rupture_df(
+        _get_flt_rupture_df(), const.SourceType.fault
+    )
+    ds_df = rupture.to_compact_rupture_df(
+        _get_ds_rupture_df(), const.SourceType.distributed
+    )
+
+    rupture_df = rupture.concat_compact_rupture_dfs([flt_df, ds_df])
+    _check_categorical(
+        rupture_df, ["rupture_name", "rupture_type", "tectonic_type", "location"]
+    )
+    assert list(rupture_df.columns) == sorted(rupture_df.columns)
+    assert np.array_equal(rupture_df.index.values, np.arange(rupture_df.shape[0]))
+
+    # The values are unchanged
+    for cur_df in [flt_df, ds_df]:
+        cur_concat_df = rupture_df.loc[cur_df.index, cur_df.columns]
+        for cur_column in cur_df.columns:
+            assert np.array_equal(
+                cur_concat_df[cur_column].astype(str).values,
+                cur_df[cur_column].astype(str).values,
+            )
+
+    # Missing columns are nan
+    assert rupture_df.loc[flt_df.index, "location"].isna().all()
+    assert rupture_df.loc[ds_df.index, "tectonic_type"].isna().all()
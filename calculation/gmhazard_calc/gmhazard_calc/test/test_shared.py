@@ -0,0 +1,181 @@
+"""Branch evaluation tests, these use small synthetic IMDBs and stand-in branches"""
+import functools
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+from gmhazard_calc import shared
+from gmhazard_calc import constants as const
+from gmhazard_calc.im import IMType
+
+ENSEMBLE_NAME = "test_ensemble"
+STATIONS = ["station_a", "station_b", "station_c"]
+IMS = ["PGA", "pSA_1.0"]
+N_RUPTURES = 10
+N_BRANCHES = 6
+
+
+def _write_imdb(imdb_ffp: str, rng: np.random.Generator) -> str:
+    imdb = dbs.IMDBParametric(
+        imdb_ffp, writeable=True, source_type=const.SourceType.fault
+    )
+    with imdb:
+        imdb.write_sites(
+            pd.DataFrame(
+                {"lon": np.linspace(172, 173, len(STATIONS)), "lat": -43.5},
+                index=STATIONS,
+            )
+        )
+        imdb.write_rupture_data(
+            pd.DataFrame(
+                {
+                    "rupture_name": pd.Categorical(
+                        [f"rupture_{ix}" for ix in range(N_RUPTURES)]
+                    )
+                }
+            )
+        )
+        imdb.write_attributes(ims=np.asarray(IMS, dtype=str))
+        for cur_station in STATIONS:
+            imdb.write_im_data(
+                cur_station,
+                pd.DataFrame(
+                    rng.uniform(size=(N_RUPTURES, len(IMS))),
+                    index=np.arange(N_RUPTURES),
+                    columns=IMS,
+                ),
+            )
+    return imdb.db_ffp
+
+
+def _branch_fn(branch: SimpleNamespace, imdbs: list = None) -> pd.Series:
+    """Weighted sum of the IM data of the branch IMDBs"""
+    result = []
+    for cur_ffp in branch.imdb_ffps:
+        with dbs.IMDB.get_imdb(cur_ffp) as imdb:
+            if imdbs is not None:
+                imdbs.append((threading.get_ident(), cur_ffp, imdb))
+            result.append(
+                pd.concat(
+                    [imdb.im_data(cur_station) for cur_station in STATIONS], axis=1
+                ).sum(axis=1)
+            )
+    return branch.weight * pd.concat(result, axis=1).sum(axis=1)
+
+
+def _run_worker_branch(branch_name: str) -> pd.Series:
+    return _branch_fn(shared.get_worker_branch(ENSEMBLE_NAME, IMType.PGA, branch_name))
+
+
+@pytest.fixture
+def ensemble(tmp_path):
+    """Stand-in ensemble, where the branches share some of the IMDBs"""
+    rng = np.random.default_rng(0)
+    imdb_ffps = [_write_imdb(str(tmp_path / f"imdb_{ix}.db"), rng) for ix in range(4)]
+
+    branches = {
+        f"branch_{ix}": SimpleNamespace(
+            name=f"branch_{ix}",
+            weight=rng.uniform(),
+            imdb_ffps=[imdb_ffps[ix % 2], imdb_ffps[2 + ix % 3 // 2]],
+            stations=None,
+            ims=None,
+            flt_im_data_type=None,
+            ds_im_data_type=None,
+            flt_rupture_df=None,
+            ds_rupture_df=None,
+        )
+        for ix in range(N_BRANCHES)
+    }
+    im_ensemble = SimpleNamespace(branches_dict=branches)
+    return SimpleNamespace(
+        name=ENSEMBLE_NAME, get_im_ensemble=lambda im_type: im_ensemble
+    )
+
+
+def _check_results(results: dict, expected_results: dict):
+    assert list(results.keys()) == list(expected_results.keys())
+    for cur_name, cur_result in expected_results.items():
+        pd.testing.assert_series_equal(results[cur_name], cur_result)
+
+
+def test_map_branches(ensemble):
+    """The results are the same for serial, threaded and process evaluation"""
+    im_ensemble = ensemble.get_im_ensemble(IMType.PGA)
+    results = shared.map_branches(im_ensemble, _branch_fn)
+    assert list(results.keys()) == [f"branch_{ix}" for ix in range(N_BRANCHES)]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        _check_results(
+            shared.map_branches(im_ensemble, _branch_fn, executor=executor), results
+        )
+
+    for use_threads in [True, False]:
+        with shared.create_branch_executor(
+            ensemble, 3, use_threads=use_threads
+        ) as executor:
+            _check_results(
+                shared.map_branches(
+                    im_ensemble,
+                    _branch_fn,
+                    executor=executor,
+                    worker_fn=_run_worker_branch,
+                    from_worker_fn=lambda branch, result: result,
+                ),
+                results,
+            )
+
+
+def test_map_branches_shared_handles(ensemble):
+    """The IMDBs are shared between the threads evaluating the branches"""
+    im_ensemble = ensemble.get_im_ensemble(IMType.PGA)
+    imdbs = []
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        shared.map_branches(
+            im_ensemble, functools.partial(_branch_fn, imdbs=imdbs), executor=executor
+        )
+
+    imdb_ffps = {cur_ffp for _, cur_ffp, _ in imdbs}
+    assert len({id(cur_imdb) for _, _, cur_imdb in imdbs}) == len(imdb_ffps)
+    assert all(not cur_imdb.is_open for _, _, cur_imdb in imdbs)
+
+
+def test_shared_handles_scope(ensemble):
+    """Shared handles are only used by the threads they are registered for"""
+    imdb_ffp = (
+        ensemble.get_im_ensemble(IMType.PGA).branches_dict["branch_0"].imdb_ffps[0]
+    )
+
+    with dbs.IMDB.shared_handles() as imdb_handles:
+        with dbs.IMDB.get_imdb(imdb_ffp) as imdb_1, dbs.IMDB.get_imdb(
+            imdb_ffp
+        ) as imdb_2:
+            assert imdb_1 is not imdb_2
+
+        with imdb_handles.register():
+            with dbs.IMDB.get_imdb(imdb_ffp) as imdb_1:
+                pass
+            with dbs.IMDB.get_imdb(imdb_ffp) as imdb_2:
+                assert imdb_2 is imdb_1 and imdb_2.is_open
+
+            # Other threads are not affected
+            other_imdbs = []
+
+            def get_imdb():
+                with dbs.IMDB.get_imdb(imdb_ffp) as imdb:
+                    other_imdbs.append(imdb)
+
+            thread = threading.Thread(target=get_imdb)
+            thread.start()
+            thread.join()
+            assert other_imdbs[0] is not imdb_1
+
+        with dbs.IMDB.get_imdb(imdb_ffp) as imdb_4:
+            assert imdb_4 is not imdb_1
+
+    assert not imdb_1.is_open
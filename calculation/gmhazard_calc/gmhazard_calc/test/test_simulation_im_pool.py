@@ -0,0 +1,216 @@
+"""Simulation IM pool tests, these use small synthetic non-parametric IMDBs"""
+import os
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+from gmhazard_calc import gms
+from gmhazard_calc import site
+from gmhazard_calc import constants as const
+
+DATASET_ID = "test_simulations"
+STATIONS = ["station_a", "station_b"]
+IMS = ["PGA", "PGV", "pSA_1.0"]
+FAULTS = ["FaultA", "FaultB", "FaultC"]
+N_REL = 4
+
+
+def _write_imdb(
+    imdb_ffp: str, simulations: np.ndarray, rng: np.random.Generator
+) -> dbs.IMDBNonParametric:
+    """Writes a non-parametric IMDB, with data for a random
+    subset of the simulations at each station"""
+    imdb = dbs.IMDBNonParametric(
+        imdb_ffp, writeable=True, source_type=const.SourceType.fault
+    )
+    with imdb:
+        imdb.write_sites(
+            pd.DataFrame({"lon": [172.5, 172.6], "lat": -43.5}, index=STATIONS)
+        )
+        imdb.write_simulations(pd.Series(simulations))
+        imdb.write_attributes(ims=np.asarray(IMS, dtype=str))
+
+        for cur_station in STATIONS:
+            cur_sim_ind = np.sort(
+                rng.choice(simulations.size, simulations.size - 2, replace=False)
+            )
+            imdb.write_im_data(
+                cur_station,
+                pd.DataFrame(
+                    np.exp(rng.normal(-2.0, 1.0, size=(cur_sim_ind.size, len(IMS)))),
+                    index=cur_sim_ind,
+                    columns=IMS,
+                ),
+            )
+    return imdb
+
+
+@pytest.fixture
+def imdb_ffps(tmp_path):
+    """Two IMDBs with mutually exclusive simulations"""
+    rng = np.random.default_rng(0)
+    simulations = np.asarray(
+        [
+            f"{cur_fault}_REL{rel_ix:02d}"
+            for cur_fault in FAULTS
+            for rel_ix in range(1, N_REL + 1)
+        ]
+    )
+    return [
+        _write_imdb(str(tmp_path / "imdb_1.db"), simulations[:6], rng).db_ffp,
+        _write_imdb(str(tmp_path / "imdb_2.db"), simulations[6:], rng).db_ffp,
+    ]
+
+
+@pytest.fixture(autouse=True)
+def clear_pools():
+    dbs.clear_simulation_im_pools()
+    yield
+    dbs.clear_simulation_im_pools()
+
+
+def _get_im_data(imdb_ffps: list, station_name: str) -> pd.DataFrame:
+    """Reads the IM data of the station from all IMDBs"""
+    im_dfs = []
+    for cur_ffp in imdb_ffps:
+        with dbs.IMDBNonParametric(cur_ffp) as imdb:
+            im_dfs.append(imdb.im_data(station_name))
+    return pd.concat(im_dfs).sort_index()
+
+
+@pytest.mark.parametrize("station_name", STATIONS)
+def test_get_im_df(imdb_ffps, station_name):
+    im_pool = dbs.get_simulation_im_pool(imdb_ffps, station_name)
+    expected_df = _get_im_data(imdb_ffps, station_name)
+
+    pd.testing.assert_frame_equal(
+        im_pool.get_im_df(), expected_df, check_column_type=False
+    )
+    pd.testing.assert_frame_equal(
+        im_pool.get_im_df(["pSA_1.0", "PGA"], log=True),
+        np.log(expected_df[["pSA_1.0", "PGA"]]),
+    )
+    pd.testing.assert_series_equal(
+        im_pool.get_im_df("PGV", fault_index=False),
+        expected_df["PGV"].droplevel("fault"),
+    )
+    assert np.array_equal(
+        im_pool.simulation_faults, expected_df.index.get_level_values("fault")
+    )
+
+    with pytest.raises(KeyError):
+        im_pool.get_im_df(["PGA", "CAV"])
+
+
+def test_memoisation(imdb_ffps):
+    im_pool = dbs.get_simulation_im_pool(imdb_ffps, STATIONS[0])
+    assert dbs.get_simulation_im_pool(imdb_ffps, STATIONS[0]) is im_pool
+    assert dbs.get_simulation_im_pool(imdb_ffps[:1], STATIONS[0]) is not im_pool
+    assert dbs.get_simulation_im_pool(imdb_ffps, "unknown") is None
+
+    # Changed IMDBs are reloaded
+    with dbs.IMDBNonParametric(imdb_ffps[1], writeable=True) as imdb:
+        im_df = imdb.im_data(STATIONS[0]).reset_index(drop=True)
+        im_df.index = imdb._read_im_index(STATIONS[0])
+        imdb.write_im_data(STATIONS[0], im_df * 2.0)
+    stat = os.stat(imdb_ffps[1])
+    os.utime(imdb_ffps[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    new_im_pool = dbs.get_simulation_im_pool(imdb_ffps, STATIONS[0])
+    assert new_im_pool is not im_pool
+    pd.testing.assert_frame_equal(
+        new_im_pool.get_im_df(),
+        _get_im_data(imdb_ffps, STATIONS[0]),
+        check_column_type=False,
+    )
+
+
+@pytest.fixture
+def gm_dataset(imdb_ffps, tmp_path, monkeypatch):
+    """Simulation GM dataset, with the metadata of the simulations"""
+    rng = np.random.default_rng(1)
+    simulations = np.concatenate(
+        [
+            _get_im_data([cur_ffp], cur_station).index.get_level_values(1)
+            for cur_ffp in imdb_ffps
+            for cur_station in STATIONS
+        ]
+    )
+    source_metadata_df = pd.DataFrame(
+        {"fault": [cur_sim.split("_")[0] for cur_sim in simulations]},
+        index=pd.Index(simulations, name="realisation"),
+    )
+    source_metadata_df = source_metadata_df.loc[~source_metadata_df.index.duplicated()]
+    source_metadata_df["mag"] = rng.uniform(5.5, 8.0, source_metadata_df.shape[0])
+    source_metadata_df.to_csv(tmp_path / "source_metadata.csv")
+
+    with open(tmp_path / "vs30.ll", "w") as f:
+        f.writelines(f"{cur_station} 400.0\n" for cur_station in STATIONS)
+
+    ssdb = dbs.SiteSourceDB(
+        str(tmp_path / "site_source.db"),
+        source_type=const.SourceType.fault,
+        writeable=True,
+    )
+    with ssdb:
+        ssdb.write_fault_data(pd.DataFrame({"fault_name": FAULTS}))
+        for cur_station in STATIONS:
+            ssdb.write_site_distances_data(
+                cur_station,
+                pd.DataFrame(
+                    {
+                        "fault_id": np.arange(len(FAULTS)),
+                        **{
+                            cur_col: rng.uniform(0.0, 100.0, len(FAULTS))
+                            for cur_col in ["rjb", "rrup", "rx", "ry", "rtvz"]
+                        },
+                    }
+                ),
+            )
+
+    monkeypatch.setitem(
+        gms.GMDataset.gms_sources,
+        DATASET_ID,
+        {
+            "type": "simulations",
+            "simulations_imdbs": imdb_ffps,
+            "simulations_dirs": [str(tmp_path)],
+            "source_metadata_ffp": str(tmp_path / "source_metadata.csv"),
+            "vs30_params_csv_ffp": str(tmp_path / "vs30.ll"),
+            "site_source_db_ffp": str(tmp_path / "site_source.db"),
+        },
+    )
+    monkeypatch.setattr(gms.GMDataset, "_gm_datasets", {})
+    return gms.GMDataset.get_GMDataset(DATASET_ID)
+
+
+@pytest.mark.parametrize("station_name", STATIONS)
+def test_simulation_gm_dataset(gm_dataset, station_name):
+    site_info = site.SiteInfo(station_name, -43.5, 172.5, 400.0)
+    expected_df = _get_im_data(gm_dataset.imdb_ffps, station_name).droplevel("fault")
+
+    assert sorted(str(cur_im) for cur_im in gm_dataset.ims) == sorted(IMS)
+    assert sorted(str(cur_im) for cur_im in gm_dataset.ims) == sorted(IMS)
+
+    pd.testing.assert_frame_equal(
+        gm_dataset.get_lnIM_df(site_info, IMS), np.log(expected_df[IMS])
+    )
+    pd.testing.assert_frame_equal(
+        gm_dataset.get_im_df(site_info, IMS), expected_df[IMS]
+    )
+
+    metadata_df = gm_dataset.get_metadata_df(site_info)
+    assert np.array_equal(np.sort(metadata_df.index.values), expected_df.index.values)
+    assert np.array_equal(
+        metadata_df["fault"].values,
+        [cur_sim.split("_")[0] for cur_sim in metadata_df.index.values],
+    )
+    assert np.all(metadata_df["vs30"] == 400.0)
+
+    selected_gms = expected_df.index.values[:3]
+    pd.testing.assert_frame_equal(
+        gm_dataset.get_metadata_df(site_info, selected_gms),
+        metadata_df.loc[selected_gms, ["mag", "rrup", "vs30"]],
+    )
@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from typing import Dict, List, Sequence
+from typing import Dict, List, Sequence, Union
 
 import numpy as np
 import pandas as pd
@@ -8,6 +8,7 @@ import pandas as pd
 from gmhazard_calc.im import IMType
 from gmhazard_calc import gm_data
 from gmhazard_calc import site
+from gmhazard_calc import result_io
 
 
 class BaseUHSResult:
@@ -80,6 +81,30 @@ class BaseUHSResult:
         np.save(str(data_dir / self.PERIOD_VALUES_FN), self.period_values)
         np.save(str(data_dir / self.SA_VALUES_FN), self.sa_values)
 
+    def _write_binary(self, writer: result_io.ResultWriter, metadata: Dict = None):
+        """Writes the UHSResult data to the binary result writer"""
+        metadata = metadata if metadata is not None else {}
+        writer.set_metadata(
+            {
+                **{"exceedance": self.exceedance, "site": self.site_info.to_dict()},
+                **metadata,
+            }
+        )
+        writer.write("period_values", self.period_values)
+        writer.write("sa_values", self.sa_values)
+
+    @staticmethod
+    def _read_binary_data(reader: result_io.ResultReader):
+        """Reads the generic UHSResult data from the binary result reader"""
+        metadata = reader.metadata
+
+        return (
+            metadata,
+            site.SiteInfo.from_dict(metadata["site"]),
+            reader.read("period_values"),
+            reader.read("sa_values"),
+        )
+
     @classmethod
     def _load_data(cls, data_dir: Path):
         """Loads the generic UHSResult data from the specified directory,
@@ -135,6 +160,18 @@ class BranchUHSResult(BaseUHSResult):
             sa_values,
         )
 
+    @classmethod
+    def _read_binary(cls, reader: result_io.ResultReader, ensemble: gm_data.Ensemble):
+        metadata, site_info, period_values, sa_values = cls._read_binary_data(reader)
+
+        return cls(
+            ensemble.get_im_ensemble(IMType.pSA).branches_dict[metadata["branch_name"]],
+            site_info,
+            metadata["exceedance"],
+            period_values,
+            sa_values,
+        )
+
     @staticmethod
     def combine_results(uhs_results: Sequence["BranchUHSResult"]):
         """
@@ -174,7 +211,7 @@ class EnsembleUHSResult(BaseUHSResult):
     def __init__(
         self,
         ensemble: gm_data.Ensemble,
-        branch_uhs: List[BranchUHSResult],
+        branch_uhs: Union[List[BranchUHSResult], result_io.LazyMember],
         site_info: site.SiteInfo,
         exceedance: float,
         period_values: np.ndarray,
@@ -183,9 +220,18 @@ class EnsembleUHSResult(BaseUHSResult):
     ):
         super().__init__(site_info, exceedance, period_values, sa_values)
         self.ensemble = ensemble
-        self.branch_uhs = branch_uhs
+        self._branch_uhs = branch_uhs
         self.percentiles = percentiles
 
+    @property
+    def branch_uhs(self) -> List[BranchUHSResult]:
+        # Branch results are only loaded on first access
+        # when loaded from a binary result file
+        if isinstance(self._branch_uhs, result_io.LazyMember):
+            self._branch_uhs = self._branch_uhs.load()
+
+        return self._branch_uhs
+
     def to_dict(self):
         """Returns the EnsembleUHSResult to a dictonary ready to jsonify
         does not include branches, adds percentiles"""
@@ -229,6 +275,75 @@ class EnsembleUHSResult(BaseUHSResult):
 
         return data_dir
 
+    def save_binary(self, base_dir: Path, compression: str = None) -> Path:
+        """Saves the EnsembleUHSResult (including the branches)
+        as single binary file in the specified base directory
+
+        Parameters
+        ----------
+        base_dir: Path
+        compression: str, optional
+            The compression to use, e.g. gzip or lzf, see result_io
+
+        Returns
+        -------
+        Path
+            The file path of the saved result
+        """
+        ffp = result_io.get_binary_ffp(base_dir, f"uhs_{int(1 / self.exceedance)}")
+        with result_io.ResultWriter.create(
+            ffp, self.__class__.__name__, compression=compression
+        ) as writer:
+            self._write_binary(
+                writer, {"ensemble_params": self.ensemble.get_save_params()}
+            )
+            writer.write("percentiles", self.percentiles)
+
+            if self.branch_uhs is not None:
+                branch_writer = writer.group("branch_uhs")
+                for cur_branch_uhs in self.branch_uhs:
+                    cur_branch_uhs._write_binary(
+                        branch_writer.group(cur_branch_uhs.branch.name),
+                        metadata={"branch_name": cur_branch_uhs.branch.name},
+                    )
+
+        return ffp
+
+    @classmethod
+    def load_binary(cls, ffp: Path, ensemble: gm_data.Ensemble = None):
+        """Loads an EnsembleUHSResult from a binary result file,
+        the branch results are only loaded when first accessed"""
+        with result_io.ResultReader.open(ffp, cls.__name__) as reader:
+            metadata, site_info, period_values, sa_values = cls._read_binary_data(
+                reader
+            )
+            if ensemble is None:
+                ensemble = gm_data.Ensemble.load(metadata["ensemble_params"])
+
+            branch_uhs = (
+                reader.lazy(
+                    "branch_uhs",
+                    lambda branch_reader: [
+                        BranchUHSResult._read_binary(
+                            branch_reader.group(cur_name), ensemble
+                        )
+                        for cur_name in branch_reader.group_keys()
+                    ],
+                )
+                if "branch_uhs" in reader
+                else None
+            )
+
+            return cls(
+                ensemble,
+                branch_uhs,
+                site_info,
+                metadata["exceedance"],
+                period_values,
+                sa_values,
+                percentiles=reader.read("percentiles"),
+            )
+
     @classmethod
     def load(cls, data_dir: Path, ensemble=None):
         """Loads a EnsembleUHSResult from a specified directory
@@ -216,19 +216,15 @@ def run_nzs1170p5_uhs(
 
     pSA_periods = DEFAULT_PSA_PERIODS if pSA_periods is None else pSA_periods
 
-    results = []
-    for cur_period in pSA_periods:
-        im = (
-            IM(IMType.pSA, period=cur_period, component=im_component)
-            if cur_period > 0
-            else IM(IMType.PGA, component=im_component)
-        )
-
-        results.append(
-            nzs1170p5.run_ensemble_nzs1170p5(
-                ensemble, site_info, im, exceedance_values, **opt_nzs1170p5_args
-            )
-        )
+    ims = [
+        IM(IMType.pSA, period=cur_period, component=im_component)
+        if cur_period > 0
+        else IM(IMType.PGA, component=im_component)
+        for cur_period in pSA_periods
+    ]
+    results = nzs1170p5.run_ensemble_nzs1170p5_ims(
+        ensemble, site_info, ims, exceedance_values, **opt_nzs1170p5_args
+    )
 
     # Return None if all of the specified exceedance values
     # are out of bounds
@@ -7,7 +7,7 @@ import pandas as pd
 
 import gmhazard_calc.constants as const
 from gmhazard_calc.im import IM, IMType
-from qcore import nhm
+from qcore import nhm, geo
 
 
 def calculate_rupture_rates(
@@ -169,13 +169,38 @@ def closest_location(locations, lat, lon):
     """
     Find position of closest location in locations 2D np.array of (lat, lon).
     """
+    return np.argmin(great_circle_dist(locations[:, 1], locations[:, 0], lon, lat))
+
+
+def great_circle_dist(
+    lon_1: np.ndarray, lat_1: np.ndarray, lon_2: np.ndarray, lat_2: np.ndarray
+) -> np.ndarray:
+    """Computes the (element-wise, with broadcasting) great circle distance (in km)
+    between the locations (in degrees), using the haversine formula,
+    same as qcore.geo.get_distances"""
+    lon_1, lat_1 = np.radians(lon_1), np.radians(lat_1)
+    lon_2, lat_2 = np.radians(lon_2), np.radians(lat_2)
     d = (
-        np.sin(np.radians(locations[:, 0] - lat) / 2.0) ** 2
-        + np.cos(np.radians(lat))
-        * np.cos(np.radians(locations[:, 0]))
-        * np.sin(np.radians(locations[:, 1] - lon) / 2.0) ** 2
+        np.sin((lat_2 - lat_1) / 2.0) ** 2
+        + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2.0) ** 2
+    )
+    return geo.R_EARTH * 2.0 * np.arctan2(np.sqrt(d), np.sqrt(1 - d))
+
+
+def lon_lat_to_xyz(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Converts lon/lat (in degrees) to earth-centred cartesian coordinates (in km),
+    the chord length is monotonic in the great circle distance, i.e. these
+    can be used for nearest neighbour (e.g. KD-tree) searches
+
+    Returns
+    -------
+    array of floats
+        format: [n_locations, 3]
+    """
+    lon, lat = np.radians(np.atleast_1d(lon)), np.radians(np.atleast_1d(lat))
+    return geo.R_EARTH * np.stack(
+        (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=1
     )
-    return np.argmin(6378.139 * 2.0 * np.arctan2(np.sqrt(d), np.sqrt(1 - d)))
 
 
 def read_emp_file(emp_file, cs_faults):
@@ -12,6 +12,8 @@ from .hazard import hazard_single, hazard_curve
 from .exceptions import InputDataError
 from .nzs1170p5_spectra import nzs1170p5_spectra, get_return_period_factor
 from .spatial import compute_cond_lnIM_dist
+from .site_amp import site_amp_ratio
+from .im_component_ratio import get_component_ratio, get_computed_component_ratio
 
 from .gcim import *
 from .gms import *
@@ -5,6 +5,7 @@ from .gcim_emp import (
     get_multi_IM_IMj_Rup,
     comb_lnIMi_IMj,
     compute_rupture_weights,
+    truncate_rupture_weights,
     compute_correlation_matrix,
 )
 
@@ -5,12 +5,21 @@ from typing import Dict, Sequence, Union, Tuple
 import pandas as pd
 import numpy as np
 from scipy import stats
+from scipy import special
 
 from sha_calc import disagg
 from sha_calc import ground_motion as gm
 from . import distributions as dist
 from . import im_correlations
 
+# Default number of z-values (i.e. number of standard deviations
+# from the mean) of the non-parametric lnIMi|IMj CDF
+N_Z_CDF = 1000
+
+# Maximum number of (z-value, IMi, rupture) elements that are
+# evaluated at once when computing the lnIMi|IMj CDF
+CDF_CHUNK_SIZE = 2_000_000
+
 
 def compute_rupture_weights(
     im_j: float,
@@ -63,6 +72,51 @@ def compute_rupture_weights(
     return P_Rup_IMj
 
 
+def truncate_rupture_weights(
+    P_Rup_IMj: pd.Series, contribution_threshold: float
+) -> Tuple[pd.Series, float]:
+    """Only keeps the largest rupture weights that cover the
+    specified fraction of the total rupture weight, the kept
+    weights are renormalised to the original total weight
+
+    Parameters
+    ----------
+    P_Rup_IMj: series
+        The rupture weights given IMj=im_j
+    contribution_threshold: float
+        The fraction of the total weight to keep, e.g. 0.999
+
+    Returns
+    -------
+    series
+        The truncated and renormalised rupture weights,
+        in the same order as P_Rup_IMj
+    float
+        The neglected fraction of the total weight
+    """
+    if not 0 < contribution_threshold <= 1:
+        raise ValueError("The contribution threshold has to be in the range (0, 1]")
+
+    weights = P_Rup_IMj.values
+    total_weight = weights.sum()
+
+    # Number of (largest) ruptures required to cover the threshold
+    sort_ind = np.argsort(weights, kind="stable")[::-1]
+    cum_weights = np.cumsum(weights[sort_ind])
+    n_keep = min(
+        np.searchsorted(cum_weights, contribution_threshold * total_weight) + 1,
+        weights.size,
+    )
+
+    keep_mask = np.zeros(weights.size, dtype=bool)
+    keep_mask[sort_ind[:n_keep]] = True
+    P_Rup_IMj = P_Rup_IMj[keep_mask]
+
+    kept_weight = P_Rup_IMj.sum()
+    neglected_weight = float(1.0 - kept_weight / total_weight)
+    return P_Rup_IMj * (total_weight / kept_weight), neglected_weight
+
+
 def comb_lnIMi_IMj(lnIMi_IMj: Dict[str, dist.Uni_lnIMi_IMj], weights: pd.Series):
     """
     Combines multiple marginal (univariate) lnIMi|IMj distributions
@@ -147,6 +201,10 @@ def compute_lnIMi_IMj(
     P_Rup_IMj: pd.Series,
     IMj: str,
     im_j: float,
+    n_z: int = N_Z_CDF,
+    cdf_tol: float = None,
+    max_n_z: int = N_Z_CDF,
+    chunk_size: int = CDF_CHUNK_SIZE,
 ) -> Dict[str, dist.Uni_lnIMi_IMj]:
     """Computes the marginal (univariate)
     distribution lnIMi|IMj for each IMi
@@ -161,6 +219,18 @@ def compute_lnIMi_IMj(
     IMj: str
     im_j: float
         The conditioning IM name and value
+    n_z: int, optional
+        Number of (equally spaced) points of the non-parametric CDF
+    cdf_tol: float, optional
+        If specified, then the n_z points are adaptively refined, by
+        adding the midpoint of each interval where the linear interpolation
+        error of the CDF (at the midpoint) exceeds cdf_tol.
+        Allows for a much smaller n_z, with a controlled error.
+    max_n_z: int, optional
+        The maximum number of CDF points when using adaptive refinement
+    chunk_size: int, optional
+        Maximum number of (z-value, IMi, rupture) elements
+        evaluated at once, bounds the memory usage
 
     Returns
     -------
@@ -190,41 +260,165 @@ def compute_lnIMi_IMj(
     # Compute the CDF of the target distribution lnIMi|IMj between +/- 3 standard deviations for each IMi
     # As we are summing lognormal conditional distributions, the target distribution IMi|IMj
     # is not lognormal, hence it is computed as a non-parametric CDF
-    z = np.linspace(-3, 3, 1000)
+    z = np.linspace(-3, 3, n_z)
     # Compute the IM values for +/- sigma for each GCIM (i.e. f_IMi|IMj)
     cdf_x = (
         mu_IMi_IMj.loc[IMs].values
         + sigma_IMi_IMj.loc[IMs].values[np.newaxis, :] * z[:, np.newaxis]
     )
-    cdf_y = np.full((z.size, IMs.size), np.nan)
-    for ix, cur_z in enumerate(z):
-        # Compute the corresponding z-value for the
-        # f_IMi|Rup,IMj distributions for each rupture
-        cur_z_IMi_Rup_IMj = (
-            cdf_x[ix] - mu_lnIMi_IMj_Rup.loc[:, IMs]
-        ) / sigma_lnIMi_IMj_Rup.loc[:, IMs]
-
-        # Compute the CDF, assumes that
-        # IMi|IMj, Rup distributions are lognormal
-        cdf_y[ix, :] = np.sum(
-            stats.norm.cdf(cur_z_IMi_Rup_IMj) * P_Rup_IMj.values[:, np.newaxis], axis=0
-        )
-
-    cdf_x = pd.DataFrame(data=cdf_x, columns=IMs)
-    cdf_y = pd.DataFrame(data=cdf_y, columns=IMs)
+    mu_values = mu_lnIMi_IMj_Rup.loc[:, IMs].values
+    sigma_values = sigma_lnIMi_IMj_Rup.loc[:, IMs].values
+    cdf_y = compute_mixture_cdf(
+        cdf_x, mu_values, sigma_values, P_Rup_IMj.values, chunk_size=chunk_size
+    )
     assert np.all(~np.isnan(cdf_y))
 
-    return {
-        IMi: dist.Uni_lnIMi_IMj(
-            pd.Series(index=cdf_x[IMi], data=cdf_y[IMi].values, name=IMi),
+    result = {}
+    for ix, IMi in enumerate(IMs):
+        cur_cdf_x, cur_cdf_y = cdf_x[:, ix], cdf_y[:, ix]
+        if cdf_tol is not None:
+            cur_cdf_x, cur_cdf_y = refine_mixture_cdf(
+                cur_cdf_x,
+                cur_cdf_y,
+                mu_values[:, ix],
+                sigma_values[:, ix],
+                P_Rup_IMj.values,
+                cdf_tol,
+                max_n_z=max_n_z,
+                chunk_size=chunk_size,
+            )
+
+        result[IMi] = dist.Uni_lnIMi_IMj(
+            pd.Series(index=pd.Index(cur_cdf_x, name=IMi), data=cur_cdf_y, name=IMi),
             IMi,
             IMj,
             im_j,
             mu=mu_IMi_IMj[IMi],
             sigma=sigma_IMi_IMj[IMi],
         )
-        for IMi in IMs
-    }
+
+    return result
+
+
+def refine_mixture_cdf(
+    cdf_x: np.ndarray,
+    cdf_y: np.ndarray,
+    mu: np.ndarray,
+    sigma: np.ndarray,
+    weights: np.ndarray,
+    cdf_tol: float,
+    max_n_z: int = N_Z_CDF,
+    chunk_size: int = CDF_CHUNK_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Adaptively refines the CDF of a weighted mixture of normal
+    distributions (for a single IMi), by repeatedly adding the
+    midpoint of each interval where the linear interpolation error
+    at the midpoint exceeds cdf_tol (or until there are max_n_z points)
+
+    Parameters
+    ----------
+    cdf_x, cdf_y: array of floats
+        The initial CDF points, shape [n_z]
+    mu, sigma, weights: array of floats
+        The mean, sigma and weight of the
+        normal distribution for each rupture
+    cdf_tol: float
+        The interpolation error tolerance
+    max_n_z: int, optional
+        The maximum number of CDF points
+
+    Returns
+    -------
+    array of floats, array of floats
+        The refined CDF points (x and y)
+    """
+    # Only intervals that have been refined have to be checked again
+    check_mask = np.ones(cdf_x.size - 1, dtype=bool)
+    while np.any(check_mask) and cdf_x.size < max_n_z:
+        interval_ind = np.flatnonzero(check_mask)
+        mid_x = (cdf_x[interval_ind] + cdf_x[interval_ind + 1]) / 2
+        mid_y = compute_mixture_cdf(
+            mid_x[:, np.newaxis],
+            mu[:, np.newaxis],
+            sigma[:, np.newaxis],
+            weights,
+            chunk_size=chunk_size,
+        )[:, 0]
+
+        refine_mask = (
+            np.abs(mid_y - (cdf_y[interval_ind] + cdf_y[interval_ind + 1]) / 2)
+            > cdf_tol
+        )
+        refine_mask[np.cumsum(refine_mask) > max_n_z - cdf_x.size] = False
+        interval_ind = interval_ind[refine_mask]
+
+        cdf_x = np.insert(cdf_x, interval_ind + 1, mid_x[refine_mask])
+        cdf_y = np.insert(cdf_y, interval_ind + 1, mid_y[refine_mask])
+
+        # Each refined interval is split into two new intervals
+        check_mask = np.zeros(cdf_x.size - 1, dtype=bool)
+        new_interval_ind = interval_ind + np.arange(interval_ind.size)
+        check_mask[new_interval_ind] = check_mask[new_interval_ind + 1] = True
+
+    return cdf_x, cdf_y
+
+
+def compute_mixture_cdf(
+    cdf_x: np.ndarray,
+    mu: np.ndarray,
+    sigma: np.ndarray,
+    weights: np.ndarray,
+    chunk_size: int = CDF_CHUNK_SIZE,
+) -> np.ndarray:
+    """Computes the CDF of a weighted mixture of normal
+    distributions (one per rupture) for each IMi
+
+    The computation is done in chunks of z-values and
+    ruptures, with at most chunk_size elements per chunk
+
+    Parameters
+    ----------
+    cdf_x: array of floats
+        The values at which to compute the CDF, shape [n_z, n_IMs]
+    mu, sigma: array of floats
+        The mean and sigma of the normal distribution
+        for each rupture, shape [n_ruptures, n_IMs]
+    weights: array of floats
+        The weight of each rupture, shape [n_ruptures]
+
+    Returns
+    -------
+    array of floats
+        The CDF values, shape [n_z, n_IMs]
+    """
+    # Ruptures with zero weight do not contribute
+    mask = weights > 0
+    mu, sigma, weights = mu[mask].T, sigma[mask].T, weights[mask]
+
+    n_z, n_IMs = cdf_x.shape
+    n_ruptures = weights.size
+    rupture_chunk_size = int(np.clip(chunk_size // n_IMs, 1, max(n_ruptures, 1)))
+    z_chunk_size = max(chunk_size // (n_IMs * rupture_chunk_size), 1)
+
+    cdf_y = np.zeros((n_z, n_IMs))
+    for rup_ix in range(0, n_ruptures, rupture_chunk_size):
+        cur_rup_slice = slice(rup_ix, rup_ix + rupture_chunk_size)
+        cur_mu, cur_sigma = mu[:, cur_rup_slice], sigma[:, cur_rup_slice]
+        for z_ix in range(0, n_z, z_chunk_size):
+            cur_z_slice = slice(z_ix, z_ix + z_chunk_size)
+
+            # Compute the corresponding z-value for the
+            # f_IMi|Rup,IMj distributions for each rupture,
+            # format: [n_z, n_IMs, n_ruptures]
+            cur_z_IMi_Rup_IMj = (cdf_x[cur_z_slice, :, np.newaxis] - cur_mu) / cur_sigma
+
+            # Compute the CDF, assumes that
+            # IMi|IMj, Rup distributions are lognormal
+            cdf_y[cur_z_slice] += (
+                special.ndtr(cur_z_IMi_Rup_IMj) @ weights[cur_rup_slice]
+            )
+
+    return cdf_y
 
 
 def compute_lnIMi_IMj_Rup(
@@ -30,7 +30,11 @@ GM_SCALING_ALPHA = {
 
 
 def generate_correlated_vector(
-    n_gms: int, IMs: np.ndarray, rho: pd.DataFrame, n_replica: int = 1
+    n_gms: int,
+    IMs: np.ndarray,
+    rho: pd.DataFrame,
+    n_replica: int = 1,
+    rng: np.random.Generator = None,
 ):
     """Computes a correlated vector (along axis 1)
     of shape [n_gms, len(IMs)]
@@ -46,13 +50,17 @@ def generate_correlated_vector(
         format: index = IMs, columns = IMs (same order)
     n_replica: int
         Number of replica
+    rng: Generator, optional
+        The random number generator to use,
+        defaults to the numpy global random state
 
     Returns
     -------
     list of dataframe
         The n_replica correlated vectors
     """
-    u_vectors = [np.random.normal(0, 1, (n_gms, IMs.size)) for ix in range(n_replica)]
+    normal = np.random.normal if rng is None else rng.normal
+    u_vectors = [normal(0, 1, (n_gms, IMs.size)) for ix in range(n_replica)]
     try:
         L = cholesky(rho, lower=True)
     except np.linalg.LinAlgError:
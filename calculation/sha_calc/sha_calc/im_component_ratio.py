@@ -3,6 +3,7 @@ import numbers
 from typing import Sequence, Union, Tuple
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 
@@ -18,6 +19,39 @@ R_T_DICT = {
 }
 
 
+def _compute_ratio(
+    R: Sequence[float], T: Sequence[float], period: Union[float, np.ndarray]
+):
+    """Computes the ratio between two components using Equation 2 of the Boore paper with the specified coefficients"""
+    ln_period = np.log(period)
+
+    def line(i: int):
+        """Line between the (ln(T), R) coefficients i and i + 1"""
+        return R[i] + (R[i + 1] - R[i]) / math.log(T[i + 1] / T[i]) * (
+            ln_period - math.log(T[i])
+        )
+
+    return np.maximum(
+        R[1], np.maximum(np.minimum(line(1), line(2)), np.minimum(line(3), R[5]))
+    )
+
+
+# The ratio (equation 2 of Boore 2017) is piecewise linear in ln(period)
+# between the coefficient periods and constant outside of them,
+# therefore the ratio of each component to RotD50 is tabulated at these periods,
+# format: component -> (ln(periods), ratios)
+COMPONENT_RATIO_TABLES = {
+    "RotD50": (np.zeros(1), np.ones(1)),
+    **{
+        key.split("/")[0]: (
+            np.log(values["T"][1:]),
+            _compute_ratio(values["R"], values["T"], np.asarray(values["T"][1:])),
+        )
+        for key, values in R_T_DICT.items()
+    },
+}
+
+
 def get_component_ratio(
     im_type: str,
     current_component: str,
@@ -118,12 +152,17 @@ def _get_min_max_mag(magnitude: float):
 
 
 def get_computed_component_ratio(
-    current_component: str, wanted_component: str, period: float
+    current_component: str,
+    wanted_component: str,
+    period: Union[float, Sequence[float], np.ndarray],
 ):
     """
-    Computes the average IM Component ratio for a given period using (equation 2) from the paper
+    Computes the average IM Component ratio for the given period(s) using (equation 2) from the paper
     "Relations between Some Horizontal-Component Ground-Motion Intensity Measures Used in Practice (Boore 2017)".
 
+    Uses the precomputed ratio tables (see COMPONENT_RATIO_TABLES), i.e. the
+    ratios for all periods of interest are retrieved in a single lookup
+
     Currently Supports:
     RotD50, RotD100, Larger
 
@@ -133,37 +172,17 @@ def get_computed_component_ratio(
         The current component the values are calculated at e.g. RotD50
     wanted_component: str
         The wanted component the values to get the ratio for e.g. RotD100
-    period: float
+    period: float or array of floats
         Used for specifying the period for a pSA IM
+
+    Returns
+    -------
+    float or array of floats
+        The ratio(s), same shape as period
     """
-    if current_component == "RotD50":
-        # Converts from RotD50 -> Larger/RotD100
-        r_t_values = R_T_DICT[f"{wanted_component}/{current_component}"]
-        return _compute_ratio(r_t_values["R"], r_t_values["T"], period)
-    elif wanted_component == "RotD50":
-        # Converts from Larger/RotD100 -> RotD50
-        r_t_values = R_T_DICT[f"{current_component}/{wanted_component}"]
-        return 1 / _compute_ratio(r_t_values["R"], r_t_values["T"], period)
-    else:
-        # Converts from Larger -> RotD100 or vise versa
-        r_t_values = R_T_DICT[f"{current_component}/RotD50"]
-        ratio_rotD50 = 1 / _compute_ratio(r_t_values["R"], r_t_values["T"], period)
-        r_t_values = R_T_DICT[f"{wanted_component}/RotD50"]
-        return ratio_rotD50 * _compute_ratio(r_t_values["R"], r_t_values["T"], period)
-
-
-def _compute_ratio(R: Sequence[float], T: Sequence[float], period: float):
-    """Computes the ratio between two components using Equation 2 of the Boore paper with the specified coefficients"""
-    return max(
-        R[1],
-        max(
-            min(
-                R[1] + (R[2] - R[1]) / math.log(T[2] / T[1]) * math.log(period / T[1]),
-                R[2] + (R[3] - R[2]) / math.log(T[3] / T[2]) * math.log(period / T[2]),
-            ),
-            min(
-                R[3] + (R[4] - R[3]) / math.log(T[4] / T[3]) * math.log(period / T[3]),
-                R[5],
-            ),
-        ),
+    ln_period = np.log(np.asarray(period, dtype=float))
+    # Converts via RotD50, i.e. current -> RotD50 -> wanted
+    ratio = np.interp(ln_period, *COMPONENT_RATIO_TABLES[wanted_component]) / np.interp(
+        ln_period, *COMPONENT_RATIO_TABLES[current_component]
     )
+    return float(ratio) if ratio.ndim == 0 else ratio
@@ -2,9 +2,41 @@ from typing import Sequence, Union
 
 import numpy as np
 
+# Nmax(T) (T, Nmax)
+NMAX_DATA = np.array(
+    (
+        (0.0, 1.0),
+        (1.5, 1.0),
+        (2.0, 1.12),
+        (3.0, 1.36),
+        (4.0, 1.60),
+        (5.0, 1.72),
+        (10.0, 1.72),
+    )
+)
+
+# Return period factor (RP, R)
+R_DATA = np.array(
+    (
+        (20, 0.20),
+        (25, 0.25),
+        (50, 0.35),
+        (100, 0.50),
+        (250, 0.75),
+        (500, 1.0),
+        (1000, 1.3),
+        (2000, 1.7),
+        (2500, 1.8),
+    )
+)
+
 
 def nzs1170p5_spectra(
-    periods: Sequence[float], Z: float, RP: Union[float, int], D: float, soil_class: str
+    periods: Sequence[float],
+    Z: Union[float, np.ndarray],
+    RP: Union[float, int, np.ndarray],
+    D: Union[float, np.ndarray],
+    soil_class: Union[str, np.ndarray],
 ):
     """
     Provides the NZ code uniform hazard spectra ”
@@ -17,117 +49,118 @@ def nzs1170p5_spectra(
     SoilClass - soil class as defined by NZS1170.5 (options rock (A); weak
     rock (B); intermediate soil (C); soft or deep soil (D)); very soft (E)
 
+    Z, RP, D and SoilClass can either be single values or arrays
+    that broadcast against each other (e.g. one value per site and/or
+    return period), in which case the output variables have the
+    (broadcast) shape of their inputs with an additional trailing
+    period dimension, e.g. C has shape broadcast(Z, RP, D, SoilClass) + (n_periods,)
+
     output variables:
     C - the value of the response spectra for the required periods
     Ch - the spectral shape
     R - R-factor for the given return period
     N - the near fault factor for the required periods
     """
-    # Nmax(T) (T, Nmax)
-    Nmax = np.array(
-        (
-            (0.0, 1.0),
-            (1.5, 1.0),
-            (2.0, 1.12),
-            (3.0, 1.36),
-            (4.0, 1.60),
-            (5.0, 1.72),
-            (10.0, 1.72),
-        )
-    )
+    periods = np.asarray(periods, dtype=np.float64)
+    Z = np.asarray(Z, dtype=np.float64)
+    RP = np.asarray(RP, dtype=np.float64)
+    D = np.asarray(np.inf if D is None else D, dtype=np.float64)
 
     # compute return period factor
     R = get_return_period_factor(RP)
 
     # compute near fault factor N(D, T)
-    if RP <= 250 or D > 20 or D is None:
-        N = np.ones(len(periods), dtype=np.float32)
-    elif D < 2:
-        N = np.interp(periods, Nmax[:, 0], Nmax[:, 1])
-    else:
-        N = 1 + (np.interp(periods, Nmax[:, 0], Nmax[:, 1]) - 1) * (20 - D) / 18.0
+    N_max = np.interp(periods, NMAX_DATA[:, 0], NMAX_DATA[:, 1])
+    RP_, D_ = RP[..., np.newaxis], D[..., np.newaxis]
+    N = np.where(
+        (RP_ <= 250) | (D_ > 20),
+        1.0,
+        np.where(D_ < 2, N_max, 1 + (N_max - 1) * (20 - D_) / 18.0),
+    )
 
     # get spectral shapes
-    Ch = np.zeros(len(periods), dtype=np.float32)
-    for i in range(len(periods)):
-        if soil_class in ("A", "B"):
-            if periods[i] < 0.1:
-                Ch[i] = 1 + 1.35 * (periods[i] / 0.1)
-            elif periods[i] < 0.3:
-                Ch[i] = 2.35
-            elif periods[i] < 1.5:
-                Ch[i] = 1.6 * (0.5 / periods[i]) ** 0.75
-            elif periods[i] < 3:
-                Ch[i] = 1.05 / periods[i]
-            else:
-                Ch[i] = 3.15 / periods[i] ** 2
-        elif soil_class in ("C", "U"):
-            if periods[i] < 0.1:
-                Ch[i] = 1.33 + 1.6 * periods[i] / 0.1
-            elif periods[i] < 0.3:
-                Ch[i] = 2.93
-            elif periods[i] < 1.5:
-                Ch[i] = 2 * (0.5 / periods[i]) ** 0.75
-            elif periods[i] < 3:
-                Ch[i] = 1.32 / periods[i]
-            else:
-                Ch[i] = 3.96 / periods[i] ** 2
-        elif soil_class == "D":
-            if periods[i] < 0.1:
-                Ch[i] = 1.12 + 1.88 * periods[i] / 0.1
-            elif periods[i] < 0.56:
-                Ch[i] = 3.0
-            elif periods[i] < 1.5:
-                Ch[i] = 2.4 * (0.75 / periods[i]) ** 0.75
-            elif periods[i] < 3:
-                Ch[i] = 2.14 / periods[i]
-            else:
-                Ch[i] = 6.42 / periods[i] ** 2
-        elif soil_class == "E":
-            if periods[i] < 0.1:
-                Ch[i] = 1.12 + 1.88 * periods[i] / 0.1
-            elif periods[i] < 1:
-                Ch[i] = 3.0
-            elif periods[i] < 1.5:
-                Ch[i] = 3 * (1.0 / periods[i]) ** 0.75
-            elif periods[i] < 3:
-                Ch[i] = 3.32 / periods[i]
-            else:
-                Ch[i] = 9.66 / periods[i] ** 2
+    Ch = get_spectral_shape(periods, soil_class)
 
     # get spectra
-    C = Ch * Z * R * N
+    C = Ch * Z[..., np.newaxis] * R[..., np.newaxis] * N
 
     return C, Ch, R, N
 
 
-def get_return_period_factor(RP: int):
+def get_spectral_shape(periods: np.ndarray, soil_class: Union[str, np.ndarray]):
     """
     Parameters
     ----------
-    return_period (years)
+    periods: array of floats
+        The periods of interest
+    soil_class: string or array of strings
+        The soil class(es) as defined by NZS1170.5
 
     Returns
     -------
-    Return period factor
+    array of floats
+        The spectral shape, shape = soil_class.shape + (n_periods,)
+        Unknown soil classes have a spectral shape of 0
     """
-    r_data = np.array(
-        (
-            (20, 0.20),
-            (25, 0.25),
-            (50, 0.35),
-            (100, 0.50),
-            (250, 0.75),
-            (500, 1.0),
-            (1000, 1.3),
-            (2000, 1.7),
-            (2500, 1.8),
-        )
-    )
+    periods = np.asarray(periods, dtype=np.float64)
+    soil_class = np.asarray(soil_class, dtype=str)
+
+    # Only compute the shape once per unique soil class
+    unique_soil_classes, soil_class_ind = np.unique(soil_class, return_inverse=True)
+    soil_class_ind = soil_class_ind.reshape(soil_class.shape)
+
+    Ch = np.zeros(soil_class.shape + periods.shape, dtype=np.float32)
+    for ix, cur_soil_class in enumerate(unique_soil_classes):
+        Ch[soil_class_ind == ix] = _get_soil_spectral_shape(periods, cur_soil_class)
+
+    return Ch
 
-    if RP < 20:
+
+def _get_soil_spectral_shape(periods: np.ndarray, soil_class: str):
+    """Computes the spectral shape for a single soil class"""
+    T = periods
+    with np.errstate(divide="ignore"):
+        if soil_class in ("A", "B"):
+            return np.select(
+                [T < 0.1, T < 0.3, T < 1.5, T < 3],
+                [1 + 1.35 * (T / 0.1), 2.35, 1.6 * (0.5 / T) ** 0.75, 1.05 / T],
+                3.15 / T ** 2,
+            )
+        elif soil_class in ("C", "U"):
+            return np.select(
+                [T < 0.1, T < 0.3, T < 1.5, T < 3],
+                [1.33 + 1.6 * T / 0.1, 2.93, 2 * (0.5 / T) ** 0.75, 1.32 / T],
+                3.96 / T ** 2,
+            )
+        elif soil_class == "D":
+            return np.select(
+                [T < 0.1, T < 0.56, T < 1.5, T < 3],
+                [1.12 + 1.88 * T / 0.1, 3.0, 2.4 * (0.75 / T) ** 0.75, 2.14 / T],
+                6.42 / T ** 2,
+            )
+        elif soil_class == "E":
+            return np.select(
+                [T < 0.1, T < 1, T < 1.5, T < 3],
+                [1.12 + 1.88 * T / 0.1, 3.0, 3 * (1.0 / T) ** 0.75, 3.32 / T],
+                9.66 / T ** 2,
+            )
+    return np.zeros(T.shape)
+
+
+def get_return_period_factor(RP: Union[int, np.ndarray]):
+    """
+    Parameters
+    ----------
+    return_period (years), single value or array
+
+    Returns
+    -------
+    Return period factor
+    """
+    RP = np.asarray(RP)
+    if np.any(RP < 20):
         raise ValueError("return_period must be at least 20 years")
-    elif RP > 2500:
+    elif np.any(RP > 2500):
         raise ValueError("return_period must be at most 2500 years")
-    r = np.interp(RP, r_data[:, 0], r_data[:, 1])
+    r = np.interp(RP, R_DATA[:, 0], R_DATA[:, 1])
     return r
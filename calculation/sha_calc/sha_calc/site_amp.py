@@ -0,0 +1,160 @@
+from typing import Union
+
+import numpy as np
+
+# Campbell & Bozorgnia (2014) site amplification coefficients,
+# used for the vs30 adjustment of IM values/distributions
+# Periods of the coefficients, -1 and 0 correspond to PGV and PGA
+CB14_PERIODS = np.array(
+    [
+        -1,
+        0,
+        0.001,
+        0.01,
+        0.02,
+        0.03,
+        0.05,
+        0.075,
+        0.10,
+        0.15,
+        0.20,
+        0.25,
+        0.30,
+        0.40,
+        0.50,
+        0.75,
+        1.00,
+        1.50,
+        2.00,
+        3.00,
+        4.00,
+        5.00,
+        7.50,
+        10.0,
+    ]
+)
+
+# fmt: off
+CB14_K1 = np.array([400, 865.0, 865.0, 865.0, 865.0, 908.0, 1054.0, 1086.0, 1032.0,
+                    878.0, 748.0, 654.0, 587.0, 503.0, 457.0, 410.0,
+                    400.0, 400.0, 400.0, 400.0, 400.0, 400.0, 400.0, 400.0])
+CB14_K2 = np.array([-1.955, -1.186, -1.186, -1.186, -1.219, -1.273, -1.346, -1.471, -1.624,
+                    -1.931, -2.188, -2.381, -2.518, -2.657, -2.669, -2.401,
+                    -1.955, -1.025, -0.299, 0.0, 0.0, 0.0, 0.0, 0.0])
+CB14_C10 = np.array([1.713, 1.090, 1.090, 1.094, 1.149, 1.290, 1.449, 1.535, 1.615,
+                     1.877, 2.069, 2.205, 2.306, 2.398, 2.355, 1.995,
+                     1.447, 0.330, -0.514, -0.848, -0.793, -0.748, -0.664,
+                     -0.576])
+# fmt: on
+
+SCON_C = 1.88
+SCON_N = 1.18
+
+# Site term for vs30 >= 1100 (i.e. independent of vs30), per period
+CB14_FS_HIGH = (CB14_C10 + CB14_K2 * SCON_N) * np.log(1100.0 / CB14_K1)
+
+
+def get_period_ix(periods: Union[float, np.ndarray]) -> np.ndarray:
+    """Gets the index of the nearest CB14 coefficient period
+
+    Parameters
+    ----------
+    periods: float or array of floats
+        The periods, -1 for PGV and 0 for PGA
+
+    Returns
+    -------
+    array of ints
+    """
+    periods = np.asarray(periods, dtype=float)
+    return np.argmin(np.abs(CB14_PERIODS - periods[..., np.newaxis]), axis=-1)
+
+
+def site_term(
+    period_ix: Union[int, np.ndarray],
+    vs30: Union[float, np.ndarray],
+    a1100: Union[float, np.ndarray] = None,
+) -> np.ndarray:
+    """Computes the CB14 site term (f_site), all
+    parameters are broadcast against each other
+
+    Parameters
+    ----------
+    period_ix: int or array of ints
+        Index of the coefficient period, see get_period_ix
+    vs30: float or array of floats
+        The vs30 that is being amplified to
+    a1100: float or array of floats, optional
+        PGA at vs30 = 1100 m/s for the site source combination,
+        only required for vs30 values below k1
+
+    Returns
+    -------
+    array of floats
+    """
+    k1, k2, c10 = CB14_K1[period_ix], CB14_K2[period_ix], CB14_C10[period_ix]
+    vs30 = np.asarray(vs30, dtype=float)
+    a1100 = np.nan if a1100 is None else np.asarray(a1100, dtype=float)
+
+    ln_vs30_k1 = np.log(vs30 / k1)
+    with np.errstate(invalid="ignore"):
+        fs_low = c10 * ln_vs30_k1 + k2 * np.log(
+            (a1100 + SCON_C * np.exp(SCON_N * ln_vs30_k1)) / (a1100 + SCON_C)
+        )
+    fs_medium = (c10 + k2 * SCON_N) * ln_vs30_k1
+
+    return np.where(
+        vs30 < k1,
+        fs_low,
+        np.where(vs30 < 1100.0, fs_medium, CB14_FS_HIGH[period_ix]),
+    )
+
+
+def site_amp_ratio(
+    pga: Union[float, np.ndarray],
+    db_vs30: Union[float, np.ndarray],
+    user_vs30: Union[float, np.ndarray],
+    periods: Union[float, np.ndarray],
+) -> np.ndarray:
+    """
+    Calculates a PGA_1100 estimate and uses it to calculate the site
+    amplification ratio for the difference between the user and the modelled vs30
+
+    Parameters
+    ----------
+    pga: float or array of floats
+        PGA value (at the original vs30) per site/rupture
+    db_vs30: float or array of floats
+        The vs30 of the initial calculation
+    user_vs30: float or array of floats
+        The vs30 that the IM values are scaled to
+    periods: float or array of floats
+        The periods of the IMs, -1 for PGV and 0 for PGA
+
+    pga, db_vs30 and user_vs30 are broadcast against each
+    other, the periods are added as the last dimension
+
+    Returns
+    -------
+    array of floats
+        The ratios to apply to the IM values,
+        shape [*broadcast(pga, db_vs30, user_vs30).shape, n_periods]
+    """
+    period_ix = get_period_ix(periods)
+
+    pga, db_vs30, user_vs30 = np.broadcast_arrays(
+        np.asarray(pga, dtype=float),
+        np.asarray(db_vs30, dtype=float),
+        np.asarray(user_vs30, dtype=float),
+    )
+    pga1100 = pga * np.exp(CB14_FS_HIGH[0] - site_term(0, db_vs30, pga))
+
+    pga1100, db_vs30, user_vs30 = (
+        pga1100[..., np.newaxis],
+        db_vs30[..., np.newaxis],
+        user_vs30[..., np.newaxis],
+    )
+    return np.exp(
+        site_term(period_ix, user_vs30, pga1100)
+        - site_term(period_ix, db_vs30, pga1100)
+    )
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from sha_calc.gcim.gcim_emp import (
+    compute_mixture_cdf,
+    refine_mixture_cdf,
+    truncate_rupture_weights,
+)
+
+RNG = np.random.default_rng(0)
+N_RUPTURES, N_IMS = 500, 3
+MU = RNG.normal(-2.0, 1.0, (N_RUPTURES, N_IMS))
+SIGMA = RNG.uniform(0.3, 0.7, (N_RUPTURES, N_IMS))
+WEIGHTS = RNG.exponential(size=N_RUPTURES)
+WEIGHTS /= WEIGHTS.sum()
+CDF_X = np.repeat(np.linspace(-6, 2, 200)[:, np.newaxis], N_IMS, axis=1)
+
+
+def test_single_rupture():
+    """The mixture of a single distribution is the normal CDF"""
+    cdf_y = compute_mixture_cdf(CDF_X, MU[:1], SIGMA[:1], np.asarray([1.0]))
+
+    assert np.all(np.isclose(cdf_y, stats.norm.cdf(CDF_X, MU[:1], SIGMA[:1])))
+
+
+def test_chunking():
+    """The chunk size must not affect the result"""
+    ref_cdf_y = np.sum(
+        stats.norm.cdf((CDF_X[:, np.newaxis, :] - MU[np.newaxis]) / SIGMA[np.newaxis])
+        * WEIGHTS[np.newaxis, :, np.newaxis],
+        axis=1,
+    )
+
+    for cur_chunk_size in [1, 100, 7_000, 10_000_000]:
+        cdf_y = compute_mixture_cdf(
+            CDF_X, MU, SIGMA, WEIGHTS, chunk_size=cur_chunk_size
+        )
+        assert np.all(np.isclose(cdf_y, ref_cdf_y))
+
+
+def test_refinement():
+    """The refined CDF has to be within the tolerance of the full resolution CDF"""
+    cdf_tol = 1e-4
+    cdf_x = np.linspace(-6, 2, 20)
+    cdf_y = compute_mixture_cdf(cdf_x[:, np.newaxis], MU[:, :1], SIGMA[:, :1], WEIGHTS)
+    cdf_x, cdf_y = refine_mixture_cdf(
+        cdf_x,
+        cdf_y[:, 0],
+        MU[:, 0],
+        SIGMA[:, 0],
+        WEIGHTS,
+        cdf_tol,
+    )
+
+    assert np.all(np.diff(cdf_x) > 0)
+    assert np.all(
+        np.abs(
+            np.interp(CDF_X[:, 0], cdf_x, cdf_y)
+            - compute_mixture_cdf(CDF_X, MU, SIGMA, WEIGHTS)[:, 0]
+        )
+        < 2 * cdf_tol
+    )
+
+
+def test_truncate_rupture_weights():
+    """Truncation keeps the largest weights (in the original order)
+    and renormalises them to the original total"""
+    P_Rup_IMj = pd.Series([0.05, 0.5, 0.01, 0.3, 0.14], index=list("abcde"))
+
+    trunc_P_Rup_IMj, neglected = truncate_rupture_weights(P_Rup_IMj, 0.9)
+
+    assert np.all(trunc_P_Rup_IMj.index.values == ["b", "d", "e"])
+    assert np.isclose(trunc_P_Rup_IMj.sum(), 1.0)
+    assert np.isclose(neglected, 0.06)
+
+    trunc_P_Rup_IMj, neglected = truncate_rupture_weights(P_Rup_IMj, 1.0)
+    assert np.all(trunc_P_Rup_IMj.index.values == P_Rup_IMj.index.values)
+    assert np.isclose(neglected, 0.0)
@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+import pytest
+
+from sha_calc.im_component_ratio import R_T_DICT, get_computed_component_ratio
+
+COMPONENTS = ["RotD50", "RotD100", "Larger"]
+PERIODS = np.exp(np.linspace(np.log(0.005), np.log(20.0), 200))
+
+
+def _compute_ratio_scalar(R, T, period: float):
+    """Scalar reference implementation of equation 2 (Boore 2017)"""
+    return max(
+        R[1],
+        max(
+            min(
+                R[1] + (R[2] - R[1]) / math.log(T[2] / T[1]) * math.log(period / T[1]),
+                R[2] + (R[3] - R[2]) / math.log(T[3] / T[2]) * math.log(period / T[2]),
+            ),
+            min(
+                R[3] + (R[4] - R[3]) / math.log(T[4] / T[3]) * math.log(period / T[3]),
+                R[5],
+            ),
+        ),
+    )
+
+
+def _ratio_to_rotD50(component: str, period: float):
+    if component == "RotD50":
+        return 1.0
+    r_t_values = R_T_DICT[f"{component}/RotD50"]
+    return _compute_ratio_scalar(r_t_values["R"], r_t_values["T"], period)
+
+
+@pytest.mark.parametrize("current_component", COMPONENTS)
+@pytest.mark.parametrize("wanted_component", COMPONENTS)
+def test_computed_component_ratio(current_component, wanted_component):
+    ratios = get_computed_component_ratio(current_component, wanted_component, PERIODS)
+
+    assert ratios.shape == PERIODS.shape
+    assert np.all(
+        np.isclose(
+            ratios,
+            [
+                _ratio_to_rotD50(wanted_component, cur_period)
+                / _ratio_to_rotD50(current_component, cur_period)
+                for cur_period in PERIODS
+            ],
+        )
+    )
+
+
+def test_computed_component_ratio_scalar():
+    ratio = get_computed_component_ratio("RotD50", "Larger", 0.01)
+
+    assert isinstance(ratio, float)
+    assert np.isclose(ratio, _ratio_to_rotD50("Larger", 0.01))
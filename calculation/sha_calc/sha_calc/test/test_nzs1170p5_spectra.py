@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+
+from sha_calc.nzs1170p5_spectra import nzs1170p5_spectra, get_return_period_factor
+
+PERIODS = np.asarray([0.0, 0.05, 0.2, 0.5, 1.0, 2.0, 4.0, 10.0])
+
+
+def test_single_site():
+    """Soil class C, RP = 500 and D > 20, i.e. N = 1"""
+    C, Ch, R, N = nzs1170p5_spectra([0.0, 0.2, 1.0], 0.4, 500, 100, "C")
+
+    assert R == 1.0
+    assert np.all(N == 1.0)
+    assert np.all(np.isclose(Ch, [1.33, 2.93, 2 * 0.5 ** 0.75]))
+    assert np.all(np.isclose(C, Ch * 0.4))
+
+
+def test_near_fault_factor():
+    """Based on the linear N(D) reduction between 2km and 20km"""
+    _, _, _, N = nzs1170p5_spectra([4.0], 0.4, 500, 11, "C")
+
+    assert np.isclose(N[0], 1.3)
+
+
+def test_vectorised():
+    """The vectorised computation has to match the per site/return period one"""
+    Z = np.asarray([0.13, 0.4, 0.25])
+    D = np.asarray([1.0, 10.0, 200.0])
+    soil_class = np.asarray(["A", "D", "E"])
+    RP = np.asarray([100, 500, 2500])
+
+    C, Ch, R, N = nzs1170p5_spectra(
+        PERIODS, Z[:, None], RP[None, :], D[:, None], soil_class[:, None]
+    )
+
+    assert C.shape == (Z.size, RP.size, PERIODS.size)
+    for i in range(Z.size):
+        for j in range(RP.size):
+            cur_C, cur_Ch, cur_R, cur_N = nzs1170p5_spectra(
+                PERIODS, Z[i], RP[j], D[i], soil_class[i]
+            )
+            assert np.all(np.isclose(C[i, j], cur_C))
+            assert np.all(np.isclose(N[i, j], cur_N))
+            assert np.all(np.isclose(Ch[i, 0], cur_Ch))
+            assert np.isclose(R[0, j], cur_R)
+
+
+def test_return_period_factor_bounds():
+    with pytest.raises(ValueError):
+        get_return_period_factor(np.asarray([10, 500]))
+    with pytest.raises(ValueError):
+        get_return_period_factor(3000)
@@ -0,0 +1,59 @@
+import numpy as np
+
+from sha_calc.site_amp import (
+    CB14_PERIODS,
+    CB14_K1,
+    CB14_K2,
+    CB14_C10,
+    SCON_C,
+    SCON_N,
+    site_amp_ratio,
+    site_term,
+)
+
+RNG = np.random.default_rng(0)
+PGA = np.exp(RNG.normal(-2.0, 1.5, 100))
+PERIODS = np.asarray([-1, 0, 0.01, 0.1, 0.35, 1.0, 3.0, 10.0])
+
+
+def _site_term_scalar(i: int, vs30: float, a1100: float = None):
+    """Scalar reference implementation of the CB14 site term"""
+    k1, k2, c10 = CB14_K1[i], CB14_K2[i], CB14_C10[i]
+    if vs30 < k1:
+        return c10 * np.log(vs30 / k1) + k2 * np.log(
+            (a1100 + SCON_C * np.exp(SCON_N * np.log(vs30 / k1))) / (a1100 + SCON_C)
+        )
+    elif vs30 < 1100.0:
+        return (c10 + k2 * SCON_N) * np.log(vs30 / k1)
+    return (c10 + k2 * SCON_N) * np.log(1100.0 / k1)
+
+
+def test_site_term():
+    for vs30 in [150.0, 400.0, 760.0, 1100.0, 1500.0]:
+        for i in range(CB14_PERIODS.size):
+            assert np.all(
+                np.isclose(
+                    site_term(i, vs30, PGA),
+                    [_site_term_scalar(i, vs30, cur_pga) for cur_pga in PGA],
+                )
+            )
+
+
+def test_site_amp_ratio_same_vs30():
+    """No amplification if the user vs30 matches the db vs30"""
+    ratio = site_amp_ratio(PGA, 400.0, 400.0, PERIODS)
+
+    assert ratio.shape == (PGA.size, PERIODS.size)
+    assert np.all(np.isclose(ratio, 1.0))
+
+
+def test_site_amp_ratio_broadcast():
+    """Vectorised vs30 values match the per vs30 results"""
+    user_vs30 = np.asarray([200.0, 500.0, 1200.0])
+    ratio = site_amp_ratio(PGA[:, np.newaxis], 500.0, user_vs30, PERIODS)
+
+    assert ratio.shape == (PGA.size, user_vs30.size, PERIODS.size)
+    for ix, cur_vs30 in enumerate(user_vs30):
+        assert np.all(
+            np.isclose(ratio[:, ix], site_amp_ratio(PGA, 500.0, cur_vs30, PERIODS))
+        )
@@ -1,5 +1,6 @@
 import os
 import argparse
+import multiprocessing as mp
 
 import numpy as np
 import pandas as pd
@@ -9,6 +10,7 @@ from qcore import nhm, formats
 from IM_calculation.source_site_dist import src_site_dist
 
 import gmhazard_calc as gc
+import site_source_distances
 
 # 1km divided by distance between points (1km/0.1km gives 100m grid)
 POINTS_PER_KILOMETER = 1 / 0.1
@@ -16,9 +18,18 @@ POINTS_PER_KILOMETER = 1 / 0.1
 # Calculation distance is 200, but larger
 # distances are required for simulation disaggregation
 RJB_MAX_DIST = 500
-STATION_TOO_FAR_KEY = -1
 
 DIR_SUPPORTED_TECTONIC_TYPYES = ["ACTIVE_SHALLOW", "VOLCANIC"]
+DIRECTIVITY_COLUMNS = [
+    str(gc.im.IM(gc.im.IMType.pSA, period)) + mu_sigma
+    for mu_sigma in ["", "_sigma"]
+    for period in gc.im.DEFAULT_PSA_PERIODS
+]
+
+# Number of fault blocks per process when processing the faults in parallel
+FAULT_BLOCKS_PER_PROC = 4
+
+_stations, _site_tree = None, None
 
 
 def compute_site_source_distances(
@@ -34,7 +45,7 @@ def compute_site_source_distances(
     ----------
     stations: numpy array of floats
         The stations data
-        Format: [lon, lat]
+        Format: [lon, lat, depth]
     faults: dictionary
         Either a fault_name -> NHMFault object dictionary or
         fault_name -> dictionary with keys [lon, lat, depth]
@@ -42,103 +53,165 @@ def compute_site_source_distances(
         finite faults and the 2nd for computing site-source distances for
         point sources
     calculate_directivity: bool, optional
-        True to calculate directivity and return numpy array of
+        True to calculate directivity and return the
          site directivity amplification values per fault
     n_procs: int, optional
-        Number of processes to use for the directivity
-        calculation
+        Number of processes to use, the faults are
+        processed in blocks, in parallel
 
     Returns
     -------
-    structured numpy array
-        With columns [fault_id, rjb, rrup, rx, ry, rtvz]
+    pd.DataFrame
+        The distances for all site-source pairs with rjb <= RJB_MAX_DIST,
+        with columns [fault_id, site_ix, rjb, rrup, rx, ry, rtvz],
+        where site_ix is the index of the station in the stations array
+        and fault_id the index of the fault in the sorted faults
+        Sorted by site_ix
+    pd.DataFrame
+        The directivity values for all site-source pairs for which it
+        was computed, with columns [fault_id, site_ix, directivity columns],
+        None if calculate_directivity is False
     """
-    distances = np.full(
-        fill_value=STATION_TOO_FAR_KEY,
-        shape=(len(faults), len(stations)),
-        dtype=[
-            ("fault_id", np.int64),
-            ("rjb", np.float64),
-            ("rrup", np.float64),
-            ("rx", np.float64),
-            ("ry", np.float64),
-            ("rtvz", np.float64),
-        ],
-    )
-    directivity = (
-        np.full(
-            fill_value=0,
-            shape=(len(faults), len(stations), len(gc.im.DEFAULT_PSA_PERIODS) * 2),
-            dtype=np.float64,
+    faults = dict(sorted(faults.items(), key=lambda item: item[0]))
+
+    # Point sources
+    if not isinstance(next(iter(faults.values())), nhm.NHMFault):
+        distance_df = site_source_distances.compute_point_source_distances(
+            pd.DataFrame.from_dict(faults, orient="index").loc[
+                :, ["lon", "lat", "depth"]
+            ],
+            pd.DataFrame(stations[:, :2], columns=["lon", "lat"]),
+            RJB_MAX_DIST,
+            n_procs=n_procs,
+        )
+
+        # Set Rx/Ry to rrup for point sources
+        distance_df["rx"] = distance_df["rrup"].values
+        distance_df["ry"] = distance_df["rrup"].values
+        distance_df["rtvz"] = np.nan
+        return distance_df, None
+
+    # Finite faults, processed in blocks of faults in parallel
+    fault_args = [
+        (index, cur_fault_data, calculate_directivity)
+        for index, cur_fault_data in enumerate(faults.values())
+    ]
+    if n_procs == 1:
+        _init_stations(stations)
+        results = [_compute_fault_distances(*cur_args) for cur_args in fault_args]
+    else:
+        with mp.Pool(n_procs, initializer=_init_stations, initargs=(stations,)) as p:
+            results = p.starmap(
+                _compute_fault_distances,
+                fault_args,
+                chunksize=max(1, len(fault_args) // (n_procs * FAULT_BLOCKS_PER_PROC)),
+            )
+
+    distance_dfs = [
+        cur_distance_df for cur_distance_df, _ in results if cur_distance_df is not None
+    ]
+    distance_df = (
+        pd.concat(distance_dfs, ignore_index=True).sort_values(
+            ["site_ix", "fault_id"], kind="stable"
+        )
+        if len(distance_dfs) > 0
+        else pd.DataFrame(
+            columns=["fault_id", "site_ix", "rjb", "rrup", "rx", "ry", "rtvz"]
         )
-        if calculate_directivity
-        else None
     )
 
-    n_faults = len(faults)
-    faults = dict(sorted(faults.items(), key=lambda item: item[0]))
-    for index, (cur_fault_name, cur_fault_data) in enumerate(faults.items()):
-        print(f"Processing fault {(index + 1)} / {n_faults}")
+    directivity_df = None
+    if calculate_directivity:
+        directivity_dfs = [
+            cur_directivity_df
+            for _, cur_directivity_df in results
+            if cur_directivity_df is not None
+        ]
+        directivity_df = (
+            pd.concat(directivity_dfs, ignore_index=True)
+            if len(directivity_dfs) > 0
+            else pd.DataFrame(columns=["fault_id", "site_ix"] + DIRECTIVITY_COLUMNS)
+        )
 
-        srf_header = None
-        if isinstance(cur_fault_data, nhm.NHMFault):
-            srf_header, srf_points = nhm.get_fault_header_points(
-                faults[cur_fault_name]
-            )
-            srf_points = np.asarray(srf_points)
-        # Point source
-        else:
-            srf_points = np.asarray(
-                [
-                    [
-                        cur_fault_data["lon"],
-                        cur_fault_data["lat"],
-                        cur_fault_data["depth"],
-                    ]
-                ]
-            )
+    return distance_df, directivity_df
 
-        rrup, rjb = src_site_dist.calc_rrup_rjb(srf_points, stations)
 
-        too_far_mask = rjb > RJB_MAX_DIST
-        distances[index, :]["fault_id"] = index
-        distances[index, :]["rrup"][~too_far_mask] = rrup[~too_far_mask]
-        distances[index, :]["rjb"][~too_far_mask] = rjb[~too_far_mask]
-        distances[index, :]["rtvz"] = float("nan")
+def _init_stations(stations: np.ndarray):
+    global _stations, _site_tree
+    _stations = stations
+    _site_tree = site_source_distances.LocationTree(stations[:, 0], stations[:, 1])
 
-        if (
-            calculate_directivity
-            and cur_fault_data.tectonic_type in DIR_SUPPORTED_TECTONIC_TYPYES
-        ):
-            n_hypo_data = gc.directivity.NHypoData(
-                gc.constants.HypoMethod.latin_hypercube, nhypo=100
-            )
-            fd, _, phi_red = gc.directivity.compute_fault_directivity(
-                srf_points,
-                srf_header,
-                stations[~too_far_mask, :2],
-                n_hypo_data,
-                cur_fault_data.mw,
-                cur_fault_data.rake,
-                n_procs=n_procs,
-            )
 
-            directivity[index, ~too_far_mask, :31] = fd
-            directivity[index, ~too_far_mask, 31:] = phi_red
+def _compute_fault_distances(
+    fault_id: int,
+    fault: nhm.NHMFault,
+    calculate_directivity: bool,
+):
+    """Computes the distances (and directivity) for a single finite fault,
+    only stations within RJB_MAX_DIST of the fault extent are considered
+
+    The directivity is computed using a single process, as
+    the faults are already processed in parallel"""
+    print(f"Processing fault {fault.name}")
+    srf_header, srf_points = nhm.get_fault_header_points(fault)
+    srf_points = np.asarray(srf_points)
+
+    # Candidate stations, within RJB_MAX_DIST of the
+    # circle (around the centre) that contains the fault
+    centre_lon, centre_lat = np.mean(srf_points[:, 0]), np.mean(srf_points[:, 1])
+    fault_radius = np.max(
+        gc.utils.great_circle_dist(
+            centre_lon, centre_lat, srf_points[:, 0], srf_points[:, 1]
+        )
+    )
+    site_ix = np.sort(
+        _site_tree.query(centre_lon, centre_lat, RJB_MAX_DIST + fault_radius)[0]
+    )
 
-        if srf_header is not None:
-            (
-                distances[index, :]["rx"][~too_far_mask],
-                distances[index, :]["ry"][~too_far_mask],
-            ) = src_site_dist.calc_rx_ry(
-                srf_points, srf_header, stations[~too_far_mask], type=2
-            )
-        else:
-            # Set Rx/Ry to rrup for point sources
-            distances[index, :]["rx"][~too_far_mask] = rrup[~too_far_mask]
-            distances[index, :]["ry"][~too_far_mask] = rrup[~too_far_mask]
+    if site_ix.size > 0:
+        rrup, rjb = src_site_dist.calc_rrup_rjb(srf_points, _stations[site_ix])
+        mask = rjb <= RJB_MAX_DIST
+        site_ix, rrup, rjb = site_ix[mask], rrup[mask], rjb[mask]
 
-    return distances, directivity
+    if site_ix.size == 0:
+        return None, None
+
+    rx, ry = src_site_dist.calc_rx_ry(
+        srf_points, srf_header, _stations[site_ix], type=2
+    )
+    distance_df = pd.DataFrame(
+        {
+            "fault_id": fault_id,
+            "site_ix": site_ix,
+            "rjb": rjb,
+            "rrup": rrup,
+            "rx": rx,
+            "ry": ry,
+            "rtvz": np.nan,
+        }
+    )
+
+    directivity_df = None
+    if calculate_directivity and fault.tectonic_type in DIR_SUPPORTED_TECTONIC_TYPYES:
+        n_hypo_data = gc.directivity.NHypoData(
+            gc.constants.HypoMethod.latin_hypercube, nhypo=100
+        )
+        fd, _, phi_red = gc.directivity.compute_fault_directivity(
+            srf_points,
+            srf_header,
+            _stations[site_ix, :2],
+            n_hypo_data,
+            fault.mw,
+            fault.rake,
+            n_procs=1,
+        )
+        directivity_df = pd.DataFrame(
+            np.concatenate((fd, phi_red), axis=1), columns=DIRECTIVITY_COLUMNS
+        )
+        directivity_df.insert(0, "site_ix", site_ix)
+        directivity_df.insert(0, "fault_id", fault_id)
+
+    return distance_df, directivity_df
 
 
 def load_args():
@@ -164,8 +237,8 @@ def load_args():
     )
     parser.add_argument(
         "--n_procs",
-        help="Number of processes to use for the directivity calculation, "
-        "does not affect distance calculation as it uses numba (uses all available cores)",
+        help="Number of processes to use, the faults are processed in parallel "
+        "(in blocks), with a single process for the directivity of each fault",
         type=int,
         default=4,
     )
@@ -192,30 +265,34 @@ def load_args():
 
 
 def store_site_sources_distance_data(
-    distances: np.ndarray, stations: pd.DataFrame, ssddb: gc.dbs.SiteSourceDB
+    distance_df: pd.DataFrame, stations: pd.DataFrame, ssddb: gc.dbs.SiteSourceDB
 ):
     with ssddb as ssd:
-        for index, station_name in enumerate(stations.index):
-            station_mask = distances[:, index]["rjb"] != STATION_TOO_FAR_KEY
-            if np.sum(station_mask) > 0:
-                station_frame = pd.DataFrame(distances[:, index][station_mask])
-                ssd.write_site_distances_data(station_name, station_frame)
+        site_source_distances.write_station_distances(
+            ssd, distance_df, stations.index.values
+        )
 
 
 def store_site_sources_directivity_data(
-    directivity: np.ndarray, stations: pd.DataFrame, ssddb: gc.dbs.SiteSourceDB
+    directivity_df: pd.DataFrame,
+    n_faults: int,
+    stations: pd.DataFrame,
+    ssddb: gc.dbs.SiteSourceDB,
 ):
+    directivity_df = directivity_df.sort_values("site_ix", kind="stable")
+    site_ix = directivity_df["site_ix"].values.astype(int)
     with ssddb as ssd:
         for index, station_name in enumerate(stations.index):
-            station_frame = pd.DataFrame(
-                directivity[:, index],
-                columns=[
-                    str(gc.im.IM(gc.im.IMType.pSA, period)) + mu_sigma
-                    for mu_sigma in ["", "_sigma"]
-                    for period in gc.im.DEFAULT_PSA_PERIODS
-                ],
+            # Directivity is 0 for all faults without directivity data
+            directivity = np.zeros((n_faults, len(DIRECTIVITY_COLUMNS)))
+            start, end = np.searchsorted(site_ix, [index, index + 1])
+            directivity[
+                directivity_df["fault_id"].values[start:end].astype(int)
+            ] = directivity_df[DIRECTIVITY_COLUMNS].values[start:end]
+
+            ssd.write_site_directivity_data(
+                station_name, pd.DataFrame(directivity, columns=DIRECTIVITY_COLUMNS)
             )
-            ssd.write_site_directivity_data(station_name, station_frame)
 
 
 def main():
@@ -259,6 +336,7 @@ def main():
             .loc[:, ("lon", "lat", "depth")]
             .to_dict("index"),
             calculate_directivity=False,
+            n_procs=args.n_procs,
         )
 
         fault_df = fault_df["fault_name"].to_frame()
@@ -275,7 +353,9 @@ def main():
 
     store_site_sources_distance_data(site_source_distance_data, stations, ssddb)
     if directivity_data is not None:
-        store_site_sources_directivity_data(directivity_data, stations, ssddb)
+        store_site_sources_directivity_data(
+            directivity_data, fault_df.shape[0], stations, ssddb
+        )
 
 
 if __name__ == "__main__":
@@ -4,28 +4,17 @@
 Writes to multiple empirical DB depending on the config
 """
 import argparse
-import math
-import time
-import threading
+import functools
+from pathlib import Path
+from typing import Dict, Sequence
 
-from mpi4py import MPI
 import pandas as pd
 
 import gmhazard_calc as sc
 import common
+import scheduler
 from empirical.util import empirical_factory
 
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
-hostname = MPI.Get_processor_name()
-master = 0
-is_master = not rank
-
-if size < 2:
-    print("This script is required to run with MPI and have n_procs >= 2")
-    exit()
-
 
 def calculate_ds(
     background_sources_ffp,
@@ -37,6 +26,9 @@ def calculate_ds(
     output_dir,
     model_dict_ffp,
     suffix=None,
+    n_procs: int = 1,
+    chunk_size: int = scheduler.CHUNK_SIZE,
+    ledger_ffp: str = None,
 ):
     """
     Calculate Empirical values for every site-fault pairing in the provided site_source_db.
@@ -45,137 +37,104 @@ def calculate_ds(
 
     Saves all IM values (median and sigma) for all ims specified to the imdb_path in pandas h5 format
 
+    If the run is interrupted, then running it again (with the same arguments)
+    resumes at the first unfinished chunk of sites, see scheduler.py
+
     :return: None
     """
-    imdb_dict = {}
-    wait_time = 0.0
-    nhm_data, rupture_df = None, None
-    if is_master:
-        nhm_data = sc.utils.ds_nhm_to_rup_df(background_sources_ffp)
-        rupture_df = pd.DataFrame(nhm_data["rupture_name"])
-        imdb_dict, stations_calculated = common.open_imdbs(
-            model_dict_ffp,
-            output_dir,
-            sc.constants.SourceType.distributed,
-            suffix=suffix,
-        )
-    nhm_data = comm.bcast(nhm_data, root=master)
-    rupture_df = comm.bcast(rupture_df, root=master)
-    imdb_dict_copy = comm.bcast({key: None for key in imdb_dict.keys()}, root=master)
+    nhm_data = sc.utils.ds_nhm_to_rup_df(background_sources_ffp)
+    rupture_df = pd.DataFrame(nhm_data["rupture_name"])
+    imdb_dict, _ = common.open_imdbs(
+        model_dict_ffp,
+        output_dir,
+        sc.constants.SourceType.distributed,
+        suffix=suffix,
+    )
     model_dict = empirical_factory.read_model_dict(model_dict_ffp)
 
     with sc.dbs.SiteSourceDB(site_source_db_ffp) as distance_store:
-        fault_df = None
-        if is_master:
-            # For DS, master is getting all of the work and then distributing it to slaves. Hence why size is 1.
-            fault_df, n_stations, site_df, work = common.get_work(
-                distance_store, vs30_ffp, z_ffp, rank, 1, stations_calculated
-            )
-        fault_df = comm.bcast(fault_df, root=master)
-
-        status = MPI.Status()
-        if is_master:
-            nslaves = size - 1
-            n_rows = len(work)
-            print(f"{n_rows} stations to compute")
-
-            # Determine number of MP processes to use per site
-            n_mp_proc = math.ceil(size / n_rows) if size > n_rows else 1
-            print(f"Using {n_mp_proc} MP processes per station")
-
-            i = 0
-            results = []
-            writer = threading.Thread(
-                None, print, "writer", ("Writer thread started")
-            )  # create the thread object to check if it is running below
-            while nslaves:
-                value, station_name = comm.recv(source=MPI.ANY_SOURCE, status=status)
-                slave_id = status.Get_source()
-
-                # next job - gives work before storing data
-                if i < n_rows:
-                    msg = (i, n_rows, work.iloc[i], n_mp_proc)
-                    comm.send(obj=msg, dest=slave_id)
-                    i += 1
-                else:
-                    comm.send(obj=StopIteration, dest=slave_id)
-                    nslaves -= 1
-
-                if station_name is None:
-                    print(f"Rank {slave_id} asking for work")
-                else:
-                    print(f"Received site {station_name} from {slave_id}")
-                    results.append((value, imdb_dict, station_name))
-                    if not writer.is_alive():
-                        writer = threading.Thread(
-                            None, write_results_to_db, "writer", (results,)
-                        )
-                        writer.start()
-                        results = []
-            if len(results) > 0:
-                write_results_to_db(results)
-            writer.join()
-            print("all done")
-        else:
-            value = (None, None)
-            s_time = time.perf_counter()
-            for i, n_rows, site, n_mp_proc in iter(
-                lambda: comm.sendrecv(value, dest=master), StopIteration
-            ):
-                comm_time = time.perf_counter() - s_time
-                wait_time += comm_time
-                if distance_store.has_station_data(site.name):
-                    print(
-                        f"Processing site {i + 1} / {n_rows} - Rank: {rank} - {hostname} - waited for {comm_time:.2f}s"
-                    )
-                    max_dist = common.get_max_dist_zfac_scaled(site)
-                    value = (
-                        common.calculate_emp_site(
-                            ims,
-                            psa_periods,
-                            imdb_dict_copy,
-                            fault_df,
-                            rupture_df,
-                            distance_store,
-                            nhm_data,
-                            site.vs30,
-                            site.z1p0 if hasattr(site, "z1p0") else None,
-                            site.z2p5 if hasattr(site, "z2p5") else None,
-                            site.name,
-                            model_dict,
-                            max_dist,
-                            dist_filter_by_mag=True,
-                            return_vals=True,
-                            n_procs=n_mp_proc,
-                            use_directivity=False,
-                        ),
-                        site.name,
-                    )
-                else:
-                    print(f"Skipping site {i} - Rank: {rank}")
-                print(f"total time for station: {time.perf_counter() - s_time:.2f}s")
-                s_time = time.perf_counter()
-            print(
-                f"rank: {rank} - {hostname} complete. Total time waited {wait_time:.2f}s"
-            )
-
-    if is_master:
-        common.write_metadata_and_close(
-            imdb_dict,
-            background_sources_ffp,
-            rupture_df,
-            site_df,
-            vs30_ffp,
-            psa_periods,
-            ims,
-            model_dict_ffp,
+        fault_df, n_stations, site_df, _ = common.get_work(
+            distance_store, vs30_ffp, z_ffp
         )
+    print(f"{n_stations} stations to compute")
+
+    scheduler.run_site_chunks(
+        functools.partial(
+            _process_sites,
+            site_source_db_ffp=site_source_db_ffp,
+            imdb_keys=list(imdb_dict.keys()),
+            fault_df=fault_df,
+            rupture_df=rupture_df,
+            nhm_data=nhm_data,
+            ims=ims,
+            psa_periods=psa_periods,
+            model_dict=model_dict,
+        ),
+        site_df,
+        {imdb_key: imdb.db_ffp for imdb_key, imdb in imdb_dict.items()},
+        sc.constants.SourceType.distributed,
+        Path(output_dir) / "ds_progress.ledger" if ledger_ffp is None else ledger_ffp,
+        chunk_size=chunk_size,
+        n_procs=n_procs,
+    )
+
+    common.write_metadata_and_close(
+        imdb_dict,
+        background_sources_ffp,
+        rupture_df,
+        site_df,
+        vs30_ffp,
+        psa_periods,
+        ims,
+        model_dict_ffp,
+    )
 
 
-def write_results_to_db(results):
-    for result in results:
-        print(f"Writing {result[2]}")
-        common.write_result_to_db(*result)
+def _process_sites(
+    site_df: pd.DataFrame,
+    site_source_db_ffp: str,
+    imdb_keys: Sequence[str],
+    fault_df: pd.DataFrame,
+    rupture_df: pd.DataFrame,
+    nhm_data: pd.DataFrame,
+    ims: Sequence[sc.im.IMType],
+    psa_periods: Sequence[float],
+    model_dict: Dict,
+):
+    results = []
+    with sc.dbs.SiteSourceDB(site_source_db_ffp) as distance_store:
+        for _, site in site_df.iterrows():
+            if not distance_store.has_station_data(site.name):
+                print(f"Skipping site {site.name}")
+                continue
+
+            max_dist = common.get_max_dist_zfac_scaled(site)
+            results.append(
+                (
+                    site.name,
+                    common.calculate_emp_site(
+                        ims,
+                        psa_periods,
+                        {imdb_key: None for imdb_key in imdb_keys},
+                        fault_df,
+                        rupture_df,
+                        distance_store,
+                        nhm_data,
+                        site.vs30,
+                        site.z1p0 if hasattr(site, "z1p0") else None,
+                        site.z2p5 if hasattr(site, "z2p5") else None,
+                        site.name,
+                        model_dict,
+                        max_dist,
+                        dist_filter_by_mag=True,
+                        return_vals=True,
+                        n_procs=1,
+                        use_directivity=False,
+                    ),
+                )
+            )
+
+    return results
 
 
 def parse_args():
@@ -207,15 +166,27 @@ def parse_args():
         help="suffix for the end of the imdb files",
         default=None,
     )
+    parser.add_argument(
+        "--n-procs", type=int, help="Number of processes to use", default=1
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Number of sites per work chunk",
+        default=scheduler.CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--ledger",
+        help="File path of the progress ledger, defaults to "
+        "ds_progress.ledger in the output directory",
+        default=None,
+    )
 
     return parser.parse_args()
 
 
 def calculate_emp_ds():
-    args = None
-    if is_master:
-        args = parse_args()
-    args = comm.bcast(args, root=master)
+    args = parse_args()
     calculate_ds(
         args.background_txt,
         args.site_source_db,
@@ -226,6 +197,9 @@ def calculate_emp_ds():
         args.output_dir,
         args.model_dict,
         suffix=args.suffix,
+        n_procs=args.n_procs,
+        chunk_size=args.chunk_size,
+        ledger_ffp=args.ledger,
     )
 
 
@@ -3,16 +3,16 @@
 
 Writes to multiple empirical DB depending on the config
 """
-import math
-import time
 import argparse
-import multiprocessing as mp
+import functools
+from pathlib import Path
 from typing import Dict, Sequence
 
 import numpy as np
 import pandas as pd
 
 import common
+import scheduler
 import gmhazard_calc as sc
 from empirical.util import empirical_factory
 
@@ -31,7 +31,15 @@ def calculate_flt(
     rupture_lookup=False,
     use_directivity: bool = True,
     n_procs: int = 1,
+    chunk_size: int = scheduler.CHUNK_SIZE,
+    ledger_ffp: str = None,
 ):
+    """
+    Calculates the empirical values for every site-fault pairing in the provided site_source_db
+
+    If the run is interrupted, then running it again (with the same arguments)
+    resumes at the first unfinished chunk of sites, see scheduler.py
+    """
     nhm_data = sc.utils.flt_nhm_to_rup_df(nhm_ffp)
 
     imdb_dict, __ = common.open_imdbs(
@@ -44,9 +52,7 @@ def calculate_flt(
     with sc.dbs.SiteSourceDB(site_source_db_ffp, writeable=False) as distance_store:
         distance_stations = np.asarray(distance_store.stored_stations())
 
-        fault_df, _, site_df, work = common.get_work(
-            distance_store, vs30_ffp, z_ffp, None, None
-        )
+        fault_df, _, site_df, _ = common.get_work(distance_store, vs30_ffp, z_ffp)
 
     # Drop stations for which there is no distance data
     site_df = site_df.loc[np.isin(site_df.index.values, distance_stations)]
@@ -57,56 +63,30 @@ def calculate_flt(
     rupture_df = fault_df.copy(deep=True)
     rupture_df.columns = ["rupture_name"]
 
-    # Process stations in batch of 1000 (and save in between)
-    for ix in range(math.ceil(n_stations / 1000)):
-        cur_site_df = site_df.iloc[(ix * 1000) : (ix + 1) * 1000]
-
-        start_time = time.time()
-        if n_procs == 1:
-            im_data = []
-            for _, cur_site in cur_site_df.iterrows():
-                im_data.append(
-                    _process_site(
-                        cur_site,
-                        site_source_db_ffp,
-                        fault_df,
-                        rupture_df,
-                        keep_sigma,
-                        ims,
-                        psa_periods,
-                        imdb_dict,
-                        nhm_data,
-                        tect_type_model_dict,
-                        use_directivity,
-                    )
-                )
-        else:
-            with mp.Pool(n_procs) as p:
-                im_data = p.starmap(
-                    _process_site,
-                    [
-                        (
-                            cur_site,
-                            site_source_db_ffp,
-                            fault_df,
-                            rupture_df,
-                            keep_sigma,
-                            ims,
-                            psa_periods,
-                            imdb_dict,
-                            nhm_data,
-                            tect_type_model_dict,
-                            use_directivity,
-                        )
-                        for _, cur_site in cur_site_df.iterrows()
-                    ],
-                )
-
-        print(
-            f"Computed data for sites {ix * 1000} - {(ix + 1) * 1000}, "
-            f"took {time.time() - start_time:.2f} seconds; writing to DB"
-        )
-        _write_result_to_db(im_data, imdb_dict)
+    # Process stations in chunks, where the GMMs are evaluated
+    # for all site-rupture pairs of a chunk at once
+    print(f"{n_stations} stations to compute")
+    scheduler.run_site_chunks(
+        functools.partial(
+            _process_sites,
+            site_source_db_ffp=site_source_db_ffp,
+            fault_df=fault_df,
+            rupture_df=rupture_df,
+            keep_sigma=keep_sigma,
+            ims=ims,
+            psa_periods=psa_periods,
+            imdb_keys=list(imdb_dict.keys()),
+            nhm_data=nhm_data,
+            tect_type_model_dict=tect_type_model_dict,
+            use_directivity=use_directivity,
+        ),
+        site_df,
+        {imdb_key: imdb.db_ffp for imdb_key, imdb in imdb_dict.items()},
+        sc.constants.SourceType.fault,
+        Path(output_dir) / "flt_progress.ledger" if ledger_ffp is None else ledger_ffp,
+        chunk_size=chunk_size,
+        n_procs=n_procs,
+    )
 
     common.write_metadata_and_close(
         imdb_dict,
@@ -121,56 +101,37 @@ def calculate_flt(
     )
 
 
-def _write_result_to_db(im_data, imdb_dict):
-    s_time = time.perf_counter()
-    for imdb_key in imdb_dict.keys():
-        imdb_dict[imdb_key].open()
-        for cur_site_name, cur_im_data in im_data:
-            cur_im_df = cur_im_data[imdb_key]
-            if not cur_im_df.empty:
-                imdb_dict[imdb_key].write_im_data(cur_site_name, cur_im_df)
-        imdb_dict[imdb_key].close()
-    print(f"Took {time.perf_counter() - s_time:.2f}s to write {len(im_data)} stations.")
-
-
-def _process_site(
-    site,
+def _process_sites(
+    site_df: pd.DataFrame,
     site_source_db_ffp: str,
     fault_df: pd.DataFrame,
     rupture_df: pd.DataFrame,
     keep_sigma: bool,
-    ims: Sequence[str],
+    ims: Sequence[sc.im.IMType],
     psa_periods,
-    imdb_dict,
+    imdb_keys: Sequence[str],
     nhm_data,
     tect_type_model_dict: Dict,
     use_directivity: bool,
 ):
     with sc.dbs.SiteSourceDB(site_source_db_ffp, writeable=False) as distance_store:
-        max_dist = common.get_max_dist_zfac_scaled(site)
-        print(f"Processing site {site.name}")
-        result = common.calculate_emp_site(
+        print(
+            f"Processing sites {site_df.index.values[0]} - {site_df.index.values[-1]}"
+        )
+        return common.calculate_emp_flt_sites(
             ims,
             psa_periods,
-            imdb_dict,
+            imdb_keys,
+            site_df,
             fault_df,
             rupture_df,
             distance_store,
             nhm_data,
-            site.vs30,
-            site.z1p0 if hasattr(site, "z1p0") else None,
-            site.z2p5 if hasattr(site, "z2p5") else None,
-            site.name,
             tect_type_model_dict,
-            max_dist,
             keep_sigma_components=keep_sigma,
             use_directivity=use_directivity,
-            n_procs=1,
-            return_vals=True,
         )
 
-        return site.name, result
-
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -218,6 +179,18 @@ def parse_args():
     parser.add_argument(
         "--n-procs", type=int, help="Number of processes to use", default=1
     )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Number of sites per work chunk",
+        default=scheduler.CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--ledger",
+        help="File path of the progress ledger, defaults to "
+        "flt_progress.ledger in the output directory",
+        default=None,
+    )
     parser.add_argument(
         "--no-directivity",
         action="store_true",
@@ -244,6 +217,8 @@ def calculate_emp_flt():
         rupture_lookup=args.rupture_lookup,
         n_procs=args.n_procs,
         use_directivity=not args.no_directivity,
+        chunk_size=args.chunk_size,
+        ledger_ffp=args.ledger,
     )
 
 
@@ -4,12 +4,13 @@ This file contains functions used by both calc_emp_ds.py and calculate_emp_flt.p
 import os
 import time
 import multiprocessing as mp
-from typing import List
+from typing import Dict, List, Sequence
 
 import numpy as np
 import pandas as pd
 
 from empirical.util import empirical_factory, classdef
+from empirical.util import openquake_wrapper_vectorized
 from empirical.util.classdef import Site, Fault
 from qcore import formats
 from gmhazard_calc.nz_code.nzs1170p5.nzs_zfactor_2016.ll2z import ll2z
@@ -42,6 +43,12 @@ MAG = [
 ]  # Definitions for the maximum magnitude / rjb relation
 DIST = [125, 150, 175, 200, 250, 300]
 
+# GMMs that only support active shallow when using the vectorised OQ wrapper
+ACTIVE_SHALLOW_ONLY_GMMS = ("CB_10", "CB_12", "AS_16")
+
+# Column prefix of the directivity adjustments in the rupture context dataframe
+DIRECTIVITY_PREFIX = "directivity_"
+
 
 def open_imdbs(model_dict_ffp, output_dir, source_type, suffix=None):
     """
@@ -71,18 +78,17 @@ def open_imdbs_from_list(item_list, output_dir, source_type, suffix=None):
     return imdb_dict, stations_calculated
 
 
-def get_work(distance_store, vs30_file, z_file, rank, size, stations_calculated=None):
+def get_work(distance_store, vs30_file, z_file, stations_calculated=None):
     """
 
-    :param stations_calculated:
     :param distance_store: A source_site_distance db object
     :param vs30_file: file containing lon, lat, vs30 value
     :param z_file: file containing station_name, z1.0, z2.5
-    :param rank: rank of MPI process
-    :param size: number of MPI processors running
+    :param stations_calculated: stations to exclude from the work
     :return: tuple containing (fault dataframe, number of stations, site dataframe, work)
     fault_dataframe: dataframe containing ids and fault_names
     site_dataframe: dataframe containing lat, lon, station_name and vs30 - includes Z values if file specified
+    work: site dataframe of the stations that still have to be computed
     """
     station_df = distance_store.stations()
     vs30_df = formats.load_vs30_file(vs30_file)
@@ -101,10 +107,7 @@ def get_work(distance_store, vs30_file, z_file, rank, size, stations_calculated=
     fault_df = distance_store.faults()
     fault_df["fault_name"] = fault_df["fault_name"].astype("category")
 
-    n_stations = len(site_to_do_df)
-    work = site_to_do_df[rank::size] if rank is not None and size is not None else None
-
-    return fault_df, n_stations, site_df, work
+    return fault_df, len(site_to_do_df), site_df, site_to_do_df
 
 
 def get_im_list(im_types, periods):
@@ -311,7 +314,7 @@ def calculate_emp_site(
     :param station_name: the stations name for the specific station
     :param tect_type_model_dict_ffp: the relation between tectonic type and which empirical model(s) to use
     :param return_vals: flag to return the values instead of writing them to the DB - specifically for the single
-                        writer MPI paradigm
+                        writer paradigm, see scheduler.py
     :param use_directivity: flag to apply the directivity effect to each of the fault calculations. Applies only on pSA
     :return: if return vals is set - a Dictionary of dataframes are returned
     """
@@ -398,6 +401,226 @@ def calculate_emp_site(
         write_result_to_db(im_result_df_dict, imdb_dict, station_name)
 
 
+def get_oq_tect_type(GMM: classdef.GMM, tect_type: str) -> classdef.TectType:
+    """Gets the tectonic type to use for the vectorised OQ wrapper"""
+    if tect_type != "ACTIVE_SHALLOW" and GMM.name in ACTIVE_SHALLOW_ONLY_GMMS:
+        return classdef.TectType["ACTIVE_SHALLOW"]
+    return classdef.TectType[tect_type]
+
+
+def relabel_oq_columns(
+    gmm_df: pd.DataFrame, keep_sigma_components: bool = False
+) -> pd.DataFrame:
+    """Relabels the columns of the vectorised OQ wrapper result to the IMDB
+    format and drops the columns that are not needed, i.e.
+    PGA_mean -> PGA, PGA_std_Total -> PGA_sigma
+    or if keep_sigma_components is set
+    PGA_std_Inter -> PGA_sigma_inter, PGA_std_Intra -> PGA_sigma_intra
+    """
+    columns = {
+        cur_col: cur_col[: -len("_mean")]
+        for cur_col in gmm_df.columns
+        if cur_col.endswith("_mean")
+    }
+    if keep_sigma_components:
+        columns.update(
+            {
+                cur_col: cur_col.replace("_std_Inter", "_sigma_inter")
+                for cur_col in gmm_df.columns
+                if cur_col.endswith("_std_Inter")
+            }
+        )
+        columns.update(
+            {
+                cur_col: cur_col.replace("_std_Intra", "_sigma_intra")
+                for cur_col in gmm_df.columns
+                if cur_col.endswith("_std_Intra")
+            }
+        )
+    else:
+        columns.update(
+            {
+                cur_col: cur_col.replace("_std_Total", "_sigma")
+                for cur_col in gmm_df.columns
+                if cur_col.endswith("_std_Total")
+            }
+        )
+
+    return gmm_df.loc[
+        :, [cur_col for cur_col in gmm_df.columns if cur_col in columns]
+    ].rename(columns=columns)
+
+
+def create_flt_rupture_context_df(
+    site_df: pd.DataFrame,
+    fault_df: pd.DataFrame,
+    distance_store: dbs.SiteSourceDB,
+    nhm_data: pd.DataFrame,
+    use_directivity: bool = True,
+):
+    """Creates the rupture context dataframe for the vectorised OQ wrapper
+    for all (site, rupture) pairs of the given sites, where the rjb is
+    less than the (z-factor scaled) maximum distance of the site
+
+    :param site_df: sites to process, index = station name, columns = [lon, lat, vs30, (z1p0, z2p5)]
+    :param fault_df: list of faults considered
+    :param distance_store: site source distance db
+    :param nhm_data: rupture dataframe returned from utils.flt_nhm_to_rup_df
+    :param use_directivity: flag to include the directivity adjustments as columns
+                            (with the DIRECTIVITY_PREFIX prefix), these are 0 for sites without directivity data
+    :return: Dataframe with one row per site & rupture, the station name is stored in the station column
+    """
+    distance_dfs = []
+    for station_name, site in site_df.iterrows():
+        distance_df = fault_df.merge(
+            distance_store.station_data(station_name),
+            left_on="fault_name",
+            right_index=True,
+        )
+        distance_df = distance_df.loc[
+            distance_df["rjb"].values < get_max_dist_zfac_scaled(site)
+        ]
+
+        if use_directivity:
+            dir_data = distance_store.station_directivity_data(station_name)
+            if dir_data is not None:
+                distance_df = distance_df.merge(
+                    dir_data.add_prefix(DIRECTIVITY_PREFIX),
+                    how="left",
+                    left_on="fault_name",
+                    right_index=True,
+                )
+
+        distance_df["station"] = station_name
+        distance_dfs.append(distance_df)
+
+    rupture_df = nhm_data.merge(
+        pd.concat(distance_dfs, ignore_index=True),
+        left_on="fault_name",
+        right_on="fault_name",
+    )
+    if use_directivity:
+        dir_columns = rupture_df.columns[
+            rupture_df.columns.str.startswith(DIRECTIVITY_PREFIX)
+        ]
+        rupture_df[dir_columns] = rupture_df[dir_columns].fillna(0)
+
+    # Site Parameters
+    rupture_df["vs30"] = site_df["vs30"].loc[rupture_df["station"]].values
+    rupture_df["vs30measured"] = False
+    for cur_site_col, cur_col in [("z1p0", "z1pt0"), ("z2p5", "z2pt5")]:
+        rupture_df[cur_col] = (
+            site_df[cur_site_col].loc[rupture_df["station"]].values
+            if cur_site_col in site_df.columns
+            else np.nan
+        )
+
+    # Rupture Parameters
+    # hypo_depth is set to dbot, same as for the non-vectorised calculation
+    rupture_df["hypo_depth"] = rupture_df["dbot"]
+    rupture_df[["ztor", "zbot"]] = rupture_df[["dtop", "dbot"]]
+
+    # Distance Parameter - OQ uses ry0 term
+    rupture_df[["rx", "ry0"]] = rupture_df[["rx", "ry"]].fillna(0)
+
+    return rupture_df
+
+
+def calculate_emp_flt_sites(
+    im_types: Sequence[IMType],
+    psa_periods: Sequence[float],
+    imdb_keys: Sequence[str],
+    site_df: pd.DataFrame,
+    fault_df: pd.DataFrame,
+    rupture_df: pd.DataFrame,
+    distance_store: dbs.SiteSourceDB,
+    nhm_data: pd.DataFrame,
+    tect_type_model_dict: Dict,
+    keep_sigma_components: bool = False,
+    use_directivity: bool = True,
+):
+    """
+    Calculates all empirical values for all ruptures in nhm_data for the given sites,
+    using the vectorised OQ wrapper, i.e. each GMM is evaluated for all (site, rupture)
+    pairs of the given sites at once
+
+    :param im_types: What ims to calculate
+    :param psa_periods: if pSA is specified what pSA periods to calculate
+    :param imdb_keys: keys of the imdb dictionary as returned by open_imdbs
+    :param site_df: sites to process, index = station name, columns = [lon, lat, vs30, (z1p0, z2p5)]
+    :param fault_df: list of faults considered
+    :param rupture_df: list of ruptures considered - these will be used as indexes for the data stored by each site
+    :param distance_store: site source distance db
+    :param nhm_data: rupture dataframe returned from utils.flt_nhm_to_rup_df
+    :param tect_type_model_dict: the relation between tectonic type and which empirical model(s) to use
+    :param keep_sigma_components: flag to keep sigma_inter and sigma_intra instead of sigma_total
+    :param use_directivity: flag to apply the directivity effect, applies only to pSA
+    :return: List of (station name, dictionary of IM dataframes per imdb key)
+    """
+    context_df = create_flt_rupture_context_df(
+        site_df, fault_df, distance_store, nhm_data, use_directivity=use_directivity
+    )
+    rupture_ids = pd.Series(
+        rupture_df.index.values, index=rupture_df["rupture_name"].values.astype(str)
+    )
+    context_df["rupture_id"] = rupture_ids.loc[
+        context_df["rupture_name"].values.astype(str)
+    ].values
+
+    im_result_dfs = {key: [] for key in imdb_keys}
+    for tect_type, cur_context_df in context_df.groupby("tect_type", observed=True):
+        for im_type in im_types:
+            GMMs = empirical_factory.determine_all_gmm(
+                Fault(tect_type=classdef.TectType[tect_type]),
+                str(im_type),
+                tect_type_model_dict,
+            )
+            for GMM, __comp in GMMs:
+                gmm_df = relabel_oq_columns(
+                    openquake_wrapper_vectorized.oq_run(
+                        GMM,
+                        get_oq_tect_type(GMM, tect_type),
+                        cur_context_df,
+                        str(im_type),
+                        psa_periods if im_type is IMType.pSA else None,
+                    ),
+                    keep_sigma_components=keep_sigma_components,
+                )
+                gmm_df.index = cur_context_df.index
+
+                if use_directivity and im_type is IMType.pSA:
+                    __apply_directivity(gmm_df, cur_context_df)
+
+                im_result_dfs[f"{GMM.name}_{tect_type}"].append(gmm_df)
+
+    # Split the results into the individual sites
+    station_im_result_dfs = {
+        station_name: {key: pd.DataFrame() for key in imdb_keys}
+        for station_name in site_df.index.values
+    }
+    for imdb_key, cur_dfs in im_result_dfs.items():
+        if len(cur_dfs) == 0:
+            continue
+
+        im_result_df = pd.concat(cur_dfs, axis=1)
+        stations = context_df["station"].loc[im_result_df.index].values
+        im_result_df.index = context_df["rupture_id"].loc[im_result_df.index].values
+        for station_name, cur_df in im_result_df.groupby(stations):
+            station_im_result_dfs[station_name][imdb_key] = cur_df
+
+    return list(station_im_result_dfs.items())
+
+
+def __apply_directivity(gmm_df: pd.DataFrame, context_df: pd.DataFrame):
+    """Adds the directivity adjustments to the pSA mean
+    and total sigma values (inplace), the sigma
+    components are not adjusted"""
+    for cur_col in gmm_df.columns:
+        dir_col = f"{DIRECTIVITY_PREFIX}{cur_col}"
+        if dir_col in context_df.columns:
+            gmm_df[cur_col] += context_df[dir_col].values
+
+
 def write_result_to_db(im_result_df_dict, imdb_dict, station_name):
     """
     Takes a dictionary of IM result dataframes and writes them to the IMDB that has the corresponding key in the IMDB
@@ -24,6 +24,9 @@ MAG = [
 ]  # Definitions for the maximum magnitude / rjb relation
 DIST = [125, 150, 175, 200, 250, 300]
 
+# Tectonic types for which no IMDBs are created
+SKIP_TECT_TYPES = ("SUBDUCTION_INTERFACE", "VOLCANIC")
+
 
 def create_rupture_context_df(
     distance_df: pd.DataFrame,
@@ -77,16 +80,15 @@ def calculate_emp_ds(
     model_dict_ffp: Optional[str],
     model_weights_ffp: Optional[str] = None,
     suffix: Optional[str] = None,
+    repack: bool = False,
+    writer_max_memory: int = gc.dbs.WRITER_MAX_MEMORY,
 ):
     nhm_data = gc.utils.ds_nhm_to_rup_df(background_sources_ffp)
     rupture_df = pd.DataFrame(nhm_data["rupture_name"])
     model_dict = empirical_factory.read_model_dict(model_dict_ffp)
 
     with gc.dbs.SiteSourceDB(site_source_db_ffp) as distance_store:
-        # TODO: simplify the get_work() - removing MPI
-        fault_df, _, site_df, _ = common.get_work(
-            distance_store, vs30_ffp, z_ffp, None, None
-        )
+        fault_df, _, site_df, _ = common.get_work(distance_store, vs30_ffp, z_ffp)
 
         # Check to see if any site's Z1.0 or Z2.5 is NaN
         if np.any(np.isnan(site_df.z1p0.values)):
@@ -98,33 +100,55 @@ def calculate_emp_ds(
         sites = site_df.index[np.isin(site_df.index, distance_store.stored_stations())]
 
         tect_types = list(model_dict.keys())
+        im_tect_gmms = {
+            (im, tect_type): empirical_factory.determine_all_gmm(
+                classdef.Fault(tect_type=classdef.TectType[tect_type]),
+                str(im),
+                model_dict,
+            )
+            for im in ims
+            for tect_type in tect_types
+        }
 
+        # Bulk writers for each IMDB, the IM data of a station
+        # is only written once all IMs have been computed,
+        # writer_max_memory is split across all writers
+        db_types = list(
+            dict.fromkeys(
+                f"{GMM.name}_{tect_type}"
+                for (_, tect_type), GMMs in im_tect_gmms.items()
+                if tect_type not in SKIP_TECT_TYPES
+                for GMM, _ in GMMs
+            )
+        )
+        imdb_writers = {
+            db_type: gc.dbs.IMDBWriter(
+                gc.dbs.IMDBParametric(
+                    str(
+                        Path(output_dir)
+                        / gc.utils.create_parametric_db_name(
+                            db_type, gc.constants.SourceType.distributed, suffix
+                        )
+                    ),
+                    writeable=True,
+                    source_type=gc.constants.SourceType.distributed,
+                ),
+                max_memory=writer_max_memory // max(len(db_types), 1),
+            )
+            for db_type in db_types
+        }
         for im_idx, im in enumerate(ims):
             print(f"Processing IM: {im}, {im_idx + 1} / {len(ims)}")
             for tect_idx, tect_type in enumerate(tect_types):
                 print(
                     f"Processing Tectonic Type: {tect_type}, {tect_idx + 1} / {len(tect_types)}"
                 )
-                GMMs = empirical_factory.determine_all_gmm(
-                    classdef.Fault(tect_type=classdef.TectType[tect_type]),
-                    str(im),
-                    model_dict,
-                )
+                GMMs = im_tect_gmms[(im, tect_type)]
                 for GMM_idx, (GMM, _) in enumerate(GMMs):
                     db_type = f"{GMM.name}_{tect_type}"
-                    # Create a DB if not exists
-                    imdb = gc.dbs.IMDBParametric(
-                        str(
-                            Path(output_dir)
-                            / gc.utils.create_parametric_db_name(
-                                db_type, gc.constants.SourceType.distributed, suffix
-                            )
-                        ),
-                        writeable=True,
-                        source_type=gc.constants.SourceType.distributed,
-                    )
-                    if tect_type in ("SUBDUCTION_INTERFACE", "VOLCANIC"):
+                    if tect_type in SKIP_TECT_TYPES:
                         continue
+                    imdb_writer = imdb_writers[db_type]
                     print(
                         f"Processing Model: {GMM.name} for {tect_type}, {GMM_idx + 1} / {len(GMMs)}"
                     )
@@ -141,78 +165,75 @@ def calculate_emp_ds(
                             classdef.GMM[model]: weight
                             for model, weight in meta_GMMs.items()
                         }
-                    with imdb as imdb:
-                        for site in sites:
-                            rupture_context_df = create_rupture_context_df(
-                                fault_df.merge(
-                                    distance_store.station_data(site),
-                                    left_on="fault_name",
-                                    right_index=True,
-                                ),
-                                site_df.loc[site],
-                                nhm_data,
-                                classdef.TectType[tect_type],
-                            )
+                    for site in sites:
+                        rupture_context_df = create_rupture_context_df(
+                            fault_df.merge(
+                                distance_store.station_data(site),
+                                left_on="fault_name",
+                                right_index=True,
+                            ),
+                            site_df.loc[site],
+                            nhm_data,
+                            classdef.TectType[tect_type],
+                        )
 
-                            gmm_calculated_df = openquake_wrapper_vectorized.oq_run(
-                                GMM,
-                                classdef.TectType["ACTIVE_SHALLOW"]
-                                if tect_type != "ACTIVE_SHALLOW"
-                                and GMM.name
-                                in (
-                                    "CB_10",
-                                    "CB_12",
-                                    "AS_16",
+                        gmm_calculated_df = openquake_wrapper_vectorized.oq_run(
+                            GMM,
+                            common.get_oq_tect_type(GMM, tect_type),
+                            rupture_context_df,
+                            str(im),
+                            psa_periods if im is gc.im.IMType.pSA else None,
+                            meta_config=meta_GMMs,
+                        )
+                        # Matching the index with rupture_df
+                        # to have a right rupture label
+                        gmm_calculated_df.set_index(
+                            rupture_df[
+                                rupture_df["rupture_name"].isin(
+                                    rupture_context_df["rupture_name"]
                                 )
-                                else classdef.TectType[tect_type],
-                                rupture_context_df,
-                                str(im),
-                                psa_periods if im is gc.im.IMType.pSA else None,
-                                meta_config=meta_GMMs,
-                            )
-                            # Matching the index with rupture_df
-                            # to have a right rupture label
-                            gmm_calculated_df.set_index(
-                                rupture_df[
-                                    rupture_df["rupture_name"].isin(
-                                        rupture_context_df["rupture_name"]
-                                    )
-                                ].index,
-                                inplace=True,
-                            )
+                            ].index,
+                            inplace=True,
+                        )
 
-                            # Relabel the columns
-                            # PGA_mean -> PGA
-                            gmm_calculated_df.columns = np.char.rstrip(
-                                gmm_calculated_df.columns.values.astype(str),
-                                "_mean",
-                            )
-                            # PGA_std_Total -> PGA_sigma
-                            gmm_calculated_df.columns = np.char.replace(
-                                gmm_calculated_df.columns.values.astype(str),
-                                "_std_Total",
-                                "_sigma",
-                            )
-                            # Write an im_df to the given station/site
-                            imdb.add_im_data(
-                                site,
-                                gmm_calculated_df.loc[
-                                    :,
-                                    # Only mean and sigma(std_Total) are needed
-                                    ~gmm_calculated_df.columns.str.contains("_std"),
-                                ],
-                            )
+                        # Relabel the columns
+                        # PGA_mean -> PGA
+                        gmm_calculated_df.columns = np.char.rstrip(
+                            gmm_calculated_df.columns.values.astype(str),
+                            "_mean",
+                        )
+                        # PGA_std_Total -> PGA_sigma
+                        gmm_calculated_df.columns = np.char.replace(
+                            gmm_calculated_df.columns.values.astype(str),
+                            "_std_Total",
+                            "_sigma",
+                        )
+                        # Add the im_df for the given station/site
+                        imdb_writer.add_im_data(
+                            site,
+                            gmm_calculated_df.loc[
+                                :,
+                                # Only mean and sigma(std_Total) are needed
+                                ~gmm_calculated_df.columns.str.contains("_std"),
+                            ],
+                        )
 
-                    print(f"Writing metadata for Model: {GMM.name}")
-                    common.write_metadata(
-                        imdb,
-                        site_df,
-                        background_sources_ffp,
-                        vs30_ffp,
-                        rupture_df,
-                        common.curate_im_list(model_dict, db_type, psa_periods),
-                    )
-                    print(f"Writing metadata for Model: {GMM.name} is done.")
+        # The metadata is written first, so that the
+        # repack (if enabled) also covers the metadata
+        for db_type, imdb_writer in imdb_writers.items():
+            print(f"Writing metadata for {db_type}")
+            common.write_metadata(
+                imdb_writer.imdb,
+                site_df,
+                background_sources_ffp,
+                vs30_ffp,
+                rupture_df,
+                common.curate_im_list(model_dict, db_type, psa_periods),
+            )
+
+            print(f"Writing IM data for {db_type}")
+            imdb_writer.finalise(repack=repack)
+            print(f"Writing IM data for {db_type} is done.")
 
 
 def parse_args():
@@ -252,6 +273,12 @@ def parse_args():
         help="suffix for the end of the imdb files",
         default=None,
     )
+    parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="Repack the IMDBs once all data has been written",
+        default=False,
+    )
 
     return parser.parse_args()
 
@@ -270,5 +297,6 @@ if __name__ == "__main__":
         model_dict_ffp=args.model_dict,
         model_weights_ffp=args.model_weights,
         suffix=args.suffix,
+        repack=args.repack,
     )
     print(f"Finished in {(time.time() - start) / 60:.2f} minutes")
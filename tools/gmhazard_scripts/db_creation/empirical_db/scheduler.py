@@ -0,0 +1,270 @@
+"""
+Single node work scheduler used by the empirical DB scripts
+
+The sites are split into chunks (work units), which are processed by a pool
+of worker processes. The results are written by a single dedicated writer
+process per IMDB and a chunk is only recorded as finished in the progress
+ledger once all writers have written it, so an interrupted run can be
+resumed by running the same command again.
+"""
+import os
+import queue
+import hashlib
+import multiprocessing as mp
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import constants as const
+from gmhazard_calc import dbs
+
+# Default number of sites per work chunk
+CHUNK_SIZE = 100
+
+# Maximum number of chunks queued per writer
+WRITER_QUEUE_SIZE = 8
+
+# Interval (in seconds) for checking that the writers are still alive
+WRITER_CHECK_INTERVAL = 10
+
+# (station name, {imdb key: IM dataframe}) pairs of a chunk
+ChunkResult = List[Tuple[str, Dict[str, pd.DataFrame]]]
+
+_process_fn = None
+
+
+class ProgressLedger:
+    """Persisted record of the finished chunks of a run
+
+    The first line of the ledger file is the run id, which identifies the
+    work (i.e. the sites and the chunk size), followed by one line per
+    finished chunk. Lines are only appended (and synced to disk), so the
+    ledger stays valid if the run is interrupted at any point.
+
+    Parameters
+    ----------
+    ledger_ffp: Path
+    run_id: str
+        Identifier of the run, see get_run_id
+    """
+
+    def __init__(self, ledger_ffp: Path, run_id: str):
+        self.ledger_ffp = Path(ledger_ffp)
+        self.run_id = run_id
+
+        self._finished = set()
+        if self.ledger_ffp.exists():
+            with open(self.ledger_ffp, "r") as f:
+                lines = f.read().splitlines()
+
+            if lines[0] != run_id:
+                raise ValueError(
+                    f"The progress ledger {self.ledger_ffp} belongs to a different "
+                    f"run (i.e. different sites or chunk size), delete it to "
+                    f"start a new run"
+                )
+            self._finished = {int(cur_line) for cur_line in lines[1:] if cur_line}
+        else:
+            self._append(run_id)
+
+    @property
+    def n_finished(self) -> int:
+        return len(self._finished)
+
+    def is_finished(self, chunk_id: int) -> bool:
+        return chunk_id in self._finished
+
+    def mark_finished(self, chunk_id: int):
+        self._append(str(chunk_id))
+        self._finished.add(chunk_id)
+
+    def _append(self, line: str):
+        with open(self.ledger_ffp, "a") as f:
+            f.write(f"{line}\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def get_run_id(site_names: Sequence[str], chunk_size: int) -> str:
+    """Creates the run id for the specified sites and chunk size"""
+    run_hash = hashlib.sha256(str(chunk_size).encode())
+    for cur_name in site_names:
+        run_hash.update(f"|{cur_name}".encode())
+    return run_hash.hexdigest()
+
+
+def get_site_chunks(site_names: Sequence[str], chunk_size: int) -> List[np.ndarray]:
+    """Splits the sites into chunks of the specified size"""
+    site_names = np.asarray(site_names)
+    return [
+        site_names[ix : ix + chunk_size] for ix in range(0, site_names.size, chunk_size)
+    ]
+
+
+def run_site_chunks(
+    process_fn: Callable[[pd.DataFrame], ChunkResult],
+    site_df: pd.DataFrame,
+    imdb_ffps: Dict[str, str],
+    source_type: const.SourceType,
+    ledger_ffp: Path,
+    chunk_size: int = CHUNK_SIZE,
+    n_procs: int = 1,
+):
+    """
+    Processes the sites in chunks and writes the results to the IMDBs,
+    chunks that are already recorded as finished in the ledger are skipped
+
+    :param process_fn: Function that computes the IM data for a chunk of sites, takes the
+                       site dataframe of the chunk and returns a list of
+                       (station name, {imdb key: IM dataframe}) pairs. Has to be picklable
+                       (i.e. a module level function or a functools.partial of one)
+    :param site_df: The sites to process, index = station name
+    :param imdb_ffps: The file paths of the IMDBs, keys have to match the keys of the process_fn result
+    :param source_type: Source type of the IMDBs
+    :param ledger_ffp: File path of the progress ledger
+    :param chunk_size: Number of sites per chunk
+    :param n_procs: Number of worker processes
+    """
+    chunks = get_site_chunks(site_df.index.values, chunk_size)
+    ledger = ProgressLedger(ledger_ffp, get_run_id(site_df.index.values, chunk_size))
+    chunk_ids = [ix for ix in range(len(chunks)) if not ledger.is_finished(ix)]
+
+    print(
+        f"{len(chunks)} chunks of {chunk_size} sites, {ledger.n_finished} "
+        f"already finished, {len(chunk_ids)} to compute"
+    )
+    if len(chunk_ids) == 0:
+        return
+
+    done_queue = mp.Queue()
+    writers = {}
+    for imdb_key, imdb_ffp in imdb_ffps.items():
+        cur_queue = mp.Queue(maxsize=WRITER_QUEUE_SIZE)
+        cur_writer = mp.Process(
+            target=_write_chunks,
+            args=(imdb_key, imdb_ffp, source_type, cur_queue, done_queue),
+            daemon=True,
+        )
+        cur_writer.start()
+        writers[imdb_key] = (cur_queue, cur_writer)
+
+    # Writers that still have to write the chunk, per chunk
+    pending = {}
+    try:
+        try:
+            with mp.Pool(
+                n_procs, initializer=_init_worker, initargs=(process_fn,)
+            ) as pool:
+                for chunk_id, result in pool.imap_unordered(
+                    _process_chunk,
+                    [(ix, site_df.loc[chunks[ix]]) for ix in chunk_ids],
+                ):
+                    print(f"Computed chunk {chunk_id + 1} / {len(chunks)}")
+                    pending[chunk_id] = set(writers.keys())
+                    for imdb_key, (cur_queue, cur_writer) in writers.items():
+                        _put_writer(
+                            imdb_key,
+                            cur_queue,
+                            cur_writer,
+                            (
+                                chunk_id,
+                                [
+                                    (station_name, im_dfs[imdb_key])
+                                    for station_name, im_dfs in result
+                                ],
+                            ),
+                        )
+                    _collect_finished(
+                        done_queue, pending, ledger, writers, block=False
+                    )
+        finally:
+            # Let the writers finish the chunks that have already been
+            # computed, also if the computation of a chunk failed
+            for imdb_key, (cur_queue, cur_writer) in writers.items():
+                _put_writer(imdb_key, cur_queue, cur_writer, None)
+            while pending:
+                _collect_finished(done_queue, pending, ledger, writers, block=True)
+            for _, cur_writer in writers.values():
+                cur_writer.join()
+    finally:
+        for _, cur_writer in writers.values():
+            if cur_writer.is_alive():
+                cur_writer.terminate()
+
+
+def _put_writer(
+    imdb_key: str, writer_queue: mp.Queue, writer: mp.Process, item: Any
+):
+    """Puts the item into the (bounded) queue of the writer, raises an
+    error if the writer exits while waiting for space in the queue"""
+    while True:
+        try:
+            writer_queue.put(item, timeout=WRITER_CHECK_INTERVAL)
+            return
+        except queue.Full:
+            if writer.exitcode is not None:
+                raise RuntimeError(f"The writer process for {imdb_key} failed")
+
+
+def _collect_finished(
+    done_queue: mp.Queue,
+    pending: Dict[int, set],
+    ledger: ProgressLedger,
+    writers: Dict[str, Tuple[mp.Queue, mp.Process]],
+    block: bool,
+):
+    """Records the chunks that have been written by all writers in the ledger"""
+    while True:
+        try:
+            chunk_id, imdb_key = done_queue.get(
+                block=block, timeout=WRITER_CHECK_INTERVAL if block else None
+            )
+        except queue.Empty:
+            failed = [
+                imdb_key
+                for imdb_key, (_, cur_writer) in writers.items()
+                if cur_writer.exitcode not in (None, 0)
+            ]
+            if failed:
+                raise RuntimeError(f"The writer process for {failed} failed")
+            if block:
+                continue
+            return
+
+        pending[chunk_id].remove(imdb_key)
+        if len(pending[chunk_id]) == 0:
+            del pending[chunk_id]
+            ledger.mark_finished(chunk_id)
+        if block:
+            return
+
+
+def _init_worker(process_fn: Callable[[pd.DataFrame], ChunkResult]):
+    global _process_fn
+    _process_fn = process_fn
+
+
+def _process_chunk(args: Tuple[int, pd.DataFrame]):
+    chunk_id, site_df = args
+    return chunk_id, _process_fn(site_df)
+
+
+def _write_chunks(
+    imdb_key: str,
+    imdb_ffp: str,
+    source_type: const.SourceType,
+    in_queue: mp.Queue,
+    done_queue: mp.Queue,
+):
+    """Writer process, writes the IM data of all stations
+    of a chunk to the IMDB and then reports the chunk as done"""
+    imdb = dbs.IMDBParametric(imdb_ffp, source_type=source_type, writeable=True)
+    with imdb:
+        for chunk_id, station_im_dfs in iter(in_queue.get, None):
+            for station_name, im_df in station_im_dfs:
+                if not im_df.empty:
+                    imdb.write_im_data(station_name, im_df)
+            imdb.flush()
+            done_queue.put((chunk_id, imdb_key))
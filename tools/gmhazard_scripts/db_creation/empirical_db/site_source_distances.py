@@ -0,0 +1,242 @@
+"""
+Vectorised site-source distance calculation used by the site-source DB scripts
+
+Locations within a distance of another location are found using a KD-tree
+(on earth-centred cartesian coordinates, where the chord length is monotonic
+in the great circle distance), the exact distances are then only computed
+for these site-source pairs.
+"""
+import collections
+import multiprocessing as mp
+from typing import List, Iterator
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from qcore import geo
+
+import gmhazard_calc as gc
+
+# Default number of sites per block
+SITE_BLOCK_SIZE = 500
+
+# Tolerance (km) added to the distance when querying a location tree
+QUERY_TOLERANCE = 1e-3
+
+# Columns of the site-source distance data, see SiteSourceDB.write_site_distances_data
+DISTANCE_COLUMNS = ["fault_id", "rjb", "rrup", "rx", "ry", "rtvz"]
+
+_source_tree, _source_depth = None, None
+
+
+class LocationTree:
+    """KD-tree of locations, for finding all locations
+    within a great circle distance of another location
+
+    Parameters
+    ----------
+    lon, lat: array of floats
+    """
+
+    def __init__(self, lon: np.ndarray, lat: np.ndarray):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self._tree = cKDTree(gc.utils.lon_lat_to_xyz(self.lon, self.lat))
+
+    def query(
+        self, lon: np.ndarray, lat: np.ndarray, max_dist: float
+    ) -> List[np.ndarray]:
+        """Gets the indices of the locations within max_dist (km)
+        of each of the given locations"""
+        return [
+            np.asarray(cur_ix, dtype=np.int64)
+            for cur_ix in self._tree.query_ball_point(
+                gc.utils.lon_lat_to_xyz(lon, lat),
+                2 * geo.R_EARTH * np.sin(min(max_dist / (2 * geo.R_EARTH), np.pi / 2)),
+                return_sorted=False,
+            )
+        ]
+
+
+def iter_point_source_distances(
+    source_df: pd.DataFrame,
+    site_df: pd.DataFrame,
+    max_rjb: float,
+    n_procs: int = 1,
+    block_size: int = SITE_BLOCK_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """
+    Computes the rjb and rrup for all site-source pairs with rjb <= max_rjb,
+    the sites are processed in blocks (which can be run in parallel),
+    and the distances are returned per block, i.e. only the distances
+    of a limited number of blocks are held in memory at any time
+
+    Parameters
+    ----------
+    source_df: pd.DataFrame
+        The point sources, format: columns = [lon, lat, depth]
+        The position (i.e. row number) of a source is used as fault_id
+    site_df: pd.DataFrame
+        The sites, format: columns = [lon, lat]
+    max_rjb: float
+        Maximum rjb distance (km)
+    n_procs: int, optional
+        Number of processes to use
+    block_size: int, optional
+        Number of sites per block
+
+    Yields
+    ------
+    pd.DataFrame
+        The distances of a block of sites (in site order),
+        format: columns = [fault_id, site_ix, rjb, rrup],
+        where site_ix is the position of the site in the site_df,
+        sorted by site_ix and fault_id
+    """
+    source_values = source_df.loc[:, ["lon", "lat", "depth"]].values.astype(np.float64)
+    site_values = site_df.loc[:, ["lon", "lat"]].values.astype(np.float64)
+    blocks = [
+        (ix, site_values[ix : ix + block_size], max_rjb)
+        for ix in range(0, site_values.shape[0], block_size)
+    ]
+
+    if n_procs == 1:
+        _init_source_tree(source_values)
+        for cur_block in blocks:
+            yield _compute_block_distances(*cur_block)
+    else:
+        with mp.Pool(
+            n_procs, initializer=_init_source_tree, initargs=(source_values,)
+        ) as p:
+            # Only n_procs blocks are computed ahead of the consumer
+            block_results = collections.deque(
+                p.apply_async(_compute_block_distances, cur_block)
+                for cur_block in blocks[:n_procs]
+            )
+            for ix in range(len(blocks)):
+                cur_distance_df = block_results.popleft().get()
+                if ix + n_procs < len(blocks):
+                    block_results.append(
+                        p.apply_async(_compute_block_distances, blocks[ix + n_procs])
+                    )
+                yield cur_distance_df
+
+
+def compute_point_source_distances(
+    source_df: pd.DataFrame,
+    site_df: pd.DataFrame,
+    max_rjb: float,
+    n_procs: int = 1,
+    block_size: int = SITE_BLOCK_SIZE,
+) -> pd.DataFrame:
+    """
+    Computes the rjb and rrup for all site-source pairs with rjb <= max_rjb,
+    as a single dataframe, for a large number of site-source pairs
+    use iter_point_source_distances instead
+
+    See iter_point_source_distances for the parameters
+
+    Returns
+    -------
+    pd.DataFrame
+        format: columns = [fault_id, site_ix, rjb, rrup],
+        sorted by site_ix and fault_id
+    """
+    return pd.concat(
+        list(
+            iter_point_source_distances(
+                source_df, site_df, max_rjb, n_procs=n_procs, block_size=block_size
+            )
+        ),
+        ignore_index=True,
+    )
+
+
+def iter_station_distances(distance_df: pd.DataFrame, site_names: np.ndarray):
+    """Splits the site-source distances into the individual
+    stations in the SiteSourceDB format, stations without
+    any sources are skipped
+
+    Parameters
+    ----------
+    distance_df: pd.DataFrame
+        The distances, format: columns = [fault_id, site_ix, rjb, rrup, (rx, ry, rtvz)]
+        has to be sorted by site_ix, missing distance columns are set to nan
+    site_names: array of strings
+        The station names, in the site_ix order
+
+    Yields
+    ------
+    str, pd.DataFrame
+        The station name and the distance
+        data, columns = DISTANCE_COLUMNS
+    """
+    distance_df = distance_df.reindex(
+        columns=DISTANCE_COLUMNS + ["site_ix"], fill_value=np.nan
+    )
+    site_ix = distance_df["site_ix"].values
+    split_ix = np.flatnonzero(np.diff(site_ix)) + 1
+    for cur_start, cur_end in zip(
+        np.concatenate(([0], split_ix)), np.concatenate((split_ix, [site_ix.size]))
+    ):
+        if cur_end > cur_start:
+            yield site_names[site_ix[cur_start]], distance_df.iloc[
+                cur_start:cur_end
+            ].loc[:, DISTANCE_COLUMNS].reset_index(drop=True)
+
+
+def write_station_distances(
+    ssd: gc.dbs.SiteSourceDB, distance_df: pd.DataFrame, site_names: np.ndarray
+):
+    """Writes the site-source distances of all
+    stations into the (open) SiteSourceDB
+
+    See iter_station_distances for the parameters
+    """
+    for station_name, station_df in iter_station_distances(distance_df, site_names):
+        ssd.write_site_distances_data(station_name, station_df)
+
+
+def _init_source_tree(source_values: np.ndarray):
+    global _source_tree, _source_depth
+    _source_tree = LocationTree(source_values[:, 0], source_values[:, 1])
+    _source_depth = source_values[:, 2]
+
+
+def _compute_block_distances(
+    block_start: int, site_values: np.ndarray, max_rjb: float
+) -> pd.DataFrame:
+    """Computes the distances for a block of sites, using the source tree
+    of the current process, see iter_point_source_distances"""
+    source_ix = _source_tree.query(
+        site_values[:, 0], site_values[:, 1], max_rjb + QUERY_TOLERANCE
+    )
+    site_ix = np.repeat(
+        np.arange(site_values.shape[0]), [cur_ix.size for cur_ix in source_ix]
+    )
+    source_ix = (
+        np.concatenate(source_ix) if len(source_ix) > 0 else np.zeros(0, np.int64)
+    )
+
+    rjb = gc.utils.great_circle_dist(
+        site_values[site_ix, 0],
+        site_values[site_ix, 1],
+        _source_tree.lon[source_ix],
+        _source_tree.lat[source_ix],
+    )
+
+    # Apply the cutoff on the actual distance, as the tree query
+    # is done with a tolerance for floating point differences
+    mask = rjb <= max_rjb
+    site_ix, source_ix, rjb = site_ix[mask], source_ix[mask], rjb[mask]
+
+    sort_ind = np.lexsort((source_ix, site_ix))
+    site_ix, source_ix, rjb = site_ix[sort_ind], source_ix[sort_ind], rjb[sort_ind]
+    return pd.DataFrame(
+        {
+            "fault_id": source_ix,
+            "site_ix": site_ix + block_start,
+            "rjb": rjb,
+            "rrup": np.sqrt(rjb ** 2 + _source_depth[source_ix] ** 2),
+        }
+    )
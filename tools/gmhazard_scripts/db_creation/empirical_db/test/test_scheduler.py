@@ -0,0 +1,226 @@
+"""Work scheduler tests, these use a synthetic process function and small IMDBs"""
+import sys
+import queue
+import functools
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+from gmhazard_calc import constants as const
+
+# The empirical DB scripts import the scheduler as top-level module
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import scheduler
+
+STATIONS = np.asarray([f"station_{ix}" for ix in range(10)])
+IMDB_KEYS = ["model_a", "model_b"]
+CHUNK_SIZE = 3
+N_RUPTURES = 5
+
+
+def _get_im_df(station_name: str, imdb_key: str) -> pd.DataFrame:
+    """The IM data of the station, the same for each call"""
+    rng = np.random.default_rng(
+        [int(station_name.split("_")[-1]), IMDB_KEYS.index(imdb_key)]
+    )
+    return pd.DataFrame(
+        rng.uniform(size=(N_RUPTURES, 2)),
+        index=np.arange(N_RUPTURES),
+        columns=["PGA", "PGA_sigma"],
+    )
+
+
+def _process_sites(site_df: pd.DataFrame, calls_dir: str):
+    """Records the processed chunk and computes the IM data of its sites"""
+    (Path(calls_dir) / site_df.index.values[0]).touch()
+    return [
+        (
+            cur_station,
+            {cur_key: _get_im_df(cur_station, cur_key) for cur_key in IMDB_KEYS},
+        )
+        for cur_station in site_df.index.values
+    ]
+
+
+def _get_processed_chunks(calls_dir: Path):
+    """The ids of the chunks processed since the last call"""
+    chunk_ids = []
+    for cur_ffp in calls_dir.iterdir():
+        chunk_ids.append(int(np.flatnonzero(STATIONS == cur_ffp.name)[0]) // CHUNK_SIZE)
+        cur_ffp.unlink()
+    return sorted(chunk_ids)
+
+
+def _check_imdbs(imdb_ffps: dict, chunk_ids: list):
+    """Checks that the IMDBs contain the data of the stations of the chunks"""
+    expected_stations = np.concatenate(
+        [STATIONS[ix * CHUNK_SIZE : (ix + 1) * CHUNK_SIZE] for ix in chunk_ids]
+    )
+    for cur_key, cur_ffp in imdb_ffps.items():
+        with pd.HDFStore(cur_ffp, mode="r") as store:
+            stations = [
+                cur_path.replace("/im_data/station_", "", 1)
+                for cur_path in store.keys()
+                if cur_path.startswith("/im_data/")
+            ]
+            assert sorted(stations) == sorted(expected_stations)
+            for cur_station in stations:
+                pd.testing.assert_frame_equal(
+                    store[dbs.IMDB.get_im_data_path(cur_station)],
+                    _get_im_df(cur_station, cur_key),
+                )
+
+
+@pytest.fixture
+def site_df():
+    return pd.DataFrame(
+        {"lon": np.linspace(172, 173, STATIONS.size), "lat": -43.5}, index=STATIONS
+    )
+
+
+@pytest.fixture
+def run_args(tmp_path):
+    calls_dir = tmp_path / "calls"
+    calls_dir.mkdir()
+    return SimpleNamespace(
+        calls_dir=calls_dir,
+        process_fn=functools.partial(_process_sites, calls_dir=str(calls_dir)),
+        imdb_ffps={cur_key: str(tmp_path / f"{cur_key}.db") for cur_key in IMDB_KEYS},
+        ledger_ffp=tmp_path / "progress.ledger",
+    )
+
+
+def _run(run_args, site_df: pd.DataFrame, n_procs: int = 2):
+    scheduler.run_site_chunks(
+        run_args.process_fn,
+        site_df,
+        run_args.imdb_ffps,
+        const.SourceType.distributed,
+        run_args.ledger_ffp,
+        chunk_size=CHUNK_SIZE,
+        n_procs=n_procs,
+    )
+
+
+def test_ledger(tmp_path):
+    ledger_ffp = tmp_path / "progress.ledger"
+    run_id = scheduler.get_run_id(STATIONS, CHUNK_SIZE)
+
+    ledger = scheduler.ProgressLedger(ledger_ffp, run_id)
+    assert ledger.n_finished == 0
+    ledger.mark_finished(2)
+    ledger.mark_finished(0)
+
+    ledger = scheduler.ProgressLedger(ledger_ffp, run_id)
+    assert ledger.n_finished == 2
+    assert ledger.is_finished(0) and ledger.is_finished(2)
+    assert not ledger.is_finished(1)
+
+    # Different sites or chunk size
+    for cur_run_id in [
+        scheduler.get_run_id(STATIONS[:-1], CHUNK_SIZE),
+        scheduler.get_run_id(STATIONS, CHUNK_SIZE + 1),
+    ]:
+        assert cur_run_id != run_id
+        with pytest.raises(ValueError):
+            scheduler.ProgressLedger(ledger_ffp, cur_run_id)
+
+
+def test_run_site_chunks(run_args, site_df):
+    n_chunks = len(scheduler.get_site_chunks(STATIONS, CHUNK_SIZE))
+    assert n_chunks == 4
+
+    # Resume a run where some of the chunks are already finished
+    ledger = scheduler.ProgressLedger(
+        run_args.ledger_ffp, scheduler.get_run_id(STATIONS, CHUNK_SIZE)
+    )
+    ledger.mark_finished(0)
+    ledger.mark_finished(2)
+
+    _run(run_args, site_df)
+    assert _get_processed_chunks(run_args.calls_dir) == [1, 3]
+    _check_imdbs(run_args.imdb_ffps, [1, 3])
+
+    ledger = scheduler.ProgressLedger(
+        run_args.ledger_ffp, scheduler.get_run_id(STATIONS, CHUNK_SIZE)
+    )
+    assert ledger.n_finished == n_chunks
+
+    # Nothing left to do
+    _run(run_args, site_df)
+    assert _get_processed_chunks(run_args.calls_dir) == []
+    _check_imdbs(run_args.imdb_ffps, [1, 3])
+
+    # A run with different sites is rejected
+    with pytest.raises(ValueError):
+        _run(run_args, site_df.iloc[:-1])
+
+
+@pytest.mark.parametrize("queue_size", [scheduler.WRITER_QUEUE_SIZE, 1])
+def test_run_site_chunks_writer_failure(
+    run_args, site_df, tmp_path, monkeypatch, queue_size
+):
+    """A failed writer results in an error, also if its queue is full,
+    and no chunk is recorded as finished"""
+    monkeypatch.setattr(scheduler, "WRITER_CHECK_INTERVAL", 0.1)
+    monkeypatch.setattr(scheduler, "WRITER_QUEUE_SIZE", queue_size)
+    run_args.imdb_ffps[IMDB_KEYS[1]] = str(tmp_path / "missing_dir" / "model_b.db")
+
+    with pytest.raises(RuntimeError):
+        _run(run_args, site_df)
+
+    ledger = scheduler.ProgressLedger(
+        run_args.ledger_ffp, scheduler.get_run_id(STATIONS, CHUNK_SIZE)
+    )
+    assert ledger.n_finished == 0
+
+
+def _get_writers(exitcodes: dict):
+    return {
+        cur_key: (None, SimpleNamespace(exitcode=cur_exitcode))
+        for cur_key, cur_exitcode in exitcodes.items()
+    }
+
+
+def test_collect_finished(tmp_path):
+    """A chunk is only finished once all writers have written it"""
+    ledger = scheduler.ProgressLedger(tmp_path / "progress.ledger", "test")
+    writers = _get_writers({cur_key: None for cur_key in IMDB_KEYS})
+    done_queue = queue.Queue()
+    pending = {0: set(IMDB_KEYS), 1: set(IMDB_KEYS)}
+
+    done_queue.put((1, IMDB_KEYS[0]))
+    done_queue.put((0, IMDB_KEYS[1]))
+    scheduler._collect_finished(done_queue, pending, ledger, writers, block=False)
+    assert ledger.n_finished == 0
+    assert pending == {0: {IMDB_KEYS[0]}, 1: {IMDB_KEYS[1]}}
+
+    done_queue.put((1, IMDB_KEYS[1]))
+    scheduler._collect_finished(done_queue, pending, ledger, writers, block=True)
+    assert ledger.is_finished(1) and not ledger.is_finished(0)
+    assert pending == {0: {IMDB_KEYS[0]}}
+
+    # Finished writers are fine
+    writers = _get_writers({IMDB_KEYS[0]: None, IMDB_KEYS[1]: 0})
+    scheduler._collect_finished(done_queue, pending, ledger, writers, block=False)
+    assert pending == {0: {IMDB_KEYS[0]}}
+
+
+@pytest.mark.parametrize("block", [True, False])
+def test_collect_finished_writer_failure(tmp_path, monkeypatch, block):
+    """A failed writer raises an error, instead of waiting for its chunks"""
+    monkeypatch.setattr(scheduler, "WRITER_CHECK_INTERVAL", 0.1)
+    ledger = scheduler.ProgressLedger(tmp_path / "progress.ledger", "test")
+    writers = _get_writers({IMDB_KEYS[0]: None, IMDB_KEYS[1]: 1})
+    done_queue = queue.Queue()
+    pending = {0: set(IMDB_KEYS)}
+
+    done_queue.put((0, IMDB_KEYS[0]))
+    scheduler._collect_finished(done_queue, pending, ledger, writers, block=True)
+    with pytest.raises(RuntimeError):
+        scheduler._collect_finished(done_queue, pending, ledger, writers, block=block)
+    assert ledger.n_finished == 0
@@ -0,0 +1,110 @@
+"""Site-source distance tests, these compare against a brute-force calculation"""
+import sys
+from pathlib import Path
+
+import pytest
+import numpy as np
+import pandas as pd
+
+import gmhazard_calc as gc
+
+# The empirical DB scripts import the module as top-level module
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import site_source_distances
+
+MAX_RJB = 100.0
+
+
+@pytest.fixture
+def source_site_dfs():
+    rng = np.random.default_rng(0)
+    source_df = pd.DataFrame(
+        {
+            "lon": rng.uniform(170.0, 175.0, 300),
+            "lat": rng.uniform(-45.0, -40.0, 300),
+            "depth": rng.uniform(0.0, 30.0, 300),
+        }
+    )
+    site_df = pd.DataFrame(
+        {"lon": rng.uniform(170.0, 175.0, 50), "lat": rng.uniform(-45.0, -40.0, 50)},
+        index=[f"site_{ix}" for ix in range(50)],
+    )
+    return source_df, site_df
+
+
+def _get_expected_distances(source_df: pd.DataFrame, site_df: pd.DataFrame):
+    rjb = gc.utils.great_circle_dist(
+        site_df["lon"].values[:, np.newaxis],
+        site_df["lat"].values[:, np.newaxis],
+        source_df["lon"].values,
+        source_df["lat"].values,
+    )
+    site_ix, fault_id = np.nonzero(rjb <= MAX_RJB)
+    return pd.DataFrame(
+        {
+            "fault_id": fault_id,
+            "site_ix": site_ix,
+            "rjb": rjb[site_ix, fault_id],
+            "rrup": np.sqrt(
+                rjb[site_ix, fault_id] ** 2 + source_df["depth"].values[fault_id] ** 2
+            ),
+        }
+    )
+
+
+@pytest.mark.parametrize(["n_procs", "block_size"], [(1, 7), (2, 7), (1, 1000)])
+def test_iter_point_source_distances(source_site_dfs, n_procs, block_size):
+    source_df, site_df = source_site_dfs
+    distance_dfs = list(
+        site_source_distances.iter_point_source_distances(
+            source_df, site_df, MAX_RJB, n_procs=n_procs, block_size=block_size
+        )
+    )
+
+    # One dataframe per block of sites
+    assert len(distance_dfs) == int(np.ceil(site_df.shape[0] / block_size))
+    for ix, cur_distance_df in enumerate(distance_dfs):
+        assert np.all(cur_distance_df["site_ix"].values // block_size == ix)
+
+    distance_df = pd.concat(distance_dfs, ignore_index=True)
+    expected_df = _get_expected_distances(source_df, site_df)
+    assert expected_df.shape[0] > 0
+    pd.testing.assert_frame_equal(distance_df, expected_df, check_dtype=False)
+
+
+def test_write_station_distances(source_site_dfs, tmp_path):
+    source_df, site_df = source_site_dfs
+    expected_df = _get_expected_distances(source_df, site_df)
+
+    with gc.dbs.SiteSourceDB(
+        str(tmp_path / "site_source.db"),
+        gc.constants.SourceType.distributed.value,
+        writeable=True,
+    ) as ssd:
+        ssd.write_fault_data(
+            pd.DataFrame(
+                {"fault_name": [f"source_{ix}" for ix in range(source_df.shape[0])]}
+            )
+        )
+        for cur_distance_df in site_source_distances.iter_point_source_distances(
+            source_df, site_df, MAX_RJB, block_size=7
+        ):
+            site_source_distances.write_station_distances(
+                ssd, cur_distance_df, site_df.index.values
+            )
+        ssd.write_attributes("background.txt", "stations.ll")
+
+    with gc.dbs.SiteSourceDB(str(tmp_path / "site_source.db")) as ssd:
+        for site_ix, site_name in enumerate(site_df.index.values):
+            cur_expected_df = expected_df.loc[expected_df["site_ix"] == site_ix]
+            if cur_expected_df.shape[0] == 0:
+                continue
+            station_df = ssd.station_data(site_name)
+            assert np.array_equal(
+                station_df.index.values,
+                [f"source_{ix}" for ix in cur_expected_df["fault_id"].values],
+            )
+            assert np.allclose(
+                station_df["rrup"].values, cur_expected_df["rrup"].values
+            )
+            assert np.all(np.isnan(station_df["rtvz"].values))
@@ -0,0 +1,203 @@
+"""IM csv to IMDB conversion tests, these use small synthetic IM csv files"""
+import re
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from gmhazard_calc import dbs
+
+# The DB creation scripts are not part of a package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import im_csv_to_imdb
+
+STATIONS = np.asarray([f"STAT{ix:02d}" for ix in range(12)])
+IMS = ["PGA", "PGV", "pSA_1.0"]
+COMPONENTS = ["090", "rotd50", "000"]
+SIMULATIONS = [
+    f"{cur_fault}_REL{rel_ix:02d}"
+    for cur_fault in ["FaultB", "FaultA", "FaultC"]
+    for rel_ix in range(1, 4)
+]
+
+# The original partition assembly, see _assemble_partition
+ASSEMBLE_PARTITION = im_csv_to_imdb._assemble_partition
+
+
+@pytest.fixture
+def im_csvs(tmp_path):
+    """IM csv files, where each simulation only has data for a subset of the
+    stations, also contain stations that are not in the station list
+
+    Returns
+    -------
+    list of strings
+        The IM csv files
+    dictionary
+        The expected IM data per station, index = simulation name
+    """
+    rng = np.random.default_rng(0)
+
+    # The last station has no data
+    with open(tmp_path / "stations.ll", "w") as f:
+        f.writelines(
+            f"{172.0 + 0.1 * ix:.1f} -43.5 {cur_station}\n"
+            for ix, cur_station in enumerate(STATIONS)
+        )
+
+    csv_ffps, station_dfs = [], []
+    for cur_sim in SIMULATIONS:
+        cur_stations = np.sort(
+            rng.choice(STATIONS[:-1], STATIONS.size - 4, replace=False)
+        )
+        cur_stations = np.concatenate((cur_stations, ["STAT05A", "UNKNOWN"]))
+        df = pd.DataFrame(
+            {
+                "station": np.repeat(cur_stations, len(COMPONENTS)),
+                "component": np.tile(COMPONENTS, cur_stations.size),
+                **{
+                    cur_im: rng.uniform(size=cur_stations.size * len(COMPONENTS))
+                    for cur_im in IMS
+                },
+            }
+        )
+        # Random row order
+        df = df.iloc[rng.permutation(df.shape[0])]
+
+        csv_ffp = tmp_path / "IM" / cur_sim.split("_")[0] / cur_sim / f"{cur_sim}.csv"
+        csv_ffp.parent.mkdir(parents=True)
+        df.to_csv(csv_ffp, index=False)
+        csv_ffps.append(str(csv_ffp))
+
+        # The IM values as parsed from the csv file
+        df = pd.read_csv(csv_ffp, dtype={"station": str, "component": str})
+
+        df = df.loc[(df.component == "rotd50") & df.station.isin(STATIONS)]
+        station_dfs.append(df.drop(columns="component").assign(simulation=cur_sim))
+
+    station_df = pd.concat(station_dfs)
+    expected_im_data = {
+        cur_station: cur_df.set_index("simulation").drop(columns="station").sort_index()
+        for cur_station, cur_df in station_df.groupby("station")
+    }
+    return csv_ffps, expected_im_data
+
+
+def _check_imdb(imdb_ffp: str, expected_im_data: dict, im_names: list):
+    with dbs.IMDB.get_imdb(imdb_ffp) as imdb:
+        simulations = imdb.simulations()
+        assert np.array_equal(simulations.values, np.sort(SIMULATIONS))
+        assert np.array_equal(imdb.ims, im_names)
+        assert sorted(imdb.get_stored_stations()) == sorted(expected_im_data.keys())
+
+        for cur_station, cur_expected_df in expected_im_data.items():
+            im_df = imdb._db[imdb.get_im_data_path(cur_station)]
+            assert im_df.index.is_monotonic_increasing
+            im_df.index = simulations.loc[im_df.index].values
+            pd.testing.assert_frame_equal(
+                im_df,
+                cur_expected_df.loc[:, im_names],
+                check_names=False,
+                check_column_type=False,
+                check_index_type=False,
+            )
+
+        # Rupture lookup
+        fault_stations = {}
+        for cur_station, cur_df in expected_im_data.items():
+            for cur_fault in np.unique(
+                [cur_sim.split("_")[0] for cur_sim in cur_df.index]
+            ):
+                fault_stations.setdefault(cur_fault, []).append(cur_station)
+
+        assert sorted(imdb.rupture_names()) == sorted(fault_stations.keys())
+        for cur_fault, cur_stations in fault_stations.items():
+            assert sorted(imdb.rupture_stations(cur_fault)) == sorted(cur_stations)
+
+            rupture_df = imdb.rupture_data(cur_fault)
+            for cur_station in cur_stations:
+                cur_expected_df = expected_im_data[cur_station]
+                cur_expected_df = cur_expected_df.loc[
+                    cur_expected_df.index.str.startswith(f"{cur_fault}_")
+                ]
+                assert np.array_equal(
+                    rupture_df.loc[cur_station].values,
+                    cur_expected_df.loc[:, im_names].values,
+                )
+
+
+@pytest.mark.parametrize(
+    ["im_names", "partition_memory"],
+    [(None, 1), (None, im_csv_to_imdb.PARTITION_MEMORY), (["pSA_1.0", "PGA"], 1)],
+)
+def test_run(im_csvs, tmp_path, monkeypatch, capsys, im_names, partition_memory):
+    csv_ffps, expected_im_data = im_csvs
+    monkeypatch.setattr(im_csv_to_imdb, "CSV_BATCH_SIZE", 4)
+
+    imdb_ffp = tmp_path / "test.db"
+    im_csv_to_imdb.run(
+        np.asarray(csv_ffps),
+        str(tmp_path / "stations.ll"),
+        str(imdb_ffp),
+        2,
+        2,
+        "rotd50",
+        im_names=None if im_names is None else np.asarray(im_names),
+        partition_memory=partition_memory,
+    )
+
+    # Multiple partitions and read batches
+    output = capsys.readouterr().out
+    assert int(re.search(r"using (\d+) partitions", output).group(1)) > 1
+    assert "Read batch 3/3" in output
+
+    _check_imdb(str(imdb_ffp), expected_im_data, IMS if im_names is None else im_names)
+
+    # The partition files are removed
+    assert list(tmp_path.glob(".imdb_partitions_*")) == []
+
+
+def _assemble_partition(args):
+    """Records the start of the assembly of the partition"""
+    partition_dir, _ = args
+    Path(partition_dir).with_name(f"assembled_{Path(partition_dir).name}").touch()
+    return ASSEMBLE_PARTITION(args)
+
+
+def test_run_bounded_partitions(im_csvs, tmp_path, monkeypatch):
+    """At most n_procs partitions are assembled ahead of the writing"""
+    csv_ffps, expected_im_data = im_csvs
+    n_procs = 2
+    monkeypatch.setattr(im_csv_to_imdb, "_assemble_partition", _assemble_partition)
+
+    # Slow writing, one flush per partition
+    n_assembled = []
+    flush = dbs.IMDBNonParametric.flush
+
+    def slow_flush(self):
+        time.sleep(0.05)
+        n_assembled.append(len(list(tmp_path.glob(".imdb_partitions_*/assembled_*"))))
+        return flush(self)
+
+    monkeypatch.setattr(dbs.IMDBNonParametric, "flush", slow_flush)
+
+    imdb_ffp = tmp_path / "test.db"
+    im_csv_to_imdb.run(
+        np.asarray(csv_ffps),
+        str(tmp_path / "stations.ll"),
+        str(imdb_ffp),
+        n_procs,
+        n_procs,
+        "rotd50",
+        partition_memory=1,
+    )
+
+    assert len(n_assembled) == STATIONS.size
+    assert all(
+        cur_n_assembled <= ix + 1 + n_procs
+        for ix, cur_n_assembled in enumerate(n_assembled)
+    )
+    _check_imdb(str(imdb_ffp), expected_im_data, IMS)
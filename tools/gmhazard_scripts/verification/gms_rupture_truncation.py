@@ -0,0 +1,128 @@
+#!/bin/env python3
+"""Benchmark script for the GMS rupture contribution truncation,
+runs GMS for a set of rupture contribution thresholds and compares the
+runtime and the GCIMs against the GMS without any rupture truncation
+"""
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import gmhazard_calc as sc
+from gmhazard_calc.im import IM, to_im_list
+from gmhazard_calc.gms.GCIMResult import IMEnsembleUniGCIM
+
+DEFAULT_THRESHOLDS = [0.9, 0.99, 0.999, 0.9999]
+
+
+def run_gms(args, ensemble, site_info, gm_dataset, IMs, threshold: float = None):
+    start_time = time.time()
+    gms_result = sc.gms.run_ensemble_gms(
+        ensemble,
+        site_info,
+        args.n_gms,
+        IM.from_str(args.IMj),
+        gm_dataset,
+        IMs,
+        exceedance=args.exceedance,
+        n_replica=args.n_replica,
+        rupture_contribution_threshold=threshold,
+        # Same seed for every run, so that only the truncation affects the results
+        seed=args.seed,
+    )
+    return gms_result, time.time() - start_time
+
+
+def max_cdf_diff(gcim: IMEnsembleUniGCIM, ref_gcim: IMEnsembleUniGCIM):
+    """Maximum absolute difference between the lnIMi|IMj CDFs (i.e. KS distance)"""
+    ref_cdf = ref_gcim.lnIMi_IMj.cdf
+    return np.max(
+        np.abs(
+            np.interp(
+                ref_cdf.index.values,
+                gcim.lnIMi_IMj.cdf.index.values,
+                gcim.lnIMi_IMj.cdf.values,
+                left=0.0,
+                right=1.0,
+            )
+            - ref_cdf.values
+        )
+    )
+
+
+def main(args):
+    ensemble = sc.gm_data.Ensemble(args.ensemble_id)
+    site_info = sc.site.get_site_from_name(ensemble, args.station_name)
+    gm_dataset = sc.gms.GMDataset.get_GMDataset(args.gm_dataset_id)
+
+    # Can only use IMs that are supported by the GM dataset
+    IMs = np.asarray(ensemble.ims if args.IMs is None else to_im_list(args.IMs))
+    IMs = IMs[np.isin(IMs, gm_dataset.ims)]
+
+    ref_result, ref_runtime = run_gms(args, ensemble, site_info, gm_dataset, IMs)
+    print(f"No truncation - Runtime {ref_runtime:.2f}s")
+
+    results = [
+        dict(threshold=1.0, runtime=ref_runtime, neglected_contribution=0.0)
+        | {str(IMi): 0.0 for IMi in ref_result.IMs}
+    ]
+    for cur_threshold in args.thresholds:
+        cur_result, cur_runtime = run_gms(
+            args, ensemble, site_info, gm_dataset, IMs, threshold=cur_threshold
+        )
+        results.append(
+            dict(
+                threshold=cur_threshold,
+                runtime=cur_runtime,
+                neglected_contribution=cur_result.neglected_rupture_contribution,
+            )
+            | {
+                str(IMi): max_cdf_diff(
+                    cur_result.IMi_gcims[IMi], ref_result.IMi_gcims[IMi]
+                )
+                for IMi in ref_result.IMs
+            }
+        )
+        print(
+            f"Threshold {cur_threshold} - Runtime {cur_runtime:.2f}s - "
+            f"Neglected contribution {cur_result.neglected_rupture_contribution:.2e}"
+        )
+
+    # Runtime and maximum GCIM CDF difference (per IMi) for each threshold
+    result_df = pd.DataFrame(results).set_index("threshold")
+    print(result_df.to_string())
+
+    if args.output_ffp is not None:
+        result_df.to_csv(args.output_ffp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("ensemble_id", type=str, help="The ensemble to use")
+    parser.add_argument("station_name", type=str, help="The station of interest")
+    parser.add_argument("IMj", type=str, help="The conditioning IM")
+    parser.add_argument("exceedance", type=float, help="The exceedance value")
+    parser.add_argument("gm_dataset_id", type=str, help="The GM dataset to use")
+    parser.add_argument(
+        "--IMs", type=str, nargs="+", help="The IM vector, defaults to all IMs"
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        help="The rupture contribution thresholds to test",
+        default=DEFAULT_THRESHOLDS,
+    )
+    parser.add_argument("--n_gms", type=int, help="Number of GMs", default=10)
+    parser.add_argument("--n_replica", type=int, help="Number of replica", default=10)
+    parser.add_argument("--seed", type=int, help="The random seed", default=1)
+    parser.add_argument(
+        "--output_ffp", type=Path, help="Path of the result csv file", default=None
+    )
+
+    args = parser.parse_args()
+
+    main(args)
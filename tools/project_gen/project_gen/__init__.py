@@ -7,3 +7,10 @@ from .project import (
 )
 from .gms import gen_gms_project_data
 from .utils import get_site_infos
+from .result_index import (
+    write_result_index,
+    write_project_result_indices,
+    load_result_index,
+    get_index_version,
+    get_result_names,
+)
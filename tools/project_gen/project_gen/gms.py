@@ -8,6 +8,7 @@ import numpy as np
 
 import gmhazard_calc as gc
 from . import utils
+from . import result_index
 
 
 def process_station_gms_config_comb(
@@ -63,6 +64,7 @@ def process_station_gms_config_comb(
         disagg_output_dir = output_dir / f"gms_{gms_id}" / "disagg_data"
         disagg_output_dir.mkdir(exist_ok=True, parents=True)
         disagg_data.save(disagg_output_dir)
+        disagg_data.save_binary(disagg_output_dir)
 
         # Retrieve the default causal filter parameters
         cs_param_bounds = gc.gms.default_causal_params(
@@ -83,7 +85,7 @@ def process_station_gms_config_comb(
 
     # Run the GM selection
     try:
-        gc.gms.run_ensemble_gms(
+        gms_result = gc.gms.run_ensemble_gms(
             ensemble,
             site_info,
             n_gms,
@@ -95,7 +97,9 @@ def process_station_gms_config_comb(
             exceedance=exceedance,
             n_replica=n_replica,
             gms_id=gms_id,
-        ).save(output_dir, gms_id)
+        )
+        gms_result.save(output_dir, gms_id)
+        gms_result.save_binary(output_dir, gms_id)
     # Require additional exceedance error handling here, as it is possible to run
     # fine for disagg, but get an exceedance error here.
     # This is due to the fact that disagg uses mean hazard,
@@ -232,3 +236,5 @@ def gen_gms_project_data(project_dir: Path, n_procs: int = 1):
                     for cur_station, cur_id in station_id_comb
                 ],
             )
+
+    result_index.write_project_result_indices(results_dir)
@@ -11,6 +11,7 @@ import celery
 import gmhazard_calc as gc
 from . import tasks
 from . import utils
+from . import result_index
 
 
 def gen_psha_project_data(project_dir: Path, n_procs: int = 1, use_mp: bool = True):
@@ -151,6 +152,7 @@ def gen_psha_project_data(project_dir: Path, n_procs: int = 1, use_mp: bool = Tr
                 )
                 for cur_uhs_result in uhs_results:
                     cur_uhs_result.save(cur_output_dir)
+                    cur_uhs_result.save_binary(cur_output_dir)
 
                 # Compute & write UHS NZS1170.5
                 cur_uhs_nzs1170p5_dir = cur_output_dir / "uhs_nzs1170p5"
@@ -163,6 +165,7 @@ def gen_psha_project_data(project_dir: Path, n_procs: int = 1, use_mp: bool = Tr
                 )
                 for cur_uhs_nzs1170p5 in uhs_nzs1170p5:
                     cur_uhs_nzs1170p5.save(cur_uhs_nzs1170p5_dir, "uhs")
+                    cur_uhs_nzs1170p5.save_binary(cur_uhs_nzs1170p5_dir, "uhs")
 
     if any(
         [
@@ -171,6 +174,7 @@ def gen_psha_project_data(project_dir: Path, n_procs: int = 1, use_mp: bool = Tr
         ]
     ):
         print(f"Skipping Scenario generation as not all IM data is parametric")
+        result_index.write_project_result_indices(results_dir)
         return
 
     # Generate the station - IMComponent combinations
@@ -207,6 +211,8 @@ def gen_psha_project_data(project_dir: Path, n_procs: int = 1, use_mp: bool = Tr
             for cur_station, cur_component in station_im_comb
         )
 
+    result_index.write_project_result_indices(results_dir)
+
 
 def generate_maps(
     ensemble: gc.gm_data.Ensemble, station_name: str, results_dir: Union[str, Path]
@@ -312,6 +318,7 @@ def process_station_im(
             ensemble, site_info, im, calc_percentiles=True
         )
         ens_hazard.save(output_dir)
+        ens_hazard.save_binary(output_dir)
 
     # Compute & write NZS1170.5 if needed
     if im.im_type == gc.im.IMType.PGA or im.is_pSA():
@@ -327,9 +334,11 @@ def process_station_im(
                 f"\t{os.getpid()} - Computing NZS1170.5 for station "
                 f"{site_info.station_name} - IM {im} - Component {im.component}"
             )
-            gc.nz_code.nzs1170p5.run_ensemble_nzs1170p5(ensemble, site_info, im).save(
-                output_dir, "hazard"
+            nzs1170p5_hazard = gc.nz_code.nzs1170p5.run_ensemble_nzs1170p5(
+                ensemble, site_info, im
             )
+            nzs1170p5_hazard.save(output_dir, "hazard")
+            nzs1170p5_hazard.save_binary(output_dir, "hazard")
 
     # Compute & write NZTA hazard if needed
     if im.im_type == gc.im.IMType.PGA:
@@ -342,7 +351,9 @@ def process_station_im(
             print(
                 f"\t{os.getpid()} - Computing NZTA for station {site_info.station_name}"
             )
-            gc.nz_code.nzta_2018.run_ensemble_nzta(ensemble, site_info).save(output_dir)
+            nzta_hazard = gc.nz_code.nzta_2018.run_ensemble_nzta(ensemble, site_info)
+            nzta_hazard.save(output_dir)
+            nzta_hazard.save_binary(output_dir)
 
     # Compute & write disagg for the different exceedances
     for cur_excd in disagg_exceedances:
@@ -380,7 +391,10 @@ def process_station_im(
 
                 # Save
                 cur_disagg_data_dir = cur_disagg_data.save(output_dir)
-                cur_disagg_grid_data.save(cur_disagg_data_dir, save_disagg_data=False)
+                cur_disagg_data.save_binary(output_dir)
+                cur_disagg_grid_data.save_binary(
+                    cur_disagg_data_dir, save_disagg_data=False
+                )
 
                 # Additional info for the table
                 # Annual rec prob, magnitude and rrup (for disagg table)
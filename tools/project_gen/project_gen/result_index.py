@@ -0,0 +1,136 @@
+"""Index of the results of a project station (or station & IM component)
+
+The index is a single table per results directory that lists all
+existing result directories and binary result files (see
+gmhazard_calc.result_io), so that the project API does not have to
+check the file system for every request. It is rewritten whenever
+project_gen writes results, the modification time of the index file is
+used as the version of the results (e.g. for invalidating cached results).
+"""
+import os
+from pathlib import Path
+from typing import Iterable, Tuple, Union
+
+import pandas as pd
+
+import gmhazard_calc as gc
+
+INDEX_FN = "result_index.csv"
+
+# Directories that contain several results
+RESULT_GROUP_DIRS = ("uhs_nzs1170p5",)
+
+
+def build_result_index(data_dir: Path) -> pd.DataFrame:
+    """Creates the result index for the specified results directory
+
+    Parameters
+    ----------
+    data_dir: Path
+        Results directory of a station or
+        of a station & IM component
+
+    Returns
+    -------
+    pd.DataFrame
+        The result directory and binary file names (relative
+        to the data_dir) as index and the type of the result as column
+    """
+    result_dirs = []
+    for cur_dir in sorted(data_dir.iterdir()):
+        if cur_dir.suffix == gc.result_io.BINARY_SUFFIX and cur_dir.is_file():
+            result_dirs.append((cur_dir.name, cur_dir.name.split("_")[0]))
+            continue
+        if not cur_dir.is_dir():
+            continue
+
+        if cur_dir.name in RESULT_GROUP_DIRS:
+            result_dirs.extend(
+                (f"{cur_dir.name}/{cur_sub_dir.name}", cur_dir.name)
+                for cur_sub_dir in sorted(cur_dir.iterdir())
+                if cur_sub_dir.is_dir()
+                or cur_sub_dir.suffix == gc.result_io.BINARY_SUFFIX
+            )
+        # Result directories always contain files, this
+        # excludes the IM component directories of a station
+        elif any(cur_file.is_file() for cur_file in cur_dir.iterdir()):
+            result_dirs.append((cur_dir.name, cur_dir.name.split("_")[0]))
+
+    return pd.DataFrame(
+        data=[cur_type for _, cur_type in result_dirs],
+        index=pd.Index([cur_name for cur_name, _ in result_dirs], name="name"),
+        columns=["result_type"],
+    )
+
+
+def write_result_index(data_dir: Union[str, Path]) -> Path:
+    """Creates and writes the result index for the specified results directory,
+    the existing index file is replaced atomically"""
+    data_dir = Path(data_dir)
+    index_ffp = data_dir / INDEX_FN
+    tmp_ffp = data_dir / f".{INDEX_FN}.{os.getpid()}"
+
+    build_result_index(data_dir).to_csv(tmp_ffp)
+    os.replace(tmp_ffp, index_ffp)
+
+    return index_ffp
+
+
+def write_project_result_indices(results_dir: Union[str, Path]):
+    """Writes the result index for all station and
+    station & IM component directories of a project"""
+    for cur_station_dir in Path(results_dir).iterdir():
+        if not cur_station_dir.is_dir():
+            continue
+
+        write_result_index(cur_station_dir)
+        for cur_dir in cur_station_dir.iterdir():
+            # IM component directories, i.e. contain hazard/disagg/uhs results
+            if cur_dir.is_dir() and any(cur_dir.glob("hazard_*")):
+                write_result_index(cur_dir)
+
+
+def load_result_index(data_dir: Path) -> Tuple[pd.DataFrame, int]:
+    """Loads the result index for the specified results directory,
+    if there is no index file then it is created (without saving it)
+
+    Returns
+    -------
+    pd.DataFrame
+        The result index, see build_result_index
+    int
+        The version of the index, i.e. modification time (in ns)
+        of the index file, or of the results directory if there
+        is no index file
+    """
+    index_ffp = data_dir / INDEX_FN
+    try:
+        version = index_ffp.stat().st_mtime_ns
+    except FileNotFoundError:
+        return build_result_index(data_dir), data_dir.stat().st_mtime_ns
+
+    return pd.read_csv(index_ffp, index_col=0), version
+
+
+def get_index_version(data_dir: Path) -> int:
+    """Gets the version of the result index, see load_result_index"""
+    try:
+        return (data_dir / INDEX_FN).stat().st_mtime_ns
+    except FileNotFoundError:
+        return data_dir.stat().st_mtime_ns
+
+
+def get_result_names(index_df: pd.DataFrame, result_type: str) -> Iterable[str]:
+    """Gets the names of all results of the specified type, results that
+    are saved both as directory and binary file are only listed once
+    (i.e. without the binary file suffix)"""
+    return list(
+        dict.fromkeys(
+            cur_name[: -len(gc.result_io.BINARY_SUFFIX)]
+            if cur_name.endswith(gc.result_io.BINARY_SUFFIX)
+            else cur_name
+            for cur_name in index_df.index.values[
+                index_df.result_type.values == result_type
+            ]
+        )
+    )